@@ -0,0 +1,38 @@
+"""
+Benchmarks
+Load, latency and memory measurements, kept out of the service modules.
+Each is a module run from the repository root:
+
+    PYTHONPATH=. python -m benchmarks.<name> --help
+
+They use fake model backends and scratch data (a temporary SQLite database
+unless --database-url is given), so none needs GEMINI_API_KEY and none
+touches the application's database.
+"""
+import os
+import tempfile
+
+
+def use_database(url: str | None = None) -> str:
+    """
+    Points the app at `url` (default: a new temporary SQLite file) and
+    migrates it to head. Call before importing innertone, which reads its
+    settings once, on import.
+    """
+    url = url or f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='innertone-bench-')}/bench.db"
+    os.environ["DATABASE_URL"] = url
+    os.environ["ENVIRONMENT"] = "benchmark"  # No SQL echo
+    from init_db import init_models
+
+    init_models()
+    return url
+
+
+def percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def ms(samples: list[float]) -> dict:
+    """p50/p99 of durations in seconds, as milliseconds."""
+    return {"p50": round(percentile(samples, 0.5) * 1000, 2), "p99": round(percentile(samples, 0.99) * 1000, 2)}
@@ -0,0 +1,120 @@
+"""
+Mood rollups at scale: backfill throughput, per-turn write cost, and trend
+reads from the rollups against aggregating a session's emotion_records on
+each request (what the API would do without them), for typical sessions
+and for one long-running session holding --heavy-share of the records.
+
+    PYTHONPATH=. python -m benchmarks.analytics --records 1000000
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from benchmarks import ms, use_database
+
+EMOTIONS = ["anxious", "sad", "calm", "angry", "hopeful", "stressed", "lonely", "grateful"]
+
+
+async def run(records: int, sessions: int, days: int, queries: int, heavy_share: float) -> dict:
+    from sqlalchemy import func, insert, select
+
+    from innertone.core.database import AsyncSessionLocal as Session, engine
+    from innertone.models.analytics import MoodRollup
+    from innertone.models.emotion import EmotionRecord
+    from innertone.services import analytics
+
+    rng = random.Random(0)
+    now = datetime.now(timezone.utc)
+    started = time.perf_counter()
+    async with engine.begin() as conn:
+        for start in range(0, records, 10_000):
+            await conn.execute(insert(EmotionRecord), [
+                {
+                    "session_id": "session-0" if rng.random() < heavy_share else f"session-{rng.randrange(1, sessions)}",
+                    "emotions": rng.sample(EMOTIONS, rng.randint(1, 3)),
+                    "intensity": rng.choice(analytics.INTENSITIES),
+                    "detection_method": "keyword",
+                    "created_at": now - timedelta(seconds=rng.randrange(days * 86400)),
+                }
+                for _ in range(min(10_000, records - start))
+            ])
+    load_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    async with Session() as db:
+        await analytics.backfill(db)
+    backfill_s = time.perf_counter() - started
+
+    # Per-request reads, for the last 90 days of a random session
+    since = (now - timedelta(days=90)).date()
+    reads = {}
+    async with Session() as db:
+        for kind, picked in (
+            ("typical_session", [f"session-{rng.randrange(1, sessions)}" for _ in range(queries)]),
+            ("heavy_session", ["session-0"] * max(1, queries // 10)),
+        ):
+            from_rollups, from_records = [], []
+            for session_id in picked:
+                started = time.perf_counter()
+                await analytics.get_mood_trend(db, session_id, "day", start=since)
+                from_rollups.append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                result = await db.execute(
+                    select(EmotionRecord).where(
+                        EmotionRecord.session_id == session_id,
+                        EmotionRecord.created_at >= datetime.combine(since, datetime.min.time(), timezone.utc),
+                    )
+                )
+                analytics.aggregate(result.scalars().all())
+                from_records.append(time.perf_counter() - started)
+                db.expunge_all()
+            reads[kind] = {"from_rollups_ms": ms(from_rollups), "from_records_ms": ms(from_records)}
+
+    # The write path: one turn's record, with and without its rollup upsert
+    writes = {"record_only": [], "record_and_rollup": []}
+    for kind in writes:
+        for i in range(200):
+            async with Session() as db:
+                record = EmotionRecord(session_id=f"session-{i}", emotions=["calm"], intensity="low")
+                started = time.perf_counter()
+                db.add(record)
+                if kind == "record_and_rollup":
+                    await analytics.apply_emotion_records(db, [record])
+                await db.commit()
+                writes[kind].append(time.perf_counter() - started)
+
+    async with Session() as db:
+        rollup_rows = await db.scalar(select(func.count()).select_from(MoodRollup))
+    await engine.dispose()
+
+    return {
+        "database": engine.dialect.name,
+        "records": records,
+        "sessions": sessions,
+        "rollup_rows": rollup_rows,
+        "load_s": round(load_s, 1),
+        "backfill_s": round(backfill_s, 1),
+        "backfill_records_per_s": round(records / backfill_s),
+        "trend_90d_reads": reads,
+        "write_record_only_ms": ms(writes["record_only"]),
+        "write_record_and_rollup_ms": ms(writes["record_and_rollup"]),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--sessions", type=int, default=10_000)
+    parser.add_argument("--days", type=int, default=365, help="Spread of created_at")
+    parser.add_argument("--queries", type=int, default=500, help="Trend reads to time")
+    parser.add_argument("--heavy-share", type=float, default=0.01, help="Share of records in one session")
+    parser.add_argument("--database-url", help="Scratch database (default: a temporary SQLite file)")
+    args = parser.parse_args()
+
+    use_database(args.database_url)
+    from innertone.core.serialization import dumps
+
+    print(dumps(asyncio.run(run(args.records, args.sessions, args.days, args.queries, args.heavy_share))))
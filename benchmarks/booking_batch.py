@@ -0,0 +1,117 @@
+"""
+Bulk bookings through the API: --items appointments booked and then
+cancelled with one POST /bookings/batch and one POST /bookings/batch/cancel,
+against the per-item path (one POST /bookings/ and one DELETE per
+appointment, each its own request and commit).
+
+    PYTHONPATH=. python -m benchmarks.booking_batch --items 10000
+
+Requests go to the ASGI app in process (httpx's ASGITransport), so the
+times include validation, serialization and the database, but no network.
+Both paths book the same shape of schedule for different therapists, with
+--conflicts of the items repeating an earlier slot.
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from benchmarks import ms, use_database
+
+HOURS = ("08:00", "20:00")
+
+
+def _items(prefix: str, count: int, therapists: int, conflicts: float, rng: random.Random) -> list[dict]:
+    """Hourly 50-minute slots from tomorrow on, spread over the therapists, some repeated."""
+    first = datetime.now(timezone.utc).replace(hour=8, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    per_day = int(HOURS[1][:2]) - int(HOURS[0][:2])
+    items = []
+    for i in range(count):
+        if items and rng.random() < conflicts:
+            items.append(dict(rng.choice(items)))
+            continue
+        therapist, slot = i % therapists, i // therapists
+        items.append({
+            "user_id": f"user-{i}",
+            "therapist_name": f"{prefix}-{therapist}",
+            "scheduled_at": (first + timedelta(days=slot // per_day, hours=slot % per_day)).isoformat(),
+            "duration_minutes": 50,
+        })
+    return items
+
+
+async def run(items: int, therapists: int, conflicts: float) -> dict:
+    import httpx
+
+    from innertone.core.database import engine
+    from innertone.main import app
+
+    # Every day, so the generated slots are all inside availability
+    week = [{"weekday": d, "start_time": HOURS[0], "end_time": HOURS[1], "slot_minutes": 50} for d in range(7)]
+
+    rng = random.Random(0)
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench/api/v1/bookings") as client:
+        for path in ("per_item", "batch"):
+            for t in range(therapists):
+                (await client.put(f"/availability/{path}-{t}", json=week)).raise_for_status()
+            batch = _items(path, items, therapists, conflicts, rng)
+
+            started = time.perf_counter()
+            ids, latencies = [], []
+            if path == "batch":
+                response = await client.post("/batch", json={"items": batch})
+                response.raise_for_status()
+                ids = [r["appointment"]["id"] for r in response.json()["results"] if r["status"] == "created"]
+            else:
+                for item in batch:
+                    sent = time.perf_counter()
+                    response = await client.post("/", json=item)
+                    latencies.append(time.perf_counter() - sent)
+                    if response.status_code == 201:
+                        ids.append(response.json()["id"])
+                    elif response.status_code != 409:
+                        response.raise_for_status()
+            book_s = time.perf_counter() - started
+
+            started = time.perf_counter()
+            if path == "batch":
+                (await client.post("/batch/cancel", json={"appointment_ids": ids})).raise_for_status()
+            else:
+                for appointment_id in ids:
+                    (await client.delete(f"/{appointment_id}")).raise_for_status()
+            cancel_s = time.perf_counter() - started
+
+            results[path] = {
+                "created": len(ids),
+                "book_s": round(book_s, 2),
+                "bookings_per_s": round(len(batch) / book_s),
+                "cancel_s": round(cancel_s, 2),
+                **({"request_ms": ms(latencies)} if latencies else {}),
+            }
+    await engine.dispose()
+
+    results["speedup"] = {
+        "book": round(results["per_item"]["book_s"] / results["batch"]["book_s"], 1),
+        "cancel": round(results["per_item"]["cancel_s"] / max(results["batch"]["cancel_s"], 0.01), 1),
+    }
+    return {"items": items, "therapists": therapists, "conflicts": conflicts, **results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=10_000, help="Appointments per path (the batch limit is 10,000)")
+    parser.add_argument("--therapists", type=int, default=20)
+    parser.add_argument("--conflicts", type=float, default=0.05, help="Share of items repeating an earlier slot")
+    parser.add_argument("--database-url", help="Database to book into (default: a temporary SQLite file)")
+    args = parser.parse_args()
+
+    # Availability hours in UTC, like the generated slots
+    os.environ["BOOKING_TIMEZONE"] = "UTC"
+    use_database(args.database_url)
+    from innertone.core.serialization import dumps
+
+    print(dumps(asyncio.run(run(args.items, args.therapists, args.conflicts))))
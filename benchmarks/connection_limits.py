@@ -0,0 +1,145 @@
+"""
+Connection-limit soak: starts the API in a subprocess with fast heartbeats
+and holds call pairs on the signaling socket at a steady message rate, next
+to clients that never answer pings and clients that flood, then reports how
+each group's sockets ended, server RSS over the run and whether the gauges
+returned to zero.
+
+    PYTHONPATH=. python -m benchmarks.connection_limits --sockets 200 --duration 60
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+
+from benchmarks import use_database
+from innertone.core.serialization import dumps
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    return 0.0
+
+
+async def run(sockets: int, duration: float, rate: float, idle: int, flood: int, port: int) -> dict:
+    """
+    `sockets` signaling peers (two per session) sending `rate` messages per
+    second each for `duration` seconds, plus `idle` peers that never answer
+    pings and `flood` peers sending 10x the session limit.
+    """
+    import httpx
+    import websockets
+
+    from innertone.services.connection_limits import frame_type, settings
+
+    env = {
+        **os.environ,
+        "WS_CONNECTS_PER_MINUTE": "1000000",
+        "WS_HEARTBEAT_INTERVAL": "1",
+        "WS_IDLE_TIMEOUT": "3",
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "innertone.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    base = f"127.0.0.1:{port}"
+    outcomes: dict[str, Counter] = {"steady": Counter(), "idle": Counter(), "flood": Counter()}
+    frames: Counter[str] = Counter()
+
+    async def client(session_id: str, group: str, interval: float):
+        try:
+            async with websockets.connect(f"ws://{base}/api/v1/calls/signaling/{session_id}") as ws:
+
+                async def read():
+                    try:
+                        async for message in ws:
+                            if frame_type(message) == "ping":
+                                frames["pings"] += 1
+                                if group != "idle":
+                                    await ws.send(dumps({"type": "pong"}))
+                            else:
+                                frames["relayed"] += 1
+                    except websockets.ConnectionClosed:
+                        pass
+
+                reader = asyncio.create_task(read())
+                deadline = time.monotonic() + duration
+                while time.monotonic() < deadline and not reader.done():
+                    if group != "idle":
+                        await ws.send(dumps({"type": "candidate", "candidate": "candidate:1 1 udp 2122260223 10.0.0.1 5000 typ host"}))
+                        frames["sent"] += 1
+                    await asyncio.sleep(interval)
+                if reader.done():
+                    outcomes[group][f"closed_{ws.close_code}"] += 1
+                else:
+                    outcomes[group]["held"] += 1
+                    reader.cancel()
+        except websockets.ConnectionClosed as e:
+            outcomes[group][f"closed_{e.rcvd.code if e.rcvd else None}"] += 1
+
+    try:
+        async with httpx.AsyncClient(base_url=f"http://{base}") as http:
+            for _ in range(300):
+                if server.poll() is not None:
+                    raise RuntimeError(f"API server exited with {server.returncode}")
+                try:
+                    if (await http.get("/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.2)
+            rss = [rss_mb(server.pid)]
+
+            async def sample():
+                while True:
+                    await asyncio.sleep(1)
+                    rss.append(rss_mb(server.pid))
+
+            sampler = asyncio.create_task(sample())
+            tasks = [client(f"soak-{i // 2}", "steady", 1 / rate) for i in range(sockets)]
+            tasks += [client(f"soak-idle-{i}", "idle", 1.0) for i in range(idle)]
+            limit = settings.WS_MESSAGES_PER_SECOND * 10
+            tasks += [client(f"soak-flood-{i}", "flood", 1 / limit) for i in range(flood)]
+            gathered = asyncio.gather(*tasks)
+            await asyncio.sleep(min(duration / 2, 5))
+            peak = (await http.get("/api/v1/calls/stats")).json()
+            await gathered
+            sampler.cancel()
+            await asyncio.sleep(1)
+            after = (await http.get("/api/v1/calls/stats")).json()
+    finally:
+        server.terminate()
+        server.wait()
+
+    return {
+        "duration_s": duration,
+        "outcomes": {group: dict(counts) for group, counts in outcomes.items()},
+        "frames": dict(frames),
+        "open_at_peak": peak["open_connections"],
+        "open_after": after["open_connections"],
+        "signaling_rooms_after": after["signaling_rooms"],
+        "server_totals": after["totals"],
+        "rss_mb": {"start": rss[0], "peak": max(rss), "end": rss[-1]},
+    }
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sockets", type=int, default=200, help="Well-behaved peers, two per session")
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument("--rate", type=float, default=2.0, help="Messages per second per well-behaved peer")
+    parser.add_argument("--idle", type=int, default=10, help="Peers that never answer pings")
+    parser.add_argument("--flood", type=int, default=4, help="Peers sending 10x the session rate limit")
+    parser.add_argument("--port", type=int, default=8300)
+    parser.add_argument("--database-url", help="Database the server uses (default: a temporary SQLite file)")
+    args = parser.parse_args()
+
+    use_database(args.database_url)
+    print(dumps(asyncio.run(run(args.sockets, args.duration, args.rate, args.idle, args.flood, args.port))))
@@ -0,0 +1,153 @@
+"""
+Cost of the always-on diagnostics: the flight recorder middleware per HTTP
+request, the engine listeners per query, and the loop-lag monitor (its tick
+task and watchdog thread) on event loop throughput. Each is measured with
+and without, alternating over --rounds, and the median round reported.
+
+    PYTHONPATH=. python -m benchmarks.diagnostics --requests 5000 --queries 5000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks import use_database
+
+
+async def _rounds(rounds: int, variants: dict) -> dict:
+    """Median seconds per round of each variant, run alternately."""
+    timings = {name: [] for name in variants}
+    for _ in range(rounds):
+        for name, measure in variants.items():
+            timings[name].append(await measure())
+    return {name: statistics.median(samples) for name, samples in timings.items()}
+
+
+async def http(requests: int, rounds: int) -> dict:
+    import httpx
+    from fastapi import FastAPI
+
+    from innertone.services.diagnostics import FlightRecorderMiddleware
+
+    def make_app(traced: bool) -> FastAPI:
+        app = FastAPI()
+
+        @app.get("/ping")
+        async def ping():
+            return {"ok": True}
+
+        if traced:
+            app.add_middleware(FlightRecorderMiddleware)
+        return app
+
+    clients = {
+        name: httpx.AsyncClient(transport=httpx.ASGITransport(app=make_app(name == "recorder")), base_url="http://bench")
+        for name in ("plain", "recorder")
+    }
+
+    def measure(client):
+        async def run():
+            started = time.perf_counter()
+            for _ in range(requests):
+                await client.get("/ping")
+            return time.perf_counter() - started
+        return run
+
+    medians = await _rounds(rounds, {name: measure(client) for name, client in clients.items()})
+    for client in clients.values():
+        await client.aclose()
+    per_request = {name: seconds / requests * 1e6 for name, seconds in medians.items()}
+    return {
+        "request_us": {name: round(us, 1) for name, us in per_request.items()},
+        "overhead_us": round(per_request["recorder"] - per_request["plain"], 1),
+    }
+
+
+async def queries(count: int, rounds: int) -> dict:
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from innertone.core.config import get_settings
+    from innertone.services import diagnostics
+
+    engines = {name: create_async_engine(get_settings().DATABASE_URL) for name in ("plain", "instrumented")}
+    diagnostics.instrument_engine(engines["instrumented"])
+
+    def measure(engine):
+        async def run():
+            async with engine.connect() as conn:
+                with diagnostics.traced("bench"):
+                    started = time.perf_counter()
+                    for _ in range(count):
+                        await conn.execute(text("SELECT 1"))
+                    return time.perf_counter() - started
+        return run
+
+    medians = await _rounds(rounds, {name: measure(engine) for name, engine in engines.items()})
+    for engine in engines.values():
+        await engine.dispose()
+    per_query = {name: seconds / count * 1e6 for name, seconds in medians.items()}
+    return {
+        "query_us": {name: round(us, 1) for name, us in per_query.items()},
+        "overhead_us": round(per_query["instrumented"] - per_query["plain"], 1),
+    }
+
+
+async def loop(seconds: float, rounds: int) -> dict:
+    from innertone.services.diagnostics import LoopLagMonitor, loop_monitor
+
+    async def switches() -> float:
+        """Context switches per second between two ping-ponging tasks."""
+        count = 0
+        deadline = time.perf_counter() + seconds
+
+        async def spin():
+            nonlocal count
+            while time.perf_counter() < deadline:
+                await asyncio.sleep(0)
+                count += 1
+
+        await asyncio.gather(spin(), spin())
+        return count / seconds
+
+    async def unmonitored():
+        return await switches()
+
+    async def monitored():
+        monitor = LoopLagMonitor(loop_monitor.interval, loop_monitor.stall_threshold)
+        monitor.start()
+        try:
+            return await switches()
+        finally:
+            monitor.stop()
+
+    medians = await _rounds(rounds, {"plain": unmonitored, "monitor": monitored})
+    return {
+        "interval_ms": loop_monitor.interval * 1000,
+        "switches_per_s": {name: round(rate) for name, rate in medians.items()},
+        "throughput_change_pct": round((medians["monitor"] / medians["plain"] - 1) * 100, 2),
+    }
+
+
+async def run(requests: int, count: int, seconds: float, rounds: int) -> dict:
+    return {
+        "rounds": rounds,
+        "http": await http(requests, rounds),
+        "db": await queries(count, rounds),
+        "loop": await loop(seconds, rounds),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000, help="HTTP requests per round")
+    parser.add_argument("--queries", type=int, default=5000, help="Queries per round")
+    parser.add_argument("--loop-seconds", type=float, default=2.0, help="Length of each event loop round")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--database-url", help="Database to query (default: a temporary SQLite file)")
+    args = parser.parse_args()
+
+    use_database(args.database_url)
+    from innertone.core.serialization import dumps
+
+    print(dumps(asyncio.run(run(args.requests, args.queries, args.loop_seconds, args.rounds))))
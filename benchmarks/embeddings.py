@@ -0,0 +1,107 @@
+"""
+Embedding store: FAISS index rebuild from the store against re-embedding,
+and the cost of a chat query embedding kept in the in-memory LRU against
+one appended to the store.
+
+    PYTHONPATH=. python -m benchmarks.embeddings --chunks 100000 --queries 5000
+
+The rebuild builds a store of --chunks random document vectors, then times a
+full IndexIDMap2 rebuild from it (cold open included); re-embedding is
+estimated at ingest.py's pacing. The query part embeds --queries distinct
+queries with a zero-latency fake model, so the numbers are the store's own
+cost per miss. Everything is written to a temporary directory.
+"""
+import argparse
+import math
+import os
+import tempfile
+import time
+
+from benchmarks import ms, use_database
+
+
+def rebuild(chunks: int, dimensions: int, embed_latency: float) -> dict:
+    import faiss
+    import numpy as np
+
+    from innertone.rag.embeddings import EmbeddingStore
+    from innertone.rag.ingest import EMBED_BATCH, EMBED_BATCH_DELAY
+
+    rng = np.random.default_rng(0)
+    texts = [f"chunk {i}: " + " ".join(map(str, rng.integers(0, 10_000, 40))) for i in range(chunks)]
+    batch = 1000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = EmbeddingStore(tmp, dimensions)
+        started = time.perf_counter()
+        for start in range(0, chunks, batch):
+            part = texts[start : start + batch]
+            store.put_many(part, rng.random((len(part), dimensions), dtype="float32"))
+        write_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        store = EmbeddingStore(tmp, dimensions)
+        open_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        index = faiss.IndexIDMap2(faiss.IndexFlatL2(dimensions))
+        for start in range(0, chunks, batch):
+            vectors = store.get_many(texts[start : start + batch])
+            index.add_with_ids(np.stack(vectors), np.arange(start, start + len(vectors), dtype="int64"))
+        rebuild_s = time.perf_counter() - started
+        size_mb = store.snapshot()["bytes"] / 2**20
+
+    reembed_s = math.ceil(chunks / EMBED_BATCH) * (embed_latency + EMBED_BATCH_DELAY)
+    return {
+        "chunks": chunks,
+        "store_mb": round(size_mb, 1),
+        "store_write_s": round(write_s, 2),
+        "rebuild_from_store_s": round(open_s + rebuild_s, 2),
+        "of_which_open_s": round(open_s, 2),
+        "reembed_estimate_s": round(reembed_s),
+        "reembed_pacing": f"{EMBED_BATCH} chunks per call, {embed_latency}s call + {EMBED_BATCH_DELAY}s delay",
+        "speedup": f"{reembed_s / (open_s + rebuild_s):,.0f}x",
+    }
+
+
+def queries(count: int, dimensions: int) -> dict:
+    from innertone.rag.embeddings import StoredEmbeddings, open_store
+    from innertone.services.gemini_fakes import FakeEmbeddings
+
+    texts = [f"message {i}: I keep worrying about work and cannot switch off at night" for i in range(count)]
+    results = {}
+    for name, persist in (("persisted", True), ("in_memory_lru", False)):
+        embeddings = StoredEmbeddings(lambda: FakeEmbeddings(dimensions), f"bench-{name}", dimensions, persist_queries=persist)
+        misses, hits = [], []
+        for samples in (misses, hits):
+            for text in texts:
+                started = time.perf_counter()
+                embeddings.embed_query(text)
+                samples.append(time.perf_counter() - started)
+        store = open_store(f"bench-{name}", dimensions, "query")
+        results[name] = {"miss_ms": ms(misses), "hit_ms": ms(hits), "store_bytes": store.snapshot()["bytes"]}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=5000, help="Distinct chat queries, each embedded twice")
+    parser.add_argument("--dimension", type=int, help="Default: EMBEDDING_DIMENSIONS")
+    parser.add_argument("--embed-latency", type=float, default=0.5, help="Seconds per embedding API call")
+    args = parser.parse_args()
+
+    os.environ["EMBEDDING_STORE_DIR"] = tempfile.mkdtemp(prefix="innertone-bench-")
+    use_database()
+    from innertone.core.config import get_settings
+    from innertone.core.serialization import dumps
+
+    settings = get_settings()
+    dimensions = args.dimension or settings.EMBEDDING_DIMENSIONS
+    # Room for every query, so the second pass measures hits
+    settings.EMBEDDING_QUERY_CACHE_SIZE = max(settings.EMBEDDING_QUERY_CACHE_SIZE, args.queries)
+    print(dumps({
+        "dimensions": dimensions,
+        "rebuild": rebuild(args.chunks, dimensions, args.embed_latency),
+        "queries": queries(args.queries, dimensions),
+    }))
@@ -0,0 +1,93 @@
+"""
+Emotion micro-batching: model calls saved and latency added by
+EmotionBatcher at each arrival rate, against unbatched classification, with
+a fake backend and Poisson arrivals.
+
+    PYTHONPATH=. python -m benchmarks.emotion --rates 1,5,20,100
+
+The fake answers after --fake-latency plus --fake-latency-per-item per
+message, and leaves --fake-drop of the messages out of its answer (those
+callers fall back to keyword detection).
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks import percentile, use_database
+
+
+async def run(rates: list[float], seconds: float, latency: float, per_item: float, drop: float) -> list[dict]:
+    from innertone.core.serialization import dumps
+    from innertone.services.emotion import EmotionBatcher, _keyword_detect, settings
+
+    rng = random.Random(0)
+
+    async def fake_backend(items: list[dict]) -> str:
+        await asyncio.sleep(latency + per_item * len(items))
+        return dumps([
+            {"id": item["id"], "emotions": _keyword_detect(item["message"]), "intensity": "medium"}
+            for item in items
+            if rng.random() >= drop
+        ])
+
+    async def arrivals(batcher: EmotionBatcher, rate: float) -> dict:
+        latencies, fallbacks = [], 0
+
+        async def one(n: int):
+            nonlocal fallbacks
+            started = time.perf_counter()
+            try:
+                await batcher.classify(f"message {n}: I feel anxious and overwhelmed at work")
+            except Exception:
+                fallbacks += 1  # detect_emotion would use _keyword_detect for this one
+            latencies.append(time.perf_counter() - started)
+
+        tasks, n, deadline = [], 0, time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            tasks.append(asyncio.create_task(one(n)))
+            n += 1
+            await asyncio.sleep(rng.expovariate(rate))
+        await asyncio.gather(*tasks)
+
+        return {
+            "messages": n,
+            "calls": batcher.stats["calls"],
+            "mean_batch": batcher.snapshot()["mean_batch"],
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+            "keyword_fallbacks": fallbacks,
+        }
+
+    report = []
+    for rate in rates:
+        unbatched = await arrivals(EmotionBatcher(0, 1, backend=fake_backend), rate)
+        batched = await arrivals(
+            EmotionBatcher(settings.EMOTION_BATCH_WINDOW_MS / 1000, settings.EMOTION_BATCH_MAX, backend=fake_backend),
+            rate,
+        )
+        report.append({
+            "rate_per_s": rate,
+            "unbatched": unbatched,
+            "batched": batched,
+            "calls_saved": f"{1 - batched['calls'] / max(1, batched['messages']):.0%}",
+            "added_p50_ms": round(batched["p50_ms"] - unbatched["p50_ms"], 1),
+        })
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rates", default="1,5,20,100", help="Arrival rates to test, messages per second")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--fake-latency", type=float, default=0.4, help="Seconds per call")
+    parser.add_argument("--fake-latency-per-item", type=float, default=0.01, help="Extra seconds per message in a call")
+    parser.add_argument("--fake-drop", type=float, default=0.05, help="Share of messages the fake leaves out of its answer")
+    args = parser.parse_args()
+
+    use_database()
+    from innertone.core.serialization import dumps
+
+    rates = [float(rate) for rate in args.rates.split(",")]
+    for row in asyncio.run(run(rates, args.seconds, args.fake_latency, args.fake_latency_per_item, args.fake_drop)):
+        print(dumps(row))
@@ -0,0 +1,127 @@
+"""
+Book ingestion memory and latency: peak RSS and time to the first embedded
+batch for a synthetic --pages page PDF, streamed through iter_pdf_chunks
+(the current pipeline) and parsed whole before splitting (the previous
+PyPDFLoader + split_documents path).
+
+    PYTHONPATH=. python -m benchmarks.ingest --pages 6000
+
+Each path runs in its own process, so peak RSS is its own. Embeddings come
+from FakeEmbeddings in batches of EMBED_BATCH, with no rate-limit delay, so
+the numbers are parsing and chunking alone. Nothing is written to the index
+or the database.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from benchmarks import use_database
+
+WORDS = (
+    "thought feeling evidence behaviour worry sleep mood pattern belief notice pause "
+    "breathe exam pressure balance habit memory small step kind practice journal"
+).split()
+
+
+def write_pdf(path: str, pages: int, chars_per_page: int = 2800, seed: int = 0) -> None:
+    """A plain-text PDF (Helvetica, one content stream per page) with a chapter heading every 20 pages."""
+    rng = random.Random(seed)
+    offsets = []
+
+    with open(path, "wb") as f:
+        def add(body: bytes) -> None:
+            offsets.append(f.tell())
+            f.write(f"{len(offsets)} 0 obj\n".encode() + body + b"\nendobj\n")
+
+        f.write(b"%PDF-1.4\n")
+        kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(pages))
+        add(b"<< /Type /Catalog /Pages 2 0 R >>")
+        add(f"<< /Type /Pages /Count {pages} /Kids [{kids}] >>".encode())
+        add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+        for number in range(pages):
+            lines = [f"Chapter {number // 20 + 1}"] if number % 20 == 0 else []
+            while sum(len(line) for line in lines) < chars_per_page:
+                lines.append(" ".join(rng.choice(WORDS) for _ in range(14)))
+            text = " T*\n".join(f"({line}) Tj" for line in lines)
+            stream = f"BT /F1 9 Tf 11 TL 40 800 Td\n{text}\nET".encode()
+            add(
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * number} 0 R >>".encode()
+            )
+            add(f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+
+        xref = f.tell()
+        f.write(f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode())
+        f.writelines(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+        f.write(f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+
+
+def _measure(path: str, streaming: bool) -> dict:
+    """Runs one path in this (child) process and reports its timings and peak RSS."""
+    from innertone.core.config import get_settings
+    from innertone.rag import ingest
+    from innertone.services.gemini_fakes import FakeEmbeddings
+
+    embeddings = FakeEmbeddings(get_settings().EMBEDDING_DIMENSIONS)
+    rss_before = ingest._peak_rss_mb()
+    started = time.perf_counter()
+    first = None
+    count = 0
+
+    if streaming:
+        chunks = (text for text, _ in ingest.iter_pdf_chunks(path))
+    else:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+        from pypdf import PdfReader
+
+        # What PyPDFLoader.load() did: every page's text, then one split over all of them
+        pages = [page.extract_text() for page in PdfReader(path).pages]
+        splitter = RecursiveCharacterTextSplitter(chunk_size=ingest.CHUNK_SIZE, chunk_overlap=ingest.CHUNK_OVERLAP)
+        chunks = (document.page_content for document in splitter.create_documents(pages))
+
+    for batch in ingest._batched(chunks, ingest.EMBED_BATCH):
+        embeddings.embed_documents(batch)
+        if first is None:
+            first = time.perf_counter() - started
+        count += len(batch)
+
+    return {
+        "chunks": count,
+        "first_embedding_s": round(first, 2),
+        "total_s": round(time.perf_counter() - started, 2),
+        "rss_before_mb": round(rss_before),
+        "peak_rss_mb": round(ingest._peak_rss_mb()),
+    }
+
+
+def run(pages: int) -> dict:
+    directory = tempfile.mkdtemp(prefix="innertone-bench-")
+    path = os.path.join(directory, "synthetic.pdf")
+    started = time.perf_counter()
+    write_pdf(path, pages)
+    results = {
+        "pages": pages,
+        "pdf_mb": round(os.path.getsize(path) / 2 ** 20, 1),
+        "write_s": round(time.perf_counter() - started, 1),
+    }
+    # A fresh interpreter per path, so neither inherits the other's peak
+    context = multiprocessing.get_context("spawn")
+    for name, streaming in (("previous_whole_book", False), ("streaming", True)):
+        with context.Pool(1) as pool:
+            results[name] = pool.apply(_measure, (path, streaming))
+    os.remove(path)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=6000, help="Pages in the synthetic book")
+    args = parser.parse_args()
+
+    use_database()
+    from innertone.core.serialization import dumps
+
+    print(dumps(run(args.pages)))
@@ -0,0 +1,148 @@
+"""
+History tables with and without monthly partitioning (PostgreSQL only):
+loads the same synthetic conversation_messages rows into a plain table and
+into one range-partitioned by created_at, then times single-row inserts,
+get_history's latest-window read, and dropping the oldest month.
+
+    PYTHONPATH=. python -m benchmarks.partitions --database-url postgresql+asyncpg://... --rows 100000000
+
+The tables are scratch copies (bench_history_*), dropped at the end unless
+--keep is given; the application's own tables are not touched. Loading runs
+in the server (INSERT ... SELECT generate_series), one transaction per
+--batch rows.
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from datetime import datetime, timezone
+
+from benchmarks import ms
+
+TABLES = ("bench_history_plain", "bench_history_partitioned")
+MONTHS_AHEAD = 3
+
+
+def _ddl(table: str, partitioned: bool) -> list[str]:
+    primary_key = "id, created_at" if partitioned else "id"
+    return [
+        f"DROP TABLE IF EXISTS {table} CASCADE",
+        f"CREATE TABLE {table} ("
+        "id bigserial NOT NULL, session_id varchar(128) NOT NULL, role varchar(16) NOT NULL, "
+        "content text NOT NULL, is_crisis boolean NOT NULL, created_at timestamptz NOT NULL DEFAULT now(), "
+        f"PRIMARY KEY ({primary_key}))" + (" PARTITION BY RANGE (created_at)" if partitioned else ""),
+        f"CREATE INDEX {table}_session_created ON {table} (session_id, created_at)",
+    ]
+
+
+async def run(url: str, rows: int, sessions: int, months: int, batch: int, queries: int, keep: bool) -> dict:
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from innertone.services.partitions import add_months, create_partition_sql, default_partition_sql, month_start
+
+    engine = create_async_engine(url)
+    if engine.dialect.name != "postgresql":
+        raise SystemExit("Partitioning is PostgreSQL only; pass a postgresql+asyncpg:// --database-url")
+
+    this_month = month_start(datetime.now(timezone.utc).date())
+    first_month = add_months(this_month, -(months - 1))
+    async with engine.begin() as conn:
+        for table in TABLES:
+            for statement in _ddl(table, partitioned=table.endswith("partitioned")):
+                await conn.execute(text(statement))
+        month = first_month
+        while month <= add_months(this_month, MONTHS_AHEAD):
+            await conn.execute(text(create_partition_sql(TABLES[1], month)))
+            month = add_months(month, 1)
+        await conn.execute(text(default_partition_sql(TABLES[1])))
+
+    # Each row lands at a random point of the last `months` months, three roles per chat turn
+    load = (
+        "INSERT INTO {table} (session_id, role, content, is_crisis, created_at) "
+        "SELECT 'session-' || (g % :sessions), (ARRAY['user', 'model', 'system'])[g % 3 + 1], "
+        "'message ' || g || ' ' || md5(g::text) || md5((g + 1)::text), g % 997 = 0, "
+        "date_trunc('month', now()) - interval '1 month' * (:months - 1) "
+        "+ (now() - date_trunc('month', now()) + interval '1 month' * (:months - 1)) * ((hashint8(g) & 65535) / 65536.0) "
+        "FROM generate_series(CAST(:start AS bigint), CAST(:end AS bigint)) AS g"
+    )
+    loaded = {}
+    for table in TABLES:
+        started = time.perf_counter()
+        for start in range(0, rows, batch):
+            async with engine.begin() as conn:
+                await conn.execute(text(load.format(table=table)), {
+                    "sessions": sessions, "months": months, "start": start, "end": min(rows, start + batch) - 1,
+                })
+        async with engine.begin() as conn:
+            await conn.execute(text(f"ANALYZE {table}"))
+            size = await conn.scalar(text(
+                "SELECT sum(pg_total_relation_size(c.oid)) FROM pg_class c "
+                "WHERE c.relname = :table OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = CAST(:table AS regclass))"
+            ), {"table": table})
+        loaded[table] = {"load_s": round(time.perf_counter() - started, 1), "size_mb": round(size / 2 ** 20)}
+
+    rng = random.Random(0)
+    history = (
+        "SELECT id, role, content FROM {table} WHERE session_id = :session "
+        "ORDER BY created_at DESC, id DESC LIMIT 20"
+    )
+    insert = "INSERT INTO {table} (session_id, role, content, is_crisis) VALUES (:session, 'user', :content, false)"
+    results = {}
+    for table in TABLES:
+        reads, writes = [], []
+        async with engine.connect() as conn:
+            for _ in range(queries):
+                session = f"session-{rng.randrange(sessions)}"
+                started = time.perf_counter()
+                (await conn.execute(text(history.format(table=table)), {"session": session})).all()
+                reads.append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                await conn.execute(text(insert.format(table=table)), {"session": session, "content": "I can't sleep"})
+                await conn.commit()
+                writes.append(time.perf_counter() - started)
+
+        # Retention: the oldest month goes, by DELETE on the plain table, by DROP of its partition otherwise
+        started = time.perf_counter()
+        async with engine.begin() as conn:
+            if table.endswith("partitioned"):
+                await conn.execute(text(f"DROP TABLE {table}_p{first_month:%Y%m}"))
+            else:
+                await conn.execute(
+                    text(f"DELETE FROM {table} WHERE created_at < :cutoff"),
+                    {"cutoff": datetime.combine(add_months(first_month, 1), datetime.min.time(), timezone.utc)},
+                )
+        results[table.removeprefix("bench_history_")] = {
+            **loaded[table],
+            "history_read_ms": ms(reads),
+            "insert_ms": ms(writes),
+            "drop_oldest_month_s": round(time.perf_counter() - started, 2),
+        }
+
+    if not keep:
+        async with engine.begin() as conn:
+            for table in TABLES:
+                await conn.execute(text(f"DROP TABLE IF EXISTS {table} CASCADE"))
+    await engine.dispose()
+    return {"rows": rows, "sessions": sessions, "months": months, **results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database-url", required=True, help="PostgreSQL database for the scratch tables")
+    parser.add_argument("--rows", type=int, default=100_000_000, help="Rows loaded into each table")
+    parser.add_argument("--sessions", type=int, default=1_000_000)
+    parser.add_argument("--months", type=int, default=24, help="History spread over this many months")
+    parser.add_argument("--batch", type=int, default=1_000_000, help="Rows per load transaction")
+    parser.add_argument("--queries", type=int, default=1000, help="History reads and inserts to time per table")
+    parser.add_argument("--keep", action="store_true", help="Leave the scratch tables in place")
+    args = parser.parse_args()
+
+    os.environ.update(DATABASE_URL=args.database_url, ENVIRONMENT="benchmark")
+    from innertone.core.serialization import dumps
+
+    print(dumps(asyncio.run(run(
+        args.database_url, args.rows, args.sessions, args.months, args.batch, args.queries, args.keep,
+    ))))
@@ -0,0 +1,146 @@
+"""
+JSON cost per response and per WebSocket frame: the orjson helpers in
+innertone.core.serialization against the stdlib json they replaced, and a
+page of appointments read as ORM objects or as plain rows validated by the
+pre-built AppointmentList adapter.
+
+    PYTHONPATH=. python -m benchmarks.serialization --repeat 20000
+
+Responses are serialized the way FastAPI does it for a route with a
+response_model (fastapi.routing.serialize_response with the field built
+from it), so the numbers are the encoding cost alone, without HTTP.
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+from benchmarks import use_database
+
+REPLY = (
+    "It sounds like the pressure before exams has been building for a while. "
+    "Try writing each worry down with one small step beside it. What usually goes through your mind at night?"
+)
+
+
+def _per_call_us(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return round((time.perf_counter() - started) / repeat * 1e6, 2)
+
+
+async def _per_call_us_async(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        await fn()
+    return round((time.perf_counter() - started) / repeat * 1e6, 2)
+
+
+def frames(repeat: int) -> dict:
+    """Encode and decode of a voice chunk frame and a signaling backplane envelope."""
+    from innertone.core.serialization import dumps, dumps_bytes, loads
+
+    chunk = {"type": "chunk", "turn_id": 42, "text": REPLY[:80], "final": False}
+    envelope = {"origin": "worker-3f2a", "exclude": "peer-91c0", "message": json.dumps({"type": "offer", "sdp": "v=0\r\n" * 40})}
+    results = {}
+    for name, frame, encode in (("voice_chunk", chunk, dumps), ("signaling_envelope", envelope, dumps_bytes)):
+        encoded = encode(frame)
+        results[name] = {
+            "bytes": len(encoded),
+            "encode_us": {"json": _per_call_us(lambda: json.dumps(frame), repeat), "orjson": _per_call_us(lambda: encode(frame), repeat)},
+            "decode_us": {"json": _per_call_us(lambda: json.loads(encoded), repeat), "orjson": _per_call_us(lambda: loads(encoded), repeat)},
+        }
+    return results
+
+
+async def responses(repeat: int, page_size: int) -> dict:
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_model_field
+    from sqlalchemy import insert, select
+
+    from innertone.core.database import AsyncSessionLocal, engine
+    from innertone.core.serialization import ORJSONResponse
+    from innertone.models.booking import Appointment
+    from innertone.schemas.booking import AppointmentList, AppointmentPage
+    from innertone.schemas.chat import ChatResponse
+    from innertone.services import booking
+
+    def response_field(model):
+        return create_model_field(name=f"Response_{model.__name__}", type_=model, mode="serialization")
+
+    results = {}
+    chat = ChatResponse(
+        session_id="user-abc-123", response=REPLY, is_crisis=False,
+        sources=[{"book": "Feeling Good", "section": "Chapter 4"}] * 3, emotions=["anxious", "stressed"],
+    )
+    chat_field = response_field(ChatResponse)
+    results["chat_response_us"] = await _per_call_us_async(
+        lambda: serialize_response(field=chat_field, response_content=chat, dump_json=True), repeat,
+    )
+
+    # The untyped stats endpoints, with the default JSONResponse and with ORJSONResponse
+    stats = {"active": 12, "rooms": {f"room-{i}": {"peers": 2, "messages": i * 7, "rate": i / 3} for i in range(20)}}
+    results["stats_dict_us"] = {
+        "json_response": _per_call_us(lambda: JSONResponse(jsonable_encoder(stats)), repeat),
+        "orjson_response": _per_call_us(lambda: ORJSONResponse(stats), repeat),
+    }
+
+    # One page of a user's appointments, from the database to response bytes
+    now = datetime.now(timezone.utc)
+    async with engine.begin() as conn:
+        await conn.execute(insert(Appointment), [
+            {
+                "user_id": "bench-user", "therapist_name": f"Dr. {i % 7}", "scheduled_at": now + timedelta(hours=i),
+                "ends_at": now + timedelta(hours=i, minutes=50), "duration_minutes": 50, "status": "scheduled",
+                "created_at": now,
+            }
+            for i in range(page_size + 1)
+        ])
+    page_field = response_field(AppointmentPage)
+    # What list_user_appointments ran before it returned plain rows
+    query = (
+        select(Appointment).where(Appointment.user_id == "bench-user")
+        .order_by(Appointment.scheduled_at, Appointment.id).limit(page_size + 1)
+    )
+
+    async def orm_page():
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(query)).scalars().all()[:page_size]
+        await serialize_response(field=page_field, response_content=AppointmentPage(items=rows), dump_json=True)
+
+    async def row_page():
+        async with AsyncSessionLocal() as db:
+            rows, _ = await booking.list_user_appointments(db, "bench-user", limit=page_size)
+        await serialize_response(
+            field=page_field,
+            response_content=AppointmentPage(items=AppointmentList.validate_python(rows, from_attributes=True)),
+            dump_json=True,
+        )
+
+    page_repeat = max(1, repeat // 100)
+    results[f"appointment_page_{page_size}_us"] = {
+        "orm_objects": await _per_call_us_async(orm_page, page_repeat),
+        "rows_and_adapter": await _per_call_us_async(row_page, page_repeat),
+    }
+    await engine.dispose()
+    return results
+
+
+async def run(repeat: int, page_size: int) -> dict:
+    return {"repeat": repeat, "frames": frames(repeat), "responses": await responses(repeat, page_size)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20_000, help="Calls per measurement (pages: a hundredth of it)")
+    parser.add_argument("--page-size", type=int, default=200, help="Appointments per page (the API maximum is 200)")
+    args = parser.parse_args()
+
+    use_database()
+    from innertone.core.serialization import dumps
+
+    print(dumps(asyncio.run(run(args.repeat, args.page_size))))
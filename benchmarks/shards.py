@@ -0,0 +1,155 @@
+"""
+Sharded vector search: QPS, tail latency and recall of the scatter-gather
+path over local shard servers against searching the single index, on
+random vectors.
+
+    PYTHONPATH=. python -m benchmarks.shards --shards 4 --vectors 200000 [--slow-shard-ms 200]
+
+Needs neither the database nor Gemini: it builds a random index, splits it
+round-robin into --shards files and starts one `innertone.rag.shards serve`
+process per shard. --slow-shard-ms delays shard 0, to show the per-shard
+timeout trading recall for latency.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import percentile
+
+
+async def _measure(search, queries, concurrency: int) -> tuple[dict, list]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = [0.0] * len(queries)
+    results = [None] * len(queries)
+
+    async def one(i: int):
+        async with semaphore:
+            started = time.perf_counter()
+            results[i] = await search(queries[i : i + 1])
+            latencies[i] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(len(queries))))
+    elapsed = time.perf_counter() - started
+    return {
+        "qps": round(len(queries) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }, results
+
+
+async def _wait_ready(urls: list[str], servers: list, deadline: float = 60.0) -> None:
+    import httpx
+
+    async with httpx.AsyncClient() as client:
+        for url, server in zip(urls, servers):
+            while True:
+                if server.poll() is not None:
+                    raise RuntimeError(f"Shard server {url} exited with {server.returncode}")
+                try:
+                    if (await client.get(f"{url}/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if (deadline := deadline - 0.2) <= 0:
+                    raise RuntimeError(f"Shard server {url} did not start")
+                await asyncio.sleep(0.2)
+
+
+async def run(
+    shards: int,
+    vectors: int,
+    dimension: int,
+    queries: int,
+    concurrency: int,
+    top_k: int,
+    timeout_ms: float,
+    slow_shard_ms: float,
+    base_port: int,
+) -> dict:
+    import faiss
+    import numpy as np
+
+    from innertone.rag.shards import ShardClient, shard_path, write_shards
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        base = os.path.join(tmp, "bench.faiss")
+        index = faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+        index.add_with_ids(rng.random((vectors, dimension), dtype="float32"), np.arange(vectors, dtype="int64"))
+        sizes = write_shards(index, np.arange(vectors) % shards, shards, base)
+        sample = rng.random((queries, dimension), dtype="float32")
+
+        servers, urls = [], []
+        for shard in range(shards):
+            port = base_port + shard
+            command = [sys.executable, "-m", "innertone.rag.shards", "serve", "--index", shard_path(shard, base), "--port", str(port)]
+            if shard == 0 and slow_shard_ms:
+                command += ["--delay-ms", str(slow_shard_ms)]
+            servers.append(subprocess.Popen(command))
+            urls.append(f"http://127.0.0.1:{port}")
+        client = ShardClient(urls, timeout_ms / 1000)
+        try:
+            await _wait_ready(urls, servers)
+
+            # The single-index path searches on the event loop, as retrieval does
+            async def single(query):
+                return index.search(query, top_k)[1][0].tolist()
+
+            async def sharded(query):
+                return (await client.search(query[0].tolist(), top_k))[0]
+
+            await _measure(sharded, sample[: min(50, queries)], concurrency)  # warm up connections
+            client.degraded_queries = 0
+            single_report, exact = await _measure(single, sample, concurrency)
+            sharded_report, merged = await _measure(sharded, sample, concurrency)
+        finally:
+            await client.close()
+            for server in servers:
+                server.terminate()
+            for server in servers:
+                server.wait()
+
+    recall = sum(len(set(e) & set(m)) for e, m in zip(exact, merged)) / (queries * top_k)
+    return {
+        "vectors": vectors,
+        "shard_sizes": sizes,
+        "concurrency": concurrency,
+        "single": single_report,
+        "sharded": {
+            **sharded_report,
+            "recall_vs_single": round(recall, 4),
+            "degraded_queries": client.degraded_queries,
+        },
+    }
+
+
+if __name__ == "__main__":
+    # The shard servers import innertone, which needs a database URL even though they never use it
+    os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+    os.environ["ENVIRONMENT"] = "benchmark"
+    from innertone.core.config import get_settings
+    from innertone.core.serialization import dumps
+
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--vectors", type=int, default=200_000)
+    parser.add_argument("--dimension", type=int, default=settings.EMBEDDING_DIMENSIONS)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--top-k", type=int, default=settings.RAG_TOP_K)
+    parser.add_argument("--timeout-ms", type=float, default=settings.RAG_SHARD_TIMEOUT_MS)
+    parser.add_argument("--slow-shard-ms", type=float, default=0.0)
+    parser.add_argument("--base-port", type=int, default=8100)
+    args = parser.parse_args()
+
+    print(dumps(asyncio.run(run(
+        args.shards, args.vectors, args.dimension, args.queries, args.concurrency,
+        args.top_k, args.timeout_ms, args.slow_shard_ms, args.base_port,
+    ))))
@@ -0,0 +1,120 @@
+"""
+Cross-worker signaling relay: N ConnectionManagers sharing one backplane,
+each with its own connection, the two peers of every room on different
+managers. Reports relay throughput and latency, then reconnects one peer of
+every room while the other is live and checks that each room still relays.
+
+    PYTHONPATH=. python -m benchmarks.signaling --url redis://localhost:6379 --workers 4
+
+Without --url the managers share an in-process MemoryBroker, which measures
+the managers and send queues without a Redis round trip.
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks import percentile, use_database
+from innertone.core.serialization import dumps, loads
+
+
+class BenchSocket:
+    """Stands in for a peer's WebSocket, timing the bench messages it is sent."""
+
+    def __init__(self, latencies: list[float]):
+        self.latencies = latencies
+        self.received = 0
+
+    async def accept(self) -> None:
+        pass
+
+    async def send_text(self, message: str) -> None:
+        self.received += 1
+        self.latencies.append(time.perf_counter() - loads(message)["t"])
+
+    async def close(self) -> None:
+        pass
+
+
+async def run(url: str, workers: int, rooms: int, rate: float, duration: float) -> dict:
+    """
+    `rooms` calls of two peers, each sending `rate` messages per second for
+    `duration` seconds, relayed between `workers` managers over the backplane
+    at `url` (an in-process MemoryBroker when `url` is empty).
+    """
+    from innertone.services.signaling import ConnectionManager, MemoryBroker, PeerConnection, RedisBackplane
+
+    broker = MemoryBroker()
+    managers = [
+        ConnectionManager(RedisBackplane(url) if url else RedisBackplane(client=broker))
+        for _ in range(workers)
+    ]
+    latencies: list[float] = []
+    peers = []
+    for room in range(rooms):
+        session_id = f"bench-{room}"
+        for side in range(2):
+            manager = managers[(room + side) % workers]
+            peers.append((manager, session_id, await manager.connect(session_id, BenchSocket(latencies))))
+    await asyncio.sleep(0.5)
+
+    per_peer = int(rate * duration)
+
+    async def talk(index: int, manager: ConnectionManager, session_id: str, peer: PeerConnection):
+        # Spread the peers' sends evenly over the first interval
+        await asyncio.sleep(index / len(peers) / rate)
+        for _ in range(per_peer):
+            await manager.broadcast_to_room(session_id, dumps({"type": "candidate", "t": time.perf_counter()}), exclude=peer)
+            await asyncio.sleep(1 / rate)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(talk(i, *p) for i, p in enumerate(peers)))
+    elapsed = time.perf_counter() - started
+    await asyncio.sleep(1.0)
+    delivered = len(latencies)
+    expected = per_peer * len(peers)
+    dropped = sum(peer.dropped for _, _, peer in peers)
+
+    # Reconnect every room's first peer at once, as a network blip would
+    async def reconnect(manager: ConnectionManager, session_id: str, peer: PeerConnection) -> BenchSocket:
+        manager.disconnect(session_id, peer)
+        socket = BenchSocket([])
+        await manager.connect(session_id, socket)
+        return socket
+
+    sockets = await asyncio.gather(*(reconnect(*peers[2 * room]) for room in range(rooms)))
+    await asyncio.sleep(0.5)
+    for room in range(rooms):
+        manager, session_id, peer = peers[2 * room + 1]
+        await manager.broadcast_to_room(session_id, dumps({"type": "probe", "t": time.perf_counter()}), exclude=peer)
+    await asyncio.sleep(1.0)
+    unreachable = sum(socket.received == 0 for socket in sockets)
+    mismatched = sum(set(m.rooms) != m._subscribed for m in managers)
+
+    for manager in managers:
+        await manager.close()
+    return {
+        "backplane": "redis" if url else "memory",
+        "workers": workers,
+        "rooms": rooms,
+        "offered_msgs_per_s": round(expected / elapsed),
+        "delivered": f"{delivered}/{expected}",
+        "queue_drops": dropped,
+        "relay_p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "relay_p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "relay_p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "rooms_unreachable_after_reconnect": unreachable,
+        "workers_with_stale_subscriptions": mismatched,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="", help="Redis backplane URL (default: an in-process MemoryBroker)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rooms", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=10.0, help="Messages per second per peer")
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    use_database()
+    print(dumps(asyncio.run(run(args.url, args.workers, args.rooms, args.rate, args.duration))))
@@ -0,0 +1,88 @@
+"""
+Topic clustering: k-means time, labelling calls and how many of the
+corpus' themes come out as topics of their own, on synthetic clustered
+vectors, against k-means from FAISS's default random starting points.
+
+    PYTHONPATH=. python -m benchmarks.topics --chunks 100000 --clusters 32
+
+The vectors are --clusters themes (random centres plus noise); a theme is
+recovered when some cluster has it as its majority and no other theme
+shares that cluster. Labelling is one Gemini call per LABEL_BATCH clusters,
+whatever the corpus size, against one call per chunk for a per-chunk
+classifier. Needs neither the database nor Gemini.
+"""
+import argparse
+import math
+import os
+import time
+
+
+def _recovered(assignment, themes, clusters: int) -> int:
+    import numpy as np
+
+    majority = {}
+    for c in range(clusters):
+        members = themes[assignment == c]
+        if len(members):
+            majority[c] = int(np.bincount(members).argmax())
+    owners = np.bincount(list(majority.values()), minlength=clusters)
+    return int((owners == 1).sum())
+
+
+def run(chunks: int, dimensions: int, clusters: int) -> dict:
+    import faiss
+    import numpy as np
+
+    from innertone.rag import topics
+
+    rng = np.random.default_rng(0)
+    centres = rng.normal(size=(clusters, dimensions)).astype("float32")
+    themes = rng.integers(0, clusters, chunks)
+    vectors = centres[themes] + 0.3 * rng.normal(size=(chunks, dimensions)).astype("float32")
+
+    started = time.perf_counter()
+    kmeans = faiss.Kmeans(dimensions, clusters, niter=topics.KMEANS_ITERATIONS, seed=topics.KMEANS_SEED, verbose=False)
+    kmeans.train(vectors)
+    random_assignment = kmeans.index.search(vectors, 1)[1][:, 0]
+    random_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    centroids, assignment, distances = topics.cluster(vectors, clusters)
+    cluster_s = time.perf_counter() - started
+    started = time.perf_counter()
+    topics.nearest_members(assignment, distances, clusters, topics.LABEL_SAMPLES)
+    sample_s = time.perf_counter() - started
+    calls = math.ceil(clusters / topics.LABEL_BATCH)
+    return {
+        "chunks": chunks,
+        "dimensions": dimensions,
+        "clusters": clusters,
+        "random_init": {
+            "cluster_s": round(random_s, 2),
+            "themes_recovered": _recovered(random_assignment, themes, clusters),
+        },
+        "kmeans_pp_init": {
+            "cluster_s": round(cluster_s, 2),
+            "themes_recovered": _recovered(assignment, themes, clusters),
+        },
+        "label_samples_s": round(sample_s, 3),
+        "label_calls": calls,  # one call per LABEL_BATCH clusters, independent of corpus size
+        "per_chunk_llm_calls": chunks,
+    }
+
+
+if __name__ == "__main__":
+    # innertone reads a database URL on import even though this never uses it
+    os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+    os.environ["ENVIRONMENT"] = "benchmark"
+    from innertone.core.config import get_settings
+    from innertone.core.serialization import dumps
+
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--dimension", type=int, default=settings.EMBEDDING_DIMENSIONS)
+    parser.add_argument("--clusters", type=int, default=settings.TOPIC_CLUSTERS or 32)
+    args = parser.parse_args()
+
+    print(dumps(run(args.chunks, args.dimension, args.clusters)))
@@ -0,0 +1,118 @@
+"""
+Time to first sentence through the consultant against a simulated provider:
+the streaming path used by VoiceSession, and the previous loop, which waited
+for get_consultant_response's full reply before speaking.
+
+    PYTHONPATH=. python -m benchmarks.voice --ttft-ms 600 --tokens-per-s 80
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from types import SimpleNamespace
+
+from benchmarks import percentile, use_database
+
+REPLY = (
+    "It sounds like the pressure before exams has been building for a while, and it makes sense "
+    "that your mind keeps racing at night. Worry often feels like preparation, but it rarely "
+    "gives you anything new to work with once the lights are off. Tonight, try setting aside ten "
+    "minutes before bed to write down every worry and one small step for each, then close the "
+    "notebook as a signal that the thinking is done for the day. What usually goes through your "
+    "mind in the moments right before you try to fall asleep?"
+)
+
+
+class PacedClient:
+    """Stands in for genai.Client: REPLY after a first-token delay, at a fixed token rate."""
+
+    # Characters per streamed chunk (~4 tokens)
+    CHUNK_CHARS = 16
+
+    def __init__(self, ttft: float, tokens_per_s: float):
+        self.ttft = ttft
+        self.tokens_per_s = tokens_per_s
+        self.jitter = 1.0
+        self.aio = SimpleNamespace(models=self)
+
+    def _chunk_delay(self, chars: int) -> float:
+        return chars / 4 / self.tokens_per_s * self.jitter
+
+    async def generate_content(self, model: str, contents: list, config=None):
+        await asyncio.sleep(self.ttft * self.jitter + self._chunk_delay(len(REPLY)))
+        return SimpleNamespace(text=REPLY, usage_metadata=None)
+
+    async def generate_content_stream(self, model: str, contents: list, config=None):
+        async def stream():
+            await asyncio.sleep(self.ttft * self.jitter)
+            for start in range(0, len(REPLY), self.CHUNK_CHARS):
+                piece = REPLY[start:start + self.CHUNK_CHARS]
+                await asyncio.sleep(self._chunk_delay(len(piece)))
+                yield SimpleNamespace(text=piece, usage_metadata=None)
+
+        return stream()
+
+
+async def run(turns: int, ttft: float, tokens_per_s: float) -> dict:
+    """Time to first sentence (and to the full reply) per turn, for both paths on the same jitter."""
+    from innertone.services import consultant
+    from innertone.services.voice import SentenceChunker
+
+    client = PacedClient(ttft, tokens_per_s)
+    consultant._client = client
+
+    rng = random.Random(0)
+    message = "I can't sleep before exams, my mind keeps racing."
+    blocking, streaming, complete = [], [], []
+    for _ in range(turns):
+        client.jitter = 0.75 + 0.5 * rng.random()
+
+        started = time.perf_counter()
+        result = await consultant.get_consultant_response(message, [], None)
+        if SentenceChunker().feed(result["response"] + " "):
+            blocking.append(time.perf_counter() - started)
+
+        chunker = SentenceChunker()
+        first = None
+        started = time.perf_counter()
+        async for event in consultant.stream_consultant_response(message, [], None):
+            if event["type"] == "delta" and chunker.feed(event["text"]) and first is None:
+                first = time.perf_counter() - started
+        streaming.append(first)
+        complete.append(time.perf_counter() - started)
+
+    def summary(samples: list[float]) -> dict:
+        return {
+            "p50_ms": round(percentile(samples, 0.50) * 1000),
+            "p95_ms": round(percentile(samples, 0.95) * 1000),
+        }
+
+    return {
+        "turns": turns,
+        "provider": f"{ttft * 1000:.0f} ms to first token, {tokens_per_s:g} tokens/s, +/-25% jitter",
+        "reply_chars": len(REPLY),
+        "first_sentence_previous_loop": summary(blocking),
+        "first_sentence_streaming": summary(streaming),
+        "full_reply_streaming": summary(complete),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--ttft-ms", type=float, default=600.0, help="Simulated time to first token")
+    parser.add_argument("--tokens-per-s", type=float, default=80.0, help="Simulated output rate")
+    args = parser.parse_args()
+
+    # No retrieval, no provider-side caching and no rate limits: only the provider's pacing is measured
+    os.environ.update(
+        RAG_ENABLED="false",
+        CONTEXT_CACHE_ENABLED="false",
+        LLM_DEFAULT_RPM=str(10 ** 9),
+        LLM_DEFAULT_TPM=str(10 ** 9),
+    )
+    use_database()
+    from innertone.core.serialization import dumps
+
+    print(dumps(asyncio.run(run(args.turns, args.ttft_ms / 1000, args.tokens_per_s))))
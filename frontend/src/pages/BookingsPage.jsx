@@ -3,7 +3,10 @@ import { Calendar as CalendarIcon, Clock, User, CheckCircle2, Trash2 } from 'luc
 
 export default function BookingsPage() {
     const [appointments, setAppointments] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [showCancelled, setShowCancelled] = useState(false);
     const [isLoading, setIsLoading] = useState(true);
+    const [isLoadingMore, setIsLoadingMore] = useState(false);
     const [isSubmitLoading, setSubmitLoading] = useState(false);
     const [formData, setFormData] = useState({
         therapist_name: 'Dr. Sarah (Clinical Psychologist)',
@@ -15,11 +18,16 @@ export default function BookingsPage() {
     // Mock user session
     const userId = 'web-user-demo';
 
-    const fetchAppointments = async () => {
+    // Keyset-paginated: one page per call; pass the previous page's cursor to append the next
+    const fetchAppointments = async (cursor = null) => {
+        const params = new URLSearchParams();
+        if (!showCancelled) params.set('status', 'scheduled');
+        if (cursor) params.set('cursor', cursor);
         try {
-            const res = await fetch(`http://localhost:8000/api/v1/bookings/${userId}`);
-            const data = await res.json();
-            setAppointments(data);
+            const res = await fetch(`http://localhost:8000/api/v1/bookings/${userId}?${params}`);
+            const page = await res.json();
+            setAppointments(prev => (cursor ? prev.concat(page.items) : page.items));
+            setNextCursor(page.next_cursor);
         } catch (e) {
             console.error(e);
         } finally {
@@ -29,7 +37,13 @@ export default function BookingsPage() {
 
     useEffect(() => {
         fetchAppointments();
-    }, []);
+    }, [showCancelled]);
+
+    const handleLoadMore = async () => {
+        setIsLoadingMore(true);
+        await fetchAppointments(nextCursor);
+        setIsLoadingMore(false);
+    };
 
     const handleBook = async (e) => {
         e.preventDefault();
@@ -40,7 +54,7 @@ export default function BookingsPage() {
             // Combine date and time
             const scheduledAt = new Date(`${formData.date}T${formData.time}:00`).toISOString();
 
-            await fetch('http://localhost:8000/api/v1/bookings/', {
+            const res = await fetch('http://localhost:8000/api/v1/bookings/', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({
@@ -50,6 +64,12 @@ export default function BookingsPage() {
                     notes: formData.notes
                 })
             });
+            if (!res.ok) {
+                // 409: slot already taken, 422: outside the therapist's hours
+                const err = await res.json();
+                alert(typeof err.detail === 'string' ? err.detail : 'Could not book this time.');
+                return;
+            }
 
             // Reset form and refresh list
             setFormData({ ...formData, date: '', time: '', notes: '' });
@@ -63,8 +83,12 @@ export default function BookingsPage() {
 
     const handleCancel = async (id) => {
         try {
-            await fetch(`http://localhost:8000/api/v1/bookings/${id}`, { method: 'DELETE' });
-            fetchAppointments(); // Refresh
+            const res = await fetch(`http://localhost:8000/api/v1/bookings/${id}`, { method: 'DELETE' });
+            if (!res.ok) return;
+            // Update the loaded pages in place rather than reloading them
+            setAppointments(prev => showCancelled
+                ? prev.map(appt => (appt.id === id ? { ...appt, status: 'cancelled' } : appt))
+                : prev.filter(appt => appt.id !== id));
         } catch (error) {
             console.error(error);
         }
@@ -82,10 +106,16 @@ export default function BookingsPage() {
 
                 {/* List Section */}
                 <div style={{ display: 'flex', flexDirection: 'column', gap: '16px' }}>
-                    <h2 style={{ fontSize: '1.2rem', display: 'flex', alignItems: 'center', gap: '8px' }}>
-                        <CalendarIcon size={20} className="text-secondary" />
-                        Upcoming Sessions
-                    </h2>
+                    <div style={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center' }}>
+                        <h2 style={{ fontSize: '1.2rem', display: 'flex', alignItems: 'center', gap: '8px' }}>
+                            <CalendarIcon size={20} className="text-secondary" />
+                            Upcoming Sessions
+                        </h2>
+                        <label style={{ display: 'flex', alignItems: 'center', gap: '8px', fontSize: '0.85rem', color: 'var(--text-secondary)' }}>
+                            <input type="checkbox" checked={showCancelled} onChange={e => setShowCancelled(e.target.checked)} />
+                            Show cancelled
+                        </label>
+                    </div>
 
                     {isLoading ? (
                         <p style={{ color: 'var(--text-secondary)' }}>Loading appointments...</p>
@@ -122,6 +152,12 @@ export default function BookingsPage() {
                             </div>
                         ))
                     )}
+
+                    {nextCursor && !isLoading && (
+                        <button onClick={handleLoadMore} disabled={isLoadingMore} className="btn btn-ghost" style={{ alignSelf: 'center' }}>
+                            {isLoadingMore ? 'Loading...' : 'Load more'}
+                        </button>
+                    )}
                 </div>
 
                 {/* Booking Form Sidebar */}
@@ -77,38 +77,61 @@ const VoiceCallPage = () => {
         return `${mins.toString().padStart(2, '0')}:${secs.toString().padStart(2, '0')}`;
     };
 
-    // TTS
+    // TTS — sentences arrive one chunk at a time and are spoken in order.
+    // When the server marks the turn as ended and the queue drains, we ack it.
     const ttsResumeInterval = useRef(null);
+    const speechQueue = useRef([]);
+    const isSpeaking = useRef(false);
+    const pendingAck = useRef(null);
+    const pickVoice = () => {
+        const voices = window.speechSynthesis.getVoices();
+        if (gender === 'male') {
+            return voices.find(v => v.name.includes('Google UK English Male') || (v.name.includes('Male') && v.lang.startsWith('en'))) || voices.find(v => v.name.includes('Google US English')) || voices[0];
+        }
+        return voices.find(v => v.name.includes('Google US English') || v.name.includes('Female')) || voices[0];
+    };
+    const sendAckIfDone = () => {
+        if (isSpeaking.current || speechQueue.current.length || pendingAck.current === null) return;
+        if (aiWs.current && aiWs.current.readyState === WebSocket.OPEN) {
+            aiWs.current.send(JSON.stringify({ type: 'ack', turn_id: pendingAck.current }));
+        }
+        pendingAck.current = null;
+    };
+    const speakNext = () => {
+        const sentence = speechQueue.current.shift();
+        if (sentence === undefined) {
+            isSpeaking.current = false;
+            clearInterval(ttsResumeInterval.current);
+            sendAckIfDone();
+            return;
+        }
+        isSpeaking.current = true;
+        const utterance = new SpeechSynthesisUtterance(sentence);
+        utterance.rate = 0.95; utterance.pitch = gender === 'male' ? 0.85 : 1.1;
+        const preferredVoice = pickVoice();
+        if (preferredVoice) utterance.voice = preferredVoice;
+        utterance.onend = speakNext;
+        utterance.onerror = speakNext;
+        window.speechSynthesis.speak(utterance);
+    };
     const speakText = (text) => {
         if (!window.speechSynthesis) return;
-        window.speechSynthesis.cancel();
+        speechQueue.current.push(...(text.match(/[^.!?]+[.!?]+/g) || [text]).map(s => s.trim()).filter(Boolean));
+        if (isSpeaking.current) return;
         if (ttsResumeInterval.current) clearInterval(ttsResumeInterval.current);
         ttsResumeInterval.current = setInterval(() => {
             if (window.speechSynthesis.speaking) window.speechSynthesis.resume();
             else clearInterval(ttsResumeInterval.current);
         }, 5000);
-        const sentences = text.match(/[^.!?]+[.!?]+/g) || [text];
-        const voices = window.speechSynthesis.getVoices();
-        let preferredVoice;
-        if (gender === 'male') {
-            preferredVoice = voices.find(v => v.name.includes('Google UK English Male') || (v.name.includes('Male') && v.lang.startsWith('en'))) || voices.find(v => v.name.includes('Google US English')) || voices[0];
-        } else {
-            preferredVoice = voices.find(v => v.name.includes('Google US English') || v.name.includes('Female')) || voices[0];
-        }
-        let index = 0;
-        const speakNext = () => {
-            if (index >= sentences.length) { clearInterval(ttsResumeInterval.current); return; }
-            const sentence = sentences[index].trim();
-            if (!sentence) { index++; speakNext(); return; }
-            const utterance = new SpeechSynthesisUtterance(sentence);
-            utterance.rate = 0.95; utterance.pitch = gender === 'male' ? 0.85 : 1.1;
-            if (preferredVoice) utterance.voice = preferredVoice;
-            utterance.onend = () => { index++; speakNext(); };
-            utterance.onerror = () => { index++; speakNext(); };
-            window.speechSynthesis.speak(utterance);
-        };
         speakNext();
     };
+    const stopSpeaking = () => {
+        speechQueue.current = [];
+        pendingAck.current = null;
+        isSpeaking.current = false;
+        if (window.speechSynthesis) window.speechSynthesis.cancel();
+        if (ttsResumeInterval.current) clearInterval(ttsResumeInterval.current);
+    };
 
     // Audio Visualizer
     const initVisualizer = (stream) => {
@@ -159,15 +182,21 @@ const VoiceCallPage = () => {
             aiWs.current = new WebSocket(`${protocol}://${window.location.hostname}:8000/api/v1/calls/ai-voice/${sessionId}`);
             aiWs.current.onmessage = (event) => {
                 const data = JSON.parse(event.data);
+                if (data.type === 'ping') { aiWs.current.send(JSON.stringify({ type: 'pong' })); return; }
                 if (data.state) {
                     setAiState(data.state);
                     if (data.state === 'listening') setStatus('AI Listening');
                     else if (data.state === 'speaking') setStatus('AI Speaking');
                     else if (data.state === 'thinking') setStatus('InnerTone Thinking');
                 }
-                if (data.transcript) {
-                    setAiTranscript(data.transcript);
-                    if (data.state === 'speaking') speakText(data.transcript);
+                if (data.type === 'chunk') {
+                    setAiTranscript(prev => data.seq === 0 ? data.transcript : `${prev} ${data.transcript}`);
+                    speakText(data.transcript);
+                } else if (data.type === 'turn_end') {
+                    pendingAck.current = data.turn_id;
+                    sendAckIfDone();
+                } else if (data.type === 'interrupted') {
+                    stopSpeaking();
                 }
             };
             aiWs.current.onopen = () => console.log('AI WS Connected');
@@ -193,7 +222,14 @@ const VoiceCallPage = () => {
         recognition.lang = 'en-US'; recognition.interimResults = true; recognition.continuous = false;
         recognitionRef.current = recognition;
         speechTextRef.current = '';
-        recognition.onstart = () => { setIsRecording(true); setUserSpeechText(''); };
+        recognition.onstart = () => {
+            setIsRecording(true); setUserSpeechText('');
+            // Barge-in: the user talking over the AI cancels its reply
+            stopSpeaking();
+            if (aiWs.current && aiWs.current.readyState === WebSocket.OPEN) {
+                aiWs.current.send(JSON.stringify({ type: 'barge_in' }));
+            }
+        };
         recognition.onresult = (event) => {
             let transcript = '';
             for (let i = 0; i < event.results.length; i++) transcript += event.results[i][0].transcript;
@@ -355,7 +391,7 @@ const VoiceCallPage = () => {
                         <button
                             className={`btn ${isRecording ? 'btn-ghost' : 'btn-primary'}`}
                             onClick={isRecording ? stopListeningMic : startListeningMic}
-                            disabled={aiState === 'thinking' || aiState === 'speaking'}
+                            disabled={aiState === 'idle'}
                             style={{
                                 padding: '16px 32px', fontSize: '1.1rem', borderRadius: '999px',
                                 background: isRecording ? 'var(--emotion-stressed)' : undefined,
@@ -1,18 +1,36 @@
+"""
+Database initialisation: brings the schema up to date with Alembic.
+
+Databases created by the old create_all() version of this script have the
+tables but no migration history; they are stamped at the baseline revision
+first, so only the later migrations (e.g. partitioning) run against them.
+"""
 import asyncio
-from sqlalchemy.ext.asyncio import create_async_engine
-from innertone.core.database import Base, engine
-# Import the model to ensure it is registered with Base.metadata
-from innertone.models.document_metadata import DocumentMetadata
-from innertone.models.memory import ConversationMessage
-from innertone.models.emotion import EmotionRecord
-from innertone.models.booking import Appointment
+from pathlib import Path
+from sqlalchemy import inspect
+from alembic import command
+from alembic.config import Config
+from innertone.core.database import engine
+
+BASELINE_REVISION = "0001"
+
+
+async def existing_tables() -> set[str]:
+    async with engine.connect() as conn:
+        tables = await conn.run_sync(lambda sync_conn: set(inspect(sync_conn).get_table_names()))
+    await engine.dispose()
+    return tables
+
 
-async def init_models():
-    async with engine.begin() as conn:
-        print("Creating all tables...")
-        await conn.run_sync(Base.metadata.create_all)
+def init_models():
+    config = Config(str(Path(__file__).parent / "alembic.ini"))
+    tables = asyncio.run(existing_tables())
+    if "alembic_version" not in tables and "conversation_messages" in tables:
+        print("Existing schema without migration history, stamping baseline...")
+        command.stamp(config, BASELINE_REVISION)
+    print("Applying migrations...")
+    command.upgrade(config, "head")
     print("Database initialization complete.")
 
 if __name__ == "__main__":
-    from sqlalchemy import text
-    asyncio.run(init_models())
+    init_models()
@@ -0,0 +1,58 @@
+"""
+Admin Diagnostics API Router (v1)
+Flight recorder dump, event-loop lag and on-demand profiling.
+
+Disabled (404) unless ADMIN_DIAGNOSTICS_ENABLED is set; every request must
+carry the X-Admin-Token header matching ADMIN_TOKEN.
+"""
+import hmac
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from innertone.core.config import get_settings
+from innertone.core.serialization import ORJSONResponse
+from innertone.services import diagnostics
+
+settings = get_settings()
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    if not settings.ADMIN_DIAGNOSTICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not settings.ADMIN_TOKEN or not hmac.compare_digest(x_admin_token or "", settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+router = APIRouter(prefix="/admin/diagnostics", tags=["Admin"], dependencies=[Depends(require_admin)])
+
+
+@router.get("/slow-requests", summary="Slowest recent requests with per-stage timings")
+async def slow_requests(clear: bool = False):
+    """
+    Dumps the flight recorder: the slowest requests and voice turns since the
+    last clear, with stage timings, model attempts and DB time.
+    """
+    body = {"seen": diagnostics.recorder.seen, "slowest": diagnostics.recorder.slowest()}
+    if clear:
+        diagnostics.recorder.clear()
+    return ORJSONResponse(body)
+
+
+@router.get("/loop", summary="Event loop lag and captured stalls")
+async def loop_lag():
+    return ORJSONResponse(diagnostics.loop_monitor.snapshot())
+
+
+@router.post("/profile", response_class=PlainTextResponse, summary="Profile the event loop for a few seconds")
+async def run_profile(seconds: float = 5.0, engine: Literal["sampler", "pyinstrument", "cprofile"] = "sampler"):
+    """
+    Profiles this worker's event loop thread. "sampler" returns folded
+    stacks (flamegraph.pl / speedscope), the others a text report.
+    """
+    try:
+        return PlainTextResponse(await diagnostics.profile(seconds, engine))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ImportError as e:
+        raise HTTPException(status_code=501, detail=str(e))
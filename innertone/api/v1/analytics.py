@@ -0,0 +1,29 @@
+"""
+Analytics API Router (v1)
+Serves mood trends from the pre-aggregated mood_rollups table.
+"""
+from datetime import date
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from innertone.core.database import get_db
+from innertone.schemas.analytics import MoodTrendResponse
+from innertone.services.analytics import get_mood_trend
+
+router = APIRouter(prefix="/analytics", tags=["Analytics"])
+
+
+@router.get("/mood", response_model=MoodTrendResponse, summary="Mood trend for a session")
+async def mood_trend(
+    session_id: str = Query(..., max_length=128),
+    granularity: Literal["day", "week"] = "day",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Returns emotion counts and intensity distribution per day or week.
+    """
+    buckets = await get_mood_trend(db, session_id, granularity, start, end)
+    return MoodTrendResponse(session_id=session_id, granularity=granularity, buckets=buckets)
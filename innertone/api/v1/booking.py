@@ -2,16 +2,26 @@
 Booking API Router (v1)
 Handles scheduling, retrieving, and canceling wellness appointments.
 """
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import date
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 
 from innertone.core.database import get_db
-from innertone.schemas.booking import AppointmentCreate, AppointmentResponse
+from innertone.schemas.booking import (
+    AppointmentCreate, AppointmentResponse, AppointmentList, AppointmentPage,
+    AvailabilityWindow, AvailabilityResponse, AvailabilitySlot,
+    AppointmentBatchCreate, AppointmentBatchResponse,
+    AppointmentBatchCancel, AppointmentBatchCancelResponse,
+)
 from innertone.models.booking import Appointment
+from innertone.services import booking as booking_service
+from innertone.services.booking import BookingConflict, OutsideAvailability
 
 router = APIRouter(prefix="/bookings", tags=["Bookings"])
 
+AppointmentStatus = Literal["scheduled", "completed", "cancelled"]
+
 
 @router.post("/", response_model=AppointmentResponse, status_code=201, summary="Schedule a new appointment")
 async def create_appointment(
@@ -20,32 +30,103 @@ async def create_appointment(
 ):
     """
     Creates a new appointment booking in the database.
+    Returns 409 if the therapist is already booked for an overlapping time,
+    and 422 if the time is outside the therapist's availability.
+    """
+    try:
+        return await booking_service.create_appointment(
+            db,
+            user_id=booking.user_id,
+            therapist_name=booking.therapist_name,
+            scheduled_at=booking.scheduled_at,
+            duration_minutes=booking.duration_minutes,
+            notes=booking.notes,
+        )
+    except BookingConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except OutsideAvailability as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@router.post("/batch", response_model=AppointmentBatchResponse, summary="Schedule many appointments")
+async def create_appointments_batch(
+    batch: AppointmentBatchCreate,
+    db: AsyncSession = Depends(get_db),
+):
     """
-    new_appt = Appointment(
-        user_id=booking.user_id,
-        therapist_name=booking.therapist_name,
-        scheduled_at=booking.scheduled_at,
-        notes=booking.notes,
-        status="scheduled"
+    Books up to 10,000 appointments in one transaction. Each item gets its
+    own result; unavailable or conflicting items are skipped, not fatal.
+    """
+    try:
+        results = await booking_service.create_appointments_batch(db, [item.model_dump() for item in batch.items])
+    except BookingConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    created = sum(1 for r in results if r["status"] == "created")
+    return AppointmentBatchResponse(created=created, failed=len(results) - created, results=results)
+
+
+@router.post("/batch/cancel", response_model=AppointmentBatchCancelResponse, summary="Cancel many appointments")
+async def cancel_appointments_batch(
+    batch: AppointmentBatchCancel,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Cancels up to 10,000 appointments in one transaction.
+    """
+    results = await booking_service.cancel_appointments_batch(db, batch.appointment_ids)
+    return AppointmentBatchCancelResponse(results=results)
+
+
+@router.get("/availability/{therapist_name}", response_model=AvailabilityResponse, summary="Free slots for a therapist")
+async def get_availability(
+    therapist_name: str,
+    day: date,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Lists the bookable slots on a given day.
+    """
+    slots = await booking_service.free_slots(db, therapist_name, day)
+    return AvailabilityResponse(
+        therapist_name=therapist_name,
+        day=day,
+        slots=[AvailabilitySlot(start=start, end=end) for start, end in slots],
     )
-    db.add(new_appt)
-    await db.commit()
-    await db.refresh(new_appt)
-    return new_appt
 
 
-@router.get("/{user_id}", response_model=list[AppointmentResponse], summary="Get appointments for a user")
+@router.put("/availability/{therapist_name}", status_code=204, summary="Set a therapist's weekly hours")
+async def set_availability(
+    therapist_name: str,
+    windows: list[AvailabilityWindow],
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Replaces the therapist's weekly availability windows.
+    """
+    for w in windows:
+        if w.end_time <= w.start_time:
+            raise HTTPException(status_code=422, detail="end_time must be after start_time")
+    await booking_service.set_availability(db, therapist_name, [w.model_dump() for w in windows])
+    return None
+
+
+@router.get("/{user_id}", response_model=AppointmentPage, summary="Get appointments for a user")
 async def get_user_appointments(
     user_id: str,
+    status: Optional[AppointmentStatus] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(None, ge=1, le=booking_service.MAX_PAGE_SIZE),
     db: AsyncSession = Depends(get_db),
 ):
     """
-    Retrieves all appointments for a specific user ID.
+    Retrieves a user's appointments in time order, one page at a time.
+    Pass the returned next_cursor to fetch the following page.
     """
-    result = await db.execute(
-        select(Appointment).where(Appointment.user_id == user_id).order_by(Appointment.scheduled_at.asc())
-    )
-    return result.scalars().all()
+    try:
+        items, next_cursor = await booking_service.list_user_appointments(db, user_id, status, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return AppointmentPage(items=AppointmentList.validate_python(items, from_attributes=True), next_cursor=next_cursor)
 
 
 @router.delete("/{appointment_id}", status_code=204, summary="Cancel an appointment")
@@ -54,11 +135,10 @@ async def cancel_appointment(
     db: AsyncSession = Depends(get_db),
 ):
     """
-    Marks an appointment as cancelled.
+    Marks an appointment as cancelled, which frees its time slot.
     """
-    result = await db.execute(select(Appointment).where(Appointment.id == appointment_id))
-    appt = result.scalar_one_or_none()
-    
+    appt = await db.get(Appointment, appointment_id)
+
     if not appt:
         raise HTTPException(status_code=404, detail="Appointment not found")
         
@@ -1,26 +1,107 @@
 """
 Chat API Router (v1)
 Handles user messages, calls the consultant engine, persists memory, and returns a response.
+
+Duplicate submissions (client retries, double taps) are coalesced: requests
+for the same session with the same message — or the same Idempotency-Key
+header — share one consultant run and one set of persisted rows. Reusing an
+Idempotency-Key with a different body is rejected with 422.
 """
 import asyncio
-from fastapi import APIRouter, Depends
-from sqlalchemy.ext.asyncio import AsyncSession
+import csv
+import hashlib
+import io
+import re
+from typing import Literal
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import StreamingResponse
 
-from innertone.core.database import get_db
+from innertone.core.config import get_settings
+from innertone.core.database import AsyncSessionLocal
+from innertone.core.serialization import dumps_bytes
 from innertone.schemas.chat import ChatRequest, ChatResponse
 from innertone.services.consultant import get_consultant_response
-from google.genai.errors import APIError, ClientError
-from innertone.services.memory import get_history, save_message
+from innertone.services.memory import get_history, save_message, iter_messages
 from innertone.services.emotion import detect_emotion
+from innertone.services.llm_scheduler import SchedulerOverloaded
+from innertone.services.singleflight import KeyReused, SingleFlight
+from innertone.services.analytics import apply_emotion_records
+from innertone.services.diagnostics import stage
 from innertone.models.emotion import EmotionRecord
 
+settings = get_settings()
+
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
+_chat_flight = SingleFlight(window=settings.CHAT_DEDUP_WINDOW_SECONDS)
+
+
+def _dedup_key(request: ChatRequest, idempotency_key: str | None) -> tuple:
+    if idempotency_key:
+        return (request.session_id, "key", idempotency_key)
+    digest = hashlib.sha256(request.message.encode()).hexdigest()
+    return (request.session_id, "message", digest)
+
+
+def _body_digest(request: ChatRequest) -> str:
+    """Fingerprint stored with an Idempotency-Key, to catch its reuse for another body."""
+    return hashlib.sha256(request.model_dump_json().encode()).hexdigest()
+
+
+async def _process_message(request: ChatRequest) -> ChatResponse:
+    """
+    Runs one chat turn end to end. Uses its own DB session because the
+    result may be shared with (and outlive) the request that started it.
+    """
+    async with AsyncSessionLocal() as db:
+        # 1. Load conversation history from memory (PostgreSQL)
+        with stage("history"):
+            history = await get_history(request.session_id, db)
+
+        # 2. Run Consultant Engine and Emotion Detection in parallel
+        # We wrap detect_emotion and get_consultant_response in gather
+        # so they start simultaneously.
+        emotion_task = asyncio.create_task(detect_emotion(request.message))
+        consultant_task = asyncio.create_task(get_consultant_response(
+            user_message=request.message,
+            conversation_history=history,
+            db=db,
+        ))
+
+        with stage("generate"):
+            emotion_result, result = await asyncio.gather(emotion_task, consultant_task)
+
+        with stage("persist"):
+            # 3. Persist conversation messages
+            await save_message(request.session_id, "user", request.message, db, is_crisis=result["is_crisis"])
+            await save_message(request.session_id, "model", result["response"], db, is_crisis=result["is_crisis"])
+
+            # 4. Persist emotion record and fold it into the mood rollups
+            emotion_record = EmotionRecord(
+                session_id=request.session_id,
+                message_snippet=request.message[:300],
+                emotions=emotion_result["emotions"],
+                intensity=emotion_result["intensity"],
+                detection_method=emotion_result["method"],
+            )
+            db.add(emotion_record)
+            await apply_emotion_records(db, [emotion_record])
+            await db.commit()
+
+    return ChatResponse(
+        session_id=request.session_id,
+        response=result["response"],
+        is_crisis=result["is_crisis"],
+        sources=result["sources"],
+        emotions=emotion_result["emotions"],
+        emotion_intensity=emotion_result["intensity"],
+    )
+
 
 @router.post("/", response_model=ChatResponse, summary="Send a message to InnerTone AI")
 async def send_message(
     request: ChatRequest,
-    db: AsyncSession = Depends(get_db),
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key", max_length=128),
 ) -> ChatResponse:
     """
     Main chat endpoint.
@@ -31,22 +112,22 @@ async def send_message(
     3. Save user message + AI response to memory
     4. Return structured response
     """
-    # 1. Load conversation history from memory (PostgreSQL)
-    history = await get_history(request.session_id, db)
+    # Imported here so the router can be mounted without loading the SDK
+    from google.genai.errors import APIError, ClientError
 
-    # 2. Run Consultant Engine and Emotion Detection in parallel
     try:
-        # We wrap detect_emotion and get_consultant_response in gather
-        # so they start simultaneously.
-        emotion_task = asyncio.create_task(detect_emotion(request.message))
-        consultant_task = asyncio.create_task(get_consultant_response(
-            user_message=request.message,
-            conversation_history=history,
-            db=db,
-        ))
-        
-        emotion_result, result = await asyncio.gather(emotion_task, consultant_task)
-    except (APIError, ClientError) as api_err:
+        return await _chat_flight.do(
+            _dedup_key(request, idempotency_key),
+            lambda: _process_message(request),
+            window=settings.IDEMPOTENCY_KEY_TTL_SECONDS if idempotency_key else None,
+            fingerprint=_body_digest(request) if idempotency_key else None,
+        )
+    except KeyReused:
+        raise HTTPException(
+            status_code=422,
+            detail="This Idempotency-Key was already used with a different request body.",
+        )
+    except (APIError, ClientError, SchedulerOverloaded) as api_err:
         return ChatResponse(
             session_id=request.session_id,
             response=f"I'm sorry, our AI service is currently unavailable. Please check your API key or try again later.",
@@ -61,26 +142,46 @@ async def send_message(
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
-    # 4. Persist conversation messages
-    await save_message(request.session_id, "user", request.message, db, is_crisis=result["is_crisis"])
-    await save_message(request.session_id, "model", result["response"], db, is_crisis=result["is_crisis"])
 
-    # 5. Persist emotion record
-    db.add(EmotionRecord(
-        session_id=request.session_id,
-        message_snippet=request.message[:300],
-        emotions=emotion_result["emotions"],
-        intensity=emotion_result["intensity"],
-        detection_method=emotion_result["method"],
-    ))
-    await db.commit()
+EXPORT_FIELDS = ("id", "role", "content", "is_crisis", "created_at")
 
-    # 6. Return response
-    return ChatResponse(
-        session_id=request.session_id,
-        response=result["response"],
-        is_crisis=result["is_crisis"],
-        sources=result["sources"],
-        emotions=emotion_result["emotions"],
-        emotion_intensity=emotion_result["intensity"],
+
+async def _export_rows(session_id: str, fmt: str):
+    # Own session: the response body is streamed after the endpoint returns
+    async with AsyncSessionLocal() as db:
+        if fmt == "csv":
+            yield ",".join(EXPORT_FIELDS) + "\r\n"
+        async for batch in iter_messages(session_id, db):
+            rows = [
+                {
+                    "id": m.id,
+                    "role": m.role,
+                    "content": m.content,
+                    "is_crisis": m.is_crisis,
+                    "created_at": m.created_at.isoformat() if m.created_at else None,
+                }
+                for m in batch
+            ]
+            if fmt == "csv":
+                buffer = io.StringIO()
+                csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS).writerows(rows)
+                yield buffer.getvalue()
+            else:
+                yield b"".join(dumps_bytes(row, newline=True) for row in rows)
+
+
+@router.get("/{session_id}/export", summary="Export a session transcript")
+async def export_session(session_id: str, format: Literal["ndjson", "csv"] = "ndjson"):
+    """
+    Streams every message of a session as NDJSON or CSV, oldest first.
+    Rows are read in batches through a server-side cursor, so large
+    transcripts are never held in memory.
+    """
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = re.sub(r"[^A-Za-z0-9_.-]", "_", session_id)
+    return StreamingResponse(
+        _export_rows(session_id, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{format}"'},
     )
+
@@ -10,6 +10,113 @@ class Settings(BaseSettings):
     # Vector DB settings
     EMBEDDING_MODEL_NAME: str = "models/gemini-embedding-001"
     EMBEDDING_DIMENSIONS: int = 768  # Default for Gemini text-embedding-004
+    # When disabled, the consultant answers without book context and
+    # faiss/langchain are never imported.
+    RAG_ENABLED: bool = True
+    # Book excerpts injected into each consultant prompt
+    RAG_TOP_K: int = 4
+    FAISS_INDEX_PATH: str = "/home/ca/Projects/InnerTone/innertone_index.faiss"
+    # Content-addressed store of every embedding computed (rag/embeddings.py),
+    # read by ingestion, index rebuilds and evaluation; empty dir =
+    # "embeddings" next to the FAISS index
+    EMBEDDING_STORE_ENABLED: bool = True
+    EMBEDDING_STORE_DIR: str = ""
+    # Chat query embeddings are kept in memory only, at most this many per
+    # worker, so the store does not grow with every message; evaluation
+    # runs still persist theirs
+    EMBEDDING_QUERY_CACHE_SIZE: int = 10_000
+    # Chunk topics (rag/topics.py): k-means clusters of the chunk vectors,
+    # labelled once each; at most this many. 0 skips the ingestion stage.
+    TOPIC_CLUSTERS: int = 32
+    # Deleted/replaced book chunks are filtered at query time; the index is
+    # compacted in the background once this share of it is dead
+    INDEX_COMPACTION_THRESHOLD: float = 0.2
+    INDEX_COMPACTION_INTERVAL_HOURS: float = 1.0  # 0 disables the in-app job
+    # Sharded retrieval (rag/shards.py): the index is split by book into
+    # RAG_SHARD_COUNT files, re-split after ingestion and compaction. With
+    # RAG_SHARD_URLS set, workers scatter queries to those shard servers
+    # instead of loading the index; a shard slower than the timeout is left
+    # out of that query's results.
+    RAG_SHARD_COUNT: int = 0
+    RAG_SHARD_URLS: list[str] = []
+    RAG_SHARD_TIMEOUT_MS: float = 300.0
+    
+    # WebRTC signaling: empty = single-process rooms, redis://... = cross-worker pub/sub
+    SIGNALING_BACKPLANE_URL: str = ""
+    SIGNALING_SEND_QUEUE_SIZE: int = 64
+    # "drop_oldest" or "close" when a peer's send queue is full
+    SIGNALING_SLOW_CONSUMER_POLICY: str = "drop_oldest"
+
+    # WebSocket lifecycle limits for the calls endpoints
+    WS_HEARTBEAT_INTERVAL: float = 20.0  # seconds between server pings
+    WS_IDLE_TIMEOUT: float = 60.0  # close sockets silent for this long
+    WS_MAX_MESSAGE_BYTES: int = 65_536
+    WS_MESSAGES_PER_SECOND: float = 10.0  # per session
+    WS_MESSAGE_BURST: int = 50
+    WS_CONNECTS_PER_MINUTE: int = 30  # per client IP
+    WS_MAX_CONNECTIONS_PER_SESSION: int = 4
+    # AI voice: at most this many consultant calls in flight per session,
+    # and user messages arriving within the window are merged into one turn
+    VOICE_MAX_CONCURRENT_TURNS: int = 1
+    VOICE_COALESCE_SECONDS: float = 0.6
+    VOICE_MAX_PENDING_MESSAGES: int = 5
+
+    # LLM scheduler: every Gemini call is admitted against these budgets
+    LLM_MAX_CONCURRENCY: int = 16
+    LLM_MAX_QUEUE: int = 256
+    LLM_DEFAULT_RPM: int = 60
+    LLM_DEFAULT_TPM: int = 1_000_000
+    # Per-model overrides as JSON, e.g. {"gemini-2.5-flash": {"rpm": 1000, "tpm": 4000000}}
+    LLM_MODEL_LIMITS: dict[str, dict[str, int]] = {}
+    # Queue depth at which emotion/summary calls fall back to local heuristics
+    LLM_DEGRADE_QUEUE_DEPTH: int = 20
+
+    # Emotion classification: messages arriving within the window (or until
+    # EMOTION_BATCH_MAX are waiting) share one Gemini call; 0 disables batching
+    EMOTION_BATCH_WINDOW_MS: float = 50.0
+    EMOTION_BATCH_MAX: int = 16
+
+    # Provider-side context caching of the system prompt and hot excerpt
+    # bundles (Gemini explicit caching). Prefixes below the provider's
+    # minimum size (1024 tokens on Flash) are never cached.
+    CONTEXT_CACHE_ENABLED: bool = True
+    CONTEXT_CACHE_TTL_SECONDS: int = 3600
+    CONTEXT_CACHE_REFRESH_MARGIN_SECONDS: int = 300
+    CONTEXT_CACHE_MIN_TOKENS: int = 1024
+    CONTEXT_CACHE_HOT_THRESHOLD: int = 3  # retrievals before an excerpt bundle is cached
+    CONTEXT_CACHE_MAX_ENTRIES: int = 32
+
+    # Chat de-duplication: identical (session, message) requests within this
+    # window share one reply; an Idempotency-Key header is honoured for longer
+    CHAT_DEDUP_WINDOW_SECONDS: float = 10.0
+    IDEMPOTENCY_KEY_TTL_SECONDS: float = 300.0
+
+    # Storage lifecycle for conversation_messages / emotion_records (Postgres):
+    # monthly partitions are created this far ahead, and partitions older than
+    # RETENTION_MONTHS are archived to ARCHIVE_DIR (if set) and dropped.
+    PARTITION_MONTHS_AHEAD: int = 3
+    RETENTION_MONTHS: int = 0  # 0 keeps everything
+    ARCHIVE_DIR: str = ""
+    ARCHIVE_FORMAT: str = "jsonl"  # "jsonl" (gzip) or "parquet" (needs pyarrow)
+    PARTITION_MAINTENANCE_INTERVAL_HOURS: float = 6.0  # 0 disables the in-app job
+
+    # Bookings: therapists without configured availability work these
+    # hours on these weekdays (0 = Monday), in BOOKING_TIMEZONE
+    BOOKING_TIMEZONE: str = "UTC"
+    BOOKING_DEFAULT_HOURS: str = "09:00-17:00"
+    BOOKING_DEFAULT_WEEKDAYS: list[int] = [0, 1, 2, 3, 4]
+    BOOKING_DEFAULT_DURATION_MINUTES: int = 50
+    BOOKING_PAGE_SIZE: int = 50
+
+    # Diagnostics: flight recorder of the slowest requests and an event-loop
+    # lag monitor (cheap enough to leave on). The admin endpoints that dump
+    # them and run profiles need ADMIN_DIAGNOSTICS_ENABLED and an X-Admin-Token.
+    DIAGNOSTICS_ENABLED: bool = True
+    DIAGNOSTICS_SLOW_REQUESTS: int = 50
+    LOOP_LAG_INTERVAL: float = 0.5  # seconds between loop lag probes
+    LOOP_STALL_THRESHOLD: float = 0.25  # capture the loop's stack when blocked this long
+    ADMIN_DIAGNOSTICS_ENABLED: bool = False
+    ADMIN_TOKEN: str = ""
     
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding='utf-8', extra='ignore')
 
@@ -0,0 +1,32 @@
+"""
+JSON Serialization
+orjson-backed helpers for the places that build JSON by hand: WebSocket
+frames, the signaling backplane, NDJSON exports and untyped endpoints.
+
+Endpoints with a response_model do not need these: FastAPI serializes
+their responses straight to bytes through pydantic-core, and setting a
+custom default response class would switch that fast path off.
+"""
+from typing import Any
+import orjson
+from fastapi.responses import JSONResponse
+
+
+def dumps(obj: Any) -> str:
+    return orjson.dumps(obj).decode()
+
+
+def dumps_bytes(obj: Any, newline: bool = False) -> bytes:
+    return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE if newline else None)
+
+
+def loads(data: str | bytes) -> Any:
+    """Raises ValueError (orjson.JSONDecodeError) on malformed input, like json.loads."""
+    return orjson.loads(data)
+
+
+class ORJSONResponse(JSONResponse):
+    """For endpoints returning plain dicts; skips jsonable_encoder when returned directly."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
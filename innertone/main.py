@@ -1,15 +1,56 @@
 """
 FastAPI Application Entry Point
 """
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from innertone.api.v1.chat import router as chat_router
+from innertone.core.config import get_settings
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    settings = get_settings()
+    if settings.DIAGNOSTICS_ENABLED:
+        from innertone.core.database import engine
+        from innertone.services.diagnostics import instrument_engine, loop_monitor
+        instrument_engine(engine)
+        loop_monitor.start()
+
+    # Partition creation / retention for the history tables (Postgres only)
+    maintenance = None
+    if settings.PARTITION_MAINTENANCE_INTERVAL_HOURS > 0:
+        from innertone.core.database import engine
+        from innertone.services.partitions import maintenance_loop
+        if engine.dialect.name == "postgresql":
+            maintenance = asyncio.create_task(maintenance_loop(engine))
+
+    # Drops deleted/replaced book chunks from the FAISS index once enough pile up
+    compaction = None
+    if settings.RAG_ENABLED and settings.INDEX_COMPACTION_INTERVAL_HOURS > 0:
+        from innertone.rag.store import compaction_loop
+        compaction = asyncio.create_task(compaction_loop())
+    yield
+    if maintenance is not None:
+        maintenance.cancel()
+    if compaction is not None:
+        compaction.cancel()
+    if settings.RAG_ENABLED and settings.RAG_SHARD_URLS:
+        from innertone.rag.shards import get_shard_client
+        await get_shard_client().close()
+    if settings.DIAGNOSTICS_ENABLED:
+        loop_monitor.stop()
+    # Close signaling peers and the cross-worker backplane connection
+    from innertone.api.v1.calls import manager
+    await manager.close()
+
 
 def create_app() -> FastAPI:
     app = FastAPI(
         title="InnerTone API",
         description="AI Mental Wellness Consultation Platform",
         version="0.1.0",
+        lifespan=lifespan,
     )
 
     # CORS — allow all origins in dev, restrict in prod
@@ -20,6 +61,10 @@ def create_app() -> FastAPI:
         allow_methods=["*"],
         allow_headers=["*"],
     )
+    # Per-request traces for the slow-request flight recorder
+    if get_settings().DIAGNOSTICS_ENABLED:
+        from innertone.services.diagnostics import FlightRecorderMiddleware
+        app.add_middleware(FlightRecorderMiddleware)
 
     # Routers
     app.include_router(chat_router, prefix="/api/v1")
@@ -27,11 +72,37 @@ def create_app() -> FastAPI:
     app.include_router(calls_router, prefix="/api/v1")
     from innertone.api.v1.booking import router as booking_router
     app.include_router(booking_router, prefix="/api/v1")
+    from innertone.api.v1.analytics import router as analytics_router
+    app.include_router(analytics_router, prefix="/api/v1")
+    from innertone.api.v1.admin import router as admin_router
+    app.include_router(admin_router, prefix="/api/v1")
 
     @app.get("/health", tags=["Health"])
     async def health():
         return {"status": "ok", "service": "InnerTone"}
 
+    @app.get("/health/llm", tags=["Health"])
+    async def llm_health():
+        """LLM scheduler queue depth, admissions, shedding and wait times, plus context cache and emotion batching."""
+        from innertone.core.serialization import ORJSONResponse
+        from innertone.services.context_cache import get_context_cache
+        from innertone.services.emotion import get_emotion_batcher
+        from innertone.services.llm_scheduler import get_scheduler
+        return ORJSONResponse({
+            **get_scheduler().snapshot(),
+            "context_cache": get_context_cache().snapshot(),
+            "emotion_batching": get_emotion_batcher().snapshot(),
+        })
+
+    @app.get("/health/rag", tags=["Health"])
+    async def rag_health():
+        """Retrieval mode, and per-shard successes, timeouts, errors and latency when sharded."""
+        settings = get_settings()
+        if not settings.RAG_SHARD_URLS:
+            return {"enabled": settings.RAG_ENABLED, "mode": "local"}
+        from innertone.rag.shards import get_shard_client
+        return {"enabled": settings.RAG_ENABLED, "mode": "sharded", **get_shard_client().snapshot()}
+
     return app
 
 app = create_app()
@@ -0,0 +1,33 @@
+"""
+MoodRollup ORM Model
+Pre-aggregated emotion counts per session and day/week, maintained
+incrementally as EmotionRecords are written, so trend queries never scan
+emotion_records.
+"""
+from sqlalchemy import Column, Integer, String, Date, DateTime, UniqueConstraint
+from sqlalchemy.sql import func
+from innertone.core.database import Base
+
+# Pseudo-emotion row holding the number of records in the bucket
+ALL_EMOTIONS = "*"
+
+
+class MoodRollup(Base):
+    __tablename__ = "mood_rollups"
+    __table_args__ = (
+        UniqueConstraint("session_id", "granularity", "period_start", "emotion", name="uq_mood_rollup_bucket"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(String(128), nullable=False)
+    # "day" or "week" (weeks start on Monday)
+    granularity = Column(String(8), nullable=False)
+    period_start = Column(Date, nullable=False)
+    # An Emotion value, or ALL_EMOTIONS for the bucket total
+    emotion = Column(String(32), nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    # Intensity distribution of the records counted above
+    intensity_low = Column(Integer, nullable=False, default=0)
+    intensity_medium = Column(Integer, nullable=False, default=0)
+    intensity_high = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
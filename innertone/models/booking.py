@@ -1,18 +1,43 @@
 """
 Appointment Booking ORM Model
 """
-from sqlalchemy import Column, Integer, String, DateTime, Text
+from sqlalchemy import Column, Index, Integer, String, DateTime, Text, Time
 from sqlalchemy.sql import func
 from innertone.core.database import Base
 
 
 class Appointment(Base):
     __tablename__ = "appointments"
+    __table_args__ = (
+        # Per-user listing with keyset pagination on (scheduled_at, id)
+        Index("ix_appointments_user_scheduled", "user_id", "scheduled_at"),
+        # On Postgres, migration 0003 also adds the exclusion constraint
+        # "ex_appointments_no_overlap": no two scheduled appointments of the
+        # same therapist may have overlapping [scheduled_at, ends_at) ranges.
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(String(128), nullable=False, index=True)
     therapist_name = Column(String(128), nullable=False)
     scheduled_at = Column(DateTime(timezone=True), nullable=False)
+    duration_minutes = Column(Integer, nullable=False, default=50)
+    # scheduled_at + duration, stored so the overlap constraint can index it
+    ends_at = Column(DateTime(timezone=True), nullable=False)
     notes = Column(Text, nullable=True)
     status = Column(String(32), default="scheduled", nullable=False)  # scheduled, completed, cancelled
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class TherapistAvailability(Base):
+    """A weekly working window; a therapist may have several per weekday."""
+    __tablename__ = "therapist_availability"
+
+    id = Column(Integer, primary_key=True, index=True)
+    therapist_name = Column(String(128), nullable=False, index=True)
+    # 0 = Monday ... 6 = Sunday
+    weekday = Column(Integer, nullable=False)
+    # Local times in BOOKING_TIMEZONE
+    start_time = Column(Time, nullable=False)
+    end_time = Column(Time, nullable=False)
+    # Length of the bookable slots offered inside the window
+    slot_minutes = Column(Integer, nullable=False, default=50)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, JSON
+from sqlalchemy import Column, Integer, String, Text, JSON, DateTime
 from innertone.core.database import Base
 
 class DocumentMetadata(Base):
@@ -15,3 +15,6 @@ class DocumentMetadata(Base):
     content = Column(Text, nullable=False)
     # Metadata for additional info (page number, token count, etc)
     metadata_json = Column(JSON, nullable=True)
+    # Tombstone: set when the book is deleted or replaced. Retrieval skips
+    # these rows; compaction removes them and their vectors.
+    deleted_at = Column(DateTime(timezone=True), nullable=True, index=True)
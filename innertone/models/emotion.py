@@ -1,16 +1,19 @@
 """
 EmotionRecord ORM Model
 Stores the detected emotion for each user message for mood trend tracking.
+Range-partitioned by month on created_at, like conversation_messages.
 """
 from sqlalchemy import Column, Integer, String, JSON, ForeignKey, DateTime
 from sqlalchemy.sql import func
 from innertone.core.database import Base
+from innertone.models.memory import utcnow
 
 
 class EmotionRecord(Base):
     __tablename__ = "emotion_records"
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     session_id = Column(String(128), nullable=False, index=True)
     # The raw user message snippet (first 300 chars for audit)
     message_snippet = Column(String(300), nullable=True)
@@ -20,4 +23,4 @@ class EmotionRecord(Base):
     intensity = Column(String(16), nullable=False, default="medium")
     # "keyword" or "gemini"
     detection_method = Column(String(16), nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), primary_key=True, default=utcnow, server_default=func.now())
@@ -1,16 +1,30 @@
 """
 ConversationMessage ORM Model
 Stores every message in a user conversation for memory retrieval.
+
+On Postgres the table is range-partitioned by month on created_at (see
+migrations/ and services/partitions.py), so created_at is part of the
+primary key and is set client-side to route each row to its partition.
 """
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime
+from datetime import datetime, timezone
+from sqlalchemy import Column, Index, Integer, String, Text, Boolean, DateTime
 from sqlalchemy.sql import func
 from innertone.core.database import Base
 
 
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
 class ConversationMessage(Base):
     __tablename__ = "conversation_messages"
+    __table_args__ = (
+        # get_history: newest messages of one session
+        Index("ix_conversation_messages_session_created", "session_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     # Session ID groups messages into one conversation
     session_id = Column(String(128), nullable=False, index=True)
     # "user" or "model"
@@ -18,5 +32,16 @@ class ConversationMessage(Base):
     content = Column(Text, nullable=False)
     # Flag for crisis detection — marks the session as high-risk
     is_crisis = Column(Boolean, default=False, nullable=False)
-    # Auto-populated timestamp
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Auto-populated timestamp; also the partition key
+    created_at = Column(DateTime(timezone=True), primary_key=True, default=utcnow, server_default=func.now())
+
+
+class SessionSummary(Base):
+    """Rolling summary of the turns that fell out of a session's memory window."""
+    __tablename__ = "session_summaries"
+
+    session_id = Column(String(128), primary_key=True)
+    summary = Column(Text, nullable=False)
+    # Number of messages folded into the summary so far
+    summarised_count = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
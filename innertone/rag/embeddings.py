@@ -0,0 +1,277 @@
+"""
+Embedding Store
+Durable, content-addressed cache of embeddings, so no text is sent to the
+embedding API twice: re-ingesting a book (identical chunks across editions
+included), rebuilding the FAISS index and evaluation runs all read through
+it. Chat queries only go through a bounded in-memory LRU per worker; they
+are too many and too rarely repeated to append and fsync each one on the
+request path.
+
+One namespace per (model, dimensions, kind), kind being "document" or
+"query" (Gemini embeds the two differently), under EMBEDDING_STORE_DIR:
+  - vectors.f32: float32 matrix, one row per text, appended to and read
+    memory-mapped
+  - keys.bin: sha256 of each row's normalized text (whitespace collapsed,
+    NFC), 32 bytes per row; loaded into an in-memory hash index on open
+Only hashes and vectors are kept, never the text itself.
+
+Rows are appended under a lock file, vectors before keys, so a crashed
+append leaves at most a partial tail that is ignored and overwritten.
+Readers pick up rows appended by other processes on their next lookup.
+
+    PYTHONPATH=. python -m innertone.rag.embeddings stats
+
+benchmarks/embeddings.py times an index rebuild from the store against
+re-embedding.
+"""
+import fcntl
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from functools import lru_cache
+from typing import TYPE_CHECKING, Callable
+
+from innertone.core.config import get_settings
+
+if TYPE_CHECKING:
+    import numpy as np
+
+settings = get_settings()
+
+DIGEST_BYTES = 32
+# Prefix of the digest used as the in-memory hash key (the full digest is checked on hit)
+INDEX_KEY_BYTES = 8
+
+_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+def store_root() -> str:
+    """EMBEDDING_STORE_DIR, or an "embeddings" directory next to the FAISS index."""
+    return settings.EMBEDDING_STORE_DIR or os.path.join(
+        os.path.dirname(settings.FAISS_INDEX_PATH) or ".", "embeddings"
+    )
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def text_digest(text: str) -> bytes:
+    return hashlib.sha256(normalize_text(text).encode()).digest()
+
+
+class EmbeddingStore:
+    """One namespace: an append-only, memory-mapped matrix with a hash index over its rows."""
+
+    def __init__(self, path: str, dimensions: int):
+        self.path = path
+        self.dimensions = dimensions
+        self.row_bytes = 4 * dimensions
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._keys_path = os.path.join(path, "keys.bin")
+        self._lock_path = os.path.join(path, ".lock")
+        os.makedirs(path, exist_ok=True)
+
+        self._rows = 0
+        self._index: dict[int, int] = {}
+        self._keys = None
+        self._vectors = None
+        # Lookups run in worker threads (asyncio.to_thread)
+        self._lock = threading.Lock()
+        self.stats: Counter[str] = Counter()
+        self._refresh()
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def _complete_rows(self) -> int:
+        def size(path: str) -> int:
+            try:
+                return os.path.getsize(path)
+            except FileNotFoundError:
+                return 0
+
+        # A row counts once both its vector and its key are on disk
+        return min(size(self._keys_path) // DIGEST_BYTES, size(self._vectors_path) // self.row_bytes)
+
+    def _refresh(self) -> None:
+        """Maps rows appended since the last call, by this or another process."""
+        import numpy as np
+
+        rows = self._complete_rows()
+        if rows == self._rows:
+            return
+        keys = np.memmap(self._keys_path, dtype="uint8", mode="r", shape=(rows, DIGEST_BYTES))
+        for row in range(self._rows, rows):
+            self._index.setdefault(int.from_bytes(keys[row, :INDEX_KEY_BYTES].tobytes(), "little"), row)
+        self._keys = keys
+        self._vectors = np.memmap(self._vectors_path, dtype="float32", mode="r", shape=(rows, self.dimensions))
+        self._rows = rows
+
+    def _find(self, digest: bytes) -> int | None:
+        row = self._index.get(int.from_bytes(digest[:INDEX_KEY_BYTES], "little"))
+        if row is None or self._keys[row].tobytes() != digest:
+            return None
+        return row
+
+    def get_many(self, texts: list[str]) -> list["np.ndarray | None"]:
+        """The stored vector of each text, or None where there is none."""
+        import numpy as np
+
+        digests = [text_digest(text) for text in texts]
+        with self._lock:
+            self._refresh()
+            rows = [self._find(digest) for digest in digests]
+            vectors = [None if row is None else np.array(self._vectors[row]) for row in rows]
+        hits = sum(v is not None for v in vectors)
+        self.stats["hits"] += hits
+        self.stats["misses"] += len(vectors) - hits
+        return vectors
+
+    def put_many(self, texts: list[str], vectors) -> int:
+        """Stores vectors for texts not stored yet. Returns the rows added."""
+        import numpy as np
+
+        matrix = np.asarray(vectors, dtype="float32")
+        if matrix.ndim != 2 or matrix.shape[1] != self.dimensions or len(matrix) != len(texts):
+            raise ValueError(
+                f"Expected {len(texts)} vectors of {self.dimensions} dimensions, got shape {matrix.shape}"
+            )
+        digests = [text_digest(text) for text in texts]
+
+        with self._lock, open(self._lock_path, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                new, seen = [], set()
+                for i, digest in enumerate(digests):
+                    if digest not in seen and self._find(digest) is None:
+                        seen.add(digest)
+                        new.append(i)
+                if not new:
+                    return 0
+
+                # Vectors before keys; each write first drops a partial tail left by a crashed append
+                self._append(self._vectors_path, self._rows * self.row_bytes, matrix[new].tobytes())
+                self._append(self._keys_path, self._rows * DIGEST_BYTES, b"".join(digests[i] for i in new))
+                self._refresh()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        self.stats["stored"] += len(new)
+        return len(new)
+
+    @staticmethod
+    def _append(path: str, offset: int, data: bytes) -> None:
+        with open(path, "ab") as f:
+            f.truncate(offset)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def snapshot(self) -> dict:
+        return {"rows": self._rows, "bytes": self._rows * (self.row_bytes + DIGEST_BYTES), **self.stats}
+
+
+@lru_cache()
+def open_store(model_id: str, dimensions: int, kind: str) -> EmbeddingStore:
+    name = _UNSAFE_CHARS.sub("_", f"{model_id}-{dimensions}-{kind}")
+    return EmbeddingStore(os.path.join(store_root(), name), dimensions)
+
+
+class StoredEmbeddings:
+    """
+    Wraps an embedding model (embed_documents / embed_query) so every call
+    reads through the store; the model is only created on the first miss.
+    Query embeddings are kept in an LRU of EMBEDDING_QUERY_CACHE_SIZE
+    entries instead, unless `persist_queries` is set (evaluation runs).
+    With EMBEDDING_STORE_ENABLED off, calls go straight to the model.
+    """
+
+    def __init__(self, create_model: Callable, model_id: str, dimensions: int, persist_queries: bool = False):
+        self._create_model = create_model
+        self._model = None
+        self.model_id = model_id
+        self.dimensions = dimensions
+        self.persist_queries = persist_queries
+        self._queries: OrderedDict[bytes, list[float]] = OrderedDict()
+        # embed_query runs in worker threads (asyncio.to_thread)
+        self._queries_lock = threading.Lock()
+        self.query_stats: Counter[str] = Counter()
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = self._create_model()
+        return self._model
+
+    def _store(self, kind: str) -> EmbeddingStore | None:
+        if not settings.EMBEDDING_STORE_ENABLED:
+            return None
+        return open_store(self.model_id, self.dimensions, kind)
+
+    def embed_documents_counted(self, texts: list[str]) -> tuple[list[list[float]], int]:
+        """Vectors for `texts`, and how many of them had to be sent to the model."""
+        store = self._store("document")
+        if store is None:
+            return self.model.embed_documents(texts), len(texts)
+
+        vectors = store.get_many(texts)
+        missing = list({normalize_text(texts[i]): i for i, v in enumerate(vectors) if v is None}.values())
+        if missing:
+            computed = self.model.embed_documents([texts[i] for i in missing])
+            store.put_many([texts[i] for i in missing], computed)
+            by_text = {normalize_text(texts[i]): vector for i, vector in zip(missing, computed)}
+            vectors = [by_text[normalize_text(t)] if v is None else v for t, v in zip(texts, vectors)]
+        return [list(map(float, v)) for v in vectors], len(missing)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embed_documents_counted(texts)[0]
+
+    def embed_query(self, text: str) -> list[float]:
+        if not settings.EMBEDDING_STORE_ENABLED:
+            return self.model.embed_query(text)
+        if self.persist_queries:
+            store = self._store("query")
+            vector = store.get_many([text])[0]
+            if vector is None:
+                vector = self.model.embed_query(text)
+                store.put_many([text], [vector])
+            return list(map(float, vector))
+
+        digest = text_digest(text)
+        with self._queries_lock:
+            vector = self._queries.get(digest)
+            if vector is not None:
+                self._queries.move_to_end(digest)
+                self.query_stats["hits"] += 1
+                return vector
+        vector = list(map(float, self.model.embed_query(text)))
+        with self._queries_lock:
+            self.query_stats["misses"] += 1
+            self._queries[digest] = vector
+            while len(self._queries) > settings.EMBEDDING_QUERY_CACHE_SIZE:
+                self._queries.popitem(last=False)
+                self.query_stats["evicted"] += 1
+        return vector
+
+    def query_cache_snapshot(self) -> dict:
+        return {"entries": len(self._queries), "max_entries": settings.EMBEDDING_QUERY_CACHE_SIZE, **self.query_stats}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from innertone.core.serialization import dumps
+
+    parser = argparse.ArgumentParser(description="Content-addressed embedding store.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="Rows and size of every namespace")
+    args = parser.parse_args()
+
+    root = store_root()
+    for name in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+        dimensions = int(name.rsplit("-", 2)[-2])
+        print(name, dumps(EmbeddingStore(os.path.join(root, name), dimensions).snapshot()))
@@ -1,59 +1,239 @@
+"""
+RAG Ingestion Pipeline
+Chunks the PDF books, embeds the chunks with Gemini and stores the vectors
+in FAISS and the chunk metadata in PostgreSQL.
+
+Books are streamed: pages are parsed one at a time with pypdf and chunked
+incrementally (overlap is kept across page boundaries), and chunks are
+embedded while the rest of the book is still being parsed, so memory stays
+flat for books of any length. Sections come from the PDF outline, or from
+"Chapter ..." headings when a PDF has none.
+
+Embeddings are read through the embedding store (rag/embeddings.py), so
+chunks embedded before (an earlier run, the previous edition of a book)
+cost no API call and no rate-limit delay.
+
+Once the books are in, chunk topics are assigned by clustering their
+vectors (rag/topics.py) rather than by a model call per chunk.
+
+Vectors are stored under stable ids (see rag/store.py). Books already in
+the index are skipped unless passed to --replace, which ingests the new
+edition and tombstones the old one in the same transaction.
+
+Run as a script: PYTHONPATH=. python innertone/rag/ingest.py [--replace "Book Name" ...]
+Heavy dependencies (faiss, langchain) and the embedding client are only
+loaded when the pipeline actually runs, not when this module is imported.
+"""
 import os
-import json
-import faiss
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from sentence_transformers import SentenceTransformer
+import re
+import time
 import asyncio
+import itertools
+from bisect import bisect_right
+from typing import Iterable, Iterator
 from sqlalchemy.ext.asyncio import AsyncSession
 from innertone.core.database import AsyncSessionLocal
 from innertone.models.document_metadata import DocumentMetadata
 from innertone.core.config import get_settings
+from innertone.rag.embeddings import StoredEmbeddings
+from innertone.rag.store import index_lock, load_index, next_faiss_id, save_index, tombstone_book
 
 settings = get_settings()
 
 BOOKS_DIR = "/home/ca/Projects/InnerTone/Books"
-FAISS_INDEX_PATH = "/home/ca/Projects/InnerTone/innertone_index.faiss"
 
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+# 400-600 tokens ~ 1600-2400 characters (rough estimate of 4 chars per token)
+CHUNK_SIZE = 2000
+CHUNK_OVERLAP = 200
+# Pages are buffered until this many chunks' worth of text is waiting, then split
+SPLIT_WINDOW = 4
+PAGE_SEPARATOR = "\n\n"
+# Testing limit: only the first chunks of each book are ingested (None = whole book)
+MAX_CHUNKS_PER_BOOK = 15
+# Embedding batches sized for the free tier's 15 RPM / TPM limits
+EMBED_BATCH = 5
+EMBED_BATCH_DELAY = 5
 
-# Initialize embedding model
-print(f"Loading embedding model: {settings.EMBEDDING_MODEL_NAME}")
-if not settings.GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY is not set in the environment.")
-    
-embedding_model = GoogleGenerativeAIEmbeddings(
-    model=settings.EMBEDDING_MODEL_NAME,
-    google_api_key=settings.GEMINI_API_KEY
-)
-
-def load_and_chunk_pdf(file_path: str):
-    """Loads a PDF and chunks it into smaller pieces."""
-    print(f"Loading {file_path}...")
-    loader = PyPDFLoader(file_path)
-    documents = loader.load()
-    
-    # 400-600 tokens ~ 1600-2400 characters (rough estimate of 4 chars per token)
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=2000,
-        chunk_overlap=200,
+HEADING_SCAN_LINES = 5
+_HEADING_RE = re.compile(r"^(chapter|part|section)\s+([0-9]+|[ivxlc]+|[a-z]+)\b.{0,120}$", re.IGNORECASE)
+
+_embedding_model = None
+
+def _create_embedding_model():
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    print(f"Loading embedding model: {settings.EMBEDDING_MODEL_NAME}")
+    if not settings.GEMINI_API_KEY:
+        raise ValueError("GEMINI_API_KEY is not set in the environment.")
+
+    return GoogleGenerativeAIEmbeddings(
+        model=settings.EMBEDDING_MODEL_NAME,
+        google_api_key=settings.GEMINI_API_KEY
+    )
+
+def _get_embedding_model() -> StoredEmbeddings:
+    """
+    The Gemini embedding client behind the embedding store; the client is
+    only created once a chunk is not in the store.
+    """
+    global _embedding_model
+    if _embedding_model is None:
+        _embedding_model = StoredEmbeddings(
+            _create_embedding_model, settings.EMBEDDING_MODEL_NAME, settings.EMBEDDING_DIMENSIONS
+        )
+    return _embedding_model
+
+def _outline_starts(reader) -> list[tuple[int, str]]:
+    """(page index, title) for every outline (bookmark) entry, in page order."""
+    starts = []
+
+    def walk(items):
+        for item in items:
+            if isinstance(item, list):
+                walk(item)
+                continue
+            try:
+                page = reader.get_destination_page_number(item)
+            except Exception:
+                continue
+            title = " ".join(str(item.title or "").split())
+            if page is not None and page >= 0 and title:
+                starts.append((page, title[:255]))
+
+    try:
+        walk(reader.outline)
+    except Exception as e:
+        print(f"Ignoring unreadable PDF outline: {e}")
+    # Stable sort: entries on the same page keep document order, so the
+    # innermost heading wins
+    starts.sort(key=lambda start: start[0])
+    return starts
+
+
+def _page_heading(text: str) -> str | None:
+    """A "Chapter 3 ..." style heading near the top of the page, for PDFs without an outline."""
+    for line in text.splitlines()[:HEADING_SCAN_LINES]:
+        line = " ".join(line.split())
+        if _HEADING_RE.match(line):
+            return line[:255]
+    return None
+
+
+def iter_pdf_pages(file_path: str) -> Iterator[tuple[int, str, str | None]]:
+    """
+    Yields (page index, text, section) one page at a time. The section is
+    the latest outline entry starting on or before the page, or the latest
+    detected chapter heading when the PDF has no outline.
+    """
+    from pypdf import PdfReader
+
+    # Given a path, pypdf reads the whole file into memory; a file object is read on demand
+    with open(file_path, "rb") as stream:
+        reader = PdfReader(stream)
+        starts = _outline_starts(reader)
+        position = 0
+        section = None
+        for page_index, page in enumerate(reader.pages):
+            while position < len(starts) and starts[position][0] <= page_index:
+                section = starts[position][1]
+                position += 1
+            text = page.extract_text() or ""
+            # pypdf caches every object it parses (content streams, fonts);
+            # drop them so memory does not grow with the page count
+            reader.resolved_objects.clear()
+            if not starts:
+                section = _page_heading(text) or section
+            yield page_index, text, section
+
+
+def iter_chunks(
+    pages: Iterable[tuple[int, str, str | None]],
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+) -> Iterator[tuple[str, dict]]:
+    """
+    Splits a stream of pages into overlapping chunks, holding only a few
+    chunks' worth of text at a time. Chunks run across page boundaries with
+    the overlap kept; each is tagged with the page and section it starts on.
+    """
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
         length_function=len,
         is_separator_regex=False,
     )
-    chunks = text_splitter.split_documents(documents)
-    return chunks
-
-def init_faiss_index(dimension: int):
-    """Initializes or loads a FAISS index."""
-    if os.path.exists(FAISS_INDEX_PATH):
-        print("Loading existing FAISS index...")
-        return faiss.read_index(FAISS_INDEX_PATH)
-    else:
-        print("Creating new FAISS index...")
-        return faiss.IndexFlatL2(dimension)
-
-async def process_books():
-    """Processes all books in the directory, embeds chunks, and stores them in FAISS/DB."""
+    buffer = ""
+    # (offset in buffer, page index, section) where each buffered page starts
+    marks: list[tuple[int, int, str | None]] = []
+
+    def split(final: bool) -> Iterator[tuple[str, dict]]:
+        nonlocal buffer, marks
+        pieces = splitter.split_text(buffer)
+        offsets = []
+        index = previous = 0
+        for piece in pieces:
+            # Same lookup langchain uses for add_start_index
+            found = buffer.find(piece, max(0, index + previous - chunk_overlap))
+            index = found if found >= 0 else index
+            previous = len(piece)
+            offsets.append(index)
+
+        # Unless the book is finished, the last piece may still grow: keep it buffered
+        emit = len(pieces) if final else len(pieces) - 1
+        starts = [mark[0] for mark in marks]
+        for piece, offset in zip(pieces[:emit], offsets[:emit]):
+            _, page, section = marks[max(0, bisect_right(starts, offset) - 1)]
+            yield piece, {"page": page, "section": section}
+        if not final and emit > 0:
+            cut = offsets[emit]
+            current = max(0, bisect_right(starts, cut) - 1)
+            marks = [(max(0, offset - cut), page, section) for offset, page, section in marks[current:]]
+            buffer = buffer[cut:]
+
+    for page_index, text, section in pages:
+        if buffer:
+            buffer += PAGE_SEPARATOR
+        marks.append((len(buffer), page_index, section))
+        buffer += text
+        if len(buffer) >= chunk_size * SPLIT_WINDOW:
+            yield from split(final=False)
+    if buffer.strip():
+        yield from split(final=True)
+
+
+def iter_pdf_chunks(file_path: str) -> Iterator[tuple[str, dict]]:
+    """Lazily parses and chunks one PDF; memory stays flat regardless of book length."""
+    source = os.path.basename(file_path)
+    for text, meta in iter_chunks(iter_pdf_pages(file_path)):
+        yield text, {"source": source, **meta}
+
+
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def _peak_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    # ru_maxrss is in kilobytes on Linux (bytes on macOS)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def process_books(replace: Iterable[str] = ()):
+    """
+    Processes all books in the directory, embeds chunks, and stores them in FAISS/DB.
+    Each book is one transaction: the index file is saved before its rows are
+    committed, so a committed row always has its vector.
+    """
+    import numpy as np
+
+    replace = set(replace)
     dimension = settings.EMBEDDING_DIMENSIONS
     
     if not os.path.exists(BOOKS_DIR):
@@ -66,74 +246,110 @@ async def process_books():
         print(f"No PDF files found in {BOOKS_DIR}")
         return
 
-    # Load FAISS index
-    index = init_faiss_index(dimension)
-    
-    async with AsyncSessionLocal() as session:
-        for file_name in pdf_files:
-            # We track the faiss_id per document since we commit after every document.
-            current_faiss_id = index.ntotal
-             
-            file_path = os.path.join(BOOKS_DIR, file_name)
-            book_name = os.path.splitext(file_name)[0]
-            
-            # Simple check if we already processed this by checking DB for the book name
-            from sqlalchemy import select
-            existing = await session.execute(select(DocumentMetadata).filter_by(book_name=book_name).limit(1))
-            if existing.scalar() is not None:
-                print(f"Book {book_name} already ingested, skipping.")
-                continue
+    # Load the embedding client; the index stays locked against compaction until we are done
+    embedding_model = _get_embedding_model()
+    with index_lock():
+        index = load_index(dimension)
 
-            chunks = load_and_chunk_pdf(file_path)[:15]  # Limit to 15 chunks for testing
-            if not chunks:
-                continue
-                
-            print(f"Generated {len(chunks)} chunks for {book_name}")
-            texts = [chunk.page_content for chunk in chunks]
-            
-            # Embed texts for this book in batches to avoid rate limits
-            print("Generating embeddings in batches (abiding by strict RPM limits)...")
-            embeddings = []
-            batch_size = 5  # Reduced to avoid 15RPM/TPM limits
-            for k in range(0, len(texts), batch_size):
-                batch = texts[k:k + batch_size]
-                batch_embeddings = embedding_model.embed_documents(batch)
-                embeddings.extend(batch_embeddings)
-                print(f"Embedded {len(embeddings)}/{len(texts)} chunks...")
-                await asyncio.sleep(5)  # Delay to respect rate limits
-            
-            # Add to FAISS index — must be numpy float32
-            import numpy as np
-            emb_arr = np.array(embeddings, dtype="float32")
-            print(f"Adding batch of {emb_arr.shape[0]} embeddings with dimension {emb_arr.shape[1]} to FAISS index with dimension {index.d}")
-            index.add(emb_arr)
-            
-            # Save metadata to database
-            for i, chunk in enumerate(chunks):
-                # Basic section heuristic (e.g., page number)
-                page_num = chunk.metadata.get('page', 'Unknown')
-                section_name = f"Page {page_num}"
-                
-                # Create a local copy of metadata to safely modify
-                meta_json = chunk.metadata.copy()
-                meta_json["token_estimate"] = len(chunk.page_content) // 4
-                
-                db_record = DocumentMetadata(
-                    faiss_id=current_faiss_id + i,
-                    book_name=book_name,
-                    section=section_name,
-                    topic="general psychology",  # Placeholder, could use LLM to classify topic per chunk
-                    content=chunk.page_content,
-                    metadata_json=meta_json
+        async with AsyncSessionLocal() as session:
+            next_id = await next_faiss_id(session, index)
+            ingested = False
+
+            for file_name in pdf_files:
+                file_path = os.path.join(BOOKS_DIR, file_name)
+                book_name = os.path.splitext(file_name)[0]
+
+                # Simple check if we already processed this by checking DB for the book name
+                from sqlalchemy import select
+                existing = await session.execute(
+                    select(DocumentMetadata.id)
+                    .filter_by(book_name=book_name, deleted_at=None)
+                    .limit(1)
                 )
-                session.add(db_record)
-            
-            await session.commit()
-            print(f"Saved metadata to DB for {book_name}")
-    
-    # Save the FAISS index to disk
-    faiss.write_index(index, FAISS_INDEX_PATH)
-    print("Ingestion complete. FAISS index saved.")
+                if existing.scalar() is not None:
+                    if book_name not in replace:
+                        print(f"Book {book_name} already ingested, skipping.")
+                        continue
+                    # Uncommitted until the new edition is in, so readers never see neither
+                    old_chunks = await tombstone_book(session, book_name)
+                    print(f"Replacing {old_chunks} chunks of {book_name}...")
+
+                chunks = iter_pdf_chunks(file_path)
+                if MAX_CHUNKS_PER_BOOK:
+                    chunks = itertools.islice(chunks, MAX_CHUNKS_PER_BOOK)
+
+                # Parsing runs in a worker thread one batch ahead of the embedding
+                # calls, so chunks are embedded as soon as they are ready
+                batch_iter = _batched(chunks, EMBED_BATCH)
+                pending = asyncio.ensure_future(asyncio.to_thread(next, batch_iter, None))
+                started = time.perf_counter()
+                first_embedding = None
+                count = 0
+
+                print(f"Chunking and embedding {book_name} (abiding by strict RPM limits)...")
+                while (batch := await pending) is not None:
+                    pending = asyncio.ensure_future(asyncio.to_thread(next, batch_iter, None))
+                    texts = [text for text, _ in batch]
+                    embeddings, computed = await asyncio.to_thread(embedding_model.embed_documents_counted, texts)
+                    if first_embedding is None:
+                        first_embedding = time.perf_counter() - started
+
+                    # Add to FAISS index under stable ids — must be numpy float32 / int64
+                    emb_arr = np.array(embeddings, dtype="float32")
+                    ids = np.arange(next_id, next_id + len(batch), dtype="int64")
+                    index.add_with_ids(emb_arr, ids)
+                    next_id += len(batch)
+
+                    # Save metadata to database
+                    for faiss_id, (text, meta) in zip(ids.tolist(), batch):
+                        meta_json = {**meta, "token_estimate": len(text) // 4}
+                        session.add(DocumentMetadata(
+                            faiss_id=faiss_id,
+                            book_name=book_name,
+                            section=meta["section"] or f"Page {meta['page']}",
+                            topic=None,  # Assigned by clustering once the books are in (rag/topics.py)
+                            content=text,
+                            metadata_json=meta_json
+                        ))
+                    await session.flush()
+                    count += len(batch)
+                    print(f"Embedded {count} chunks of {book_name} ({computed} new)...")
+                    if computed:
+                        await asyncio.sleep(EMBED_BATCH_DELAY)  # Delay to respect rate limits
+
+                if not count:
+                    await session.rollback()  # Keep the old edition if the new one is empty
+                    continue
+                peak = _peak_rss_mb()
+                print(
+                    f"{book_name}: {count} chunks, first embedding after {first_embedding:.1f}s, "
+                    f"total {time.perf_counter() - started:.1f}s"
+                    + (f", peak RSS {peak:.0f} MB" if peak is not None else "")
+                )
+
+                # Vectors first: if the commit fails they are orphans, which
+                # retrieval ignores and compaction removes
+                await asyncio.to_thread(save_index, index)
+                await session.commit()
+                ingested = True
+                print(f"Saved index and metadata for {book_name}")
+
+            if settings.RAG_SHARD_COUNT:
+                from innertone.rag.shards import reshard
+                print(f"Shard sizes: {await reshard(session, index, settings.RAG_SHARD_COUNT)}")
+
+            # New chunks get the topic of their nearest cluster (the first run clusters everything)
+            if ingested and settings.TOPIC_CLUSTERS:
+                from innertone.rag.topics import assign_topics
+                await assign_topics(session, index=index)
+
+    print("Ingestion complete.")
 
 if __name__ == "__main__":
-    asyncio.run(process_books())
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Ingest the PDF books into FAISS and the database.")
+    parser.add_argument("--replace", action="append", default=[], metavar="BOOK",
+                        help="Re-ingest this (already ingested) book, replacing the old edition")
+    args = parser.parse_args()
+    asyncio.run(process_books(replace=args.replace))
@@ -2,42 +2,71 @@
 RAG Retrieval Module
 Performs semantic search over the FAISS index using Gemini embeddings,
 and fetches the matching document metadata from PostgreSQL.
+
+With RAG_SHARD_URLS set, the nearest neighbours come from the shard
+servers instead (rag/shards.py) and no index is loaded in this process.
+
+Tombstoned chunks (deleted or replaced books, see rag/store.py) are
+skipped, so the search over-fetches a little to still return top_k. The
+index is reloaded when the file on disk changes (ingestion, compaction).
+
+faiss, numpy and langchain are imported on first use so that importing
+the API (and every uvicorn worker) does not pay for them when retrieval
+is disabled or not yet needed.
 """
-import faiss
-import numpy as np
-import os
+import asyncio
+from typing import TYPE_CHECKING
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from innertone.models.document_metadata import DocumentMetadata
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from innertone.core.config import get_settings
+from innertone.services.diagnostics import stage
+from innertone.services.singleflight import SingleFlight
+from innertone.rag.embeddings import StoredEmbeddings
+from innertone.rag.shards import get_shard_client
+from innertone.rag.store import FAISS_INDEX_PATH, IndexFile
+
+if TYPE_CHECKING:
+    import faiss
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
 
 settings = get_settings()
 
-FAISS_INDEX_PATH = "/home/ca/Projects/InnerTone/innertone_index.faiss"
+# Neighbours fetched per requested result, to make up for tombstoned hits
+TOMBSTONE_OVERFETCH = 2
+# ...and at most this many when most hits are tombstoned (compaction is due)
+MAX_OVERFETCH = 32
 
-_index = None
+_index_file = IndexFile(FAISS_INDEX_PATH)
 _embedding_model = None
 
-def _get_embedding_model() -> GoogleGenerativeAIEmbeddings:
+# Identical queries in flight (or seen in the last few minutes) share one embedding call
+_query_embeddings = SingleFlight(window=300, max_entries=2048)
+
+def _create_embedding_model() -> "GoogleGenerativeAIEmbeddings":
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    return GoogleGenerativeAIEmbeddings(
+        model=settings.EMBEDDING_MODEL_NAME,
+        google_api_key=settings.GEMINI_API_KEY
+    )
+
+def _get_embedding_model() -> StoredEmbeddings:
     global _embedding_model
     if _embedding_model is None:
-        _embedding_model = GoogleGenerativeAIEmbeddings(
-            model=settings.EMBEDDING_MODEL_NAME,
-            google_api_key=settings.GEMINI_API_KEY
+        _embedding_model = StoredEmbeddings(
+            _create_embedding_model, settings.EMBEDDING_MODEL_NAME, settings.EMBEDDING_DIMENSIONS
         )
     return _embedding_model
 
-def _get_faiss_index() -> faiss.Index:
-    global _index
-    if _index is None:
-        if not os.path.exists(FAISS_INDEX_PATH):
-            raise FileNotFoundError(
-                f"FAISS index not found at {FAISS_INDEX_PATH}. "
-                "Please run the ingestion pipeline first."
-            )
-        _index = faiss.read_index(FAISS_INDEX_PATH)
-    return _index
+def _get_faiss_index() -> "faiss.Index":
+    try:
+        return _index_file.get()
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"FAISS index not found at {FAISS_INDEX_PATH}. "
+            "Please run the ingestion pipeline first."
+        ) from None
 
 async def retrieve_relevant_chunks(
     query: str,
@@ -50,30 +79,51 @@ async def retrieve_relevant_chunks(
     
     Returns a list of dicts: {book_name, section, content}
     """
+    import numpy as np
+
+    sharded = bool(settings.RAG_SHARD_URLS)
+    index = None if sharded else _get_faiss_index()
     model = _get_embedding_model()
-    index = _get_faiss_index()
     
-    # Embed the query
-    query_embedding = model.embed_query(query)
+    # Embed the query through the in-memory query cache (the SDK call is blocking,
+    # so keep it off the event loop)
+    with stage("embed_query"):
+        query_embedding = await _query_embeddings.do(
+            query,
+            lambda: asyncio.to_thread(model.embed_query, query),
+        )
     query_vector = np.array([query_embedding], dtype="float32")
     
-    # Search FAISS
-    distances, faiss_ids = index.search(query_vector, top_k)
-    faiss_ids_flat = faiss_ids[0].tolist()
-    
-    # Filter out -1 (FAISS returns -1 when the index has fewer results than top_k)
-    valid_ids = [fid for fid in faiss_ids_flat if fid != -1]
-    
-    if not valid_ids:
-        return []
+    # Search FAISS; widen the search while tombstoned hits leave us short
+    fetch = top_k * TOMBSTONE_OVERFETCH
+    while True:
+        with stage("faiss_search"):
+            if sharded:
+                # Shards that time out or fail are left out (fewer, not late, results)
+                valid_ids, ntotal = await get_shard_client().search(query_vector[0].tolist(), fetch)
+            else:
+                distances, faiss_ids = index.search(query_vector, fetch)
+                ntotal = index.ntotal
+                # Filter out -1 (FAISS returns -1 when the index has fewer results than top_k)
+                valid_ids = [fid for fid in faiss_ids[0].tolist() if fid != -1]
 
-    # Fetch metadata from DB
-    result = await db.execute(
-        select(DocumentMetadata).where(DocumentMetadata.faiss_id.in_(valid_ids))
-    )
-    records = result.scalars().all()
+        if not valid_ids:
+            return []
+
+        # Fetch metadata from DB; tombstoned rows and orphaned vectors drop out here
+        result = await db.execute(
+            select(DocumentMetadata).where(
+                DocumentMetadata.faiss_id.in_(valid_ids),
+                DocumentMetadata.deleted_at.is_(None),
+            )
+        )
+        by_id = {r.faiss_id: r for r in result.scalars()}
+        records = [by_id[fid] for fid in valid_ids if fid in by_id][:top_k]
+        if len(records) >= top_k or fetch >= ntotal or fetch >= top_k * MAX_OVERFETCH:
+            break
+        fetch *= 4
     
-    # Return structured context
+    # Return structured context, nearest first
     return [
         {
             "book_name": r.book_name,
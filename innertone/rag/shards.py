@@ -0,0 +1,287 @@
+"""
+Sharded Vector Search
+Optional retrieval service mode for corpora that do not fit one index per
+API worker: the index is split by book into N shard files, each served by
+its own process (on this host or others), and retrieval scatters every
+query to all shards and merges their nearest neighbours by distance.
+
+  - Shard files are derived from the main index, which ingestion, deletes
+    and compaction keep maintaining; with RAG_SHARD_COUNT set they re-split
+    it after every save. A book always maps to the same shard.
+  - A shard server re-reads its file when it is replaced on disk.
+  - With RAG_SHARD_URLS set, API workers never load an index. A shard that
+    errors or misses RAG_SHARD_TIMEOUT_MS is left out of that query's
+    results, so a slow shard degrades retrieval instead of stalling the turn.
+
+    PYTHONPATH=. python -m innertone.rag.shards split 4
+    PYTHONPATH=. python -m innertone.rag.shards serve 0 --port 8100
+
+benchmarks/shards.py compares the scatter-gather path against searching
+the single index.
+"""
+import asyncio
+import heapq
+import logging
+import os
+import time
+import zlib
+from collections import Counter
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from innertone.core.config import get_settings
+from innertone.core.serialization import dumps_bytes, loads
+from innertone.models.document_metadata import DocumentMetadata
+from innertone.rag.store import FAISS_INDEX_PATH, IndexFile, index_lock, load_index, save_index
+from innertone.services.diagnostics import add_stage
+
+if TYPE_CHECKING:
+    import faiss
+    import numpy as np
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Smoothing of the per-shard latency averages
+LATENCY_EWMA_ALPHA = 0.1
+
+
+def shard_path(shard: int, base: str = FAISS_INDEX_PATH) -> str:
+    return f"{base}.shard{shard}"
+
+
+def shard_of(book_name: str, count: int) -> int:
+    """The shard holding a book; stable across processes and restarts (unlike hash())."""
+    return zlib.crc32(book_name.encode()) % count
+
+
+def write_shards(index: "faiss.IndexIDMap2", assignment: "np.ndarray", count: int, base: str = FAISS_INDEX_PATH) -> list[int]:
+    """
+    Writes one index file per shard. `assignment` gives the shard of each
+    stored vector, in storage order; vectors assigned -1 are left out.
+    Returns the shard sizes.
+    """
+    import faiss
+    import numpy as np
+
+    ids = faiss.vector_to_array(index.id_map)
+    vectors = index.index.reconstruct_n(0, index.ntotal) if index.ntotal else np.empty((0, index.d), dtype="float32")
+    sizes = []
+    for shard in range(count):
+        mask = assignment == shard
+        part = faiss.IndexIDMap2(faiss.IndexFlatL2(index.d))
+        if mask.any():
+            part.add_with_ids(vectors[mask], ids[mask])
+        save_index(part, shard_path(shard, base))
+        sizes.append(part.ntotal)
+    return sizes
+
+
+async def reshard(db: AsyncSession, index: "faiss.IndexIDMap2", count: int) -> list[int]:
+    """Re-splits the (just saved) main index by book. The caller holds index_lock."""
+    import faiss
+    import numpy as np
+
+    rows = await db.execute(
+        select(DocumentMetadata.faiss_id, DocumentMetadata.book_name)
+        .where(DocumentMetadata.deleted_at.is_(None))
+    )
+    shard_by_id = {faiss_id: shard_of(book_name, count) for faiss_id, book_name in rows}
+    # Tombstoned and orphaned vectors are not worth shipping to the shards
+    ids = faiss.vector_to_array(index.id_map).tolist()
+    assignment = np.array([shard_by_id.get(faiss_id, -1) for faiss_id in ids], dtype="int64")
+    return await asyncio.to_thread(write_shards, index, assignment, count)
+
+
+async def split(db: AsyncSession, count: int) -> list[int]:
+    with index_lock():
+        index = await asyncio.to_thread(load_index, settings.EMBEDDING_DIMENSIONS)
+        return await reshard(db, index, count)
+
+
+def create_shard_app(path: str, delay: float = 0.0):
+    """
+    A shard server: POST /search {"vector": [...], "k": n} returns the shard's
+    nearest ids and distances. `delay` slows every search down (for testing
+    the client timeouts).
+    """
+    import numpy as np
+    from fastapi import FastAPI, HTTPException, Request
+
+    from innertone.core.serialization import ORJSONResponse
+
+    index_file = IndexFile(path)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # Load before taking traffic, so the first queries do not time out on it
+        try:
+            await asyncio.to_thread(index_file.get)
+        except FileNotFoundError:
+            logger.warning(f"No shard index at {path} yet")
+        yield
+
+    app = FastAPI(title=f"InnerTone shard {os.path.basename(path)}", lifespan=lifespan)
+
+    def _search(query: "np.ndarray", k: int) -> dict:
+        index = index_file.get()
+        distances, ids = index.search(query, k)
+        hits = [(d, i) for d, i in zip(distances[0].tolist(), ids[0].tolist()) if i != -1]
+        return {
+            "ntotal": index.ntotal,
+            "ids": [i for _, i in hits],
+            "distances": [d for d, _ in hits],
+        }
+
+    @app.post("/search")
+    async def search(request: Request):
+        body = loads(await request.body())
+        if delay:
+            await asyncio.sleep(delay)
+        query = np.array([body["vector"]], dtype="float32")
+        try:
+            # FAISS releases the GIL, so concurrent queries search in parallel
+            result = await asyncio.to_thread(_search, query, int(body["k"]))
+        except FileNotFoundError:
+            raise HTTPException(status_code=503, detail=f"No shard index at {path}")
+        return ORJSONResponse(result)
+
+    @app.get("/health")
+    async def health():
+        try:
+            vectors = index_file.get().ntotal
+        except FileNotFoundError:
+            vectors = None
+        return {"status": "ok", "index": path, "vectors": vectors}
+
+    return app
+
+
+class ShardClient:
+    """Scatters a query to every shard server and merges the answers."""
+
+    def __init__(self, urls: list[str], timeout: float):
+        self.urls = [url.rstrip("/") for url in urls]
+        self.timeout = timeout
+        self._client = None
+        self._latency: dict[str, float] = {}
+        self.stats: dict[str, Counter[str]] = {url: Counter() for url in self.urls}
+        self.degraded_queries = 0
+
+    @classmethod
+    def from_settings(cls) -> "ShardClient":
+        return cls(settings.RAG_SHARD_URLS, settings.RAG_SHARD_TIMEOUT_MS / 1000)
+
+    def _http(self):
+        if self._client is None:
+            import httpx
+
+            self._client = httpx.AsyncClient(
+                headers={"Content-Type": "application/json"},
+                limits=httpx.Limits(max_connections=None, max_keepalive_connections=64),
+            )
+        return self._client
+
+    async def search(self, vector: list[float], k: int) -> tuple[list[int], int]:
+        """
+        The `k` nearest ids over the shards that answered in time, nearest
+        first, and the number of vectors those shards hold.
+        """
+        body = dumps_bytes({"vector": vector, "k": k})
+        answers = await asyncio.gather(*(self._query(shard, body) for shard in range(len(self.urls))))
+
+        hits, total = [], 0
+        for answer in answers:
+            if answer is not None:
+                hits.extend(zip(answer["distances"], answer["ids"]))
+                total += answer["ntotal"]
+        if any(answer is None for answer in answers):
+            self.degraded_queries += 1
+        return [faiss_id for _, faiss_id in heapq.nsmallest(k, hits)], total
+
+    async def _query(self, shard: int, body: bytes) -> dict | None:
+        url = self.urls[shard]
+        started = time.perf_counter()
+        try:
+            # wait_for bounds the whole exchange; httpx timeouts are per phase
+            response = await asyncio.wait_for(self._http().post(f"{url}/search", content=body), self.timeout)
+            response.raise_for_status()
+            answer = loads(response.content)
+        except asyncio.TimeoutError:
+            self.stats[url]["timeouts"] += 1
+            return None
+        except Exception as e:
+            self.stats[url]["errors"] += 1
+            logger.warning(f"Shard {url} failed: {e}")
+            return None
+        finally:
+            add_stage(f"shard{shard}", time.perf_counter() - started)
+
+        seconds = time.perf_counter() - started
+        previous = self._latency.get(url)
+        self._latency[url] = seconds if previous is None else previous + LATENCY_EWMA_ALPHA * (seconds - previous)
+        self.stats[url]["ok"] += 1
+        return answer
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def snapshot(self) -> dict:
+        return {
+            "timeout_ms": round(self.timeout * 1000),
+            "degraded_queries": self.degraded_queries,
+            "shards": [
+                {
+                    "url": url,
+                    **self.stats[url],
+                    "latency_ms": round(self._latency[url] * 1000, 2) if url in self._latency else None,
+                }
+                for url in self.urls
+            ],
+        }
+
+
+@lru_cache()
+def get_shard_client() -> ShardClient:
+    return ShardClient.from_settings()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sharded FAISS search.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    split_parser = commands.add_parser("split", help="Split the main index into shard files by book")
+    split_parser.add_argument("count", type=int)
+
+    serve_parser = commands.add_parser("serve", help="Serve one shard file over HTTP")
+    serve_parser.add_argument("shard", type=int, nargs="?", help="Shard number (next to FAISS_INDEX_PATH)")
+    serve_parser.add_argument("--index", help="Shard file, instead of a shard number")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8100)
+    serve_parser.add_argument("--delay-ms", type=float, default=0.0, help="Slow every search down (testing)")
+    args = parser.parse_args()
+
+    if args.command == "split":
+        from innertone.core.database import AsyncSessionLocal, engine
+
+        async def _split():
+            async with AsyncSessionLocal() as db:
+                print(f"Shard sizes: {await split(db, args.count)}")
+            await engine.dispose()
+
+        asyncio.run(_split())
+    elif args.command == "serve":
+        import uvicorn
+
+        if args.index is None and args.shard is None:
+            parser.error("serve needs a shard number or --index")
+        path = args.index or shard_path(args.shard)
+        uvicorn.run(create_shard_app(path, args.delay_ms / 1000), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,286 @@
+"""
+Vector Store
+Owns the FAISS index file and keeps it consistent with document_metadata.
+
+The index is an IndexIDMap2, so every vector is stored under its chunk's
+faiss_id and ids stay stable as books come and go:
+  - delete_book() tombstones a book's rows (deleted_at); retrieval skips
+    them straight away, the vectors stay until compaction
+  - ingest.py --replace re-ingests a book under new ids and tombstones the
+    old edition in the same transaction
+  - compact() removes tombstoned and orphaned vectors from the index, then
+    the tombstoned rows; the API runs it in the background once
+    INDEX_COMPACTION_THRESHOLD of the index is dead
+
+Writers save the index (atomically, via rename) before committing their
+rows, so a committed row always has its vector; a failed run can at worst
+leave orphaned vectors, which retrieval ignores and compaction removes.
+Writers on the same host are serialised with a lock file.
+
+    PYTHONPATH=. python -m innertone.rag.store stats
+    PYTHONPATH=. python -m innertone.rag.store delete "Book Name"
+    PYTHONPATH=. python -m innertone.rag.store compact [--force]
+    PYTHONPATH=. python -m innertone.rag.store rebuild
+
+rebuild() recreates the index from the live rows, with vectors from the
+embedding store (rag/embeddings.py) rather than the embedding API.
+"""
+import asyncio
+import fcntl
+import logging
+import os
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from innertone.core.config import get_settings
+from innertone.models.document_metadata import DocumentMetadata
+
+if TYPE_CHECKING:
+    import faiss
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+FAISS_INDEX_PATH = settings.FAISS_INDEX_PATH
+LOCK_PATH = FAISS_INDEX_PATH + ".lock"
+
+
+class IndexBusy(Exception):
+    """Another process is writing the index."""
+
+
+@contextmanager
+def index_lock(blocking: bool = True):
+    """Exclusive lock for index writers (ingestion, deletes, compaction)."""
+    os.makedirs(os.path.dirname(LOCK_PATH) or ".", exist_ok=True)
+    with open(LOCK_PATH, "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError as e:
+            raise IndexBusy("The FAISS index is being written by another process") from e
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def load_index(dimension: int) -> "faiss.IndexIDMap2":
+    """
+    Loads the index, or creates an empty one. An index from before stable
+    ids (a bare IndexFlatL2, faiss_id = position) is converted in place.
+    """
+    import faiss
+    import numpy as np
+
+    if not os.path.exists(FAISS_INDEX_PATH):
+        logger.info("Creating new FAISS index")
+        return faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+
+    logger.info("Loading existing FAISS index")
+    index = faiss.read_index(FAISS_INDEX_PATH)
+    if isinstance(index, faiss.IndexIDMap2):
+        return index
+
+    logger.warning(f"Converting the legacy index ({index.ntotal} vectors) to stable ids")
+    converted = faiss.IndexIDMap2(faiss.IndexFlatL2(index.d))
+    if index.ntotal:
+        converted.add_with_ids(index.reconstruct_n(0, index.ntotal), np.arange(index.ntotal, dtype="int64"))
+    return converted
+
+
+def save_index(index: "faiss.Index", path: str = FAISS_INDEX_PATH) -> None:
+    """Writes the index to a temporary file and renames it over the old one."""
+    import faiss
+
+    tmp = path + ".tmp"
+    faiss.write_index(index, tmp)
+    os.replace(tmp, path)
+
+
+class IndexFile:
+    """An index file read on first use and re-read whenever it is replaced on disk."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._index = None
+        self._version = None
+
+    def get(self) -> "faiss.Index":
+        """Raises FileNotFoundError if there is no index at `path`."""
+        stat = os.stat(self.path)
+        # Writers replace the file atomically, so a new mtime/size means a new index
+        version = (stat.st_mtime_ns, stat.st_size)
+        if self._index is None or version != self._version:
+            import faiss
+
+            self._index = faiss.read_index(self.path)
+            self._version = version
+        return self._index
+
+
+def index_ids(index: "faiss.IndexIDMap2") -> set[int]:
+    import faiss
+
+    return set(faiss.vector_to_array(index.id_map).tolist())
+
+
+async def next_faiss_id(db: AsyncSession, index: "faiss.IndexIDMap2") -> int:
+    """First id above everything in use, by rows (live or tombstoned) or vectors."""
+    highest = await db.scalar(select(func.max(DocumentMetadata.faiss_id)))
+    in_index = max(index_ids(index), default=-1)
+    return max(highest if highest is not None else -1, in_index) + 1
+
+
+async def tombstone_book(db: AsyncSession, book_name: str) -> int:
+    """Marks a book's live rows deleted. The caller commits."""
+    result = await db.execute(
+        update(DocumentMetadata)
+        .where(DocumentMetadata.book_name == book_name, DocumentMetadata.deleted_at.is_(None))
+        .values(deleted_at=datetime.now(timezone.utc))
+    )
+    return result.rowcount
+
+
+async def delete_book(db: AsyncSession, book_name: str) -> int:
+    """Removes a book from retrieval immediately; its vectors go at the next compaction."""
+    count = await tombstone_book(db, book_name)
+    await db.commit()
+    return count
+
+
+async def index_stats(db: AsyncSession) -> dict:
+    live = await db.scalar(select(func.count()).where(DocumentMetadata.deleted_at.is_(None)))
+    dead = await db.scalar(select(func.count()).where(DocumentMetadata.deleted_at.is_not(None)))
+    total = live + dead
+    return {
+        "live_chunks": live,
+        "tombstoned_chunks": dead,
+        "dead_ratio": round(dead / total, 3) if total else 0.0,
+    }
+
+
+async def compact(db: AsyncSession, threshold: float | None = None, force: bool = False) -> dict:
+    """
+    Drops tombstoned and orphaned vectors from the index, then the
+    tombstoned rows, if the dead share is at least `threshold`.
+    Raises IndexBusy if another writer holds the index.
+    """
+    threshold = settings.INDEX_COMPACTION_THRESHOLD if threshold is None else threshold
+    stats = await index_stats(db)
+    if not force and (not stats["tombstoned_chunks"] or stats["dead_ratio"] < threshold):
+        return {"skipped": "below threshold", **stats}
+    if not os.path.exists(FAISS_INDEX_PATH):
+        return {"skipped": "no index", **stats}
+
+    import numpy as np
+
+    with index_lock(blocking=False):
+        cutoff = datetime.now(timezone.utc)
+        dead = set((await db.execute(
+            select(DocumentMetadata.faiss_id).where(DocumentMetadata.deleted_at <= cutoff)
+        )).scalars())
+        live = set((await db.execute(
+            select(DocumentMetadata.faiss_id).where(DocumentMetadata.deleted_at.is_(None))
+        )).scalars())
+
+        index = await asyncio.to_thread(load_index, settings.EMBEDDING_DIMENSIONS)
+        present = index_ids(index)
+        # Vectors without a live row: tombstoned, or left by a failed run
+        remove = sorted(present - live)
+        if remove:
+            await asyncio.to_thread(index.remove_ids, np.array(remove, dtype="int64"))
+            await asyncio.to_thread(save_index, index)
+            if settings.RAG_SHARD_COUNT:
+                from innertone.rag.shards import reshard
+                await reshard(db, index, settings.RAG_SHARD_COUNT)
+
+        # Only after the index no longer has their vectors
+        await db.execute(delete(DocumentMetadata).where(DocumentMetadata.deleted_at <= cutoff))
+        await db.commit()
+
+    report = {
+        "removed_vectors": len(remove),
+        "orphaned_vectors": len(present - live - dead),
+        "removed_rows": len(dead),
+        "live_vectors": index.ntotal,
+        "missing_vectors": len(live - present),
+    }
+    logger.info(f"Index compaction: {report}")
+    return report
+
+
+async def rebuild(db: AsyncSession, batch_size: int = 1000) -> dict:
+    """
+    Builds a fresh index from the live rows, with vectors from the embedding
+    store (only chunks missing there are sent to the model), and replaces
+    the index file with it. For a changed index type, or a lost/corrupt file.
+    """
+    import faiss
+    import numpy as np
+
+    from innertone.rag.ingest import _get_embedding_model
+
+    embeddings = _get_embedding_model()
+    with index_lock():
+        index = faiss.IndexIDMap2(faiss.IndexFlatL2(settings.EMBEDDING_DIMENSIONS))
+        computed = 0
+        result = await db.stream(
+            select(DocumentMetadata.faiss_id, DocumentMetadata.content)
+            .where(DocumentMetadata.deleted_at.is_(None))
+            .order_by(DocumentMetadata.faiss_id)
+            .execution_options(yield_per=batch_size)
+        )
+        async for rows in result.partitions():
+            vectors, missing = await asyncio.to_thread(embeddings.embed_documents_counted, [r.content for r in rows])
+            index.add_with_ids(np.array(vectors, dtype="float32"), np.array([r.faiss_id for r in rows], dtype="int64"))
+            computed += missing
+
+        await asyncio.to_thread(save_index, index)
+        if settings.RAG_SHARD_COUNT:
+            from innertone.rag.shards import reshard
+            await reshard(db, index, settings.RAG_SHARD_COUNT)
+
+    report = {"vectors": index.ntotal, "embedded": computed, "from_store": index.ntotal - computed}
+    logger.info(f"Index rebuild: {report}")
+    return report
+
+
+async def compaction_loop() -> None:
+    """Background task started by the app lifespan."""
+    from innertone.core.database import AsyncSessionLocal
+
+    while True:
+        await asyncio.sleep(settings.INDEX_COMPACTION_INTERVAL_HOURS * 3600)
+        try:
+            async with AsyncSessionLocal() as db:
+                await compact(db)
+        except IndexBusy:
+            pass  # An ingestion or another worker is on it; try next time
+        except Exception as e:
+            logger.error(f"Index compaction failed: {e}")
+
+
+if __name__ == "__main__":
+    import sys
+    from innertone.core.database import AsyncSessionLocal, engine
+
+    async def _main(args: list[str]):
+        async with AsyncSessionLocal() as db:
+            if args[:1] == ["stats"]:
+                print(await index_stats(db))
+            elif args[:1] == ["delete"] and len(args) == 2:
+                print(f"Tombstoned {await delete_book(db, args[1])} chunks of {args[1]}")
+            elif args[:1] == ["compact"]:
+                print(await compact(db, force="--force" in args))
+            elif args[:1] == ["rebuild"]:
+                print(await rebuild(db))
+            else:
+                print('Usage: python -m innertone.rag.store stats | delete "<book>" | compact [--force] | rebuild')
+                sys.exit(1)
+        await engine.dispose()
+
+    asyncio.run(_main(sys.argv[1:]))
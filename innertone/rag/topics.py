@@ -0,0 +1,318 @@
+"""
+Topic Assignment
+Fills DocumentMetadata.topic without a model call per chunk: the chunk
+vectors already in the FAISS index are clustered with k-means, each
+cluster is labelled once from the chunks nearest its centroid (several
+clusters per Gemini call, keyword labels as the fallback), and the topics
+are written back in bulk.
+
+The centroids and labels are saved next to the index, so later ingestion
+runs only assign their new chunks to the nearest existing topic (no
+clustering, no model calls). Re-cluster the whole corpus with --recluster
+once it has grown or changed a lot.
+
+    PYTHONPATH=. python -m innertone.rag.topics assign [--recluster]
+
+benchmarks/topics.py measures clustering time and labelling calls.
+"""
+import asyncio
+import logging
+import math
+import os
+import re
+import time
+from collections import Counter
+from typing import TYPE_CHECKING
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from innertone.core.config import get_settings
+from innertone.core.serialization import loads
+from innertone.models.document_metadata import DocumentMetadata
+from innertone.rag.store import FAISS_INDEX_PATH, load_index
+from innertone.services.llm_scheduler import Priority, estimate_tokens, get_scheduler
+
+if TYPE_CHECKING:
+    import faiss
+    import numpy as np
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+TOPIC_MODEL_PATH = FAISS_INDEX_PATH + ".topics.npz"
+# What ingestion used to write before topics were assigned
+PLACEHOLDER_TOPIC = "general psychology"
+
+# Fewer clusters than TOPIC_CLUSTERS for small corpora: at least this many
+# chunks each (FAISS warns below 39 training points per centroid)
+MIN_CLUSTER_SIZE = 40
+KMEANS_ITERATIONS = 20
+KMEANS_SEED = 1234
+# Points per centroid sampled for k-means++ seeding (FAISS trains on at most 256 per centroid too)
+KMEANS_SEED_SAMPLE = 256
+# Chunks nearest each centroid shown to the labeller, and characters of each
+LABEL_SAMPLES = 4
+LABEL_SAMPLE_CHARS = 300
+# Clusters labelled per Gemini call
+LABEL_BATCH = 8
+# Rows per bulk UPDATE
+WRITE_BATCH = 1000
+
+LABEL_MODELS = [
+    "gemini-2.5-flash-lite",
+    "gemini-2.0-flash-lite",
+]
+
+_LABEL_PROMPT = """
+Below are groups of passages from psychology and CBT books; the passages
+in a group are about the same subject. Give each group a short topic label
+of 1-4 words (for example "cognitive distortions", "sleep hygiene",
+"grief and loss"). Return ONLY a JSON object mapping each group id to its
+label, no extra text.
+
+{groups}
+""".strip()
+
+_WORD_RE = re.compile(r"[a-z]{4,}")
+_STOPWORDS = frozenset("""
+about after again also because been before being between both could does doing down during each
+from further have having here however into just like more most much must only other over same
+should some such than that their them then there these they this those through under until very
+what when where which while will with would your yours yourself you're it's chapter page
+""".split())
+
+
+def _cluster_count(chunks: int) -> int:
+    return max(1, min(settings.TOPIC_CLUSTERS, chunks // MIN_CLUSTER_SIZE))
+
+
+def _seed_centroids(vectors: "np.ndarray", k: int) -> "np.ndarray":
+    """
+    Greedy k-means++ seeding on a sample: a few candidates are drawn with
+    probability proportional to their squared distance from the nearest
+    centroid so far, and the one leaving the least total distance is kept.
+    FAISS starts from k random points instead, which often puts two
+    centroids in one topic and merges two others.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(KMEANS_SEED)
+    sample = vectors[rng.choice(len(vectors), min(len(vectors), KMEANS_SEED_SAMPLE * k), replace=False)]
+    norms = (sample ** 2).sum(axis=1)
+    trials = 2 + int(math.log(k))
+    chosen = [int(rng.integers(len(sample)))]
+    nearest = np.maximum(norms + norms[chosen[0]] - 2 * sample @ sample[chosen[0]], 0)
+    for _ in range(1, k):
+        total = nearest.sum()
+        candidates = (
+            rng.choice(len(sample), trials, p=nearest / total) if total > 0 else rng.integers(len(sample), size=trials)
+        )
+        distances = norms[None, :] + norms[candidates][:, None] - 2 * sample[candidates] @ sample.T
+        distances = np.minimum(nearest, np.maximum(distances, 0))
+        best = int(distances.sum(axis=1).argmin())
+        chosen.append(int(candidates[best]))
+        nearest = distances[best]
+    return sample[chosen]
+
+
+def cluster(vectors: "np.ndarray", k: int) -> tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+    """k-means over the vectors. Returns the centroids, each vector's cluster and its distance to it."""
+    import faiss
+
+    kmeans = faiss.Kmeans(vectors.shape[1], k, niter=KMEANS_ITERATIONS, seed=KMEANS_SEED, verbose=False)
+    kmeans.train(vectors, init_centroids=_seed_centroids(vectors, k))
+    distances, assignment = kmeans.index.search(vectors, 1)
+    return kmeans.centroids, assignment[:, 0], distances[:, 0]
+
+
+def nearest_members(assignment: "np.ndarray", distances: "np.ndarray", k: int, n: int) -> dict[int, list[int]]:
+    """The positions of the (up to) n members nearest each cluster's centroid."""
+    import numpy as np
+
+    order = np.lexsort((distances, assignment))
+    starts = np.searchsorted(assignment[order], np.arange(k))
+    ends = np.append(starts[1:], len(order))
+    return {c: order[starts[c] : min(ends[c], starts[c] + n)].tolist() for c in range(k)}
+
+
+def _keyword_labels(samples: dict[int, list[str]]) -> dict[int, str]:
+    """Each cluster's three most distinctive words, as a fallback label."""
+    counts = {c: Counter(w for text in texts for w in _WORD_RE.findall(text.lower()) if w not in _STOPWORDS)
+              for c, texts in samples.items()}
+    spread = Counter(w for words in counts.values() for w in words)
+    labels = {}
+    for c, words in counts.items():
+        ranked = sorted(words, key=lambda w: words[w] * math.log(1 + len(counts) / spread[w]), reverse=True)
+        labels[c] = ", ".join(ranked[:3]) or PLACEHOLDER_TOPIC
+    return labels
+
+
+async def _gemini_labels(samples: dict[int, list[str]]) -> dict[int, str]:
+    """Labels for one batch of clusters; raises if every model fails."""
+    from google import genai
+    from google.genai import types
+
+    groups = "\n\n".join(
+        f"Group {c}:\n" + "\n".join(f"- {' '.join(text.split())[:LABEL_SAMPLE_CHARS]}" for text in texts)
+        for c, texts in samples.items()
+    )
+    prompt = _LABEL_PROMPT.format(groups=groups)
+    scheduler = get_scheduler()
+    client = genai.Client(api_key=settings.GEMINI_API_KEY)
+    last_error = None
+    for model_name in LABEL_MODELS:
+        try:
+            async with scheduler.slot(Priority.BACKGROUND, model_name, tokens=estimate_tokens(prompt) + 20 * len(samples)):
+                response = await client.aio.models.generate_content(
+                    model=model_name,
+                    contents=[types.Content(role="user", parts=[types.Part(text=prompt)])],
+                    config=types.GenerateContentConfig(temperature=0.2, max_output_tokens=20 * len(samples) + 20),
+                )
+            raw = (response.text or "").strip().removeprefix("```json").removeprefix("```").removesuffix("```")
+            labels = loads(raw.strip())
+            return {
+                int(c): " ".join(str(label).split())[:255]
+                for c, label in labels.items()
+                if str(c).isdigit() and int(c) in samples and str(label).strip()
+            }
+        except Exception as e:
+            logger.warning(f"Topic label model {model_name} failed: {e}")
+            last_error = e
+    raise last_error
+
+
+async def label_clusters(samples: dict[int, list[str]]) -> tuple[dict[int, str], int]:
+    """A label per cluster, and the number of model calls made."""
+    labels = _keyword_labels(samples)
+    if not settings.GEMINI_API_KEY:
+        return labels, 0
+
+    calls = 0
+    clusters = sorted(samples)
+    for start in range(0, len(clusters), LABEL_BATCH):
+        batch = {c: samples[c] for c in clusters[start : start + LABEL_BATCH]}
+        calls += 1
+        try:
+            # Clusters missing from the answer keep their keyword label
+            labels.update(await _gemini_labels(batch))
+        except Exception:
+            pass
+    return labels, calls
+
+
+def _save_model(centroids: "np.ndarray", labels: list[str]) -> None:
+    import numpy as np
+
+    tmp = TOPIC_MODEL_PATH + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, centroids=centroids, labels=np.array(labels))
+    os.replace(tmp, TOPIC_MODEL_PATH)
+
+
+def _load_model() -> tuple["np.ndarray", list[str]] | None:
+    import numpy as np
+
+    if not os.path.exists(TOPIC_MODEL_PATH):
+        return None
+    with np.load(TOPIC_MODEL_PATH) as model:
+        return model["centroids"], model["labels"].tolist()
+
+
+def _vectors_for(index: "faiss.IndexIDMap2", faiss_ids: list[int]) -> tuple["np.ndarray", list[int]]:
+    """The stored vectors of those ids that have one, and the positions (in faiss_ids) they belong to."""
+    import faiss
+    import numpy as np
+
+    position = {faiss_id: i for i, faiss_id in enumerate(faiss.vector_to_array(index.id_map).tolist())}
+    found = [(i, position[faiss_id]) for i, faiss_id in enumerate(faiss_ids) if faiss_id in position]
+    if not found:
+        return np.empty((0, index.d), dtype="float32"), []
+    vectors = index.index.reconstruct_batch(np.array([p for _, p in found], dtype="int64"))
+    return vectors, [i for i, _ in found]
+
+
+async def _write_topics(db: AsyncSession, row_ids: list[int], topics: list[str]) -> None:
+    for start in range(0, len(row_ids), WRITE_BATCH):
+        await db.execute(
+            update(DocumentMetadata),
+            [{"id": row_id, "topic": topic} for row_id, topic in zip(row_ids[start : start + WRITE_BATCH], topics[start : start + WRITE_BATCH])],
+        )
+    await db.commit()
+
+
+async def assign_topics(db: AsyncSession, recluster: bool = False, index: "faiss.IndexIDMap2 | None" = None) -> dict:
+    """
+    Clusters and labels every live chunk (first run, or `recluster`), or else
+    gives chunks without a topic the label of their nearest centroid.
+    """
+    import faiss
+    import numpy as np
+
+    if index is None:
+        if not os.path.exists(FAISS_INDEX_PATH):
+            return {"skipped": "no index"}
+        index = await asyncio.to_thread(load_index, settings.EMBEDDING_DIMENSIONS)
+
+    model = None if recluster else await asyncio.to_thread(_load_model)
+    query = select(DocumentMetadata.id, DocumentMetadata.faiss_id).where(DocumentMetadata.deleted_at.is_(None))
+    if model is not None:
+        query = query.where(or_(DocumentMetadata.topic.is_(None), DocumentMetadata.topic == PLACEHOLDER_TOPIC))
+    rows = (await db.execute(query.order_by(DocumentMetadata.faiss_id))).all()
+    vectors, positions = await asyncio.to_thread(_vectors_for, index, [r.faiss_id for r in rows])
+    rows = [rows[i] for i in positions]
+    if not rows:
+        return {"chunks": 0}
+
+    report = {"chunks": len(rows)}
+    started = time.perf_counter()
+    if model is None:
+        k = _cluster_count(len(rows))
+        centroids, assignment, distances = await asyncio.to_thread(cluster, vectors, k)
+        report["cluster_s"] = round(time.perf_counter() - started, 2)
+
+        started = time.perf_counter()
+        nearest = nearest_members(assignment, distances, k, LABEL_SAMPLES)
+        sample_ids = {rows[p].id: c for c, members in nearest.items() for p in members}
+        samples: dict[int, list[str]] = {c: [] for c in range(k)}
+        result = await db.execute(
+            select(DocumentMetadata.id, DocumentMetadata.content).where(DocumentMetadata.id.in_(sample_ids))
+        )
+        for row_id, content in result:
+            samples[sample_ids[row_id]].append(content)
+        by_cluster, calls = await label_clusters(samples)
+        labels = [by_cluster[c] for c in range(k)]
+        await asyncio.to_thread(_save_model, centroids, labels)
+        report.update(clusters=k, label_calls=calls, label_s=round(time.perf_counter() - started, 2))
+    else:
+        centroids, labels = model
+        centroid_index = faiss.IndexFlatL2(centroids.shape[1])
+        centroid_index.add(centroids)
+        assignment = (await asyncio.to_thread(centroid_index.search, vectors, 1))[1][:, 0]
+        report.update(clusters=len(labels), label_calls=0, assign_s=round(time.perf_counter() - started, 2))
+
+    started = time.perf_counter()
+    await _write_topics(db, [r.id for r in rows], [labels[c] for c in assignment.tolist()])
+    report["write_s"] = round(time.perf_counter() - started, 2)
+    report["topics"] = dict(Counter(labels[c] for c in assignment.tolist()).most_common(10))
+    logger.info(f"Topic assignment: {report}")
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Cluster chunk embeddings into labelled topics.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    assign_parser = commands.add_parser("assign", help="Assign topics to the chunks in the database")
+    assign_parser.add_argument("--recluster", action="store_true", help="Re-cluster and re-label the whole corpus")
+    args = parser.parse_args()
+
+    from innertone.core.database import AsyncSessionLocal, engine
+
+    async def _assign():
+        async with AsyncSessionLocal() as db:
+            print(await assign_topics(db, recluster=args.recluster))
+        await engine.dispose()
+
+    asyncio.run(_assign())
@@ -0,0 +1,26 @@
+"""
+Analytics API Schema (Pydantic Models)
+"""
+from datetime import date
+from typing import Literal
+from pydantic import BaseModel, Field
+
+
+class IntensityDistribution(BaseModel):
+    low: int = 0
+    medium: int = 0
+    high: int = 0
+
+
+class MoodBucket(BaseModel):
+    period_start: date
+    # Number of emotion records in the period
+    total: int
+    emotions: dict[str, int] = Field(default_factory=dict, description="Records per detected emotion")
+    intensity: IntensityDistribution
+
+
+class MoodTrendResponse(BaseModel):
+    session_id: str
+    granularity: Literal["day", "week"]
+    buckets: list[MoodBucket] = []
@@ -1,8 +1,8 @@
 """
 Booking API Schema (Pydantic Models)
 """
-from pydantic import BaseModel, Field
-from datetime import datetime
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
+from datetime import date, datetime, time
 from typing import Optional
 
 
@@ -10,13 +10,76 @@ class AppointmentCreate(BaseModel):
     user_id: str = Field(..., description="User ID booking the appointment")
     therapist_name: str = Field(..., description="Name of the professional or AI service")
     scheduled_at: datetime = Field(..., description="Date and time of the appointment")
+    duration_minutes: Optional[int] = Field(None, ge=10, le=240, description="Defaults to BOOKING_DEFAULT_DURATION_MINUTES")
     notes: Optional[str] = Field(None, description="Optional notes for the session")
 
 
 class AppointmentResponse(AppointmentCreate):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
+    duration_minutes: int
+    ends_at: datetime
     status: str
     created_at: datetime
 
-    class Config:
-        from_attributes = True
+
+# Built once: validates a page of appointment rows in one pydantic-core call
+AppointmentList = TypeAdapter(list[AppointmentResponse])
+
+
+class AppointmentPage(BaseModel):
+    items: list[AppointmentResponse]
+    # Pass as ?cursor= to get the next page; null on the last page
+    next_cursor: Optional[str] = None
+
+
+class AvailabilityWindow(BaseModel):
+    weekday: int = Field(..., ge=0, le=6, description="0 = Monday ... 6 = Sunday")
+    start_time: time
+    end_time: time
+    slot_minutes: int = Field(50, ge=10, le=240)
+
+
+class AvailabilitySlot(BaseModel):
+    start: datetime
+    end: datetime
+
+
+class AvailabilityResponse(BaseModel):
+    therapist_name: str
+    day: date
+    slots: list[AvailabilitySlot] = []
+
+
+class AppointmentBatchCreate(BaseModel):
+    items: list[AppointmentCreate] = Field(..., min_length=1, max_length=10_000)
+
+
+class AppointmentBatchResult(BaseModel):
+    # Position of the item in the request
+    index: int
+    # "created", "conflict" or "unavailable"
+    status: str
+    appointment: Optional[AppointmentResponse] = None
+    error: Optional[str] = None
+
+
+class AppointmentBatchResponse(BaseModel):
+    created: int
+    failed: int
+    results: list[AppointmentBatchResult]
+
+
+class AppointmentBatchCancel(BaseModel):
+    appointment_ids: list[int] = Field(..., min_length=1, max_length=10_000)
+
+
+class CancelResult(BaseModel):
+    appointment_id: int
+    # "cancelled", "not_found" or "not_scheduled"
+    status: str
+
+
+class AppointmentBatchCancelResponse(BaseModel):
+    results: list[CancelResult]
@@ -0,0 +1,207 @@
+"""
+Mood Analytics Service
+Maintains the mood_rollups table and serves trend queries from it.
+
+Rollups are updated incrementally: whoever writes EmotionRecords (the chat
+endpoint, voice memory flushes) passes the same batch to
+apply_emotion_records() inside its transaction, which turns it into one
+upsert per touched bucket. backfill() rebuilds everything from
+emotion_records for historical data, while the API keeps writing:
+
+    PYTHONPATH=. python -m innertone.services.analytics --backfill
+
+Rollups are keyed by session: chat and emotion records carry no user id
+(sessions are the only identity the client sends), so "per user" trends
+are per session until records gain a user dimension.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import select, delete, func, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from innertone.models.analytics import MoodRollup, ALL_EMOTIONS
+from innertone.models.emotion import EmotionRecord
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ("day", "week")
+INTENSITIES = ("low", "medium", "high")
+
+BACKFILL_BATCH = 10_000
+# Parameter sets per upsert execution
+UPSERT_CHUNK = 2_000
+
+
+def floor_to_period(day: date, granularity: str) -> date:
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def period_start(moment: datetime, granularity: str) -> date:
+    day = moment.astimezone(timezone.utc).date() if moment.tzinfo else moment.date()
+    return floor_to_period(day, granularity)
+
+
+def aggregate(records: list[EmotionRecord]) -> dict[tuple, list[int]]:
+    """
+    Folds records into {(session, granularity, period, emotion): [count, low, medium, high]}.
+    Records not yet flushed have no created_at; they count as now.
+    """
+    now = datetime.now(timezone.utc)
+    deltas: dict[tuple, list[int]] = defaultdict(lambda: [0, 0, 0, 0])
+    for record in records:
+        created_at = record.created_at or now
+        intensity = record.intensity if record.intensity in INTENSITIES else "medium"
+        slot = 1 + INTENSITIES.index(intensity)
+        for granularity in GRANULARITIES:
+            start = period_start(created_at, granularity)
+            for emotion in {*record.emotions, ALL_EMOTIONS}:
+                delta = deltas[(record.session_id, granularity, start, emotion)]
+                delta[0] += 1
+                delta[slot] += 1
+    return deltas
+
+
+def _insert_for(db: AsyncSession):
+    if db.bind.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    return insert
+
+
+async def apply_emotion_records(db: AsyncSession, records: list[EmotionRecord]) -> None:
+    """Adds a batch of emotion records to the rollups. The caller commits."""
+    deltas = aggregate(records)
+    if not deltas:
+        return
+
+    insert = _insert_for(db)
+    rows = [
+        {
+            "session_id": session_id,
+            "granularity": granularity,
+            "period_start": start,
+            "emotion": emotion,
+            "count": count,
+            "intensity_low": low,
+            "intensity_medium": medium,
+            "intensity_high": high,
+        }
+        for (session_id, granularity, start, emotion), (count, low, medium, high) in deltas.items()
+    ]
+    # One statement executed with many parameter sets: compiled once and
+    # cached, where a multi-row VALUES would be compiled again every batch
+    stmt = insert(MoodRollup)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["session_id", "granularity", "period_start", "emotion"],
+        set_={
+            "count": MoodRollup.count + stmt.excluded.count,
+            "intensity_low": MoodRollup.intensity_low + stmt.excluded.intensity_low,
+            "intensity_medium": MoodRollup.intensity_medium + stmt.excluded.intensity_medium,
+            "intensity_high": MoodRollup.intensity_high + stmt.excluded.intensity_high,
+        },
+    )
+    for i in range(0, len(rows), UPSERT_CHUNK):
+        await db.execute(stmt, rows[i:i + UPSERT_CHUNK])
+
+
+async def get_mood_trend(
+    db: AsyncSession,
+    session_id: str,
+    granularity: str = "day",
+    start: date | None = None,
+    end: date | None = None,
+) -> list[dict]:
+    """Returns one bucket per period, oldest first, read straight from the rollups."""
+    query = select(MoodRollup).where(
+        MoodRollup.session_id == session_id,
+        MoodRollup.granularity == granularity,
+    )
+    if start is not None:
+        query = query.where(MoodRollup.period_start >= floor_to_period(start, granularity))
+    if end is not None:
+        query = query.where(MoodRollup.period_start <= end)
+    result = await db.execute(query.order_by(MoodRollup.period_start.asc()))
+
+    buckets: dict[date, dict] = {}
+    for row in result.scalars():
+        bucket = buckets.setdefault(row.period_start, {
+            "period_start": row.period_start,
+            "total": 0,
+            "emotions": {},
+            "intensity": {"low": 0, "medium": 0, "high": 0},
+        })
+        if row.emotion == ALL_EMOTIONS:
+            bucket["total"] = row.count
+            bucket["intensity"] = {
+                "low": row.intensity_low,
+                "medium": row.intensity_medium,
+                "high": row.intensity_high,
+            }
+        else:
+            bucket["emotions"][row.emotion] = row.count
+    return list(buckets.values())
+
+
+async def _reset_rollups(db: AsyncSession) -> int:
+    """
+    Empties the rollups and returns the highest emotion record id, in one
+    transaction. Records up to that id are the backfill's to replay; later
+    ones are rolled up by their writers. On Postgres, emotion_records is
+    locked against inserts meanwhile, so writers still in flight commit
+    first and later ones get higher ids (on SQLite the delete alone waits
+    for them, and blocks new writes until the commit).
+    """
+    if db.bind.dialect.name == "postgresql":
+        await db.execute(text("LOCK TABLE emotion_records IN SHARE MODE"))
+    await db.execute(delete(MoodRollup))
+    last_id = await db.scalar(select(func.max(EmotionRecord.id)))
+    await db.commit()
+    return last_id or 0
+
+
+async def backfill(db: AsyncSession) -> int:
+    """Rebuilds all rollups from emotion_records in id-ordered batches."""
+    end_id = await _reset_rollups(db)
+    last_id = 0
+    total = 0
+    while True:
+        result = await db.execute(
+            select(EmotionRecord)
+            .where(EmotionRecord.id > last_id, EmotionRecord.id <= end_id)
+            .order_by(EmotionRecord.id.asc())
+            .limit(BACKFILL_BATCH)
+        )
+        batch = result.scalars().all()
+        if not batch:
+            break
+        await apply_emotion_records(db, batch)
+        await db.commit()
+        last_id = batch[-1].id
+        total += len(batch)
+        db.expunge_all()
+        logger.info(f"Rolled up {total} emotion records...")
+    await db.commit()
+    return total
+
+
+if __name__ == "__main__":
+    import sys
+    from innertone.core.database import AsyncSessionLocal
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    async def _main():
+        async with AsyncSessionLocal() as db:
+            count = await backfill(db)
+        print(f"Backfill complete: {count} emotion records.")
+
+    if "--backfill" not in sys.argv:
+        print("Usage: python -m innertone.services.analytics --backfill")
+        sys.exit(1)
+    asyncio.run(_main())
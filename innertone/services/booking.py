@@ -0,0 +1,343 @@
+"""
+Booking Service
+Scheduling rules for appointments: therapist availability, overlap
+prevention and keyset-paginated listings.
+
+Overlaps are checked here so clients get a clear error, but the guarantee
+comes from the database: on Postgres the ex_appointments_no_overlap
+exclusion constraint rejects a second scheduled appointment whose
+[scheduled_at, ends_at) range overlaps another of the same therapist, even
+when both requests are checked concurrently. SQLite has no such constraint,
+so there bookings take the database write lock before checking, and
+concurrent ones queue behind each other.
+"""
+import base64
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import Row, select, delete, text, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from innertone.core.config import get_settings
+from innertone.models.booking import Appointment, TherapistAvailability
+
+settings = get_settings()
+
+OVERLAP_CONSTRAINT = "ex_appointments_no_overlap"
+MAX_PAGE_SIZE = 200
+MAX_BATCH_SIZE = 10_000
+# A batch is re-planned this many times if a concurrent booking takes one of its slots
+BATCH_ATTEMPTS = 3
+
+
+class BookingConflict(Exception):
+    """The therapist already has an appointment in that time range."""
+
+
+class OutsideAvailability(Exception):
+    """The requested time is in the past or outside the therapist's hours."""
+
+
+@lru_cache()
+def _tz() -> ZoneInfo:
+    return ZoneInfo(settings.BOOKING_TIMEZONE)
+
+
+def _default_windows(weekday: int) -> list[tuple[time, time, int]]:
+    if weekday not in settings.BOOKING_DEFAULT_WEEKDAYS:
+        return []
+    start, end = settings.BOOKING_DEFAULT_HOURS.split("-")
+    return [(time.fromisoformat(start), time.fromisoformat(end), settings.BOOKING_DEFAULT_DURATION_MINUTES)]
+
+
+def _aware(moment: datetime) -> datetime:
+    # SQLite hands timestamps back naive; they were stored as UTC
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def _windows_on(rows: list[TherapistAvailability], day: date) -> list[tuple[datetime, datetime, int]]:
+    if rows:
+        windows = [(r.start_time, r.end_time, r.slot_minutes) for r in rows if r.weekday == day.weekday()]
+    else:
+        windows = _default_windows(day.weekday())
+
+    tz = _tz()
+    return sorted(
+        (datetime.combine(day, start, tz), datetime.combine(day, end, tz), slot)
+        for start, end, slot in windows
+    )
+
+
+async def _load_availability(db: AsyncSession, therapist_names: set[str]) -> dict[str, list[TherapistAvailability]]:
+    result = await db.execute(
+        select(TherapistAvailability).where(TherapistAvailability.therapist_name.in_(therapist_names))
+    )
+    rows = defaultdict(list)
+    for row in result.scalars():
+        rows[row.therapist_name].append(row)
+    return rows
+
+
+async def get_windows(db: AsyncSession, therapist_name: str, day: date) -> list[tuple[datetime, datetime, int]]:
+    """The therapist's working windows on `day` as aware datetimes, with their slot length."""
+    availability = await _load_availability(db, {therapist_name})
+    return _windows_on(availability[therapist_name], day)
+
+
+def _check_slot(
+    therapist_name: str, windows: list[tuple[datetime, datetime, int]], scheduled_at: datetime, ends_at: datetime
+) -> None:
+    if scheduled_at <= datetime.now(timezone.utc):
+        raise OutsideAvailability("Appointments must be in the future")
+    if not any(start <= scheduled_at and ends_at <= end for start, end, _ in windows):
+        raise OutsideAvailability(f"{therapist_name} is not available at that time")
+
+
+def _normalise(scheduled_at: datetime, duration_minutes: int | None) -> tuple[datetime, datetime, int]:
+    if scheduled_at.tzinfo is None:
+        scheduled_at = scheduled_at.replace(tzinfo=_tz())
+    duration = duration_minutes or settings.BOOKING_DEFAULT_DURATION_MINUTES
+    return scheduled_at, scheduled_at + timedelta(minutes=duration), duration
+
+
+async def _lock_for_booking(db: AsyncSession) -> None:
+    """On SQLite, starts the write transaction now (a no-op UPDATE takes the lock) so the overlap check can't go stale."""
+    if db.bind.dialect.name == "sqlite":
+        await db.execute(text("UPDATE appointments SET id = id WHERE 0"))
+
+
+def _is_overlap_violation(e: IntegrityError) -> bool:
+    return getattr(e.orig, "sqlstate", None) == "23P01" or OVERLAP_CONSTRAINT in str(e.orig)
+
+
+async def set_availability(db: AsyncSession, therapist_name: str, windows: list[dict]) -> None:
+    """Replaces the therapist's weekly windows."""
+    await db.execute(delete(TherapistAvailability).where(TherapistAvailability.therapist_name == therapist_name))
+    db.add_all(TherapistAvailability(therapist_name=therapist_name, **w) for w in windows)
+    await db.commit()
+
+
+async def _scheduled_between(
+    db: AsyncSession, therapist_name: str, start: datetime, end: datetime
+) -> list[Appointment]:
+    result = await db.execute(
+        select(Appointment).where(
+            Appointment.therapist_name == therapist_name,
+            Appointment.status == "scheduled",
+            Appointment.scheduled_at < end,
+            Appointment.ends_at > start,
+        )
+    )
+    return result.scalars().all()
+
+
+async def free_slots(db: AsyncSession, therapist_name: str, day: date) -> list[tuple[datetime, datetime]]:
+    """Bookable slots on `day`: the windows cut into slots, minus taken and past ones."""
+    windows = await get_windows(db, therapist_name, day)
+    if not windows:
+        return []
+    taken = [
+        (_aware(a.scheduled_at), _aware(a.ends_at))
+        for a in await _scheduled_between(db, therapist_name, windows[0][0], windows[-1][1])
+    ]
+    now = datetime.now(timezone.utc)
+
+    slots = []
+    for window_start, window_end, slot_minutes in windows:
+        step = timedelta(minutes=slot_minutes)
+        start = window_start
+        while start + step <= window_end:
+            end = start + step
+            if start > now and not any(t_start < end and t_end > start for t_start, t_end in taken):
+                slots.append((start, end))
+            start = end
+    return slots
+
+
+async def create_appointment(
+    db: AsyncSession,
+    user_id: str,
+    therapist_name: str,
+    scheduled_at: datetime,
+    duration_minutes: int | None = None,
+    notes: str | None = None,
+) -> Appointment:
+    """Books an appointment; raises OutsideAvailability or BookingConflict."""
+    scheduled_at, ends_at, duration = _normalise(scheduled_at, duration_minutes)
+    windows = await get_windows(db, therapist_name, scheduled_at.astimezone(_tz()).date())
+    _check_slot(therapist_name, windows, scheduled_at, ends_at)
+    await _lock_for_booking(db)
+    if await _scheduled_between(db, therapist_name, scheduled_at, ends_at):
+        await db.rollback()
+        raise BookingConflict(f"{therapist_name} already has an appointment at that time")
+
+    appt = Appointment(
+        user_id=user_id,
+        therapist_name=therapist_name,
+        scheduled_at=scheduled_at,
+        duration_minutes=duration,
+        ends_at=ends_at,
+        notes=notes,
+        status="scheduled",
+    )
+    db.add(appt)
+    try:
+        await db.commit()
+    except IntegrityError as e:
+        # Lost a race with a concurrent booking of the same range
+        await db.rollback()
+        if _is_overlap_violation(e):
+            raise BookingConflict(f"{therapist_name} already has an appointment at that time") from e
+        raise
+    await db.refresh(appt)
+    return appt
+
+
+async def _plan_batch(db: AsyncSession, items: list[dict]) -> tuple[list[dict], list[Appointment]]:
+    """
+    Validates a batch against availability, existing appointments and the
+    batch itself, using two queries in total. Returns per-item results and
+    the rows to insert.
+    """
+    normalised = [_normalise(item["scheduled_at"], item.get("duration_minutes")) for item in items]
+    therapists = {item["therapist_name"] for item in items}
+    availability = await _load_availability(db, therapists)
+
+    # Existing scheduled ranges per therapist, sorted; they never overlap,
+    # so a new range conflicts only if it overlaps a neighbour
+    starts: dict[str, list[datetime]] = defaultdict(list)
+    ends: dict[str, list[datetime]] = defaultdict(list)
+    result = await db.execute(
+        select(Appointment.therapist_name, Appointment.scheduled_at, Appointment.ends_at).where(
+            Appointment.therapist_name.in_(therapists),
+            Appointment.status == "scheduled",
+            Appointment.scheduled_at < max(end for _, end, _ in normalised),
+            Appointment.ends_at > min(start for start, _, _ in normalised),
+        ).order_by(Appointment.scheduled_at)
+    )
+    for name, start, end in result:
+        starts[name].append(_aware(start))
+        ends[name].append(_aware(end))
+
+    now = datetime.now(timezone.utc)
+    results, rows = [], []
+    for index, (item, (scheduled_at, ends_at, duration)) in enumerate(zip(items, normalised)):
+        name = item["therapist_name"]
+        try:
+            windows = _windows_on(availability[name], scheduled_at.astimezone(_tz()).date())
+            _check_slot(name, windows, scheduled_at, ends_at)
+        except OutsideAvailability as e:
+            results.append({"index": index, "status": "unavailable", "error": str(e)})
+            continue
+        i = bisect_left(starts[name], scheduled_at)
+        if (i < len(starts[name]) and starts[name][i] < ends_at) or (i > 0 and ends[name][i - 1] > scheduled_at):
+            results.append({"index": index, "status": "conflict", "error": f"{name} already has an appointment at that time"})
+            continue
+        starts[name].insert(i, scheduled_at)
+        ends[name].insert(i, ends_at)
+
+        appt = Appointment(
+            user_id=item["user_id"],
+            therapist_name=name,
+            scheduled_at=scheduled_at,
+            duration_minutes=duration,
+            ends_at=ends_at,
+            notes=item.get("notes"),
+            status="scheduled",
+            # Set here so the batch needs no refresh round trip per row
+            created_at=now,
+        )
+        rows.append(appt)
+        results.append({"index": index, "status": "created", "appointment": appt})
+    return results, rows
+
+
+async def create_appointments_batch(db: AsyncSession, items: list[dict]) -> list[dict]:
+    """
+    Books many appointments in one transaction. Items that are unavailable
+    or conflict are reported and skipped; the rest are inserted together.
+    If a concurrent booking takes one of the slots before the commit, the
+    batch is re-planned; BookingConflict is raised if that keeps happening.
+    """
+    if not items:
+        return []
+    for attempt in range(BATCH_ATTEMPTS):
+        await _lock_for_booking(db)
+        results, rows = await _plan_batch(db, items)
+        db.add_all(rows)
+        try:
+            await db.commit()
+            return results
+        except IntegrityError as e:
+            await db.rollback()
+            if not _is_overlap_violation(e):
+                raise
+    raise BookingConflict("Concurrent bookings kept conflicting with this batch; retry it")
+
+
+async def cancel_appointments_batch(db: AsyncSession, appointment_ids: list[int]) -> list[dict]:
+    """Cancels many appointments in one transaction, reporting each id's outcome."""
+    result = await db.execute(
+        select(Appointment.id, Appointment.status).where(Appointment.id.in_(set(appointment_ids)))
+    )
+    statuses = dict(result.all())
+    to_cancel = [i for i, status in statuses.items() if status == "scheduled"]
+    if to_cancel:
+        await db.execute(
+            update(Appointment)
+            .where(Appointment.id.in_(to_cancel), Appointment.status == "scheduled")
+            .values(status="cancelled")
+        )
+    await db.commit()
+
+    outcomes = {i: "cancelled" for i in to_cancel}
+    return [
+        {"appointment_id": i, "status": outcomes.get(i, "not_found" if i not in statuses else "not_scheduled")}
+        for i in appointment_ids
+    ]
+
+
+def encode_cursor(appt: Appointment | Row) -> str:
+    raw = f"{appt.scheduled_at.isoformat()}|{appt.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Raises ValueError for malformed cursors."""
+    try:
+        scheduled_at, appt_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(scheduled_at), int(appt_id)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+
+async def list_user_appointments(
+    db: AsyncSession,
+    user_id: str,
+    status: str | None = None,
+    cursor: str | None = None,
+    limit: int | None = None,
+) -> tuple[list[Row], str | None]:
+    """
+    One page of the user's appointments ordered by (scheduled_at, id), read
+    from the (user_id, scheduled_at) index. Returns the page and the cursor
+    for the next one. The page holds plain column rows, not ORM objects: it
+    is only read, and skips the identity map and attribute instrumentation.
+    """
+    limit = min(limit or settings.BOOKING_PAGE_SIZE, MAX_PAGE_SIZE)
+    query = select(*Appointment.__table__.columns).where(Appointment.user_id == user_id)
+    if status is not None:
+        query = query.where(Appointment.status == status)
+    if cursor is not None:
+        query = query.where(tuple_(Appointment.scheduled_at, Appointment.id) > decode_cursor(cursor))
+    result = await db.execute(
+        query.order_by(Appointment.scheduled_at.asc(), Appointment.id.asc()).limit(limit + 1)
+    )
+    rows = result.all()
+    if len(rows) > limit:
+        return rows[:limit], encode_cursor(rows[limit - 1])
+    return rows, None
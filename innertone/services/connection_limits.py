@@ -0,0 +1,193 @@
+"""
+WebSocket Connection Lifecycle
+Admission, heartbeats, message limits and gauges for the calls endpoints.
+
+Every socket is wrapped in a GuardedConnection, which:
+  - rejects clients that connect too often (per IP) or open too many
+    sockets for one session
+  - sends {"type": "ping"} every WS_HEARTBEAT_INTERVAL and closes sockets
+    that have been silent for WS_IDLE_TIMEOUT (clients answer with
+    {"type": "pong"}; any message counts as a sign of life)
+  - closes on oversized messages, and with 1008 when a session exceeds its
+    message rate; nothing is dropped silently, since a lost SDP offer or ICE
+    candidate breaks the call. Heartbeat replies are never rate limited,
+    nor, on the voice socket, the playback controls (ack, barge_in);
+    signaling frames are all relayed to the other peers, so they all count.
+"""
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Awaitable, Callable
+
+from fastapi import WebSocket, WebSocketDisconnect, status
+from innertone.core.config import get_settings
+from innertone.core.rate_limit import KeyedRateLimiter
+from innertone.core.serialization import dumps, loads
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+PING_FRAME = dumps({"type": "ping"})
+# Client frames exempt from the message rate limit, per endpoint
+HEARTBEAT_FRAMES = frozenset({"pong"})
+VOICE_CONTROL_FRAMES = HEARTBEAT_FRAMES | {"ack", "barge_in"}
+
+
+def frame_type(data: str) -> str | None:
+    """The "type" of a JSON object frame, or None for anything else."""
+    try:
+        payload = loads(data)
+    except ValueError:
+        return None
+    return payload.get("type") if isinstance(payload, dict) else None
+
+
+class ConnectionRegistry:
+    """Process-wide gauges and counters for open call sockets."""
+
+    def __init__(self):
+        self.open_by_endpoint: Counter[str] = Counter()
+        self.open_by_session: Counter[str] = Counter()
+        self.active_calls: Counter[str] = Counter()
+        self.totals: Counter[str] = Counter()
+
+    def opened(self, endpoint: str, session_id: str) -> None:
+        self.open_by_endpoint[endpoint] += 1
+        self.open_by_session[session_id] += 1
+        self.totals["opened"] += 1
+
+    def closed(self, endpoint: str, session_id: str) -> None:
+        self._decrement(self.open_by_endpoint, endpoint)
+        self._decrement(self.open_by_session, session_id)
+        self.totals["closed"] += 1
+
+    def try_begin_call(self, session_id: str) -> bool:
+        """Reserves one of the session's concurrent consultant call slots."""
+        if self.active_calls[session_id] >= settings.VOICE_MAX_CONCURRENT_TURNS:
+            self.totals["calls_rejected"] += 1
+            return False
+        self.active_calls[session_id] += 1
+        return True
+
+    def end_call(self, session_id: str) -> None:
+        self._decrement(self.active_calls, session_id)
+
+    @staticmethod
+    def _decrement(counter: Counter, key: str) -> None:
+        # Drop zeroed keys so per-session entries do not accumulate
+        counter[key] -= 1
+        if counter[key] <= 0:
+            del counter[key]
+
+    def snapshot(self) -> dict:
+        return {
+            "open_connections": sum(self.open_by_endpoint.values()),
+            "open_by_endpoint": dict(self.open_by_endpoint),
+            "sessions": len(self.open_by_session),
+            "active_calls": sum(self.active_calls.values()),
+            "totals": dict(self.totals),
+        }
+
+
+registry = ConnectionRegistry()
+
+_connect_limiter = KeyedRateLimiter(
+    rate=settings.WS_CONNECTS_PER_MINUTE / 60,
+    capacity=settings.WS_CONNECTS_PER_MINUTE,
+)
+_message_limiter = KeyedRateLimiter(
+    rate=settings.WS_MESSAGES_PER_SECOND,
+    capacity=settings.WS_MESSAGE_BURST,
+)
+
+
+class GuardedConnection:
+    """Wraps a call WebSocket with admission control, heartbeats and limits."""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        endpoint: str,
+        session_id: str,
+        control_frames: frozenset[str] = HEARTBEAT_FRAMES,
+    ):
+        self.websocket = websocket
+        self.endpoint = endpoint
+        self.session_id = session_id
+        # Frame types that skip the message rate limit
+        self.control_frames = control_frames
+        self.send_ping: Callable[[], Awaitable[None]] = self._send_ping
+        self.last_seen = time.monotonic()
+        self._admitted = False
+        self._heartbeat: asyncio.Task | None = None
+
+    def _client_ip(self) -> str:
+        return self.websocket.client.host if self.websocket.client else "unknown"
+
+    async def admit(self) -> bool:
+        """Checks connection limits; closes the handshake and returns False if over them."""
+        if not _connect_limiter.allow(self._client_ip()):
+            reason = "too many connections from this address"
+        elif registry.open_by_session[self.session_id] >= settings.WS_MAX_CONNECTIONS_PER_SESSION:
+            reason = "too many connections for this session"
+        else:
+            self._admitted = True
+            registry.opened(self.endpoint, self.session_id)
+            return True
+
+        registry.totals["rejected"] += 1
+        logger.warning(f"Rejected {self.endpoint} socket for {self.session_id}: {reason}")
+        await self.websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=reason)
+        return False
+
+    def start_heartbeat(self) -> None:
+        """Call once the socket is accepted."""
+        self._heartbeat = asyncio.create_task(self._beat())
+
+    async def receive_text(self) -> str:
+        """Next application message; heartbeat replies are consumed here."""
+        while True:
+            data = await self.websocket.receive_text()
+            self.last_seen = time.monotonic()
+
+            if len(data.encode()) > settings.WS_MAX_MESSAGE_BYTES:
+                registry.totals["oversized"] += 1
+                await self.websocket.close(code=status.WS_1009_MESSAGE_TOO_BIG)
+                raise WebSocketDisconnect(code=status.WS_1009_MESSAGE_TOO_BIG)
+            kind = frame_type(data)
+            if kind == "pong":
+                continue  # Heartbeat reply
+            if kind not in self.control_frames and not _message_limiter.allow(self.session_id):
+                registry.totals["rate_limited"] += 1
+                logger.warning(f"Closing {self.endpoint} socket for {self.session_id}: message rate exceeded")
+                await self.websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="message rate exceeded")
+                raise WebSocketDisconnect(code=status.WS_1008_POLICY_VIOLATION)
+            return data
+
+    def release(self) -> None:
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+        if self._admitted:
+            self._admitted = False
+            registry.closed(self.endpoint, self.session_id)
+
+    async def _send_ping(self) -> None:
+        await self.websocket.send_text(PING_FRAME)
+
+    async def _beat(self) -> None:
+        while True:
+            await asyncio.sleep(settings.WS_HEARTBEAT_INTERVAL)
+            if time.monotonic() - self.last_seen > settings.WS_IDLE_TIMEOUT:
+                logger.info(f"Reaping idle {self.endpoint} socket for {self.session_id}")
+                registry.totals["reaped"] += 1
+                try:
+                    await self.websocket.close(code=status.WS_1001_GOING_AWAY)
+                except Exception:
+                    pass
+                return
+            try:
+                await self.send_ping()
+            except Exception:
+                return
+
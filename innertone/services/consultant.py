@@ -3,17 +3,25 @@ LLM Consultant Engine
 Orchestrates the full CBT-style response cycle:
   1. Safety check (always first)
   2. RAG retrieval from FAISS
-  3. Build prompt with context
+  3. Build prompt with context (or reuse a provider-cached prefix)
   4. Call Gemini via google-genai SDK
+
+The google-genai SDK is imported on the first call rather than at import
+time, keeping API startup light. One client is shared by all calls.
 """
-from google import genai
-from google.genai import types
+import logging
+import time
+from typing import AsyncIterator
 from innertone.core.config import get_settings
+from innertone.services.diagnostics import record_attempt, stage
 from innertone.rag.retrieve import retrieve_relevant_chunks
 from innertone.services.safety import check_for_crisis
+from innertone.services.context_cache import CacheEntry, get_context_cache, is_cache_rejection
+from innertone.services.llm_scheduler import Priority, SchedulerOverloaded, estimate_tokens, get_scheduler
 from sqlalchemy.ext.asyncio import AsyncSession
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
 
 # CBT-guided system instruction
 CBT_SYSTEM_PROMPT = """
@@ -50,14 +58,157 @@ def _format_rag_context(chunks: list[dict]) -> str:
     return "\n".join(lines)
 
 
+# Tried in order until one succeeds
+FALLBACK_MODELS = [
+    "gemini-2.5-flash-lite",
+    "gemini-2.0-flash-lite",
+    "gemini-2.5-flash", 
+    "gemini-2.0-flash", 
+    "gemini-flash-lite-latest",
+    "gemini-flash-latest",
+    "gemini-2.5-pro",
+    "gemini-pro-latest"
+]
+
+
+async def _retrieve_context(user_message: str, db: AsyncSession) -> tuple[str, list[dict]]:
+    """Runs RAG retrieval. Returns the formatted excerpts and the chunks."""
+    relevant_chunks = []
+    if settings.RAG_ENABLED:
+        try:
+            with stage("retrieval"):
+                relevant_chunks = await retrieve_relevant_chunks(user_message, db, top_k=settings.RAG_TOP_K)
+        except FileNotFoundError:
+            pass  # No FAISS index yet — respond without book context
+
+    return _format_rag_context(relevant_chunks), relevant_chunks
+
+
+def _build_contents(conversation_history: list[dict], full_user_message: str) -> list:
+    """Converts the stored history plus the current message to google-genai Contents."""
+    from google.genai import types
+
+    contents = []
+    for turn in conversation_history:
+        role = turn["role"]
+        text = turn["parts"][0]["text"]
+        contents.append(types.Content(role=role, parts=[types.Part(text=text)]))
+
+    # Append the current user message
+    contents.append(types.Content(role="user", parts=[types.Part(text=full_user_message)]))
+    return contents
+
+
+MAX_OUTPUT_TOKENS = 600
+
+_client = None
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        from google import genai
+
+        _client = genai.Client(api_key=settings.GEMINI_API_KEY)
+    return _client
+
+
+def _usage(response) -> dict | None:
+    """Token counts reported by the provider, if any."""
+    meta = getattr(response, "usage_metadata", None)
+    if meta is None:
+        return None
+    return {
+        "prompt_tokens": meta.prompt_token_count or 0,
+        "output_tokens": meta.candidates_token_count or 0,
+        "cached_tokens": getattr(meta, "cached_content_token_count", None) or 0,
+    }
+
+
+def _lookup_cached_prefix(model_name: str, rag_context: str) -> CacheEntry | None:
+    return get_context_cache().lookup(_get_client(), model_name, CBT_SYSTEM_PROMPT, rag_context)
+
+
+def _build_request(
+    conversation_history: list[dict],
+    user_message: str,
+    rag_context: str,
+    cached: CacheEntry | None,
+) -> tuple[list, object]:
+    """
+    Contents and config for one model call. A provider-cached prefix replaces
+    the system instruction and, when the excerpts are cached with it, the
+    excerpts injected in front of the user message.
+    """
+    full_user_message = user_message
+    if rag_context and not (cached is not None and cached.with_context):
+        full_user_message = f"{rag_context}\n\n---\n\n**User:** {user_message}"
+    contents = _build_contents(conversation_history, full_user_message)
+    return contents, _build_generation_config(cached.name if cached is not None else None)
+
+
+def _with_uncached_retry(cached: CacheEntry | None) -> list[CacheEntry | None]:
+    """
+    Cached attempt first; if the provider rejects the prefix, the same model
+    without it. Any other error moves on to the next model.
+    """
+    return [cached, None] if cached is not None else [None]
+
+
+def _record_success(model_name: str, outcome: str, started: float, usage: dict | None, cached: CacheEntry | None) -> None:
+    seconds = time.perf_counter() - started
+    saved = get_context_cache().observe(model_name, cached, seconds, (usage or {}).get("cached_tokens", 0))
+    record_attempt(
+        model_name, outcome, seconds, usage=usage,
+        cache=cached.kind if cached is not None else None, latency_saved_ms=saved,
+    )
+
+
+def _estimate_request_tokens(contents: list) -> int:
+    """Prompt + completion budget charged to the model's TPM bucket."""
+    texts = [part.text or "" for content in contents for part in content.parts]
+    return estimate_tokens(CBT_SYSTEM_PROMPT, *texts) + MAX_OUTPUT_TOKENS
+
+
+def _build_generation_config(cached_content: str | None = None):
+    from google.genai import types
+
+    return types.GenerateContentConfig(
+        # The system prompt is part of the cached content when one is used
+        system_instruction=None if cached_content else CBT_SYSTEM_PROMPT,
+        cached_content=cached_content,
+        temperature=0.7,
+        max_output_tokens=MAX_OUTPUT_TOKENS,
+        safety_settings=[
+            types.SafetySetting(category="HARM_CATEGORY_DANGEROUS_CONTENT", threshold="BLOCK_NONE"),
+            types.SafetySetting(category="HARM_CATEGORY_HARASSMENT", threshold="BLOCK_NONE"),
+            types.SafetySetting(category="HARM_CATEGORY_HATE_SPEECH", threshold="BLOCK_NONE"),
+            types.SafetySetting(category="HARM_CATEGORY_SEXUALLY_EXPLICIT", threshold="BLOCK_NONE"),
+        ]
+    )
+
+
+def _format_sources(relevant_chunks: list[dict]) -> list[dict]:
+    return [
+        {"book": c["book_name"], "section": c["section"]}
+        for c in relevant_chunks
+    ]
+
+
 async def get_consultant_response(
     user_message: str,
     conversation_history: list[dict],
     db: AsyncSession,
+    priority: Priority = Priority.CHAT,
 ) -> dict:
     """
     Main entry point for the consultant engine.
     Returns: {"response": str, "is_crisis": bool, "sources": list}
+
+    A model that fails, or whose request budget is spent, hands over to the
+    next in FALLBACK_MODELS. SchedulerOverloaded for a full queue or a missed
+    deadline is raised to the caller instead: the queue is shared by every
+    model, so another model would only wait in it again.
     """
     # --- Step 1: Safety Check (always first) ---
     safety_result = check_for_crisis(user_message)
@@ -69,81 +220,139 @@ async def get_consultant_response(
         }
 
     # --- Step 2: RAG Retrieval ---
-    relevant_chunks = []
-    try:
-        relevant_chunks = await retrieve_relevant_chunks(user_message, db, top_k=4)
-    except FileNotFoundError:
-        pass  # No FAISS index yet — respond without book context
+    rag_context, relevant_chunks = await _retrieve_context(user_message, db)
 
-    rag_context = _format_rag_context(relevant_chunks)
+    # --- Step 3 & 4: Build the request (reusing a cached prefix when there is one) and call Gemini ---
+    client = _get_client()
+    scheduler = get_scheduler()
 
-    # --- Step 3: Build the full user message with RAG context injected ---
-    full_user_message = user_message
-    if rag_context:
-        full_user_message = f"{rag_context}\n\n---\n\n**User:** {user_message}"
-
-    # --- Step 4: Call Gemini using google-genai SDK ---
-    client = genai.Client(api_key=settings.GEMINI_API_KEY)
-
-    # Build history in google-genai Content format
-    contents = []
-    for turn in conversation_history:
-        role = turn["role"]
-        text = turn["parts"][0]["text"]
-        contents.append(types.Content(role=role, parts=[types.Part(text=text)]))
-
-    # Append the current user message
-    contents.append(types.Content(role="user", parts=[types.Part(text=full_user_message)]))
-
-    fallback_models = [
-        "gemini-2.5-flash-lite",
-        "gemini-2.0-flash-lite",
-        "gemini-2.5-flash", 
-        "gemini-2.0-flash", 
-        "gemini-flash-lite-latest",
-        "gemini-flash-latest",
-        "gemini-2.5-pro",
-        "gemini-pro-latest"
-    ]
+    response = None
     response_text = None
     last_error = None
 
-    for model_name in fallback_models:
-        try:
-            response = client.models.generate_content(
-                model=model_name,
-                contents=contents,
-                config=types.GenerateContentConfig(
-                    system_instruction=CBT_SYSTEM_PROMPT,
-                    temperature=0.7,
-                    max_output_tokens=600,
-                    safety_settings=[
-                        types.SafetySetting(category="HARM_CATEGORY_DANGEROUS_CONTENT", threshold="BLOCK_NONE"),
-                        types.SafetySetting(category="HARM_CATEGORY_HARASSMENT", threshold="BLOCK_NONE"),
-                        types.SafetySetting(category="HARM_CATEGORY_HATE_SPEECH", threshold="BLOCK_NONE"),
-                        types.SafetySetting(category="HARM_CATEGORY_SEXUALLY_EXPLICIT", threshold="BLOCK_NONE"),
-                    ]
-                ),
-            )
-            response_text = response.text
-            print(f"DEBUG: Success with {model_name}")
+    for model_name in FALLBACK_MODELS:
+        for cached in _with_uncached_retry(_lookup_cached_prefix(model_name, rag_context)):
+            contents, config = _build_request(conversation_history, user_message, rag_context, cached)
+            started = time.perf_counter()
+            try:
+                async with scheduler.slot(priority, model_name, tokens=_estimate_request_tokens(contents)):
+                    response = await client.aio.models.generate_content(
+                        model=model_name,
+                        contents=contents,
+                        config=config,
+                    )
+                response_text = response.text
+                _record_success(model_name, "ok" if response_text else "empty", started, _usage(response), cached)
+                logger.debug(f"Consultant reply from {model_name}")
+                break
+            except SchedulerOverloaded as e:
+                if e.model != model_name:
+                    raise
+                logger.warning(f"Model {model_name} is over its request budget: {e}")
+                last_error = e
+                break
+            except Exception as e:
+                record_attempt(model_name, "error", time.perf_counter() - started, e, cache=cached and cached.kind)
+                if cached is not None and is_cache_rejection(e, cached):
+                    get_context_cache().invalidate(cached)
+                    continue
+                logger.warning(f"Model {model_name} failed: {e}")
+                last_error = e
+                break
+        if response is not None:
             break
-        except Exception as e:
-            print(f"DEBUG: Model {model_name} failed: {str(e)}")
-            last_error = e
-            continue
 
     if not response_text:
         raise last_error
 
     # --- Step 5: Return structured result ---
-    sources = [
-        {"book": c["book_name"], "section": c["section"]}
-        for c in relevant_chunks
-    ]
-
     return {
         "response": response_text,
         "is_crisis": False,
-        "sources": sources,
+        "sources": _format_sources(relevant_chunks),
+    }
+
+
+async def stream_consultant_response(
+    user_message: str,
+    conversation_history: list[dict],
+    db: AsyncSession,
+    priority: Priority = Priority.VOICE,
+) -> AsyncIterator[dict]:
+    """
+    Streaming variant of get_consultant_response for the voice pipeline.
+
+    Yields {"type": "delta", "text": str} as Gemini produces output, then a
+    final {"type": "done", "response": str, "is_crisis": bool, "sources": list}.
+    Falls back to the next model only while nothing has been yielded yet;
+    a failure mid-stream is raised to the caller, as is scheduler overload
+    (see get_consultant_response).
+    """
+    safety_result = check_for_crisis(user_message)
+    if safety_result["is_crisis"]:
+        yield {"type": "delta", "text": safety_result["response"]}
+        yield {
+            "type": "done",
+            "response": safety_result["response"],
+            "is_crisis": True,
+            "sources": [],
+        }
+        return
+
+    rag_context, relevant_chunks = await _retrieve_context(user_message, db)
+
+    client = _get_client()
+    scheduler = get_scheduler()
+
+    parts: list[str] = []
+    last_error = None
+
+    for model_name in FALLBACK_MODELS:
+        for cached in _with_uncached_retry(_lookup_cached_prefix(model_name, rag_context)):
+            contents, config = _build_request(conversation_history, user_message, rag_context, cached)
+            started = time.perf_counter()
+            usage = None
+            try:
+                # The slot is held for the whole stream
+                async with scheduler.slot(priority, model_name, tokens=_estimate_request_tokens(contents)):
+                    stream = await client.aio.models.generate_content_stream(
+                        model=model_name,
+                        contents=contents,
+                        config=config,
+                    )
+                    async for chunk in stream:
+                        usage = _usage(chunk) or usage
+                        text = chunk.text
+                        if text:
+                            parts.append(text)
+                            yield {"type": "delta", "text": text}
+                _record_success(model_name, "ok" if parts else "empty", started, usage, cached)
+                break
+            except SchedulerOverloaded as e:
+                if e.model != model_name:
+                    raise
+                logger.warning(f"Model {model_name} is over its request budget: {e}")
+                last_error = e
+                break
+            except Exception as e:
+                record_attempt(model_name, "error", time.perf_counter() - started, e, cache=cached and cached.kind)
+                if parts:
+                    raise
+                if cached is not None and is_cache_rejection(e, cached):
+                    get_context_cache().invalidate(cached)
+                    continue
+                logger.warning(f"Model {model_name} failed: {e}")
+                last_error = e
+                break
+        if parts:
+            break
+
+    if not parts:
+        raise last_error or RuntimeError("All models returned an empty response")
+
+    yield {
+        "type": "done",
+        "response": "".join(parts),
+        "is_crisis": False,
+        "sources": _format_sources(relevant_chunks),
     }
@@ -0,0 +1,280 @@
+"""
+Context Cache Manager
+Provider-side (Gemini explicit) caching of the prompt prefix that repeats
+across turns: the CBT system prompt, alone or together with a bundle of
+book excerpts that keeps being retrieved.
+
+  - The system prompt entry is created on first use per model; an excerpt
+    bundle once it has been retrieved CONTEXT_CACHE_HOT_THRESHOLD times.
+    Creation runs in the background, so requests never wait for it.
+  - Entries used within CONTEXT_CACHE_REFRESH_MARGIN of their expiry get
+    their TTL extended; unused ones simply expire. At most
+    CONTEXT_CACHE_MAX_ENTRIES are kept, least recently used deleted first.
+  - Prefixes below the provider minimum are never sent, and a model whose
+    cache creation fails is left uncached for a cooldown, so callers fall
+    back to the plain request transparently.
+
+Scope is the current process; each worker manages its own entries.
+
+Usage:
+    entry = get_context_cache().lookup(client, model, system_prompt, excerpts)
+    # entry.name -> GenerateContentConfig(cached_content=...), minus the cached parts
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+
+from innertone.core.config import get_settings
+from innertone.services.llm_scheduler import estimate_tokens
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# A model whose cache creation failed is retried after this long (seconds)
+UNSUPPORTED_COOLDOWN = 3600.0
+# Entries this close to expiry are treated as gone (clock skew, request time)
+EXPIRY_SKEW = 30.0
+# Excerpt bundles whose retrieval counts are tracked
+HOT_TRACKED_BUNDLES = 1024
+# Smoothing of the cached / uncached latency averages
+LATENCY_EWMA_ALPHA = 0.1
+
+
+@dataclass
+class CacheEntry:
+    key: str
+    model: str
+    name: str
+    with_context: bool
+    tokens: int
+    expires_at: float  # epoch seconds
+
+    @property
+    def kind(self) -> str:
+        return "system+excerpts" if self.with_context else "system"
+
+
+def is_cache_rejection(error: Exception, entry: CacheEntry) -> bool:
+    """
+    Whether a failed call was refused because of its cached content (expired,
+    deleted or not visible): a 4xx naming the cache. Rate limits, overload,
+    5xx and timeouts say nothing about the entry and must not drop it.
+    """
+    code = getattr(error, "code", None)
+    if not isinstance(code, int) or not 400 <= code < 500 or code == 429:
+        return False
+    message = str(error).lower()
+    return entry.name.lower() in message or "cachedcontent" in message.replace("_", "").replace(" ", "")
+
+
+class ContextCacheManager:
+    def __init__(
+        self,
+        enabled: bool,
+        ttl: float,
+        refresh_margin: float,
+        min_tokens: int,
+        hot_threshold: int,
+        max_entries: int,
+    ):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.min_tokens = min_tokens
+        self.hot_threshold = hot_threshold
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._hot: OrderedDict[str, int] = OrderedDict()
+        self._unsupported: dict[str, float] = {}
+        self._latency: dict[tuple[str, bool], float] = {}
+        self.stats: Counter[str] = Counter()
+
+    @classmethod
+    def from_settings(cls) -> "ContextCacheManager":
+        return cls(
+            enabled=settings.CONTEXT_CACHE_ENABLED,
+            ttl=settings.CONTEXT_CACHE_TTL_SECONDS,
+            refresh_margin=settings.CONTEXT_CACHE_REFRESH_MARGIN_SECONDS,
+            min_tokens=settings.CONTEXT_CACHE_MIN_TOKENS,
+            hot_threshold=settings.CONTEXT_CACHE_HOT_THRESHOLD,
+            max_entries=settings.CONTEXT_CACHE_MAX_ENTRIES,
+        )
+
+    @staticmethod
+    def _key(model: str, system_prompt: str, context: str = "") -> str:
+        digest = hashlib.sha256(f"{system_prompt}\0{context}".encode()).hexdigest()
+        return f"{model}:{digest}"
+
+    def lookup(self, client, model: str, system_prompt: str, context: str = "") -> CacheEntry | None:
+        """
+        The best cached prefix for a request: system prompt plus `context`
+        (the formatted excerpts), else the system prompt alone, else None.
+        Missing entries are created in the background for later requests.
+        """
+        if not self.enabled or self._unsupported.get(model, 0.0) > time.monotonic():
+            return None
+
+        if context:
+            key = self._key(model, system_prompt, context)
+            entry = self._usable(client, key)
+            if entry is not None:
+                self.stats["hits"] += 1
+                return entry
+            if self._is_hot(key) and estimate_tokens(system_prompt, context) >= self.min_tokens:
+                self._spawn(key, self._create(client, key, model, system_prompt, context))
+
+        key = self._key(model, system_prompt)
+        entry = self._usable(client, key)
+        if entry is not None:
+            self.stats["hits"] += 1
+            return entry
+        if estimate_tokens(system_prompt) >= self.min_tokens:
+            self._spawn(key, self._create(client, key, model, system_prompt))
+        else:
+            self.stats["below_min_tokens"] += 1
+        self.stats["misses"] += 1
+        return None
+
+    def invalidate(self, entry: CacheEntry) -> None:
+        """Forgets an entry the provider rejected (expired or deleted early)."""
+        if self._entries.pop(entry.key, None) is not None:
+            self.stats["invalidated"] += 1
+
+    def observe(self, model: str, entry: CacheEntry | None, seconds: float, cached_tokens: int = 0) -> float | None:
+        """
+        Records one successful call. Returns the estimated latency saved (ms)
+        by a cached call: the gap between this model's average uncached and
+        cached latency, once both have been seen.
+        """
+        key = (model, entry is not None)
+        previous = self._latency.get(key)
+        self._latency[key] = seconds if previous is None else previous + LATENCY_EWMA_ALPHA * (seconds - previous)
+        if entry is None:
+            return None
+        self.stats["cached_tokens"] += cached_tokens
+        uncached, cached = self._latency.get((model, False)), self._latency[key]
+        if uncached is None:
+            return None
+        saved = max(0.0, uncached - cached) * 1000
+        self.stats["latency_saved_ms"] += round(saved)
+        return round(saved, 1)
+
+    def _usable(self, client, key: str) -> CacheEntry | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        remaining = entry.expires_at - time.time()
+        if remaining < EXPIRY_SKEW:
+            del self._entries[key]
+            self.stats["expired"] += 1
+            return None
+        if remaining < self.refresh_margin:
+            self._spawn(key, self._refresh(client, entry))
+        self._entries.move_to_end(key)
+        return entry
+
+    def _is_hot(self, key: str) -> bool:
+        count = self._hot.pop(key, 0) + 1
+        self._hot[key] = count
+        if len(self._hot) > HOT_TRACKED_BUNDLES:
+            self._hot.popitem(last=False)
+        return count >= self.hot_threshold
+
+    def _spawn(self, key: str, coro) -> None:
+        """One background operation per entry at a time."""
+        if key in self._tasks:
+            coro.close()
+            return
+        task = asyncio.create_task(coro)
+        self._tasks[key] = task
+        task.add_done_callback(lambda _: self._tasks.pop(key, None))
+
+    def _expiry(self, cached) -> float:
+        expire_time = getattr(cached, "expire_time", None)
+        return expire_time.timestamp() if expire_time is not None else time.time() + self.ttl
+
+    async def _create(self, client, key: str, model: str, system_prompt: str, context: str = "") -> None:
+        from google.genai import types
+
+        try:
+            cached = await client.aio.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=system_prompt,
+                    contents=[types.Content(role="user", parts=[types.Part(text=context)])] if context else None,
+                    ttl=f"{int(self.ttl)}s",
+                    display_name=f"innertone-{key[-12:]}",
+                ),
+            )
+        except Exception as e:
+            # Unsupported model, prefix below its minimum, quota: stay uncached for a while
+            self._unsupported[model] = time.monotonic() + UNSUPPORTED_COOLDOWN
+            self.stats["create_failed"] += 1
+            logger.warning(f"Context caching unavailable for {model}: {e}")
+            return
+
+        usage = getattr(cached, "usage_metadata", None)
+        self._entries[key] = CacheEntry(
+            key=key,
+            model=model,
+            name=cached.name,
+            with_context=bool(context),
+            tokens=getattr(usage, "total_token_count", None) or estimate_tokens(system_prompt, context),
+            expires_at=self._expiry(cached),
+        )
+        self.stats["created"] += 1
+        while len(self._entries) > self.max_entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._spawn(evicted.key, self._delete(client, evicted))
+
+    async def _refresh(self, client, entry: CacheEntry) -> None:
+        from google.genai import types
+
+        try:
+            cached = await client.aio.caches.update(
+                name=entry.name,
+                config=types.UpdateCachedContentConfig(ttl=f"{int(self.ttl)}s"),
+            )
+        except Exception as e:
+            self.invalidate(entry)
+            logger.warning(f"Could not refresh context cache {entry.name}: {e}")
+            return
+        entry.expires_at = self._expiry(cached)
+        self.stats["refreshed"] += 1
+
+    async def _delete(self, client, entry: CacheEntry) -> None:
+        try:
+            await client.aio.caches.delete(name=entry.name)
+            self.stats["evicted"] += 1
+        except Exception as e:
+            logger.warning(f"Could not delete context cache {entry.name}: {e}")
+
+    def snapshot(self) -> dict:
+        latency = {}
+        for (model, cached), seconds in self._latency.items():
+            latency.setdefault(model, {})["cached_ms" if cached else "uncached_ms"] = round(seconds * 1000, 1)
+        return {
+            "enabled": self.enabled,
+            "entries": [
+                {
+                    "model": entry.model,
+                    "kind": entry.kind,
+                    "tokens": entry.tokens,
+                    "expires_in_s": round(entry.expires_at - time.time()),
+                }
+                for entry in self._entries.values()
+            ],
+            "unsupported_models": [model for model, until in self._unsupported.items() if until > time.monotonic()],
+            "stats": dict(self.stats),
+            "latency_by_model": latency,
+        }
+
+
+@lru_cache()
+def get_context_cache() -> ContextCacheManager:
+    return ContextCacheManager.from_settings()
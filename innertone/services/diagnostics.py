@@ -0,0 +1,395 @@
+"""
+Diagnostics Service
+Always-on, low-overhead instrumentation for answering "why was this slow?".
+
+  - Flight recorder: every HTTP request (and voice turn) carries a Trace in
+    a context variable; code marks stages with `with stage("retrieval"):`
+    and model attempts with record_attempt(). Only the slowest N traces are
+    kept, in a min-heap, so the cost per request is a few perf_counter()
+    calls and one heap comparison.
+  - LoopLagMonitor: measures how late the event loop wakes up from a short
+    sleep. A watchdog thread notices when the loop stops ticking and
+    captures the loop thread's stack while it is still blocked, which
+    names the sync call responsible.
+  - profile(): on-demand sampling (built-in), pyinstrument or cProfile
+    profile of the event loop thread for a few seconds.
+
+The admin router (api/v1/admin.py) exposes all three.
+"""
+import asyncio
+import cProfile
+import contextvars
+import heapq
+import io
+import itertools
+import pstats
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from innertone.core.config import get_settings
+
+settings = get_settings()
+
+# Longest profile the admin endpoint will run
+MAX_PROFILE_SECONDS = 30.0
+# Frames kept per captured stall stack
+STALL_STACK_DEPTH = 25
+
+
+class Trace:
+    """Timings of one unit of work (an HTTP request or a voice turn)."""
+
+    __slots__ = ("name", "attrs", "started_at", "_start", "duration", "stages", "attempts", "status", "db_queries", "db_seconds")
+
+    def __init__(self, name: str, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration = 0.0
+        self.stages: list[tuple[str, float, float]] = []
+        self.attempts: list[dict] = []
+        self.status = None
+        self.db_queries = 0
+        self.db_seconds = 0.0
+
+    def add_stage(self, name: str, seconds: float, offset: float | None = None) -> None:
+        if offset is None:
+            offset = time.perf_counter() - self._start - seconds
+        self.stages.append((name, offset, seconds))
+
+    def finish(self) -> None:
+        self.duration = time.perf_counter() - self._start
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            **self.attrs,
+            "status": self.status,
+            "started_at": datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(),
+            "duration_ms": round(self.duration * 1000, 1),
+            "stages": [
+                {"stage": name, "at_ms": round(offset * 1000, 1), "duration_ms": round(seconds * 1000, 1)}
+                for name, offset, seconds in self.stages
+            ],
+            "model_attempts": self.attempts,
+            "db": {"queries": self.db_queries, "duration_ms": round(self.db_seconds * 1000, 1)},
+        }
+
+
+_current: contextvars.ContextVar[Trace | None] = contextvars.ContextVar("innertone_trace", default=None)
+
+
+def current_trace() -> Trace | None:
+    return _current.get()
+
+
+@contextmanager
+def stage(name: str):
+    """Times the enclosed block as a stage of the current trace (no-op outside one)."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        trace.add_stage(name, end - start, start - trace._start)
+
+
+def add_stage(name: str, seconds: float) -> None:
+    """Records a duration measured elsewhere (e.g. a queue wait) that ended now."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add_stage(name, seconds)
+
+
+def record_attempt(model: str, outcome: str, seconds: float, error: Exception | None = None, **details) -> None:
+    """Adds a model call to the current trace; `details` (usage, cache, ...) are kept when set."""
+    trace = _current.get()
+    if trace is not None:
+        attempt = {"model": model, "outcome": outcome, "duration_ms": round(seconds * 1000, 1)}
+        attempt.update((name, value) for name, value in details.items() if value)
+        if error is not None:
+            attempt["error"] = f"{type(error).__name__}: {str(error)[:200]}"
+        trace.attempts.append(attempt)
+
+
+class FlightRecorder:
+    """Keeps the slowest `capacity` traces seen since the last clear."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._heap: list[tuple[float, int, dict]] = []
+        self._seq = itertools.count()
+        self.seen = 0
+        self.pool_status = None
+
+    def record(self, trace: Trace) -> None:
+        self.seen += 1
+        if self.capacity <= 0:
+            return
+        if len(self._heap) >= self.capacity and trace.duration <= self._heap[0][0]:
+            return  # Faster than everything kept; the common case costs one comparison
+        entry = trace.as_dict()
+        if self.pool_status is not None:
+            entry["db_pool"] = self.pool_status()
+        item = (trace.duration, next(self._seq), entry)
+        if len(self._heap) < self.capacity:
+            heapq.heappush(self._heap, item)
+        else:
+            heapq.heapreplace(self._heap, item)
+
+    def slowest(self) -> list[dict]:
+        return [entry for _, _, entry in sorted(self._heap, reverse=True)]
+
+    def clear(self) -> None:
+        self._heap.clear()
+
+
+recorder = FlightRecorder(settings.DIAGNOSTICS_SLOW_REQUESTS)
+
+
+@contextmanager
+def traced(name: str, **attrs):
+    """Runs the block under a new trace, recorded when it ends (for non-HTTP work)."""
+    trace = Trace(name, **attrs)
+    token = _current.set(trace)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.status = type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        trace.finish()
+        recorder.record(trace)
+
+
+class FlightRecorderMiddleware:
+    """Pure ASGI middleware: one Trace per HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(f"{scope['method']} {scope['path']}")
+        token = _current.set(trace)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            trace.status = trace.status or type(e).__name__
+            raise
+        finally:
+            _current.reset(token)
+            trace.finish()
+            recorder.record(trace)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._innertone_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = _current.get()
+    if trace is not None:
+        trace.db_queries += 1
+        trace.db_seconds += time.perf_counter() - context._innertone_started
+
+
+def instrument_engine(engine) -> None:
+    """
+    Counts query time into the current trace and reports pool usage with
+    slow traces. Safe to call again (e.g. on every lifespan start): the
+    listeners are only added once per engine.
+    """
+    from sqlalchemy import event
+
+    sync_engine = engine.sync_engine
+    for name, listener in (
+        ("before_cursor_execute", _before_cursor_execute),
+        ("after_cursor_execute", _after_cursor_execute),
+    ):
+        if not event.contains(sync_engine, name, listener):
+            event.listen(sync_engine, name, listener)
+
+    pool = sync_engine.pool
+    if hasattr(pool, "checkedout"):
+        recorder.pool_status = lambda: {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+        }
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float, stall_threshold: float, max_stalls: int = 20):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.avg_lag = 0.0
+        self.ticks = 0
+        self.histogram: Counter[str] = Counter()
+        self.stalls: deque[dict] = deque(maxlen=max_stalls)
+        self._heartbeat = time.monotonic()
+        self._open_stall: dict | None = None
+        self._loop_thread_id: int | None = None
+        self._task: asyncio.Task | None = None
+        self._stop = threading.Event()
+        self._watchdog: threading.Thread | None = None
+
+    _BUCKETS = ((1.0, ">1s"), (0.5, ">500ms"), (0.1, ">100ms"), (0.05, ">50ms"), (0.01, ">10ms"))
+
+    def start(self) -> None:
+        """Call from the event loop thread."""
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.create_task(self._tick())
+        self._stop.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _tick(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._heartbeat = now
+            self.ticks += 1
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self.avg_lag += (lag - self.avg_lag) * 0.05
+            for threshold, label in self._BUCKETS:
+                if lag > threshold:
+                    self.histogram[label] += 1
+                    break
+            if self._open_stall is not None:
+                self._open_stall["blocked_ms"] = round(lag * 1000, 1)
+                self._open_stall = None
+
+    def _watch(self) -> None:
+        frames_of = getattr(sys, "_current_frames", None)
+        while not self._stop.wait(self.stall_threshold / 2):
+            blocked = time.monotonic() - self._heartbeat - self.interval
+            if blocked < self.stall_threshold or self._open_stall is not None or frames_of is None:
+                continue
+            frame = frames_of().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stall = {
+                "at": datetime.now(timezone.utc).isoformat(),
+                # Updated with the full duration once the loop ticks again
+                "blocked_ms": round(blocked * 1000, 1),
+                "stack": traceback.format_stack(frame, limit=STALL_STACK_DEPTH),
+            }
+            self.stalls.append(stall)
+            self._open_stall = stall
+
+    def snapshot(self) -> dict:
+        return {
+            "interval_ms": self.interval * 1000,
+            "last_lag_ms": round(self.last_lag * 1000, 2),
+            "avg_lag_ms": round(self.avg_lag * 1000, 2),
+            "max_lag_ms": round(self.max_lag * 1000, 2),
+            "ticks": self.ticks,
+            "histogram": dict(self.histogram),
+            "stalls": list(self.stalls),
+        }
+
+
+loop_monitor = LoopLagMonitor(settings.LOOP_LAG_INTERVAL, settings.LOOP_STALL_THRESHOLD)
+
+_profile_lock = asyncio.Lock()
+
+
+def _folded(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+async def _sample(seconds: float, interval: float = 0.005) -> str:
+    """Samples the loop thread's stack from a helper thread; returns folded stacks."""
+    thread_id = threading.get_ident()
+    counts: Counter[str] = Counter()
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                counts[_folded(frame)] += 1
+
+    sampler = threading.Thread(target=run, name="profile-sampler", daemon=True)
+    sampler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        stop.set()
+        await asyncio.to_thread(sampler.join)
+    # flamegraph.pl / speedscope "collapsed" format
+    return "\n".join(f"{stack} {count}" for stack, count in counts.most_common())
+
+
+async def profile(seconds: float, engine: str = "sampler") -> str:
+    """
+    Profiles the event loop thread for `seconds`. engine: "sampler"
+    (built-in, folded stacks), "pyinstrument" (needs the package) or
+    "cprofile". One profile at a time.
+    """
+    seconds = min(max(seconds, 0.1), MAX_PROFILE_SECONDS)
+    if _profile_lock.locked():
+        raise RuntimeError("A profile is already running")
+    async with _profile_lock:
+        if engine == "sampler":
+            return await _sample(seconds)
+        if engine == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+            except ImportError as e:
+                raise ImportError("pyinstrument is not installed (pip install pyinstrument)") from e
+            profiler = Profiler(interval=0.001, async_mode="disabled")
+            profiler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profiler.stop()
+            return profiler.output_text(unicode=False, color=False)
+        if engine == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profiler.disable()
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(60)
+            return out.getvalue()
+        raise ValueError(f"Unknown profiler engine: {engine}")
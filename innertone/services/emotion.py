@@ -4,18 +4,24 @@ Emotion Detection Service
 Classifies the user's emotional state from their message using a
 multi-label approach. Uses a lightweight rule-based + Gemini hybrid:
   - Fast regex/keyword pass for obvious emotions
-  - Gemini for nuanced/ambiguous cases (async, non-blocking)
+  - Gemini for nuanced/ambiguous cases (async, non-blocking), with messages
+    from concurrent requests micro-batched into one call (EmotionBatcher)
 
 Detected emotions feed into:
   1. The consultant engine (for more empathetic contextual responses)
   2. The memory system (for longitudinal mood tracking)
   3. The safety module (as a secondary signal for distress level)
 """
+import asyncio
 import re
+from collections import Counter
 from enum import Enum
-from google import genai
-from google.genai import types
+from functools import lru_cache
 from innertone.core.config import get_settings
+from innertone.core.serialization import dumps, loads
+from innertone.services.diagnostics import stage
+from innertone.services.llm_scheduler import Priority, estimate_tokens, get_scheduler
+from innertone.services.singleflight import SingleFlight
 
 settings = get_settings()
 
@@ -59,20 +65,211 @@ def _keyword_detect(text: str) -> list[str]:
 _GEMINI_CLASSIFICATION_PROMPT = """
 You are an emotion detection classifier for a mental wellness application.
 
-Analyze the following user message and return ONLY a JSON object with this exact format:
-{
-  "emotions": ["<emotion1>", "<emotion2>"],
-  "intensity": "<low|medium|high>",
-  "short_reason": "<one sentence>"
-}
+Analyze each user message below and return ONLY a JSON array with one
+object per message, in this exact format:
+[
+  {{
+    "id": "<the message id>",
+    "emotions": ["<emotion1>", "<emotion2>"],
+    "intensity": "<low|medium|high>"
+  }}
+]
 
 Valid emotions: anxious, depressed, angry, stressed, lonely, hopeful, neutral, sad, happy, overwhelmed
-Pick 1-3 emotions that best describe the message. Always include intensity.
+Pick 1-3 emotions that best describe each message. Always include intensity.
 Return only valid JSON, no extra text.
 
-User message: "{message}"
+User messages:
+{messages}
 """.strip()
 
+# Output budget per message in a batch, plus the array's own overhead
+CLASSIFICATION_TOKENS_PER_ITEM = 40
+CLASSIFICATION_TOKENS_BASE = 20
+
+_VALID_EMOTIONS = {e.value for e in Emotion}
+_VALID_INTENSITIES = {"low", "medium", "high"}
+
+_client = None
+
+
+def _get_client():
+    """One google-genai client for all classification calls, created on first use."""
+    global _client
+    if _client is None:
+        from google import genai
+
+        _client = genai.Client(api_key=settings.GEMINI_API_KEY)
+    return _client
+
+
+async def _gemini_classify_batch(items: list[dict]) -> str:
+    """
+    Sends one classification request for [{"id", "message"}, ...] and returns
+    the raw response text; raises if every model fails.
+    """
+    from google.genai import types
+
+    scheduler = get_scheduler()
+    client = _get_client()
+    prompt = _GEMINI_CLASSIFICATION_PROMPT.format(messages=dumps(items))
+    max_output_tokens = CLASSIFICATION_TOKENS_BASE + CLASSIFICATION_TOKENS_PER_ITEM * len(items)
+    
+    fallback_models = [
+        "gemini-2.5-flash-lite", 
+        "gemini-2.0-flash-lite",
+        "gemini-2.5-flash", 
+        "gemini-2.0-flash", 
+        "gemini-flash-lite-latest",
+        "gemini-flash-latest",
+    ]
+    response_text = None
+    last_error = None
+    
+    for model_name in fallback_models:
+        try:
+            async with scheduler.slot(Priority.EMOTION, model_name, tokens=estimate_tokens(prompt) + max_output_tokens):
+                response = await client.aio.models.generate_content(
+                    model=model_name,
+                    contents=[types.Content(role="user", parts=[types.Part(text=prompt)])],
+                    config=types.GenerateContentConfig(
+                        temperature=0.1,
+                        max_output_tokens=max_output_tokens,
+                    )
+                )
+            response_text = response.text
+            print(f"DEBUG (Emotion): Success with {model_name} ({len(items)} messages)")
+            break
+        except Exception as e:
+            print(f"DEBUG (Emotion): Model {model_name} failed: {str(e)}")
+            last_error = e
+            continue
+    
+    if not response_text:
+        raise last_error
+    return response_text
+
+
+def _parse_classifications(response_text: str) -> dict[str, dict]:
+    """
+    Maps item id -> {"emotions", "intensity"} for the well-formed entries of
+    a batch response; malformed entries (wrong types included) are left out,
+    so only their callers fall back. Raises ValueError if the response is
+    not a JSON array at all.
+    """
+    # Strip markdown code fences if present
+    raw = response_text.strip().removeprefix("```json").removeprefix("```").removesuffix("```").strip()
+    entries = loads(raw)
+    if not isinstance(entries, list):
+        raise ValueError("Expected a JSON array of classifications")
+
+    results = {}
+    for entry in entries:
+        if not isinstance(entry, dict) or not isinstance(entry.get("id"), (str, int)):
+            continue
+        emotions = entry.get("emotions")
+        if not isinstance(emotions, list):
+            continue
+        emotions = [e for e in emotions if isinstance(e, str) and e in _VALID_EMOTIONS]
+        if not emotions:
+            continue
+        intensity = entry.get("intensity")
+        if not isinstance(intensity, str):
+            intensity = None
+        results[str(entry["id"])] = {
+            "emotions": emotions[:3],
+            "intensity": intensity if intensity in _VALID_INTENSITIES else "medium",
+        }
+    return results
+
+
+class EmotionBatcher:
+    """
+    Micro-batches classification requests: messages arriving within `window`
+    seconds of the first (or until `max_batch` are waiting) go to the model
+    in one call, and each caller gets its own entry back. An entry missing
+    from the response fails for that caller alone.
+
+    Scope is the current process; each worker batches its own traffic.
+    """
+
+    def __init__(self, window: float, max_batch: int, backend=_gemini_classify_batch):
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self.backend = backend
+        self._pending: list[tuple[str, str, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self._next_id = 0
+        self.stats: Counter[str] = Counter()
+
+    @classmethod
+    def from_settings(cls) -> "EmotionBatcher":
+        return cls(settings.EMOTION_BATCH_WINDOW_MS / 1000, settings.EMOTION_BATCH_MAX)
+
+    async def classify(self, message: str) -> dict:
+        """{"emotions", "intensity"} for one message; raises if it could not be classified."""
+        self._next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((str(self._next_id), message, future))
+
+        if len(self._pending) >= self.max_batch or self.window <= 0:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        # A caller that goes away does not cancel the batch for the others
+        return await asyncio.shield(future)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list[tuple[str, str, asyncio.Future]]) -> None:
+        self.stats["calls"] += 1
+        self.stats["messages"] += len(batch)
+        try:
+            results = _parse_classifications(
+                await self.backend([{"id": item_id, "message": message} for item_id, message, _ in batch])
+            )
+        except Exception as e:
+            self.stats["failed_calls"] += 1
+            results, error = {}, e
+        else:
+            error = ValueError("Message missing from the classification response")
+
+        for item_id, _, future in batch:
+            if future.done():
+                continue
+            if item_id in results:
+                future.set_result(results[item_id])
+            else:
+                self.stats["unclassified"] += 1
+                future.set_exception(error)
+
+    def snapshot(self) -> dict:
+        calls = self.stats["calls"]
+        return {
+            "window_ms": round(self.window * 1000),
+            "max_batch": self.max_batch,
+            "mean_batch": round(self.stats["messages"] / calls, 2) if calls else None,
+            "stats": dict(self.stats),
+        }
+
+
+# Identical messages being classified at the same time share one batch entry
+_classifications = SingleFlight(window=60, max_entries=2048)
+
+
+@lru_cache()
+def get_emotion_batcher() -> EmotionBatcher:
+    return EmotionBatcher.from_settings()
+
 
 async def detect_emotion(user_message: str) -> dict:
     """
@@ -88,56 +285,21 @@ async def detect_emotion(user_message: str) -> dict:
     # Try fast keyword detection first
     keyword_emotions = _keyword_detect(user_message)
 
-    # Only call Gemini if API key is set and the message is non-trivial
-    if settings.GEMINI_API_KEY and len(user_message.split()) > 3:
+    # Only call Gemini if API key is set and the message is non-trivial.
+    # Under load the keyword result is good enough; leave capacity for replies.
+    if settings.GEMINI_API_KEY and len(user_message.split()) > 3 and not get_scheduler().is_congested():
+        message = user_message[:500]
         try:
-            client = genai.Client(api_key=settings.GEMINI_API_KEY)
-            prompt = _GEMINI_CLASSIFICATION_PROMPT.format(message=user_message[:500])
-            
-            fallback_models = [
-                "gemini-2.5-flash-lite", 
-                "gemini-2.0-flash-lite",
-                "gemini-2.5-flash", 
-                "gemini-2.0-flash", 
-                "gemini-flash-lite-latest",
-                "gemini-flash-latest",
-            ]
-            response_text = None
-            last_error = None
-            
-            for model_name in fallback_models:
-                try:
-                    response = client.models.generate_content(
-                        model=model_name,
-                        contents=[types.Content(role="user", parts=[types.Part(text=prompt)])],
-                        config=types.GenerateContentConfig(
-                            temperature=0.1,
-                            max_output_tokens=100,
-                        )
-                    )
-                    response_text = response.text
-                    print(f"DEBUG (Emotion): Success with {model_name}")
-                    break
-                except Exception as e:
-                    print(f"DEBUG (Emotion): Model {model_name} failed: {str(e)}")
-                    last_error = e
-                    continue
-            
-            if not response_text:
-                raise last_error
-
-            import json
-            # Strip markdown code fences if present
-            raw = response_text.strip().strip("```json").strip("```").strip()
-            result = json.loads(raw)
-            
+            with stage("emotion"):
+                result = await _classifications.do(message, lambda: get_emotion_batcher().classify(message))
             return {
                 "emotions": result.get("emotions", keyword_emotions),
                 "intensity": result.get("intensity", "medium"),
                 "method": "gemini",
             }
         except Exception:
-            # Fallback to keyword detection on any error
+            # Fallback to keyword detection on any error, including this
+            # message being left out of (or garbled in) its batch response
             pass
 
     return {
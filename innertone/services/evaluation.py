@@ -0,0 +1,510 @@
+"""
+Offline Evaluation Runner
+Replays scripted conversations through get_consultant_response and reports
+latency per stage, token usage, retrieval hits and safety outcomes, so
+changes to the system prompt, top_k, chunking or models can be compared.
+
+The dataset is JSONL, one conversation per line:
+
+    {"id": "sleep-1", "turns": ["I can't sleep before exams", "It happens every week"],
+     "expect_crisis": false, "expect_books": ["Feeling Good"]}
+
+A turn may also be an object overriding the conversation-level labels:
+{"message": "...", "expect_crisis": true, "expect_books": [...]}. An optional
+"history" list (stored Gemini format) is sent as earlier context.
+
+Intermediate results are kept in a SQLite cache keyed by their inputs:
+retrievals (by embedding model, FAISS index file and top_k) and, with
+--cache-generations, model replies. Query embeddings come from the shared
+embedding store (rag/embeddings.py). A rerun after changing the prompt
+recomputes only the generations; after changing top_k or re-ingesting,
+only the retrievals.
+
+    PYTHONPATH=. python -m innertone.services.evaluation run data.jsonl --out eval/ \\
+        --backend fake --concurrency 16 --rate 600 --top-k 6
+
+"--backend fake" replaces Gemini with canned replies after a simulated
+latency (the google-genai package must still be installed); add
+--fake-embeddings to run retrieval without an API key as well.
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import sqlite3
+import statistics
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+
+from innertone.core.config import get_settings
+from innertone.core.rate_limit import TokenBucket
+from innertone.core.serialization import dumps, dumps_bytes, loads
+from innertone.services import consultant, diagnostics
+from innertone.services.gemini_fakes import FakeEmbeddings, FakeGeminiClient
+from innertone.services.llm_scheduler import Priority, get_scheduler
+from innertone.services.memory import MEMORY_WINDOW
+
+settings = get_settings()
+
+DEFAULT_CACHE_PATH = ".eval_cache.sqlite"
+PERCENTILES = (50, 95, 99)
+
+
+class StageCache:
+    """SQLite key/value store of stage results, keyed by a hash of their inputs."""
+
+    def __init__(self, path: str):
+        # Embeddings are computed in worker threads (asyncio.to_thread)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS stage_cache "
+            "(stage TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, PRIMARY KEY (stage, key))"
+        )
+        self._lock = threading.Lock()
+        self.hits: Counter[str] = Counter()
+        self.misses: Counter[str] = Counter()
+
+    @staticmethod
+    def key(*parts) -> str:
+        return hashlib.sha256(dumps_bytes(parts)).hexdigest()
+
+    def get(self, stage: str, key: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM stage_cache WHERE stage = ? AND key = ?", (stage, key)
+            ).fetchone()
+        if row is None:
+            self.misses[stage] += 1
+            return None
+        self.hits[stage] += 1
+        return loads(row[0])
+
+    def put(self, stage: str, key: str, value) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO stage_cache (stage, key, value) VALUES (?, ?, ?)",
+                (stage, key, dumps_bytes(value)),
+            )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        return {
+            stage: {"hits": self.hits[stage], "misses": self.misses[stage]}
+            for stage in sorted({*self.hits, *self.misses})
+        }
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class CachedGeminiClient:
+    """Caches generate_content replies by model, system prompt, sampling config and contents."""
+
+    def __init__(self, inner, cache: StageCache):
+        self._inner = inner
+        self.cache = cache
+        self.aio = SimpleNamespace(models=self, caches=inner.aio.caches)
+
+    async def generate_content(self, model: str, contents: list, config=None):
+        key = self.cache.key(
+            model,
+            getattr(config, "system_instruction", None),
+            getattr(config, "cached_content", None),
+            getattr(config, "temperature", None),
+            getattr(config, "max_output_tokens", None),
+            [[content.role, [part.text for part in content.parts]] for content in contents],
+        )
+        hit = self.cache.get("generation", key)
+        if hit is None:
+            response = await self._inner.aio.models.generate_content(model=model, contents=contents, config=config)
+            hit = {"text": response.text, "usage": consultant._usage(response)}
+            if hit["text"]:
+                self.cache.put("generation", key, hit)
+        usage = hit["usage"] or {}
+        return SimpleNamespace(
+            text=hit["text"],
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=usage.get("prompt_tokens", 0),
+                candidates_token_count=usage.get("output_tokens", 0),
+                cached_content_token_count=usage.get("cached_tokens", 0),
+            ),
+        )
+
+
+def _index_fingerprint() -> str:
+    from innertone.rag.retrieve import FAISS_INDEX_PATH
+
+    stat = os.stat(FAISS_INDEX_PATH)  # FileNotFoundError: answered without book context
+    return f"{FAISS_INDEX_PATH}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _cached_retrieval(cache: StageCache, embedding_id: str):
+    from innertone.rag import retrieve
+
+    async def retrieve_relevant_chunks(query: str, db, top_k: int = 5) -> list[dict]:
+        key = cache.key(embedding_id, _index_fingerprint(), top_k, query)
+        chunks = cache.get("retrieval", key)
+        if chunks is None:
+            chunks = await retrieve.retrieve_relevant_chunks(query, db, top_k=top_k)
+            cache.put("retrieval", key, chunks)
+        return chunks
+
+    return retrieve_relevant_chunks
+
+
+@contextmanager
+def _override(target, **attrs):
+    """Temporarily replaces module (or settings) attributes for the duration of a run."""
+    saved = {name: getattr(target, name) for name in attrs}
+    for name, value in attrs.items():
+        setattr(target, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(target, name, value)
+
+
+def iter_dataset(path: str):
+    """Yields conversations from a JSONL file, skipping blank lines and # comments."""
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            conversation = loads(line)
+            conversation.setdefault("id", f"line-{line_no}")
+            if not conversation.get("turns"):
+                raise ValueError(f"{path}:{line_no}: conversation has no turns")
+            yield conversation
+
+
+def _turn_spec(conversation: dict, turn) -> dict:
+    if isinstance(turn, str):
+        turn = {"message": turn}
+    return {
+        "message": turn["message"],
+        "expect_crisis": turn.get("expect_crisis", conversation.get("expect_crisis")),
+        "expect_books": turn.get("expect_books", conversation.get("expect_books")),
+    }
+
+
+def _turn_record(conversation_id: str, index: int, spec: dict, result: dict | None, trace, error) -> dict:
+    stages: dict[str, float] = defaultdict(float)
+    for name, _, seconds in trace.stages:
+        stages[name.split(":", 1)[0]] += seconds * 1000
+    tokens = {"prompt_tokens": 0, "output_tokens": 0, "cached_tokens": 0}
+    model = cache = None
+    latency_saved = 0.0
+    for attempt in trace.attempts:
+        stages["llm"] += attempt["duration_ms"]
+        for field, count in (attempt.get("usage") or {}).items():
+            tokens[field] += count
+        if attempt["outcome"] == "ok":
+            model = attempt["model"]
+            cache = attempt.get("cache")
+            latency_saved += attempt.get("latency_saved_ms", 0.0)
+
+    sources = result["sources"] if result else []
+    books = sorted({source["book"] for source in sources})
+    expected_books = spec["expect_books"]
+    return {
+        "conversation_id": conversation_id,
+        "turn": index,
+        "status": "error" if error else "ok",
+        "error": f"{type(error).__name__}: {error}" if error else None,
+        "message": spec["message"],
+        "response": result["response"] if result else None,
+        "model": model,
+        "is_crisis": result["is_crisis"] if result else None,
+        "expect_crisis": spec["expect_crisis"],
+        "retrieved": len(sources),
+        "books": books,
+        "expect_books": expected_books,
+        "retrieval_hit": bool(set(books) & set(expected_books)) if expected_books else None,
+        "latency_ms": round(trace.duration * 1000, 1),
+        "stages_ms": {name: round(ms, 1) for name, ms in stages.items()},
+        "tokens": tokens,
+        "context_cache": cache,
+        "latency_saved_ms": round(latency_saved, 1),
+        "db_queries": trace.db_queries,
+    }
+
+
+class Report:
+    """Accumulates turn records into the run summary."""
+
+    def __init__(self):
+        self.conversations = 0
+        self.turns = 0
+        self.errors: Counter[str] = Counter()
+        self.latency: dict[str, list[float]] = defaultdict(list)
+        self.tokens = Counter()
+        self.models: Counter[str] = Counter()
+        self.retrieved = 0
+        self.with_context = 0
+        self.hits = 0
+        self.labelled_retrievals = 0
+        self.safety = Counter()
+        self.context_cached = 0
+        self.latency_saved = 0.0
+
+    def add(self, record: dict) -> None:
+        self.turns += 1
+        if record["status"] == "error":
+            self.errors[record["error"].split(":", 1)[0]] += 1
+            return
+        self.latency["turn"].append(record["latency_ms"])
+        for name, ms in record["stages_ms"].items():
+            self.latency[name].append(ms)
+        self.tokens.update(record["tokens"])
+        self.latency_saved += record["latency_saved_ms"]
+        if record["context_cache"]:
+            self.context_cached += 1
+        if record["model"]:
+            self.models[record["model"]] += 1
+        if record["retrieved"]:
+            self.with_context += 1
+            self.retrieved += record["retrieved"]
+        if record["retrieval_hit"] is not None:
+            self.labelled_retrievals += 1
+            self.hits += record["retrieval_hit"]
+        if record["expect_crisis"] is None:
+            self.safety["flagged_unlabelled" if record["is_crisis"] else "passed_unlabelled"] += 1
+        else:
+            outcome = {(True, True): "tp", (True, False): "fp", (False, True): "fn", (False, False): "tn"}
+            self.safety[outcome[(bool(record["is_crisis"]), bool(record["expect_crisis"]))]] += 1
+
+    @staticmethod
+    def _distribution(values: list[float]) -> dict:
+        ordered = sorted(values)
+        summary = {"count": len(ordered), "mean": round(statistics.fmean(ordered), 1)}
+        for p in PERCENTILES:
+            summary[f"p{p}"] = round(ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))], 1)
+        summary["max"] = round(ordered[-1], 1)
+        return summary
+
+    def summary(self) -> dict:
+        ok = self.turns - sum(self.errors.values())
+        tp, fp, fn = self.safety["tp"], self.safety["fp"], self.safety["fn"]
+        return {
+            "conversations": self.conversations,
+            "turns": self.turns,
+            "errors": dict(self.errors),
+            "latency_ms": {name: self._distribution(values) for name, values in sorted(self.latency.items())},
+            "tokens": {
+                **self.tokens,
+                "per_turn": round((self.tokens["prompt_tokens"] + self.tokens["output_tokens"]) / ok, 1) if ok else 0.0,
+            },
+            "models": dict(self.models),
+            "context_cache": {
+                "turns": self.context_cached,
+                "cached_tokens_per_turn": round(self.tokens["cached_tokens"] / self.context_cached, 1) if self.context_cached else 0.0,
+                "latency_saved_ms_per_turn": round(self.latency_saved / self.context_cached, 1) if self.context_cached else 0.0,
+            },
+            "retrieval": {
+                "turns_with_context": self.with_context,
+                "avg_chunks": round(self.retrieved / self.with_context, 2) if self.with_context else 0.0,
+                "labelled_turns": self.labelled_retrievals,
+                "hit_rate": round(self.hits / self.labelled_retrievals, 3) if self.labelled_retrievals else None,
+            },
+            "safety": {
+                **self.safety,
+                "precision": round(tp / (tp + fp), 3) if tp + fp else None,
+                "recall": round(tp / (tp + fn), 3) if tp + fn else None,
+            },
+        }
+
+
+async def _run_conversation(conversation: dict, pacer: TokenBucket, write) -> int:
+    from innertone.core.database import AsyncSessionLocal
+
+    history = list(conversation.get("history", []))
+    async with AsyncSessionLocal() as db:
+        for index, turn in enumerate(conversation["turns"]):
+            spec = _turn_spec(conversation, turn)
+            while not pacer.try_acquire():
+                await asyncio.sleep(pacer.time_until(1))
+
+            result = error = None
+            with diagnostics.traced("eval.turn", conversation_id=conversation["id"], turn=index) as trace:
+                try:
+                    result = await consultant.get_consultant_response(
+                        spec["message"], history[-MEMORY_WINDOW:], db, priority=Priority.BACKGROUND,
+                    )
+                except Exception as e:
+                    error = e
+            write(_turn_record(conversation["id"], index, spec, result, trace, error))
+
+            history.append({"role": "user", "parts": [{"text": spec["message"]}]})
+            if result is not None:
+                history.append({"role": "model", "parts": [{"text": result["response"]}]})
+    return len(conversation["turns"])
+
+
+async def run_evaluation(
+    dataset: str,
+    out_dir: str,
+    backend: str = "fake",
+    concurrency: int = 8,
+    rate: float = 60.0,
+    top_k: int | None = None,
+    models: list[str] | None = None,
+    system_prompt: str | None = None,
+    cache_path: str = DEFAULT_CACHE_PATH,
+    cache_generations: bool = False,
+    fake_latency: float = 0.2,
+    fake_embeddings: bool = False,
+) -> dict:
+    """
+    Runs every conversation in `dataset`, `concurrency` at a time, starting at
+    most `rate` turns per minute. Writes turns.jsonl and summary.json to
+    `out_dir` and returns the summary.
+    """
+    from innertone.rag import retrieve
+    from innertone.rag.embeddings import StoredEmbeddings, open_store
+
+    if backend not in ("fake", "gemini"):
+        raise ValueError(f"Unknown backend: {backend}")
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    cache = StageCache(cache_path)
+
+    if fake_embeddings:
+        embedding_id = f"fake:{settings.EMBEDDING_DIMENSIONS}"
+        create_model = lambda: FakeEmbeddings(settings.EMBEDDING_DIMENSIONS)  # noqa: E731
+    else:
+        embedding_id = settings.EMBEDDING_MODEL_NAME
+        create_model = retrieve._create_embedding_model
+
+    # Query embeddings read through the shared embedding store (rag/embeddings.py),
+    # kept on disk so reruns of the same dataset do not embed them again
+    embeddings = StoredEmbeddings(create_model, embedding_id, settings.EMBEDDING_DIMENSIONS, persist_queries=True)
+
+    if backend == "fake":
+        client = FakeGeminiClient(fake_latency)
+        # No provider quota to protect; the runner's own rate limit applies
+        scheduler = get_scheduler()
+        scheduler.default_rpm = scheduler.default_tpm = 10 ** 9
+        scheduler.model_limits = {}
+    else:
+        client = consultant._get_client()
+    if cache_generations:
+        client = CachedGeminiClient(client, cache)
+
+    consultant_overrides = {
+        "_client": client,
+        "retrieve_relevant_chunks": _cached_retrieval(cache, embedding_id),
+    }
+    if models:
+        consultant_overrides["FALLBACK_MODELS"] = models
+    if system_prompt is not None:
+        consultant_overrides["CBT_SYSTEM_PROMPT"] = system_prompt
+
+    report = Report()
+    pacer = TokenBucket(rate / 60, max(1.0, min(rate / 60, concurrency)))
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    started = time.perf_counter()
+
+    with open(out / "turns.jsonl", "wb") as turns_file:
+        def write(record: dict) -> None:
+            turns_file.write(dumps_bytes(record, newline=True))
+            report.add(record)
+
+        async def worker() -> None:
+            while (conversation := await queue.get()) is not None:
+                await _run_conversation(conversation, pacer, write)
+                report.conversations += 1
+                if report.conversations % 100 == 0:
+                    print(f"Evaluated {report.conversations} conversations ({report.turns} turns)...")
+
+        with _override(consultant, **consultant_overrides), \
+                _override(retrieve, _embedding_model=embeddings), \
+                _override(settings, RAG_TOP_K=top_k or settings.RAG_TOP_K):
+            workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+            try:
+                for conversation in iter_dataset(dataset):
+                    await queue.put(conversation)
+                for _ in workers:
+                    await queue.put(None)
+                await asyncio.gather(*workers)
+            finally:
+                for task in workers:
+                    task.cancel()
+
+    summary = {
+        "dataset": dataset,
+        "config": {
+            "backend": backend,
+            "models": list(models or consultant.FALLBACK_MODELS),
+            "system_prompt_sha256": hashlib.sha256((system_prompt or consultant.CBT_SYSTEM_PROMPT).encode()).hexdigest()[:16],
+            "rag_enabled": settings.RAG_ENABLED,
+            "top_k": top_k or settings.RAG_TOP_K,
+            "embedding_model": embedding_id,
+            "concurrency": concurrency,
+            "rate_per_minute": rate,
+        },
+        "wall_seconds": round(time.perf_counter() - started, 2),
+        **report.summary(),
+        "cache": cache.stats(),
+        "embedding_store": (
+            open_store(embedding_id, settings.EMBEDDING_DIMENSIONS, "query").snapshot()
+            if settings.EMBEDDING_STORE_ENABLED else None
+        ),
+    }
+    cache.close()
+    (out / "summary.json").write_text(dumps(summary))
+    return summary
+
+
+if __name__ == "__main__":
+    import sys
+
+    parser = argparse.ArgumentParser(prog="python -m innertone.services.evaluation")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="Evaluate a JSONL dataset of conversations")
+    run.add_argument("dataset")
+    run.add_argument("--out", required=True, help="Directory for turns.jsonl and summary.json")
+    run.add_argument("--backend", choices=("fake", "gemini"), default="fake")
+    run.add_argument("--concurrency", type=int, default=8, help="Conversations in flight")
+    run.add_argument("--rate", type=float, default=60.0, help="Turns started per minute")
+    run.add_argument("--top-k", type=int, help=f"Book excerpts per prompt (default RAG_TOP_K={settings.RAG_TOP_K})")
+    run.add_argument("--model", action="append", dest="models", help="Model to use; repeat for a fallback chain")
+    run.add_argument("--system-prompt", help="File with a replacement CBT_SYSTEM_PROMPT")
+    run.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="SQLite cache file (':memory:' disables reuse)")
+    run.add_argument("--cache-generations", action="store_true", help="Also cache model replies")
+    run.add_argument("--fake-latency", type=float, default=0.2, help="Mean reply latency of the fake backend")
+    run.add_argument("--fake-embeddings", action="store_true", help="Hash-based query embeddings (no API key)")
+    args = parser.parse_args()
+
+    if args.backend == "gemini" and not settings.GEMINI_API_KEY:
+        print("GEMINI_API_KEY is not set; use --backend fake for offline runs.")
+        sys.exit(1)
+
+    async def _main():
+        from innertone.core.database import engine
+
+        try:
+            return await run_evaluation(
+                args.dataset,
+                args.out,
+                backend=args.backend,
+                concurrency=args.concurrency,
+                rate=args.rate,
+                top_k=args.top_k,
+                models=args.models,
+                system_prompt=Path(args.system_prompt).read_text(encoding="utf-8").strip() if args.system_prompt else None,
+                cache_path=args.cache,
+                cache_generations=args.cache_generations,
+                fake_latency=args.fake_latency,
+                fake_embeddings=args.fake_embeddings,
+            )
+        finally:
+            await engine.dispose()
+
+    summary = asyncio.run(_main())
+    print(dumps({k: summary[k] for k in ("turns", "errors", "latency_ms", "tokens", "context_cache", "retrieval", "safety", "cache")}))
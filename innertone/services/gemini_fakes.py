@@ -0,0 +1,151 @@
+"""
+Gemini Fakes
+Local stand-ins for the provider, so the consultant pipeline runs without an
+API key: in the evaluation runner (--backend fake), in tests/ and in
+benchmarks/.
+
+    client = FakeGeminiClient(latency=0.01)
+    consultant._client = client          # or monkeypatch.setattr(...)
+    ...
+    client.calls                         # Counter of generate calls per model
+    client.failures.append(ServerError(503, {...}))  # fail the next call
+
+FakeCaches implements the context caching API (client.aio.caches) with real
+TTLs, and answers a request naming a missing or expired entry with the same
+404 ClientError the provider sends. The google-genai package must be
+installed (its request types and errors are used as is).
+"""
+import asyncio
+import hashlib
+import itertools
+import random
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from innertone.services.llm_scheduler import estimate_tokens
+
+FAKE_REPLY = (
+    "It sounds like this has been weighing on you, and that makes sense. "
+    "Noticing the thought is already a first step; try writing it down and "
+    "asking what evidence supports it. What feels most pressing right now?"
+)
+
+
+def _not_found(name: str):
+    from google.genai.errors import ClientError
+
+    message = f"Cached content {name} not found or expired"
+    return ClientError(404, {"error": {"code": 404, "message": message, "status": "NOT_FOUND"}})
+
+
+class FakeEmbeddings:
+    """Deterministic pseudo-random unit vectors, so retrieval runs without an API key."""
+
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+
+    def embed_query(self, text: str) -> list[float]:
+        rng = random.Random(hashlib.sha256(text.encode()).digest())
+        vector = [rng.gauss(0.0, 1.0) for _ in range(self.dimensions)]
+        norm = sum(v * v for v in vector) ** 0.5 or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(text) for text in texts]
+
+
+class FakeCaches:
+    """In-memory stand-in for client.aio.caches (create / update / delete with TTLs)."""
+
+    def __init__(self):
+        self._store: dict[str, SimpleNamespace] = {}
+        self._ids = itertools.count(1)
+        # Models whose create calls fail, as for a model without caching support
+        self.unsupported: set[str] = set()
+
+    @staticmethod
+    def _expiry(config) -> datetime:
+        return datetime.now(timezone.utc) + timedelta(seconds=int(str(config.ttl).rstrip("s")))
+
+    def resolve(self, name: str, model: str) -> SimpleNamespace:
+        cached = self._store.get(name)
+        if cached is None or cached.model != model or cached.expire_time <= datetime.now(timezone.utc):
+            raise _not_found(name)
+        return cached
+
+    async def create(self, model: str, config):
+        if model in self.unsupported:
+            from google.genai.errors import ClientError
+
+            raise ClientError(400, {"error": {"code": 400, "message": f"{model} does not support caching"}})
+        texts = [config.system_instruction or ""]
+        texts += [part.text or "" for content in config.contents or [] for part in content.parts]
+        cached = SimpleNamespace(
+            name=f"cachedContents/fake-{next(self._ids)}",
+            model=model,
+            tokens=estimate_tokens(*texts),
+            expire_time=self._expiry(config),
+        )
+        self._store[cached.name] = cached
+        return SimpleNamespace(
+            name=cached.name,
+            expire_time=cached.expire_time,
+            usage_metadata=SimpleNamespace(total_token_count=cached.tokens),
+        )
+
+    async def update(self, name: str, config):
+        cached = self._store.get(name)
+        if cached is None:
+            raise _not_found(name)
+        cached.expire_time = self._expiry(config)
+        return SimpleNamespace(name=name, expire_time=cached.expire_time)
+
+    async def delete(self, name: str) -> None:
+        self._store.pop(name, None)
+
+
+class FakeGeminiClient:
+    """
+    Stands in for genai.Client: a canned CBT-shaped reply after a simulated
+    latency, half of which is prefill that cached prompt tokens skip.
+    """
+
+    def __init__(self, latency: float = 0.2):
+        self.latency = latency
+        self.caches = FakeCaches()
+        self.aio = SimpleNamespace(models=self, caches=self.caches)
+        self.calls: Counter[str] = Counter()
+        # Raised, in order, by the next generate calls
+        self.failures: list[Exception] = []
+
+    async def generate_content(self, model: str, contents: list, config=None):
+        self.calls[model] += 1
+        if self.failures:
+            raise self.failures.pop(0)
+        prompt = [part.text or "" for content in contents for part in content.parts]
+        digest = hashlib.sha256("".join(prompt).encode()).digest()
+        system = getattr(config, "system_instruction", "") or ""
+        uncached_tokens = estimate_tokens(system, *prompt)
+        cached_tokens = 0
+        if getattr(config, "cached_content", None):
+            cached_tokens = self.caches.resolve(config.cached_content, model).tokens
+        prefill = uncached_tokens / max(1, uncached_tokens + cached_tokens)
+        # Jitter between 0.5x and 1.5x, stable for a given prompt
+        await asyncio.sleep(self.latency * (0.5 + digest[0] / 255) * (0.5 + 0.5 * prefill))
+        return SimpleNamespace(
+            text=FAKE_REPLY,
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=uncached_tokens + cached_tokens,
+                cached_content_token_count=cached_tokens,
+                candidates_token_count=estimate_tokens(FAKE_REPLY),
+            ),
+        )
+
+    async def generate_content_stream(self, model: str, contents: list, config=None):
+        response = await self.generate_content(model, contents, config)
+
+        async def stream():
+            yield response
+
+        return stream()
@@ -0,0 +1,275 @@
+"""
+LLM Scheduler
+Single admission point for every Gemini call in the process.
+
+  - Per-model token buckets for requests/minute and tokens/minute, so we
+    stay under provider quotas instead of discovering them via 429s
+  - Priority classes: voice > chat > emotion > background summarisation
+  - A bounded queue; when it is full a higher-priority request evicts the
+    lowest-priority waiter, and waiters are shed once their deadline
+    cannot be met
+  - is_congested() lets cheap callers (emotion, summaries) degrade to
+    local fallbacks while the queue is deep
+
+Usage:
+    async with get_scheduler().slot(Priority.CHAT, model_name, tokens=est):
+        response = await client.aio.models.generate_content(...)
+"""
+import asyncio
+import itertools
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from enum import IntEnum
+from functools import lru_cache
+
+from innertone.core.config import get_settings
+from innertone.core.rate_limit import TokenBucket
+from innertone.services.diagnostics import add_stage
+
+settings = get_settings()
+
+
+class Priority(IntEnum):
+    VOICE = 0
+    CHAT = 1
+    EMOTION = 2
+    BACKGROUND = 3
+
+
+# How long each class may wait for a slot before it is shed (seconds)
+DEFAULT_DEADLINES = {
+    Priority.VOICE: 8.0,
+    Priority.CHAT: 30.0,
+    Priority.EMOTION: 5.0,
+    Priority.BACKGROUND: 120.0,
+}
+
+
+class SchedulerOverloaded(Exception):
+    """
+    Raised when a request is shed instead of being sent to the provider.
+    `model` is set when that model's request/token budget was the cause; a
+    full queue or a missed deadline (model None) applies to every model.
+    """
+
+    def __init__(self, message: str, model: str | None = None):
+        super().__init__(message)
+        self.model = model
+
+
+def estimate_tokens(*texts: str) -> int:
+    """Rough prompt size (~4 characters per token), good enough for budgeting."""
+    return sum(len(t) for t in texts) // 4
+
+
+@dataclass(order=True)
+class _Job:
+    priority: int
+    seq: int
+    model: str = field(compare=False)
+    tokens: int = field(compare=False)
+    deadline: float = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+class _ModelBudget:
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = TokenBucket(rpm / 60, rpm)
+        self.tokens = TokenBucket(tpm / 60, tpm)
+
+
+class _ClassStats:
+    def __init__(self):
+        self.submitted = 0
+        self.admitted = 0
+        self.shed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "submitted": self.submitted,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "wait_avg_ms": round(self.wait_total / self.admitted * 1000, 1) if self.admitted else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 1),
+        }
+
+
+class LLMScheduler:
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queue: int,
+        default_rpm: int,
+        default_tpm: int,
+        model_limits: dict[str, dict[str, int]] | None = None,
+        congestion_depth: int = 20,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self.model_limits = model_limits or {}
+        self.congestion_depth = congestion_depth
+        self.running = 0
+        self._queue: list[_Job] = []
+        self._budgets: dict[str, _ModelBudget] = {}
+        self._seq = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+        self._stats = {p: _ClassStats() for p in Priority}
+
+    @classmethod
+    def from_settings(cls) -> "LLMScheduler":
+        return cls(
+            max_concurrency=settings.LLM_MAX_CONCURRENCY,
+            max_queue=settings.LLM_MAX_QUEUE,
+            default_rpm=settings.LLM_DEFAULT_RPM,
+            default_tpm=settings.LLM_DEFAULT_TPM,
+            model_limits=settings.LLM_MODEL_LIMITS,
+            congestion_depth=settings.LLM_DEGRADE_QUEUE_DEPTH,
+        )
+
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def is_congested(self) -> bool:
+        """True when optional LLM work should fall back to local heuristics."""
+        return len(self._queue) >= self.congestion_depth
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority, model: str, tokens: int = 0, deadline: float | None = None):
+        """Waits for admission, holds a concurrency slot for the duration of the block."""
+        await self.acquire(priority, model, tokens, deadline)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, priority: Priority, model: str, tokens: int = 0, deadline: float | None = None) -> None:
+        """
+        Waits until the request may be sent. `deadline` is a time.monotonic()
+        timestamp; defaults to DEFAULT_DEADLINES for the priority class.
+        """
+        now = time.monotonic()
+        if deadline is None:
+            deadline = now + DEFAULT_DEADLINES[priority]
+        stats = self._stats[priority]
+        stats.submitted += 1
+
+        if len(self._queue) >= self.max_queue:
+            worst = max(self._queue)
+            if worst.priority <= priority:
+                stats.shed += 1
+                raise SchedulerOverloaded(f"LLM queue full ({self.max_queue} waiting)")
+            self._shed(worst, "evicted by higher-priority request")
+
+        job = _Job(
+            priority=priority,
+            seq=next(self._seq),
+            model=model,
+            tokens=tokens,
+            deadline=deadline,
+            enqueued_at=now,
+            future=asyncio.get_running_loop().create_future(),
+        )
+        self._queue.append(job)
+        self._pump()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(job.future), timeout=max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            if job in self._queue:
+                self._queue.remove(job)
+                stats.shed += 1
+            if job.future.done() and not job.future.exception():
+                self.release()  # Admitted just as we timed out; give the slot back
+            raise SchedulerOverloaded(f"No LLM capacity for {model} before the deadline")
+        except asyncio.CancelledError:
+            if job in self._queue:
+                self._queue.remove(job)
+            elif job.future.done() and not job.future.exception():
+                self.release()
+            raise
+        add_stage(f"llm_queue:{model}", time.monotonic() - now)
+
+    def release(self) -> None:
+        self.running -= 1
+        self._pump()
+
+    def _budget(self, model: str) -> _ModelBudget:
+        budget = self._budgets.get(model)
+        if budget is None:
+            limits = self.model_limits.get(model, {})
+            budget = _ModelBudget(limits.get("rpm", self.default_rpm), limits.get("tpm", self.default_tpm))
+            self._budgets[model] = budget
+        return budget
+
+    def _shed(self, job: _Job, reason: str, model: str | None = None) -> None:
+        self._queue.remove(job)
+        self._stats[Priority(job.priority)].shed += 1
+        if not job.future.done():
+            job.future.set_exception(SchedulerOverloaded(reason, model))
+
+    def _pump(self) -> None:
+        """Admits as many queued jobs as concurrency and model budgets allow."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        now = time.monotonic()
+        blocked_models: set[str] = set()
+        next_check = None
+
+        for job in sorted(self._queue):
+            if self.running >= self.max_concurrency:
+                break
+            if job.future.done():
+                self._queue.remove(job)
+                continue
+            if job.model in blocked_models:
+                continue  # A higher-priority job is already waiting on this model
+
+            budget = self._budget(job.model)
+            tokens = min(job.tokens, budget.tokens.capacity)
+            wait = max(budget.requests.time_until(1), budget.tokens.time_until(tokens))
+            if wait > 0:
+                blocked_models.add(job.model)
+                if now + wait > job.deadline:
+                    self._shed(job, f"{job.model} budget exhausted past the deadline", job.model)
+                else:
+                    next_check = wait if next_check is None else min(next_check, wait)
+                continue
+
+            budget.requests.try_acquire(1)
+            budget.tokens.try_acquire(tokens)
+            self._queue.remove(job)
+            self.running += 1
+            stats = self._stats[Priority(job.priority)]
+            waited = now - job.enqueued_at
+            stats.admitted += 1
+            stats.wait_total += waited
+            stats.wait_max = max(stats.wait_max, waited)
+            job.future.set_result(None)
+
+        if next_check is not None and self._queue:
+            self._timer = asyncio.get_running_loop().call_later(next_check, self._pump)
+
+    def snapshot(self) -> dict:
+        depth = {p.name.lower(): 0 for p in Priority}
+        for job in self._queue:
+            depth[Priority(job.priority).name.lower()] += 1
+        return {
+            "running": self.running,
+            "queue_depth": len(self._queue),
+            "queue_by_priority": depth,
+            "congested": self.is_congested(),
+            "classes": {p.name.lower(): s.as_dict() for p, s in self._stats.items()},
+        }
+
+
+@lru_cache()
+def get_scheduler() -> LLMScheduler:
+    return LLMScheduler.from_settings()
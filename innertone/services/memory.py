@@ -2,26 +2,66 @@
 Memory Service
 Stores and retrieves conversation history from PostgreSQL.
 Each session maintains a sliding window of messages for context.
+
+Long-lived sessions (voice calls) use SessionMemory: a bounded ring buffer
+of recent turns plus a rolling summary of older ones, with messages and
+emotion records persisted in batches rather than one commit per turn.
 """
+import asyncio
+import logging
+from collections import deque
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
-from innertone.models.memory import ConversationMessage
-import json
+from sqlalchemy import select, delete, func
+from innertone.core.config import get_settings
+from innertone.models.memory import ConversationMessage, SessionSummary
+from innertone.models.emotion import EmotionRecord
+from innertone.services.analytics import apply_emotion_records
+from innertone.services.llm_scheduler import Priority, estimate_tokens, get_scheduler
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
 
 # How many recent messages to keep as active context
 MEMORY_WINDOW = 20
 
+# Evicted messages are summarised once this many have accumulated
+SUMMARY_BATCH = 6
+# Hard cap on the rolling summary so the prompt stays flat over long calls
+SUMMARY_MAX_CHARS = 1200
+# Pending rows are written once this many have accumulated (and on close)
+PERSIST_BATCH = 6
+# Rows fetched per round trip when exporting a session
+EXPORT_BATCH = 1000
+
+SUMMARY_MODELS = [
+    "gemini-2.5-flash-lite",
+    "gemini-2.0-flash-lite",
+]
+
+_SUMMARY_PROMPT = """
+You maintain the running memory of a mental wellness conversation.
+Update the summary below with the new messages. Keep what matters for
+future support: the user's situation, feelings, coping steps tried, and
+any safety concerns. Write plain prose, at most 120 words.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+""".strip()
+
 
 async def get_history(session_id: str, db: AsyncSession) -> list[dict]:
-    """Retrieves recent conversation history for a session in Gemini format."""
+    """Retrieves the most recent conversation history for a session in Gemini format."""
     result = await db.execute(
         select(ConversationMessage)
         .where(ConversationMessage.session_id == session_id)
-        .order_by(ConversationMessage.created_at.asc())
+        .order_by(ConversationMessage.created_at.desc(), ConversationMessage.id.desc())
         .limit(MEMORY_WINDOW)
     )
-    records = result.scalars().all()
-    
+    records = list(reversed(result.scalars().all()))
+
     return [
         {"role": r.role, "parts": [{"text": r.content}]}
         for r in records
@@ -44,3 +84,187 @@ async def save_message(
     )
     db.add(msg)
     await db.commit()
+
+
+async def iter_messages(session_id: str, db: AsyncSession, batch_size: int = EXPORT_BATCH):
+    """
+    Yields a session's messages oldest first, in lists of up to batch_size,
+    through a server-side cursor so memory stays flat for any session length.
+    """
+    result = await db.stream(
+        select(ConversationMessage)
+        .where(ConversationMessage.session_id == session_id)
+        .order_by(ConversationMessage.created_at.asc(), ConversationMessage.id.asc())
+        .execution_options(yield_per=batch_size)
+    )
+    async for batch in result.scalars().partitions():
+        yield batch
+
+
+async def _summarise(previous: str, turns: list[dict]) -> str:
+    """Folds evicted turns into the rolling summary (Gemini, with a local fallback)."""
+    transcript = "\n".join(f"{t['role']}: {t['parts'][0]['text']}" for t in turns)
+
+    scheduler = get_scheduler()
+    if settings.GEMINI_API_KEY and not scheduler.is_congested():
+        from google import genai
+        from google.genai import types
+
+        client = genai.Client(api_key=settings.GEMINI_API_KEY)
+        prompt = _SUMMARY_PROMPT.format(summary=previous or "(empty)", messages=transcript)
+        for model_name in SUMMARY_MODELS:
+            try:
+                async with scheduler.slot(Priority.BACKGROUND, model_name, tokens=estimate_tokens(prompt) + 200):
+                    response = await client.aio.models.generate_content(
+                        model=model_name,
+                        contents=[types.Content(role="user", parts=[types.Part(text=prompt)])],
+                        config=types.GenerateContentConfig(temperature=0.2, max_output_tokens=200),
+                    )
+                if response.text:
+                    return response.text.strip()[:SUMMARY_MAX_CHARS]
+            except Exception as e:
+                logger.warning(f"Summary model {model_name} failed: {e}")
+
+    # Fallback: keep the newest user statements verbatim, trimmed to the cap
+    user_lines = [t["parts"][0]["text"] for t in turns if t["role"] == "user"]
+    merged = " ".join(filter(None, [previous, *user_lines]))
+    return merged[-SUMMARY_MAX_CHARS:]
+
+
+class SessionMemory:
+    """
+    Bounded, persisted memory for one conversation session.
+
+    Holds the last MEMORY_WINDOW turns in a ring buffer; turns pushed out of
+    the buffer are summarised in the background, so the context handed to
+    the consultant stays the same size no matter how long the session runs.
+    """
+
+    def __init__(self, session_id: str, window: int = MEMORY_WINDOW):
+        self.session_id = session_id
+        self.turns: deque[dict] = deque(maxlen=window)
+        self.summary = ""
+        self._summarised_count = 0
+        self._evicted: list[dict] = []
+        self._summary_task: asyncio.Task | None = None
+        self._pending: list = []
+
+    async def load(self, db: AsyncSession) -> bool:
+        """Resumes from the stored history. Returns True if there was any."""
+        for turn in await get_history(self.session_id, db):
+            self.turns.append(turn)
+        stored = await db.get(SessionSummary, self.session_id)
+        if stored is not None:
+            self.summary = stored.summary
+            self._summarised_count = stored.summarised_count
+
+        # Turns older than the window that the summary does not cover yet (the
+        # call ended before they were folded in) are summarised on the next
+        # fold; at most one window's worth, older ones are left out
+        total = await db.scalar(
+            select(func.count()).where(ConversationMessage.session_id == self.session_id)
+        )
+        window_start = total - len(self.turns)
+        first = max(self._summarised_count, window_start - self.turns.maxlen)
+        if first < window_start:
+            result = await db.execute(
+                select(ConversationMessage)
+                .where(ConversationMessage.session_id == self.session_id)
+                .order_by(ConversationMessage.created_at.asc(), ConversationMessage.id.asc())
+                .offset(first)
+                .limit(window_start - first)
+            )
+            self._evicted = [{"role": r.role, "parts": [{"text": r.content}]} for r in result.scalars()]
+            self._summarised_count = first
+        return bool(self.turns or self.summary)
+
+    def context(self) -> list[dict]:
+        """History to send to the consultant: summary first, then recent turns."""
+        history = list(self.turns)
+        if self.summary:
+            history.insert(0, {
+                "role": "user",
+                "parts": [{"text": f"(Summary of our earlier conversation: {self.summary})"}],
+            })
+        return history
+
+    def add(self, role: str, text: str, is_crisis: bool = False, persist: bool = True) -> None:
+        """Appends a turn; evicted turns are queued for summarisation."""
+        turn = {"role": role, "parts": [{"text": text}]}
+        if len(self.turns) == self.turns.maxlen:
+            self._evicted.append(self.turns[0])
+        self.turns.append(turn)
+
+        if persist:
+            self._pending.append(ConversationMessage(
+                session_id=self.session_id,
+                role=role,
+                content=text,
+                is_crisis=is_crisis,
+            ))
+        if len(self._evicted) >= SUMMARY_BATCH and not self._summarising():
+            self._summary_task = asyncio.create_task(self._fold_evicted())
+
+    def record_emotion(self, message: str, emotion_result: dict) -> None:
+        """Queues an EmotionRecord to be written with the next batch."""
+        self._pending.append(EmotionRecord(
+            session_id=self.session_id,
+            message_snippet=message[:300],
+            emotions=emotion_result["emotions"],
+            intensity=emotion_result["intensity"],
+            detection_method=emotion_result["method"],
+        ))
+
+    def should_flush(self) -> bool:
+        return len(self._pending) >= PERSIST_BATCH
+
+    async def flush(self, db: AsyncSession) -> None:
+        """
+        Writes pending messages, emotion records and the summary in one commit.
+        If the commit fails, the rows stay pending for the next flush.
+        """
+        pending, self._pending = self._pending, []
+        rows = list(pending)
+        if self.summary:
+            rows.append(SessionSummary(
+                session_id=self.session_id,
+                summary=self.summary,
+                summarised_count=self._summarised_count,
+            ))
+        if not rows:
+            return
+        try:
+            for row in rows:
+                if isinstance(row, SessionSummary):
+                    await db.merge(row)
+                else:
+                    db.add(row)
+            await apply_emotion_records(db, [r for r in rows if isinstance(r, EmotionRecord)])
+            await db.commit()
+        except Exception:
+            # Rows queued while this flush was running go after the ones it failed to write
+            self._pending = pending + self._pending
+            await db.rollback()
+            raise
+
+    async def close(self, db: AsyncSession) -> None:
+        """
+        Waits for an in-flight summary, folds in the evicted turns that did not
+        make a full batch yet, and flushes everything still pending.
+        """
+        try:
+            if self._summarising():
+                await self._summary_task
+            if self._evicted:
+                await self._fold_evicted()
+        except Exception as e:
+            logger.warning(f"Summary for {self.session_id} failed: {e}")
+        await self.flush(db)
+
+    def _summarising(self) -> bool:
+        return self._summary_task is not None and not self._summary_task.done()
+
+    async def _fold_evicted(self) -> None:
+        batch, self._evicted = self._evicted, []
+        self.summary = await _summarise(self.summary, batch)
+        self._summarised_count += len(batch)
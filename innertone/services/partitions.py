@@ -0,0 +1,282 @@
+"""
+Partition Maintenance Service
+Storage lifecycle for the append-only history tables.
+
+conversation_messages and emotion_records are range-partitioned by month on
+created_at (Postgres only). This module:
+  - creates the partitions for the coming months ahead of time, first moving
+    any rows for those months out of the DEFAULT partition
+  - archives partitions older than RETENTION_MONTHS to gzip JSONL or Parquet
+    files (streamed with a server-side cursor), then detaches and drops them
+
+The job runs inside every API worker (see main.py) and takes a Postgres
+advisory lock, so only one worker does the work at a time. It can also be
+run by hand:
+
+    PYTHONPATH=. python -m innertone.services.partitions maintain
+    PYTHONPATH=. python -m innertone.services.partitions archive conversation_messages_p202401
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from innertone.core.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = ("conversation_messages", "emotion_records")
+
+# Rows fetched from the cursor and written to the archive per batch
+ARCHIVE_BATCH = 5_000
+# Arbitrary constant identifying the maintenance job's advisory lock
+_ADVISORY_LOCK_KEY = 7_240_531
+
+_PARTITION_RE = re.compile(r"^(?P<table>[a-z_]+)_p(?P<year>\d{4})(?P<month>\d{2})$")
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+def partition_month(name: str) -> date | None:
+    match = _PARTITION_RE.match(name)
+    if match is None:
+        return None
+    return date(int(match["year"]), int(match["month"]), 1)
+
+
+def partition_bounds(month: date) -> tuple[str, str]:
+    """created_at range [start, end) of a month's partition."""
+    month = month_start(month)
+    return f"{month.isoformat()} 00:00:00+00", f"{add_months(month, 1).isoformat()} 00:00:00+00"
+
+
+def create_partition_sql(table: str, month: date) -> str:
+    """DDL for the partition holding [month, next month)."""
+    start, end = partition_bounds(month)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{start}') TO ('{end}')"
+    )
+
+
+def default_partition_sql(table: str) -> str:
+    """Catch-all for rows outside the premade range, so inserts never fail."""
+    return f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"
+
+
+async def list_partitions(conn: AsyncConnection, table: str) -> list[str]:
+    result = await conn.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+            "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+            "WHERE parent.relname = :table ORDER BY child.relname"
+        ),
+        {"table": table},
+    )
+    return list(result.scalars())
+
+
+async def create_partition(conn: AsyncConnection, table: str, month: date) -> int:
+    """
+    Creates one month's partition. Postgres refuses to create it while the
+    DEFAULT partition holds rows for that month, so those are moved over:
+    the default is detached, the partition created, the rows re-inserted
+    through the parent (which routes them to it) and the default reattached,
+    all in the caller's transaction. Returns the number of rows moved.
+    """
+    default = f"{table}_default"
+    start, end = partition_bounds(month)
+    in_range = f"created_at >= '{start}' AND created_at < '{end}'"
+
+    stranded = await conn.scalar(text(f"SELECT count(*) FROM {default} WHERE {in_range}"))
+    if not stranded:
+        await conn.execute(text(create_partition_sql(table, month)))
+        return 0
+
+    await conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {default}"))
+    await conn.execute(text(create_partition_sql(table, month)))
+    await conn.execute(text(f"INSERT INTO {table} SELECT * FROM {default} WHERE {in_range}"))
+    await conn.execute(text(f"DELETE FROM {default} WHERE {in_range}"))
+    await conn.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT"))
+    logger.info(f"Moved {stranded} rows from {default} to {partition_name(table, month)}")
+    return stranded
+
+
+async def ensure_partitions(conn: AsyncConnection, months_ahead: int, today: date | None = None) -> list[str]:
+    """Creates this month's and the next `months_ahead` months' partitions. Returns the new ones."""
+    start = month_start(today or datetime.now(timezone.utc).date())
+    created = []
+    for table in PARTITIONED_TABLES:
+        existing = set(await list_partitions(conn, table))
+        await conn.execute(text(default_partition_sql(table)))
+        for offset in range(months_ahead + 1):
+            month = add_months(start, offset)
+            if partition_name(table, month) not in existing:
+                await create_partition(conn, table, month)
+                created.append(partition_name(table, month))
+    await conn.commit()
+    return created
+
+
+def _write_jsonl(path: Path, rows: list[dict], append: bool) -> None:
+    with gzip.open(path, "at" if append else "wt", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, default=str) + "\n")
+
+
+class _ParquetSink:
+    def __init__(self, path: Path):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise RuntimeError("ARCHIVE_FORMAT=parquet requires pyarrow (pip install pyarrow)") from e
+        self.path = path
+        self.writer = None
+
+    def write(self, rows: list[dict]) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # JSON columns are stored as text so every batch has the same schema
+        rows = [{k: json.dumps(v) if isinstance(v, (list, dict)) else v for k, v in row.items()} for row in rows]
+        table = pa.Table.from_pylist(rows)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema, compression="zstd")
+        self.writer.write_table(table.cast(self.writer.schema))
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def archive_partition(conn: AsyncConnection, partition: str, out_dir: str, fmt: str = "jsonl") -> Path:
+    """
+    Streams one partition to `out_dir` without loading it into memory.
+    The file is written under a temporary name and renamed when complete.
+    """
+    if partition_month(partition) is None and not partition.endswith("_default"):
+        raise ValueError(f"Not a history partition: {partition}")
+    suffix = {"jsonl": ".jsonl.gz", "parquet": ".parquet"}.get(fmt)
+    if suffix is None:
+        raise ValueError(f"Unknown archive format: {fmt}")
+
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    final = Path(out_dir) / f"{partition}{suffix}"
+    tmp = final.with_name(final.name + ".part")
+    sink = _ParquetSink(tmp) if fmt == "parquet" else None
+
+    count = 0
+    result = await conn.stream(text(f"SELECT * FROM {partition} ORDER BY id"))
+    async for batch in result.mappings().partitions(ARCHIVE_BATCH):
+        rows = [dict(row) for row in batch]
+        if sink is not None:
+            await asyncio.to_thread(sink.write, rows)
+        else:
+            await asyncio.to_thread(_write_jsonl, tmp, rows, count > 0)
+        count += len(rows)
+    if sink is not None:
+        sink.close()
+    elif count == 0:
+        _write_jsonl(tmp, [], False)
+
+    os.replace(tmp, final)
+    logger.info(f"Archived {count} rows from {partition} to {final}")
+    return final
+
+
+async def apply_retention(
+    conn: AsyncConnection,
+    retention_months: int,
+    archive_dir: str = "",
+    fmt: str = "jsonl",
+    today: date | None = None,
+) -> list[str]:
+    """Archives (optionally) and drops partitions entirely older than the retention window."""
+    if retention_months <= 0:
+        return []
+    cutoff = add_months(month_start(today or datetime.now(timezone.utc).date()), -retention_months)
+    dropped = []
+    for table in PARTITIONED_TABLES:
+        for partition in await list_partitions(conn, table):
+            month = partition_month(partition)
+            if month is None or add_months(month, 1) > cutoff:
+                continue
+            if archive_dir:
+                await archive_partition(conn, partition, archive_dir, fmt)
+            await conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {partition}"))
+            await conn.execute(text(f"DROP TABLE {partition}"))
+            await conn.commit()
+            dropped.append(partition)
+    return dropped
+
+
+async def run_maintenance(engine: AsyncEngine) -> dict:
+    """One pass of partition creation and retention, if no other worker holds the lock."""
+    if engine.dialect.name != "postgresql":
+        return {"skipped": "partitioning needs PostgreSQL"}
+
+    async with engine.connect() as conn:
+        locked = await conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": _ADVISORY_LOCK_KEY})
+        await conn.commit()
+        if not locked:
+            return {"skipped": "another worker is running maintenance"}
+        try:
+            created = await ensure_partitions(conn, settings.PARTITION_MONTHS_AHEAD)
+            dropped = await apply_retention(
+                conn, settings.RETENTION_MONTHS, settings.ARCHIVE_DIR, settings.ARCHIVE_FORMAT,
+            )
+        finally:
+            await conn.rollback()
+            await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _ADVISORY_LOCK_KEY})
+            await conn.commit()
+    return {"created": created, "dropped": dropped}
+
+
+async def maintenance_loop(engine: AsyncEngine) -> None:
+    """Background task started by the app lifespan."""
+    while True:
+        try:
+            report = await run_maintenance(engine)
+            if report.get("created") or report.get("dropped"):
+                logger.info(f"Partition maintenance: {report}")
+        except Exception as e:
+            logger.error(f"Partition maintenance failed: {e}")
+        await asyncio.sleep(settings.PARTITION_MAINTENANCE_INTERVAL_HOURS * 3600)
+
+
+if __name__ == "__main__":
+    import sys
+    from innertone.core.database import engine
+
+    async def _main(args: list[str]):
+        if args[:1] == ["maintain"]:
+            print(await run_maintenance(engine))
+        elif args[:1] == ["archive"] and len(args) == 2:
+            async with engine.connect() as conn:
+                print(await archive_partition(conn, args[1], settings.ARCHIVE_DIR or ".", settings.ARCHIVE_FORMAT))
+        else:
+            print("Usage: python -m innertone.services.partitions maintain | archive <partition>")
+            sys.exit(1)
+        await engine.dispose()
+
+    asyncio.run(_main(sys.argv[1:]))
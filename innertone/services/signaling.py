@@ -0,0 +1,347 @@
+"""
+Signaling Service
+Room fan-out for the WebRTC signaling socket.
+
+Each peer gets a bounded send queue drained by its own writer task, so one
+slow client cannot stall the rest of its room. Rooms are shared across
+workers through a backplane: the in-process default covers a single
+worker, RedisBackplane (pub/sub) lets peers of one call land on different
+workers or containers. MemoryBroker is an in-process stand-in for the
+Redis server, so tests and local runs can put several managers on one
+"Redis" without running one.
+"""
+import asyncio
+import logging
+import uuid
+from typing import Awaitable, Callable
+
+from fastapi import WebSocket
+from innertone.core.config import get_settings
+from innertone.core.serialization import dumps_bytes, loads
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Slow consumer policies for a full send queue
+DROP_OLDEST = "drop_oldest"
+CLOSE = "close"
+
+MessageHandler = Callable[[str, dict], Awaitable[None]]
+
+
+class PeerConnection:
+    """One WebSocket in a room, with a bounded outbound queue."""
+
+    def __init__(self, websocket: WebSocket, queue_size: int, policy: str, on_dead: Callable[["PeerConnection"], None]):
+        self.websocket = websocket
+        self.peer_id = uuid.uuid4().hex
+        self.policy = policy
+        self.dropped = 0
+        self._queue: asyncio.Queue[str] = asyncio.Queue(maxsize=queue_size)
+        self._on_dead = on_dead
+        self._closed = False
+        self._writer = asyncio.create_task(self._drain())
+
+    def enqueue(self, message: str) -> None:
+        """Queues a message without waiting; applies the slow-consumer policy when full."""
+        if self._closed:
+            return
+        if self._queue.full():
+            if self.policy == CLOSE:
+                logger.warning(f"Closing slow signaling peer {self.peer_id}")
+                self.close()
+                return
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(message)
+
+    async def _drain(self) -> None:
+        try:
+            while True:
+                message = await self._queue.get()
+                await self.websocket.send_text(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Auto-cleanup broken connections
+            self.close()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._writer.cancel()
+        self._on_dead(self)
+        asyncio.create_task(self._close_socket())
+
+    async def _close_socket(self) -> None:
+        try:
+            await self.websocket.close()
+        except Exception:
+            pass
+
+
+class InProcessBackplane:
+    """Default backplane: all peers live in this process, nothing to relay."""
+
+    async def subscribe(self, room: str, handler: MessageHandler) -> None:
+        pass
+
+    async def unsubscribe(self, room: str) -> None:
+        pass
+
+    async def publish(self, room: str, envelope: dict) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryPubSub:
+    """One connection's subscriptions on a MemoryBroker (the redis.asyncio PubSub calls RedisBackplane makes)."""
+
+    def __init__(self, broker: "MemoryBroker"):
+        self._broker = broker
+        self.channels: set[str] = set()
+        self._messages: asyncio.Queue[dict] = asyncio.Queue()
+        self._error: Exception | None = None
+
+    async def subscribe(self, *channels: str) -> None:
+        for channel in channels:
+            self._broker._subscribers.setdefault(channel, set()).add(self)
+            self.channels.add(channel)
+
+    async def unsubscribe(self, *channels: str) -> None:
+        for channel in channels:
+            subscribers = self._broker._subscribers.get(channel, set())
+            subscribers.discard(self)
+            if not subscribers:
+                self._broker._subscribers.pop(channel, None)
+            self.channels.discard(channel)
+
+    async def get_message(self, ignore_subscribe_messages: bool = False, timeout: float = 0.0) -> dict | None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+        try:
+            return await asyncio.wait_for(self._messages.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def drop_connection(self, error: Exception | None = None) -> None:
+        """Simulates a lost connection: the server forgets every subscription and the next read fails."""
+        for channel in list(self.channels):
+            self._broker._subscribers.get(channel, set()).discard(self)
+        self.channels.clear()
+        self._error = error or ConnectionError("Connection closed by server.")
+
+    async def aclose(self) -> None:
+        await self.unsubscribe(*self.channels)
+
+
+class MemoryBroker:
+    """
+    In-process stand-in for a Redis server's pub/sub. Each RedisBackplane
+    built with `client=broker` acts as one worker connected to it.
+    """
+
+    def __init__(self):
+        self._subscribers: dict[str, set[MemoryPubSub]] = {}
+
+    def pubsub(self) -> MemoryPubSub:
+        return MemoryPubSub(self)
+
+    async def publish(self, channel: str, data: bytes) -> int:
+        subscribers = self._subscribers.get(channel, set())
+        for pubsub in subscribers:
+            pubsub._messages.put_nowait({"type": "message", "channel": channel.encode(), "data": data})
+        return len(subscribers)
+
+    async def aclose(self) -> None:
+        pass
+
+
+class RedisBackplane:
+    """
+    Relays room messages between workers over Redis pub/sub.
+
+    `client` may be any object exposing the redis.asyncio pub/sub API, which
+    lets tests or local runs substitute an in-memory fake (MemoryBroker).
+    """
+
+    CHANNEL_PREFIX = "innertone:signaling:"
+    # Pause before retrying after a failed read
+    RETRY_SECONDS = 1.0
+
+    def __init__(self, url: str = "", client=None):
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError as e:
+                raise RuntimeError(
+                    "SIGNALING_BACKPLANE_URL points at Redis but the 'redis' package is not installed."
+                ) from e
+            client = redis.from_url(url)
+        self._client = client
+        self._pubsub = client.pubsub()
+        self._handlers: dict[str, MessageHandler] = {}
+        self._listener: asyncio.Task | None = None
+
+    async def subscribe(self, room: str, handler: MessageHandler) -> None:
+        self._handlers[room] = handler
+        await self._pubsub.subscribe(self.CHANNEL_PREFIX + room)
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def unsubscribe(self, room: str) -> None:
+        self._handlers.pop(room, None)
+        await self._pubsub.unsubscribe(self.CHANNEL_PREFIX + room)
+
+    async def publish(self, room: str, envelope: dict) -> None:
+        await self._client.publish(self.CHANNEL_PREFIX + room, dumps_bytes(envelope))
+
+    async def _listen(self) -> None:
+        while self._handlers:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except Exception as e:
+                logger.error(f"Signaling backplane read failed: {e}")
+                await asyncio.sleep(self.RETRY_SECONDS)
+                await self._resubscribe()
+                continue
+            if not message or message.get("type") != "message":
+                continue
+            channel = message["channel"]
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            room = channel[len(self.CHANNEL_PREFIX):]
+            handler = self._handlers.get(room)
+            if handler is None:
+                continue
+            # One bad payload or failing handler must not stop relaying for every room
+            try:
+                await handler(room, loads(message["data"]))
+            except Exception as e:
+                logger.error(f"Dropped relayed signaling message for room {room}: {e}")
+
+    async def _resubscribe(self) -> None:
+        """
+        Subscribes every room again after a failed read: a dropped connection
+        loses the server-side subscriptions, and subscribing twice is harmless.
+        """
+        if not self._handlers:
+            return
+        try:
+            await self._pubsub.subscribe(*(self.CHANNEL_PREFIX + room for room in self._handlers))
+        except Exception as e:
+            logger.error(f"Signaling backplane resubscribe failed: {e}")
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+        await self._pubsub.aclose()
+        await self._client.aclose()
+
+
+def create_backplane(url: str):
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackplane(url)
+    return InProcessBackplane()
+
+
+class ConnectionManager:
+    """Tracks the signaling peers of each room and fans messages out to them."""
+
+    def __init__(self, backplane=None, queue_size: int | None = None, policy: str | None = None):
+        # Identifies this worker so it can ignore its own relayed messages
+        self.worker_id = uuid.uuid4().hex
+        self.backplane = backplane if backplane is not None else create_backplane(settings.SIGNALING_BACKPLANE_URL)
+        self.queue_size = queue_size or settings.SIGNALING_SEND_QUEUE_SIZE
+        self.policy = policy or settings.SIGNALING_SLOW_CONSUMER_POLICY
+        # Maps session_id -> {peer_id: PeerConnection}
+        self.rooms: dict[str, dict[str, PeerConnection]] = {}
+        # Rooms this worker is subscribed to on the backplane
+        self._subscribed: set[str] = set()
+        # Maps session_id -> [lock, coroutines using it], serializing (un)subscribes per room
+        self._room_locks: dict[str, list] = {}
+
+    async def connect(self, session_id: str, websocket: WebSocket) -> PeerConnection:
+        await websocket.accept()
+        peer = PeerConnection(
+            websocket,
+            self.queue_size,
+            self.policy,
+            on_dead=lambda p: self.disconnect(session_id, p),
+        )
+        self.rooms.setdefault(session_id, {})[peer.peer_id] = peer
+        try:
+            await self._sync_subscription(session_id)
+        except Exception:
+            self.disconnect(session_id, peer)
+            raise
+        logger.info(f"Connected to room {session_id}. Local peers: {len(self.rooms.get(session_id, {}))}")
+        return peer
+
+    def disconnect(self, session_id: str, peer: PeerConnection) -> None:
+        room = self.rooms.get(session_id)
+        if room is None or room.pop(peer.peer_id, None) is None:
+            return
+        peer.close()
+        if not room:
+            del self.rooms[session_id]
+            asyncio.create_task(self._release_room(session_id))
+        logger.info(f"Disconnected from room {session_id}")
+
+    async def _sync_subscription(self, session_id: str) -> None:
+        """
+        Subscribes or unsubscribes the room to match whether it has local
+        peers, as seen once the room's lock is held. A reconnect racing with
+        the last peer's disconnect therefore always ends subscribed.
+        """
+        entry = self._room_locks.setdefault(session_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                if session_id in self.rooms and session_id not in self._subscribed:
+                    await self.backplane.subscribe(session_id, self._on_relayed)
+                    self._subscribed.add(session_id)
+                elif session_id not in self.rooms and session_id in self._subscribed:
+                    self._subscribed.discard(session_id)
+                    await self.backplane.unsubscribe(session_id)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._room_locks[session_id]
+
+    async def _release_room(self, session_id: str) -> None:
+        try:
+            await self._sync_subscription(session_id)
+        except Exception as e:
+            logger.error(f"Signaling backplane unsubscribe for room {session_id} failed: {e}")
+
+    def _fan_out(self, session_id: str, message: str, exclude: str | None = None) -> None:
+        # Copy so peers closed during fan-out do not break iteration
+        for peer_id, peer in list(self.rooms.get(session_id, {}).items()):
+            if peer_id != exclude:
+                peer.enqueue(message)
+
+    async def broadcast_to_room(self, session_id: str, message: str, exclude: PeerConnection | None = None):
+        """Delivers to local peers immediately and relays to other workers."""
+        self._fan_out(session_id, message, exclude.peer_id if exclude else None)
+        await self.backplane.publish(session_id, {
+            "origin": self.worker_id,
+            "data": message,
+        })
+
+    async def _on_relayed(self, session_id: str, envelope: dict) -> None:
+        if envelope.get("origin") != self.worker_id:
+            self._fan_out(session_id, envelope["data"])
+
+    async def close(self) -> None:
+        for session_id, room in list(self.rooms.items()):
+            for peer in list(room.values()):
+                self.disconnect(session_id, peer)
+        # The backplane drops every subscription itself; the release tasks become no-ops
+        self._subscribed.clear()
+        await self.backplane.close()
+
@@ -0,0 +1,80 @@
+"""
+Single-Flight Request Coalescing
+Concurrent callers asking for the same key share one computation instead of
+each starting their own. Optionally the result is kept for a short window,
+so a retry that arrives just after the first request finished gets the same
+answer (and nothing is generated or persisted twice).
+
+A caller may pass a fingerprint of its request: reusing a key for a
+request with a different fingerprint, while the key is in flight or its
+result is kept, raises KeyReused instead of returning the other answer.
+
+Scope is the current process; each worker coalesces its own traffic.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class KeyReused(ValueError):
+    """A key was reused for a request with a different fingerprint."""
+
+
+class SingleFlight:
+    def __init__(self, window: float = 0.0, max_entries: int = 10_000):
+        self.window = window
+        self.max_entries = max_entries
+        self._inflight: dict[Hashable, tuple[asyncio.Task, Hashable]] = {}
+        self._results: OrderedDict[Hashable, tuple[float, Any, Hashable]] = OrderedDict()
+        self.hits = 0
+
+    async def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Awaitable[Any]],
+        window: float | None = None,
+        fingerprint: Hashable = None,
+    ) -> Any:
+        """
+        Returns fn()'s result, sharing it with every concurrent caller of `key`.
+        The computation runs in its own task, so a caller that disconnects
+        does not cancel it for the others. Raises KeyReused if `key` is held
+        by a request with a different `fingerprint`.
+        """
+        cached = self._results.get(key)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                self._check(key, cached[2], fingerprint)
+                self.hits += 1
+                return cached[1]
+            del self._results[key]
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._check(key, inflight[1], fingerprint)
+            task = inflight[0]
+            self.hits += 1
+        else:
+            task = asyncio.create_task(fn())
+            self._inflight[key] = (task, fingerprint)
+            task.add_done_callback(lambda t: self._finish(key, t, self.window if window is None else window, fingerprint))
+        return await asyncio.shield(task)
+
+    @staticmethod
+    def _check(key: Hashable, held: Hashable, fingerprint: Hashable) -> None:
+        if held != fingerprint:
+            raise KeyReused(f"{key!r} is already in use for a different request")
+
+    def _finish(self, key: Hashable, task: asyncio.Task, window: float, fingerprint: Hashable) -> None:
+        self._inflight.pop(key, None)
+        # Failures are not remembered, so the next attempt retries
+        if window <= 0 or task.cancelled() or task.exception() is not None:
+            return
+        self._results[key] = (time.monotonic() + window, task.result(), fingerprint)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+    def forget(self, key: Hashable) -> None:
+        self._results.pop(key, None)
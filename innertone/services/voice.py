@@ -0,0 +1,312 @@
+"""
+Voice Pipeline Helpers
+Turns a stream of LLM text deltas into sentence-sized chunks so the client
+can start speaking the first sentence while the rest is still generating,
+and drives the full-duplex AI voice session built on top of that.
+"""
+import asyncio
+import logging
+import re
+
+from innertone.core.config import get_settings
+from innertone.core.database import AsyncSessionLocal
+from innertone.core.serialization import dumps, loads
+from innertone.services.connection_limits import registry
+from innertone.services.diagnostics import traced
+from innertone.services.memory import SessionMemory
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+# A sentence ends at . ! ? (optionally followed by closing quotes/brackets)
+# when whitespace follows — a bare "3.5" or "e.g." mid-word does not split.
+_SENTENCE_END = re.compile(r"[.!?…]+[\"')\]]*\s+")
+
+# Very short fragments ("Okay.") are merged with the next sentence so the
+# TTS engine is not restarted for every couple of words.
+MIN_CHUNK_CHARS = 24
+
+
+class SentenceChunker:
+    """Incrementally splits streamed text into speakable sentences."""
+
+    def __init__(self, min_chars: int = MIN_CHUNK_CHARS):
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, delta: str) -> list[str]:
+        """Adds a text delta and returns any sentences that are now complete."""
+        self._buffer += delta
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self._buffer):
+            candidate = self._buffer[start:match.end()].strip()
+            if len(candidate) >= self.min_chars:
+                sentences.append(candidate)
+                start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> list[str]:
+        """Returns whatever text is left once the stream has ended."""
+        rest = self._buffer.strip()
+        self._buffer = ""
+        return [rest] if rest else []
+
+
+VOICE_GREETING = "Hello! I'm InnerTone, your compassionate wellness consultant. I'm here to listen and support you — no judgement, just care. Tell me, what's been on your mind lately?"
+
+VOICE_RESUME_GREETING = "Welcome back. I still remember what we talked about. Would you like to pick up where we left off?"
+
+VOICE_FALLBACK_REPLY = "I'm sorry, I'm having a moment of reflection. Could you share that thought with me again?"
+
+VOICE_BUSY_REPLY = "I'm still with you — give me just a moment to finish my previous thought."
+
+# Same cap as ChatRequest.message
+MAX_USER_TEXT_CHARS = 4000
+
+
+class VoiceSession:
+    """
+    Full-duplex state machine behind the /calls/ai-voice WebSocket.
+
+    The socket is read continuously while a reply is generated in a
+    background task, so the user can interrupt (barge in) at any point.
+    History lives in a SessionMemory, so it is bounded, persisted in
+    batches, and resumed when the client reconnects with the same session.
+    Utterances arriving in quick succession are merged into a single turn
+    (at most VOICE_MAX_PENDING_MESSAGES are held), so a flood of messages
+    does not become a flood of consultant calls.
+
+    Client -> server:
+      {"type": "text", "text": "..."}    a finished user utterance
+      {"type": "barge_in"}                user started talking; stop the reply
+      {"type": "ack", "turn_id": n}       client finished playing turn n
+    Server -> client:
+      {"type": "control", "state": "thinking" | "listening"}
+      {"type": "chunk", "state": "speaking", "turn_id": n, "seq": i, "transcript": "..."}
+      {"type": "turn_end", "turn_id": n, "transcript": "...", "is_crisis": bool}
+      {"type": "interrupted", "turn_id": n}
+    """
+
+    def __init__(self, websocket, session_id: str, receive=None):
+        self.websocket = websocket
+        self.session_id = session_id
+        self._receive = receive or websocket.receive_text
+        self._pending_texts: list[str] = []
+        self._coalesce_task: asyncio.Task | None = None
+        self.memory = SessionMemory(session_id)
+        self._turn_id = 0
+        self._turn_task: asyncio.Task | None = None
+        # Set once the client acked the current turn's playback
+        self._acked = True
+        self._send_lock = asyncio.Lock()
+        self._background: set[asyncio.Task] = set()
+
+    async def send(self, payload: dict) -> None:
+        async with self._send_lock:
+            await self.websocket.send_text(dumps(payload))
+
+    async def run(self) -> None:
+        """Greets the user, then dispatches client messages until disconnect."""
+        async with AsyncSessionLocal() as db:
+            resumed = await self.memory.load(db)
+
+        try:
+            self._start_turn(self._speak, VOICE_RESUME_GREETING if resumed else VOICE_GREETING)
+            while True:
+                data = await self._receive()
+                try:
+                    payload = loads(data)
+                except ValueError:
+                    payload = None
+                if not isinstance(payload, dict):
+                    logger.warning(f"Ignoring malformed voice frame from {self.session_id}")
+                    continue
+                kind = payload.get("type", "text")
+
+                if kind == "ack":
+                    await self._handle_ack(payload.get("turn_id"))
+                elif kind == "barge_in":
+                    await self._interrupt()
+                else:
+                    user_text = payload.get("text")
+                    user_text = user_text.strip() if isinstance(user_text, str) else ""
+                    if not user_text:
+                        continue  # Ignore empty messages
+                    await self._interrupt()
+                    self._queue_user_text(user_text[:MAX_USER_TEXT_CHARS])
+        finally:
+            if self._coalesce_task is not None:
+                self._coalesce_task.cancel()
+            await self._cancel_turn()
+            await asyncio.gather(*self._background, return_exceptions=True)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await self.memory.close(db)
+            except Exception as e:
+                logger.error(f"Failed to persist voice session {self.session_id}: {e}")
+
+    def _queue_user_text(self, text: str) -> None:
+        if len(self._pending_texts) >= settings.VOICE_MAX_PENDING_MESSAGES:
+            self._pending_texts.pop(0)
+        self._pending_texts.append(text)
+        if self._coalesce_task is None or self._coalesce_task.done():
+            self._coalesce_task = asyncio.create_task(self._start_when_quiet())
+
+    async def _start_when_quiet(self) -> None:
+        """Waits until no new utterance arrived for a window, then starts one turn."""
+        while True:
+            queued = len(self._pending_texts)
+            await asyncio.sleep(settings.VOICE_COALESCE_SECONDS)
+            if len(self._pending_texts) == queued:
+                break
+        user_text = " ".join(self._pending_texts)
+        self._pending_texts.clear()
+        self._start_turn(self._reply, user_text)
+
+    def _start_turn(self, handler, text: str) -> None:
+        self._turn_id += 1
+        self._acked = False
+        self._turn_task = asyncio.create_task(handler(self._turn_id, text))
+        self._turn_task.add_done_callback(self._log_turn_failure)
+
+    def _log_turn_failure(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Voice turn failed for {self.session_id}: {task.exception()}")
+
+    def _turn_running(self) -> bool:
+        return self._turn_task is not None and not self._turn_task.done()
+
+    async def _cancel_turn(self) -> None:
+        if self._turn_running():
+            self._turn_task.cancel()
+            try:
+                await self._turn_task
+            except asyncio.CancelledError:
+                pass
+
+    async def _interrupt(self) -> None:
+        """Cancels generation and tells the client to stop any playback."""
+        if self._acked:
+            return
+        await self._cancel_turn()
+        self._acked = True
+        await self.send({"type": "interrupted", "turn_id": self._turn_id})
+
+    async def _handle_ack(self, turn_id) -> None:
+        if turn_id != self._turn_id or self._acked or self._turn_running():
+            return  # Stale ack, or the reply is still being generated
+        self._acked = True
+        await self.send({"type": "control", "state": "listening"})
+
+    async def _send_sentences(self, turn_id: int, sentences: list[str], seq: int) -> int:
+        for sentence in sentences:
+            await self.send({
+                "type": "chunk",
+                "state": "speaking",
+                "turn_id": turn_id,
+                "seq": seq,
+                "transcript": sentence,
+            })
+            seq += 1
+        return seq
+
+    async def _speak(self, turn_id: int, text: str) -> None:
+        """Speaks a fixed message (the greeting) as one turn."""
+        chunker = SentenceChunker()
+        seq = await self._send_sentences(turn_id, chunker.feed(text + " "), 0)
+        await self._send_sentences(turn_id, chunker.flush(), seq)
+        # Greetings are part of the live context but not worth storing
+        self.memory.add("model", text, persist=False)
+        await self.send({"type": "turn_end", "turn_id": turn_id, "transcript": text, "is_crisis": False})
+
+    async def _reply(self, turn_id: int, user_text: str) -> None:
+        """Streams one consultant reply sentence by sentence."""
+        if not registry.try_begin_call(self.session_id):
+            # Another socket of this session already has a reply in flight
+            await self._send_sentences(turn_id, [VOICE_BUSY_REPLY], 0)
+            await self.send({"type": "turn_end", "turn_id": turn_id, "transcript": VOICE_BUSY_REPLY, "is_crisis": False})
+            return
+        try:
+            with traced("voice.turn", session_id=self.session_id, turn_id=turn_id):
+                await self._generate(turn_id, user_text)
+        finally:
+            registry.end_call(self.session_id)
+
+    async def _generate(self, turn_id: int, user_text: str) -> None:
+        from innertone.services.consultant import stream_consultant_response
+        from innertone.services.emotion import detect_emotion
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        history = self.memory.context()
+        emotion_task = asyncio.create_task(detect_emotion(user_text))
+        await self.send({"type": "control", "state": "thinking"})
+
+        chunker = SentenceChunker()
+        spoken: list[str] = []
+        seq = 0
+        ai_response = None
+        is_crisis = False
+
+        async def emit(sentences: list[str]) -> None:
+            nonlocal seq
+            if sentences and seq == 0:
+                logger.info(
+                    f"Voice turn {turn_id} ({self.session_id}): first sentence after "
+                    f"{(loop.time() - started) * 1000:.0f} ms"
+                )
+            seq = await self._send_sentences(turn_id, sentences, seq)
+            spoken.extend(sentences)
+
+        try:
+            async with AsyncSessionLocal() as db:
+                async for event in stream_consultant_response(
+                    user_message=user_text,
+                    conversation_history=history,
+                    db=db,
+                ):
+                    if event["type"] == "delta":
+                        await emit(chunker.feed(event["text"]))
+                    else:
+                        ai_response = event["response"]
+                        is_crisis = event["is_crisis"]
+            await emit(chunker.flush())
+        except asyncio.CancelledError:
+            # Barge-in: keep only what the user actually heard
+            self.memory.add("user", user_text)
+            if spoken:
+                self.memory.add("model", " ".join(spoken))
+            emotion_task.cancel()
+            raise
+        except Exception as e:
+            logger.error(f"Consultant engine error: {e}")
+            if not spoken:
+                await emit([VOICE_FALLBACK_REPLY])
+            ai_response = " ".join(spoken)
+
+        self.memory.add("user", user_text, is_crisis=is_crisis)
+        self.memory.add("model", ai_response, is_crisis=is_crisis)
+        await self.send({
+            "type": "turn_end",
+            "turn_id": turn_id,
+            "transcript": ai_response,
+            "is_crisis": is_crisis,
+        })
+
+        # Bookkeeping runs outside the turn so a barge-in cannot cancel a write
+        task = asyncio.create_task(self._after_turn(turn_id, user_text, emotion_task))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _after_turn(self, turn_id: int, user_text: str, emotion_task: asyncio.Task) -> None:
+        try:
+            self.memory.record_emotion(user_text, await emotion_task)
+        except Exception as e:
+            logger.warning(f"Emotion detection failed for voice turn {turn_id}: {e}")
+        if self.memory.should_flush():
+            async with AsyncSessionLocal() as db:
+                await self.memory.flush(db)
+
@@ -0,0 +1,104 @@
+"""Baseline schema, as previously created by init_db.py's create_all
+
+Databases created before migrations were introduced are stamped at this
+revision by init_db.py instead of running it.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "document_metadata",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("faiss_id", sa.Integer(), nullable=False),
+        sa.Column("book_name", sa.String(255), nullable=False),
+        sa.Column("section", sa.String(255), nullable=True),
+        sa.Column("topic", sa.String(255), nullable=True),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("metadata_json", sa.JSON(), nullable=True),
+    )
+    op.create_index("ix_document_metadata_id", "document_metadata", ["id"])
+    op.create_index("ix_document_metadata_faiss_id", "document_metadata", ["faiss_id"], unique=True)
+    op.create_index("ix_document_metadata_book_name", "document_metadata", ["book_name"])
+    op.create_index("ix_document_metadata_topic", "document_metadata", ["topic"])
+
+    op.create_table(
+        "conversation_messages",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("session_id", sa.String(128), nullable=False),
+        sa.Column("role", sa.String(16), nullable=False),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("is_crisis", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_conversation_messages_id", "conversation_messages", ["id"])
+    op.create_index("ix_conversation_messages_session_id", "conversation_messages", ["session_id"])
+
+    op.create_table(
+        "session_summaries",
+        sa.Column("session_id", sa.String(128), primary_key=True),
+        sa.Column("summary", sa.Text(), nullable=False),
+        sa.Column("summarised_count", sa.Integer(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+
+    op.create_table(
+        "emotion_records",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("session_id", sa.String(128), nullable=False),
+        sa.Column("message_snippet", sa.String(300), nullable=True),
+        sa.Column("emotions", sa.JSON(), nullable=False),
+        sa.Column("intensity", sa.String(16), nullable=False),
+        sa.Column("detection_method", sa.String(16), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_emotion_records_id", "emotion_records", ["id"])
+    op.create_index("ix_emotion_records_session_id", "emotion_records", ["session_id"])
+
+    op.create_table(
+        "appointments",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.String(128), nullable=False),
+        sa.Column("therapist_name", sa.String(128), nullable=False),
+        sa.Column("scheduled_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("notes", sa.Text(), nullable=True),
+        sa.Column("status", sa.String(32), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_appointments_id", "appointments", ["id"])
+    op.create_index("ix_appointments_user_id", "appointments", ["user_id"])
+
+    op.create_table(
+        "mood_rollups",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("session_id", sa.String(128), nullable=False),
+        sa.Column("granularity", sa.String(8), nullable=False),
+        sa.Column("period_start", sa.Date(), nullable=False),
+        sa.Column("emotion", sa.String(32), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.Column("intensity_low", sa.Integer(), nullable=False),
+        sa.Column("intensity_medium", sa.Integer(), nullable=False),
+        sa.Column("intensity_high", sa.Integer(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.UniqueConstraint("session_id", "granularity", "period_start", "emotion", name="uq_mood_rollup_bucket"),
+    )
+    op.create_index("ix_mood_rollups_id", "mood_rollups", ["id"])
+
+
+def downgrade() -> None:
+    for table in (
+        "mood_rollups", "appointments", "emotion_records",
+        "session_summaries", "conversation_messages", "document_metadata",
+    ):
+        op.drop_table(table)
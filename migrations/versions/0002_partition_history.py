@@ -0,0 +1,135 @@
+"""Range-partition conversation_messages and emotion_records by month
+
+The existing tables are renamed, recreated as partitioned tables with
+(id, created_at) primary keys, and their rows copied over. Ids keep coming
+from the original sequences. Partitions are created for every month that
+has data plus MONTHS_AHEAD months; services/partitions.py keeps creating
+them after that. The partition DDL is written out here rather than imported
+from the app, so replaying this revision does not depend on the app code or
+settings present at upgrade time. No-op on databases other than PostgreSQL.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+from datetime import date, datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+# Months created past the current one (PARTITION_MONTHS_AHEAD's default when this revision was written)
+MONTHS_AHEAD = 3
+
+COLUMNS = {
+    "conversation_messages": lambda: [
+        sa.Column("session_id", sa.String(128), nullable=False),
+        sa.Column("role", sa.String(16), nullable=False),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("is_crisis", sa.Boolean(), nullable=False),
+    ],
+    "emotion_records": lambda: [
+        sa.Column("session_id", sa.String(128), nullable=False),
+        sa.Column("message_snippet", sa.String(300), nullable=True),
+        sa.Column("emotions", sa.JSON(), nullable=False),
+        sa.Column("intensity", sa.String(16), nullable=False),
+        sa.Column("detection_method", sa.String(16), nullable=True),
+    ],
+}
+INDEXES = {
+    "conversation_messages": [
+        ("ix_conversation_messages_id", ["id"]),
+        ("ix_conversation_messages_session_id", ["session_id"]),
+        ("ix_conversation_messages_session_created", ["session_id", "created_at"]),
+    ],
+    "emotion_records": [
+        ("ix_emotion_records_id", ["id"]),
+        ("ix_emotion_records_session_id", ["session_id"]),
+    ],
+}
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _create_partition(table: str, month: date) -> None:
+    start, end = month, _add_months(month, 1)
+    op.execute(
+        f"CREATE TABLE IF NOT EXISTS {table}_p{month:%Y%m} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{start.isoformat()} 00:00:00+00') TO ('{end.isoformat()} 00:00:00+00')"
+    )
+
+
+def _move_aside(table: str) -> None:
+    """Renames the table and everything whose name the new table needs."""
+    op.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+    op.execute(f"ALTER TABLE {table}_old RENAME CONSTRAINT {table}_pkey TO {table}_old_pkey")
+    for name, _ in INDEXES[table]:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+
+
+def _copy_back(table: str) -> None:
+    names = ", ".join(["id"] + [c.name for c in COLUMNS[table]()])
+    op.execute(
+        f"INSERT INTO {table} ({names}, created_at) "
+        f"SELECT {names}, COALESCE(created_at, now()) FROM {table}_old"
+    )
+    op.execute(f"DROP TABLE {table}_old")
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+
+
+def _create(table: str, partitioned: bool) -> None:
+    kwargs = {"postgresql_partition_by": "RANGE (created_at)"} if partitioned else {}
+    op.create_table(
+        table,
+        sa.Column("id", sa.Integer(), nullable=False, server_default=sa.text(f"nextval('{table}_id_seq')")),
+        *COLUMNS[table](),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.PrimaryKeyConstraint(*(["id", "created_at"] if partitioned else ["id"]), name=f"{table}_pkey"),
+        **kwargs,
+    )
+    for name, columns in INDEXES[table]:
+        if partitioned or name != "ix_conversation_messages_session_created":
+            op.create_index(name, table, columns)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+
+    this_month = datetime.now(timezone.utc).date().replace(day=1)
+    for table in COLUMNS:
+        _move_aside(table)
+        _create(table, partitioned=True)
+
+        # Offline (--sql) runs cannot look at the data; start at this month
+        oldest = None if op.get_context().as_sql else bind.scalar(sa.text(f"SELECT min(created_at) FROM {table}_old"))
+        month = oldest.date().replace(day=1) if oldest is not None else this_month
+        last = _add_months(this_month, MONTHS_AHEAD)
+        while month <= last:
+            _create_partition(table, month)
+            month = _add_months(month, 1)
+        # Catch-all for rows outside the premade range, so inserts never fail
+        op.execute(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT")
+
+        _copy_back(table)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+
+    for table in COLUMNS:
+        # Partitions are dropped along with the parent once rows are copied
+        _move_aside(table)
+        _create(table, partitioned=False)
+        _copy_back(table)
@@ -0,0 +1,81 @@
+"""Booking engine: durations, availability and overlap prevention
+
+Adds duration_minutes/ends_at to appointments, the (user_id, scheduled_at)
+listing index and the therapist_availability table. On PostgreSQL it also
+adds an exclusion constraint (GiST, via btree_gist) so a therapist can never
+have two overlapping scheduled appointments, whatever the write concurrency.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+DEFAULT_DURATION = 50
+
+
+def upgrade() -> None:
+    op.add_column(
+        "appointments",
+        sa.Column("duration_minutes", sa.Integer(), nullable=False, server_default=str(DEFAULT_DURATION)),
+    )
+    op.add_column("appointments", sa.Column("ends_at", sa.DateTime(timezone=True), nullable=True))
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("UPDATE appointments SET ends_at = scheduled_at + make_interval(mins => duration_minutes)")
+    else:
+        op.execute(f"UPDATE appointments SET ends_at = datetime(scheduled_at, '+{DEFAULT_DURATION} minutes')")
+    with op.batch_alter_table("appointments") as batch:
+        batch.alter_column("ends_at", nullable=False)
+    op.create_index("ix_appointments_user_scheduled", "appointments", ["user_id", "scheduled_at"])
+
+    op.create_table(
+        "therapist_availability",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("therapist_name", sa.String(128), nullable=False),
+        sa.Column("weekday", sa.Integer(), nullable=False),
+        sa.Column("start_time", sa.Time(), nullable=False),
+        sa.Column("end_time", sa.Time(), nullable=False),
+        sa.Column("slot_minutes", sa.Integer(), nullable=False),
+    )
+    op.create_index("ix_therapist_availability_id", "therapist_availability", ["id"])
+    op.create_index("ix_therapist_availability_therapist_name", "therapist_availability", ["therapist_name"])
+
+    if op.get_bind().dialect.name != "postgresql":
+        return
+
+    # Exclusion constraints cannot be added NOT VALID, so existing double
+    # bookings have to be resolved first
+    overlaps = op.get_bind().scalar(sa.text(
+        "SELECT count(*) FROM appointments a JOIN appointments b "
+        "ON a.therapist_name = b.therapist_name AND a.id < b.id "
+        "AND a.status = 'scheduled' AND b.status = 'scheduled' "
+        "AND tstzrange(a.scheduled_at, a.ends_at) && tstzrange(b.scheduled_at, b.ends_at)"
+    )) if not op.get_context().as_sql else 0
+    if overlaps:
+        raise RuntimeError(
+            f"{overlaps} pairs of overlapping scheduled appointments exist; "
+            "cancel or move them before running this migration"
+        )
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    op.execute(
+        "ALTER TABLE appointments ADD CONSTRAINT ex_appointments_no_overlap "
+        "EXCLUDE USING gist (therapist_name WITH =, tstzrange(scheduled_at, ends_at, '[)') WITH &&) "
+        "WHERE (status = 'scheduled')"
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("ALTER TABLE appointments DROP CONSTRAINT IF EXISTS ex_appointments_no_overlap")
+    op.drop_table("therapist_availability")
+    op.drop_index("ix_appointments_user_scheduled", table_name="appointments")
+    with op.batch_alter_table("appointments") as batch:
+        batch.drop_column("ends_at")
+        batch.drop_column("duration_minutes")
@@ -0,0 +1,29 @@
+"""Tombstones for document chunks
+
+Adds document_metadata.deleted_at, so a book can be deleted or replaced
+without rebuilding the FAISS index: retrieval skips tombstoned rows and the
+compaction job later removes them together with their vectors.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("document_metadata", sa.Column("deleted_at", sa.DateTime(timezone=True), nullable=True))
+    op.create_index("ix_document_metadata_deleted_at", "document_metadata", ["deleted_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_document_metadata_deleted_at", table_name="document_metadata")
+    with op.batch_alter_table("document_metadata") as batch:
+        batch.drop_column("deleted_at")
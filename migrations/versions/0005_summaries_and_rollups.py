@@ -0,0 +1,54 @@
+"""Session summaries and mood rollups
+
+Tables for the rolling session memory summaries and the pre-aggregated
+mood trends. 0001 creates both, but databases built by the old create_all
+are stamped at 0001 rather than migrated through it, so they have neither.
+This revision creates whichever is missing.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "session_summaries" not in existing:
+        op.create_table(
+            "session_summaries",
+            sa.Column("session_id", sa.String(128), primary_key=True),
+            sa.Column("summary", sa.Text(), nullable=False),
+            sa.Column("summarised_count", sa.Integer(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+
+    if "mood_rollups" not in existing:
+        op.create_table(
+            "mood_rollups",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("session_id", sa.String(128), nullable=False),
+            sa.Column("granularity", sa.String(8), nullable=False),
+            sa.Column("period_start", sa.Date(), nullable=False),
+            sa.Column("emotion", sa.String(32), nullable=False),
+            sa.Column("count", sa.Integer(), nullable=False),
+            sa.Column("intensity_low", sa.Integer(), nullable=False),
+            sa.Column("intensity_medium", sa.Integer(), nullable=False),
+            sa.Column("intensity_high", sa.Integer(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.UniqueConstraint("session_id", "granularity", "period_start", "emotion", name="uq_mood_rollup_bucket"),
+        )
+        op.create_index("ix_mood_rollups_id", "mood_rollups", ["id"])
+
+
+def downgrade() -> None:
+    # Both tables belong to 0001's schema, and its downgrade drops them
+    pass
@@ -2,11 +2,14 @@
 Application entry point — starts the FastAPI server with uvicorn.
 """
 import uvicorn
+from innertone.core.config import get_settings
 
 if __name__ == "__main__":
+    # The reloader spawns an extra watcher process and re-imports the app on
+    # every change, so only use it while developing.
     uvicorn.run(
         "innertone.main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
+        reload=get_settings().ENVIRONMENT == "development",
     )
@@ -0,0 +1,36 @@
+"""
+Shared test setup. Settings are read once, when innertone is first
+imported, so the environment is pinned here beforehand: a throwaway SQLite
+database (migrated to head on first use), no Gemini key, and the FAISS
+index and embedding store in a temporary directory.
+
+    python -m pytest -q
+
+Set TEST_DATABASE_URL to run against another database (e.g. PostgreSQL,
+where the booking exclusion constraint is exercised too).
+"""
+import os
+import tempfile
+
+import pytest
+
+_TMP = tempfile.mkdtemp(prefix="innertone-tests-")
+
+os.environ.update({
+    "DATABASE_URL": os.environ.get("TEST_DATABASE_URL", f"sqlite+aiosqlite:///{_TMP}/innertone.db"),
+    "GEMINI_API_KEY": "",
+    "ENVIRONMENT": "test",
+    "FAISS_INDEX_PATH": os.path.join(_TMP, "innertone.faiss"),
+    "EMBEDDING_STORE_DIR": os.path.join(_TMP, "embeddings"),
+    "INDEX_COMPACTION_INTERVAL_HOURS": "0",
+    "PARTITION_MAINTENANCE_INTERVAL_HOURS": "0",
+})
+
+
+@pytest.fixture(scope="session")
+def database():
+    """Runs the migrations once per test session."""
+    from init_db import init_models
+
+    init_models()
+    return os.environ["DATABASE_URL"]
@@ -0,0 +1,93 @@
+"""
+Mood rollups: the incremental write path and backfill() agree, and a
+backfill running next to live writers counts every record once.
+"""
+import asyncio
+import random
+
+from sqlalchemy import func, select
+
+from innertone.core.database import AsyncSessionLocal, engine
+from innertone.models.analytics import ALL_EMOTIONS, MoodRollup
+from innertone.models.emotion import EmotionRecord
+from innertone.services import analytics
+
+EMOTIONS = ["anxious", "sad", "calm", "angry", "hopeful"]
+
+
+async def _write(session_id: str, rng: random.Random) -> None:
+    """What the chat endpoint does for one turn."""
+    async with AsyncSessionLocal() as db:
+        record = EmotionRecord(
+            session_id=session_id,
+            emotions=rng.sample(EMOTIONS, 2),
+            intensity=rng.choice(analytics.INTENSITIES),
+            detection_method="keyword",
+        )
+        db.add(record)
+        await analytics.apply_emotion_records(db, [record])
+        await db.commit()
+
+
+async def _counts(session_id: str) -> tuple[int, int]:
+    """(records, records according to the daily rollups) for the session."""
+    async with AsyncSessionLocal() as db:
+        records = await db.scalar(select(func.count()).where(EmotionRecord.session_id == session_id))
+        rolled_up = await db.scalar(
+            select(func.coalesce(func.sum(MoodRollup.count), 0)).where(
+                MoodRollup.session_id == session_id,
+                MoodRollup.granularity == "day",
+                MoodRollup.emotion == ALL_EMOTIONS,
+            )
+        )
+    return records, rolled_up
+
+
+def test_backfill_matches_the_incremental_rollups(database):
+    async def scenario():
+        rng = random.Random(0)
+        try:
+            for _ in range(30):
+                await _write("rollup-incremental", rng)
+            before = await _counts("rollup-incremental")
+            async with AsyncSessionLocal() as db:
+                trend = await analytics.get_mood_trend(db, "rollup-incremental")
+                await analytics.backfill(db)
+                assert await analytics.get_mood_trend(db, "rollup-incremental") == trend
+            return before, await _counts("rollup-incremental")
+        finally:
+            await engine.dispose()
+
+    before, after = asyncio.run(scenario())
+    assert before == (30, 30)
+    assert after == before
+
+
+def test_records_written_during_a_backfill_are_counted_once(database, monkeypatch):
+    monkeypatch.setattr(analytics, "BACKFILL_BATCH", 5)
+
+    async def scenario():
+        rng = random.Random(1)
+        try:
+            for _ in range(100):
+                await _write("rollup-race", rng)
+            backfill_done = asyncio.Event()
+
+            async def live_writer():
+                while not backfill_done.is_set():
+                    await _write("rollup-race", rng)
+                    await asyncio.sleep(0)
+
+            async def run_backfill():
+                async with AsyncSessionLocal() as db:
+                    await analytics.backfill(db)
+                backfill_done.set()
+
+            await asyncio.gather(live_writer(), run_backfill())
+            return await _counts("rollup-race")
+        finally:
+            await engine.dispose()
+
+    records, rolled_up = asyncio.run(scenario())
+    assert records > 100
+    assert rolled_up == records
@@ -0,0 +1,103 @@
+"""
+Concurrent bookings of the same therapist: however the requests interleave,
+each slot goes to exactly one of them and no two scheduled appointments
+overlap. Runs against TEST_DATABASE_URL when set (the Postgres exclusion
+constraint), otherwise SQLite.
+"""
+import asyncio
+import random
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import select
+
+from innertone.core.database import AsyncSessionLocal, engine
+from innertone.models.booking import Appointment
+from innertone.services import booking
+
+SLOTS = 8
+
+
+def _slots() -> list[datetime]:
+    """The first SLOTS default slots of a weekday at least a week ahead."""
+    tz = booking._tz()
+    day = datetime.now(tz).date() + timedelta(days=7)
+    while day.weekday() not in booking.settings.BOOKING_DEFAULT_WEEKDAYS:
+        day += timedelta(days=1)
+    start = time.fromisoformat(booking.settings.BOOKING_DEFAULT_HOURS.split("-")[0])
+    step = timedelta(minutes=booking.settings.BOOKING_DEFAULT_DURATION_MINUTES)
+    return [datetime.combine(day, start, tz) + i * step for i in range(SLOTS)]
+
+
+async def _book(therapist: str, user: str, scheduled_at: datetime) -> str:
+    async with AsyncSessionLocal() as db:
+        try:
+            await booking.create_appointment(db, user, therapist, scheduled_at)
+            return "created"
+        except booking.BookingConflict:
+            return "conflict"
+
+
+async def _book_batch(therapist: str, user: str, starts: list[datetime]) -> list[str]:
+    async with AsyncSessionLocal() as db:
+        items = [{"user_id": user, "therapist_name": therapist, "scheduled_at": s} for s in starts]
+        try:
+            return [r["status"] for r in await booking.create_appointments_batch(db, items)]
+        except booking.BookingConflict:
+            return ["conflict"] * len(starts)
+
+
+async def _scheduled(therapist: str) -> list[tuple[datetime, datetime]]:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Appointment.scheduled_at, Appointment.ends_at)
+            .where(Appointment.therapist_name == therapist, Appointment.status == "scheduled")
+            .order_by(Appointment.scheduled_at)
+        )
+        return [(booking._aware(start), booking._aware(end)) for start, end in result]
+
+
+def _assert_no_overlaps(ranges: list[tuple[datetime, datetime]]) -> None:
+    for (_, previous_end), (start, _) in zip(ranges, ranges[1:]):
+        assert previous_end <= start, f"overlapping appointments: {ranges}"
+
+
+def test_each_slot_goes_to_exactly_one_of_many_concurrent_requests(database):
+    slots = _slots()
+
+    async def scenario():
+        try:
+            requests = [slots[i % SLOTS] for i in range(25 * SLOTS)]
+            random.Random(0).shuffle(requests)
+            outcomes = await asyncio.gather(*(_book("Dr. Race", f"user-{i}", s) for i, s in enumerate(requests)))
+            return outcomes, await _scheduled("Dr. Race")
+        finally:
+            await engine.dispose()
+
+    outcomes, scheduled = asyncio.run(scenario())
+    assert outcomes.count("created") == SLOTS
+    assert outcomes.count("conflict") == len(outcomes) - SLOTS
+    assert [start for start, _ in scheduled] == slots
+    _assert_no_overlaps(scheduled)
+
+
+def test_overlapping_single_and_batch_requests_never_double_book(database):
+    slots = _slots()
+    half_slot = timedelta(minutes=booking.settings.BOOKING_DEFAULT_DURATION_MINUTES // 2)
+    # Aligned starts and starts straddling two slots, so ranges overlap only partly
+    starts = slots + [s + half_slot for s in slots[:-1]]
+
+    async def scenario():
+        rng = random.Random(1)
+        try:
+            singles = [_book("Dr. Overlap", f"user-{i}", rng.choice(starts)) for i in range(120)]
+            batches = [_book_batch("Dr. Overlap", f"batch-{i}", rng.sample(starts, 4)) for i in range(20)]
+            outcomes = await asyncio.gather(*singles, *batches)
+            return outcomes, await _scheduled("Dr. Overlap")
+        finally:
+            await engine.dispose()
+
+    outcomes, scheduled = asyncio.run(scenario())
+    statuses = [s for o in outcomes for s in ([o] if isinstance(o, str) else o)]
+    assert set(statuses) <= {"created", "conflict"}
+    assert statuses.count("created") == len(scheduled)
+    _assert_no_overlaps(scheduled)
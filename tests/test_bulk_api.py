@@ -0,0 +1,110 @@
+"""
+Bulk endpoints through the API: per-item results of a booking batch, batch
+cancellation outcomes, paging through a user's appointments, and the
+streamed transcript export.
+"""
+import asyncio
+import csv
+import io
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from innertone.core.database import AsyncSessionLocal, engine
+from innertone.core.serialization import loads
+from innertone.services import booking
+from innertone.services.memory import save_message
+
+
+@pytest.fixture
+def client(database):
+    from innertone.main import app
+
+    return TestClient(app, base_url="http://test/api/v1")
+
+
+def _weekday_slot(days_ahead: int, hour: int) -> str:
+    tz = booking._tz()
+    day = datetime.now(tz).date() + timedelta(days=days_ahead)
+    while day.weekday() not in booking.settings.BOOKING_DEFAULT_WEEKDAYS:
+        day += timedelta(days=1)
+    return datetime.combine(day, datetime.min.time(), tz).replace(hour=hour).isoformat()
+
+
+def test_batch_reports_each_item_and_cancels_by_id(client):
+    slot = _weekday_slot(10, 10)
+    items = [
+        {"user_id": "u1", "therapist_name": "Dr. Bulk", "scheduled_at": slot},
+        # Same slot as the first item: conflicts within the batch
+        {"user_id": "u2", "therapist_name": "Dr. Bulk", "scheduled_at": slot},
+        {"user_id": "u3", "therapist_name": "Dr. Bulk", "scheduled_at": _weekday_slot(10, 11)},
+        {"user_id": "u4", "therapist_name": "Dr. Bulk", "scheduled_at": "2020-01-06T10:00:00+00:00"},
+    ]
+    response = client.post("/bookings/batch", json={"items": items})
+    assert response.status_code == 200
+    body = response.json()
+    assert [r["status"] for r in body["results"]] == ["created", "conflict", "created", "unavailable"]
+    assert [r["index"] for r in body["results"]] == [0, 1, 2, 3]
+    assert (body["created"], body["failed"]) == (2, 2)
+
+    first, _, third, _ = body["results"]
+    ids = [first["appointment"]["id"], third["appointment"]["id"]]
+    client.delete(f"/bookings/{ids[1]}")
+    response = client.post("/bookings/batch/cancel", json={"appointment_ids": [ids[0], ids[1], 10 ** 9]})
+    assert [r["status"] for r in response.json()["results"]] == ["cancelled", "not_scheduled", "not_found"]
+
+    # The cancelled slot can be booked again
+    response = client.post("/bookings/batch", json={"items": items[1:2]})
+    assert [r["status"] for r in response.json()["results"]] == ["created"]
+
+
+def test_listing_pages_through_every_appointment_in_time_order(client):
+    items = [
+        {"user_id": "pager", "therapist_name": f"Dr. Page {i % 3}", "scheduled_at": _weekday_slot(14 + i // 3, 10 + i % 3)}
+        for i in range(7)
+    ]
+    assert client.post("/bookings/batch", json={"items": items}).json()["created"] == 7
+
+    pages, cursor = [], None
+    while True:
+        body = client.get("/bookings/pager", params={"limit": 3, **({"cursor": cursor} if cursor else {})}).json()
+        pages.append(body["items"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    listed = [item for page in pages for item in page]
+    assert [(a["therapist_name"], a["status"], a["duration_minutes"]) for a in listed] == [
+        (item["therapist_name"], "scheduled", booking.settings.BOOKING_DEFAULT_DURATION_MINUTES) for item in items
+    ]
+    assert [datetime.fromisoformat(a["scheduled_at"]) for a in listed] == sorted(
+        datetime.fromisoformat(a["scheduled_at"]) for a in listed
+    )
+    assert client.get("/bookings/pager", params={"cursor": "not-a-cursor"}).status_code == 400
+
+
+def test_export_streams_the_transcript_oldest_first(client):
+    async def seed():
+        async with AsyncSessionLocal() as db:
+            for i in range(5):
+                await save_message("export:1", "user" if i % 2 == 0 else "model", f"line {i}, with a comma", db)
+        await engine.dispose()
+
+    asyncio.run(seed())
+
+    response = client.get("/chat/export:1/export")
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.headers["content-disposition"] == 'attachment; filename="export_1.ndjson"'
+    rows = [loads(line) for line in response.text.splitlines()]
+    assert [r["content"] for r in rows] == [f"line {i}, with a comma" for i in range(5)]
+    assert [r["role"] for r in rows] == ["user", "model", "user", "model", "user"]
+
+    response = client.get("/chat/export:1/export", params={"format": "csv"})
+    assert response.headers["content-type"].startswith("text/csv")
+    parsed = list(csv.DictReader(io.StringIO(response.text)))
+    assert [r["content"] for r in parsed] == [r["content"] for r in rows]
+    assert [int(r["id"]) for r in parsed] == [r["id"] for r in rows]
+
+    assert client.get("/chat/nobody/export").text == ""
@@ -0,0 +1,65 @@
+"""
+Cold start: importing the API and serving its first request must not load
+the heavy optional dependencies, and must fit a time budget. Measured in a
+fresh interpreter, since this process has imported everything already.
+"""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# About 0.8 s on a 1-vCPU dev box; raise it for slower CI runners
+COLD_START_BUDGET = float(os.environ.get("COLD_START_BUDGET_SECONDS", "3.0"))
+
+HEAVY_MODULES = (
+    "faiss",
+    "numpy",
+    "google.genai",
+    "langchain_text_splitters",
+    "langchain_google_genai",
+    "pypdf",
+    "sentence_transformers",
+)
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import innertone.main
+imported = time.perf_counter() - started
+from fastapi.testclient import TestClient
+with TestClient(innertone.main.app) as client:
+    status = client.get("/health").status_code
+print(json.dumps({
+    "import_s": imported,
+    "first_response_s": time.perf_counter() - started,
+    "status": status,
+    "loaded": [m for m in %r if m in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def _cold_start() -> dict:
+    root = Path(__file__).resolve().parent.parent
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE],
+        cwd=root,
+        env={**os.environ, "PYTHONPATH": str(root)},
+        capture_output=True,
+        text=True,
+        timeout=120,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_startup_does_not_load_heavy_dependencies(database):
+    report = _cold_start()
+    assert report["status"] == 200
+    assert report["loaded"] == []
+
+
+def test_cold_start_within_budget(database):
+    # Best of three, so a noisy neighbour does not fail the build
+    seconds = min(_cold_start()["first_response_s"] for _ in range(3))
+    assert seconds < COLD_START_BUDGET, f"cold start took {seconds:.2f}s (budget {COLD_START_BUDGET}s)"
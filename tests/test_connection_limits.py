@@ -0,0 +1,139 @@
+"""
+Call socket limits, through the real endpoints (TestClient) and on a
+GuardedConnection over a fake socket.
+"""
+import asyncio
+
+import pytest
+from fastapi import WebSocketDisconnect
+from fastapi.testclient import TestClient
+
+from innertone.core.rate_limit import KeyedRateLimiter
+from innertone.core.serialization import dumps
+from innertone.services import connection_limits
+from innertone.services.connection_limits import GuardedConnection, VOICE_CONTROL_FRAMES
+
+settings = connection_limits.settings
+
+
+class FakeSocket:
+    """Hands out queued client frames, answers pings if asked, and records how the server closed it."""
+
+    client = None
+
+    def __init__(self, frames: list[str], answer_pings: bool = False):
+        self.frames = asyncio.Queue()
+        for frame in frames:
+            self.frames.put_nowait(frame)
+        self.answer_pings = answer_pings
+        self.pings = 0
+        self.close_code = None
+
+    async def receive_text(self) -> str:
+        return await self.frames.get()
+
+    async def send_text(self, data: str) -> None:
+        if data == connection_limits.PING_FRAME:
+            self.pings += 1
+            if self.answer_pings:
+                self.frames.put_nowait(dumps({"type": "pong"}))
+
+    async def close(self, code: int = 1000, reason: str | None = None) -> None:
+        self.close_code = code
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # Every TestClient socket comes from the same address
+    monkeypatch.setattr(connection_limits, "_connect_limiter", KeyedRateLimiter(rate=1000, capacity=1000))
+    from innertone.main import app
+
+    return TestClient(app)
+
+
+def test_signaling_flood_of_ack_frames_is_closed(client):
+    # Signaling relays every frame to the other peers, whatever its type
+    with client.websocket_connect("/api/v1/calls/signaling/ack-flood") as ws:
+        with pytest.raises(WebSocketDisconnect) as closed:
+            for _ in range(settings.WS_MESSAGE_BURST * 2):
+                ws.send_text(dumps({"type": "ack"}))
+            ws.receive_text()
+    assert closed.value.code == 1008
+
+
+def test_voice_playback_controls_are_not_rate_limited():
+    frames = [dumps({"type": "ack"})] * (settings.WS_MESSAGE_BURST * 2) + ['{"type": "text", "text": "hi"}']
+    socket = FakeSocket(frames)
+    guard = GuardedConnection(socket, "ai-voice", "voice-acks", control_frames=VOICE_CONTROL_FRAMES)
+
+    async def drain() -> list[str]:
+        return [await guard.receive_text() for _ in frames]
+
+    received = asyncio.run(drain())
+    assert len(received) == len(frames)
+    assert socket.close_code is None
+
+
+def test_session_over_its_message_rate_is_closed_with_1008():
+    frames = ['{"type": "candidate"}'] * (settings.WS_MESSAGE_BURST * 2)
+    socket = FakeSocket(frames)
+    guard = GuardedConnection(socket, "signaling", "candidate-flood")
+
+    async def drain() -> int:
+        received = 0
+        with pytest.raises(WebSocketDisconnect) as closed:
+            while True:
+                await guard.receive_text()
+                received += 1
+        assert closed.value.code == 1008
+        return received
+
+    received = asyncio.run(drain())
+    # The burst gets through, the rest of the flood does not
+    assert settings.WS_MESSAGE_BURST <= received < len(frames)
+    assert socket.close_code == 1008
+
+
+def test_silent_socket_is_reaped_and_an_answering_one_is_kept(monkeypatch):
+    monkeypatch.setattr(settings, "WS_HEARTBEAT_INTERVAL", 0.02)
+    monkeypatch.setattr(settings, "WS_IDLE_TIMEOUT", 0.1)
+
+    async def scenario() -> tuple[FakeSocket, FakeSocket]:
+        silent, answering = FakeSocket([]), FakeSocket([], answer_pings=True)
+        guards = [GuardedConnection(silent, "signaling", "silent"), GuardedConnection(answering, "signaling", "answering")]
+        for guard in guards:
+            guard.start_heartbeat()
+        # The endpoint's read loop, which consumes the pongs
+        reader = asyncio.create_task(guards[1].receive_text())
+        await asyncio.sleep(0.4)
+        reader.cancel()
+        for guard in guards:
+            guard.release()
+        return silent, answering
+
+    silent, answering = asyncio.run(scenario())
+    assert silent.close_code == 1001
+    assert answering.close_code is None
+    assert answering.pings > 5
+
+
+def test_connections_per_session_are_capped(monkeypatch):
+    monkeypatch.setattr(connection_limits, "_connect_limiter", KeyedRateLimiter(rate=1000, capacity=1000))
+    cap = settings.WS_MAX_CONNECTIONS_PER_SESSION
+
+    async def scenario():
+        guards = [GuardedConnection(FakeSocket([]), "signaling", "capped") for _ in range(cap + 1)]
+        admitted = [await guard.admit() for guard in guards]
+        # A slot frees up when a socket closes
+        guards[0].release()
+        late = GuardedConnection(FakeSocket([]), "signaling", "capped")
+        readmitted = await late.admit()
+        for guard in guards[1:cap] + [late]:
+            guard.release()
+        return admitted, guards[cap].websocket.close_code, readmitted
+
+    admitted, rejected_code, readmitted = asyncio.run(scenario())
+    assert admitted == [True] * cap + [False]
+    assert rejected_code == 1008
+    assert readmitted
+    assert connection_limits.registry.open_by_session["capped"] == 0
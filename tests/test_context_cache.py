@@ -0,0 +1,104 @@
+"""
+Context caching through get_consultant_response, against the local fake of
+the Gemini caching API: the prefix is cached once and reused, a rejected
+entry is dropped and the model retried uncached, and provider hiccups or
+models without caching leave replies unaffected.
+"""
+import asyncio
+
+import pytest
+from google.genai.errors import ServerError
+
+from innertone.services import consultant
+from innertone.services.context_cache import ContextCacheManager
+from innertone.services.gemini_fakes import FAKE_REPLY, FakeGeminiClient
+from innertone.services.llm_scheduler import LLMScheduler
+
+PRIMARY, SECONDARY = consultant.FALLBACK_MODELS[:2]
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    client = FakeGeminiClient(latency=0.001)
+    cache = ContextCacheManager(
+        enabled=True, ttl=3600, refresh_margin=300, min_tokens=1, hot_threshold=3, max_entries=8,
+    )
+    scheduler = LLMScheduler(max_concurrency=4, max_queue=16, default_rpm=10_000, default_tpm=10 ** 9)
+    monkeypatch.setattr(consultant, "_client", client)
+    monkeypatch.setattr(consultant, "get_context_cache", lambda: cache)
+    monkeypatch.setattr(consultant, "get_scheduler", lambda: scheduler)
+    monkeypatch.setattr(consultant.settings, "RAG_ENABLED", False)
+    return client, cache
+
+
+def _turns(count: int, before_turn=None) -> list[str]:
+    async def scenario() -> list[str]:
+        replies = []
+        for turn in range(count):
+            if before_turn is not None:
+                before_turn(turn)
+            result = await consultant.get_consultant_response("I can't sleep before exams", [], None)
+            replies.append(result["response"])
+            await asyncio.sleep(0.01)  # Let background cache creation finish
+        return replies
+
+    return asyncio.run(scenario())
+
+
+def test_system_prompt_is_cached_once_and_reused(provider):
+    client, cache = provider
+    assert _turns(3) == [FAKE_REPLY] * 3
+
+    (entry,) = cache._entries.values()
+    assert entry.model == PRIMARY and entry.kind == "system"
+    assert cache.stats["created"] == 1
+    assert cache.stats["hits"] == 2
+    # Every later turn sent the system prompt as cached tokens instead of input
+    assert cache.stats["cached_tokens"] == 2 * entry.tokens
+    assert client.calls == {PRIMARY: 3}
+
+
+def test_rejected_entry_is_dropped_and_the_same_model_retried_uncached(provider):
+    client, cache = provider
+
+    def expire_on_provider(turn: int) -> None:
+        if turn == 2:
+            client.caches._store.clear()
+
+    assert _turns(3, expire_on_provider) == [FAKE_REPLY] * 3
+    assert cache.stats["invalidated"] == 1
+    # Turn 3 tried the cached request, then the same model without it
+    assert client.calls == {PRIMARY: 4}
+
+
+def test_provider_hiccup_keeps_the_cached_entry(provider):
+    client, cache = provider
+
+    def unavailable(turn: int) -> None:
+        if turn == 1:
+            client.failures.append(ServerError(503, {"error": {"code": 503, "message": "overloaded"}}))
+
+    assert _turns(3, unavailable) == [FAKE_REPLY] * 3
+    assert cache.stats["invalidated"] == 0
+    assert client.calls == {PRIMARY: 3, SECONDARY: 1}
+    # The entry survived the 503 and served the next turn
+    assert cache.stats["hits"] == 2
+
+
+def test_model_without_caching_support_falls_back_to_plain_requests(provider):
+    client, cache = provider
+    client.caches.unsupported.add(PRIMARY)
+
+    assert _turns(3) == [FAKE_REPLY] * 3
+    assert cache.stats["create_failed"] == 1
+    assert cache.stats["hits"] == 0
+    assert cache.snapshot()["unsupported_models"] == [PRIMARY]
+
+
+def test_entries_near_expiry_are_refreshed(provider):
+    client, cache = provider
+    cache.refresh_margin = cache.ttl + 60  # Every use falls inside the refresh margin
+
+    _turns(3)
+    assert cache.stats["refreshed"] == 2
+    assert cache.stats["expired"] == 0
@@ -0,0 +1,96 @@
+"""
+Diagnostics: query counting into the current trace (registered once however
+often the app starts), the flight recorder's slowest-N heap, the ASGI
+middleware, and the loop-lag watchdog naming the call that blocked.
+"""
+import asyncio
+import time
+
+from sqlalchemy import text
+
+from innertone.core.database import AsyncSessionLocal, engine
+from innertone.services import diagnostics
+from innertone.services.diagnostics import FlightRecorder, FlightRecorderMiddleware, LoopLagMonitor, Trace
+
+
+def test_engine_instrumentation_counts_each_query_once(database):
+    # Every lifespan start calls this again (tests and reloads start several)
+    diagnostics.instrument_engine(engine)
+    diagnostics.instrument_engine(engine)
+
+    async def scenario():
+        try:
+            with diagnostics.traced("queries") as trace:
+                async with AsyncSessionLocal() as db:
+                    for _ in range(3):
+                        await db.execute(text("SELECT 1"))
+            return trace
+        finally:
+            await engine.dispose()
+
+    trace = asyncio.run(scenario())
+    assert trace.db_queries == 3
+    assert trace.db_seconds > 0
+
+
+def test_recorder_keeps_only_the_slowest_traces():
+    recorder = FlightRecorder(capacity=3)
+    for duration in (0.5, 0.1, 0.9, 0.3, 0.7, 0.2):
+        trace = Trace("GET /x", n=duration)
+        trace.duration = duration
+        recorder.record(trace)
+
+    assert recorder.seen == 6
+    assert [entry["duration_ms"] for entry in recorder.slowest()] == [900.0, 700.0, 500.0]
+
+
+def test_middleware_records_status_and_stages(monkeypatch):
+    recorder = FlightRecorder(capacity=5)
+    monkeypatch.setattr(diagnostics, "recorder", recorder)
+
+    async def app(scope, receive, send):
+        with diagnostics.stage("retrieval"):
+            await asyncio.sleep(0.01)
+        diagnostics.record_attempt("gemini-test", "ok", 0.02, usage={"prompt": 10})
+        await send({"type": "http.response.start", "status": 201, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "method": "POST", "path": "/api/v1/chat/"}
+    asyncio.run(FlightRecorderMiddleware(app)(scope, None, send))
+
+    (entry,) = recorder.slowest()
+    assert entry["name"] == "POST /api/v1/chat/" and entry["status"] == 201
+    assert [s["stage"] for s in entry["stages"]] == ["retrieval"]
+    assert entry["stages"][0]["duration_ms"] >= 10
+    assert entry["model_attempts"] == [{"model": "gemini-test", "outcome": "ok", "duration_ms": 20.0, "usage": {"prompt": 10}}]
+    # Outside a request nothing is recorded
+    with diagnostics.stage("orphan"):
+        pass
+    assert recorder.seen == 1
+
+
+def _block_the_loop(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+def test_loop_monitor_captures_the_blocking_call():
+    monitor = LoopLagMonitor(interval=0.01, stall_threshold=0.05)
+
+    async def scenario():
+        monitor.start()
+        try:
+            await asyncio.sleep(0.05)
+            _block_the_loop(0.3)
+            await asyncio.sleep(0.05)
+        finally:
+            monitor.stop()
+
+    asyncio.run(scenario())
+    (stall,) = monitor.stalls
+    assert any("_block_the_loop" in frame for frame in stall["stack"])
+    # Updated to the full duration once the loop ticked again
+    assert stall["blocked_ms"] >= 250
+    assert monitor.snapshot()["histogram"].get(">100ms") == 1
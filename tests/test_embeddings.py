@@ -0,0 +1,126 @@
+"""
+Embedding store: texts are embedded once (normalized, deduplicated), rows
+appended by another process are picked up on the next lookup, a torn
+append is ignored and overwritten, and chat query embeddings stay in a
+bounded in-memory LRU instead of growing the store.
+"""
+import os
+import subprocess
+import sys
+import textwrap
+
+import numpy as np
+import pytest
+
+from innertone.rag import embeddings
+from innertone.rag.embeddings import EmbeddingStore, StoredEmbeddings, open_store
+from innertone.services.gemini_fakes import FakeEmbeddings
+
+DIMENSIONS = 8
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class CountingEmbeddings(FakeEmbeddings):
+    def __init__(self):
+        super().__init__(DIMENSIONS)
+        self.documents = 0
+        self.queries = 0
+
+    def embed_documents(self, texts):
+        self.documents += len(texts)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.queries += 1
+        return super().embed_query(text)
+
+
+@pytest.fixture
+def model(request):
+    """A counting fake behind StoredEmbeddings, in a namespace of its own."""
+    fake = CountingEmbeddings()
+    stored = StoredEmbeddings(lambda: fake, f"test-{request.node.name}", DIMENSIONS)
+    return fake, stored
+
+
+def test_documents_are_embedded_once(model):
+    fake, stored = model
+    texts = ["a calm  mind", "a calm mind", "worry time", "a calm\nmind"]
+
+    vectors, sent = stored.embed_documents_counted(texts)
+    assert sent == 2 and fake.documents == 2
+    assert vectors[0] == vectors[1] == vectors[3] != vectors[2]
+
+    again, sent = stored.embed_documents_counted(["worry time", "a calm mind", "new chunk"])
+    assert sent == 1 and fake.documents == 3
+    # Stored as float32
+    assert np.allclose(again[:2], [vectors[2], vectors[0]], atol=1e-6)
+    store = open_store(stored.model_id, DIMENSIONS, "document")
+    assert len(store) == 3 and store.stats["hits"] == 2
+
+
+def test_put_rejects_vectors_of_the_wrong_shape(tmp_path):
+    store = EmbeddingStore(str(tmp_path), DIMENSIONS)
+    with pytest.raises(ValueError):
+        store.put_many(["one"], np.zeros((1, DIMENSIONS + 1), dtype="float32"))
+    assert len(store) == 0
+
+
+def test_rows_appended_by_another_process_are_picked_up(tmp_path):
+    store = EmbeddingStore(str(tmp_path), DIMENSIONS)
+    store.put_many(["here"], np.ones((1, DIMENSIONS), dtype="float32"))
+    assert store.get_many(["there"]) == [None]
+
+    script = textwrap.dedent(f"""
+        import numpy as np
+        from innertone.rag.embeddings import EmbeddingStore
+        store = EmbeddingStore({str(tmp_path)!r}, {DIMENSIONS})
+        assert store.put_many(["here", "there"], np.full((2, {DIMENSIONS}), 2, dtype="float32")) == 1
+    """)
+    subprocess.run([sys.executable, "-c", script], cwd=ROOT, check=True)
+
+    here, there = store.get_many(["here", "there"])
+    assert here.tolist() == [1.0] * DIMENSIONS and there.tolist() == [2.0] * DIMENSIONS
+    assert len(store) == 2
+
+
+def test_a_torn_append_is_ignored_and_overwritten(tmp_path):
+    store = EmbeddingStore(str(tmp_path), DIMENSIONS)
+    store.put_many(["kept"], np.ones((1, DIMENSIONS), dtype="float32"))
+    # A crash after the vector was written but before its key
+    with open(tmp_path / "vectors.f32", "ab") as f:
+        f.write(np.full(DIMENSIONS, 9, dtype="float32").tobytes()[:-3])
+
+    reopened = EmbeddingStore(str(tmp_path), DIMENSIONS)
+    assert len(reopened) == 1
+    assert reopened.put_many(["next"], np.full((1, DIMENSIONS), 3, dtype="float32")) == 1
+    kept, following = EmbeddingStore(str(tmp_path), DIMENSIONS).get_many(["kept", "next"])
+    assert kept.tolist() == [1.0] * DIMENSIONS and following.tolist() == [3.0] * DIMENSIONS
+    assert os.path.getsize(tmp_path / "vectors.f32") == 2 * 4 * DIMENSIONS
+
+
+def test_chat_queries_stay_in_a_bounded_lru(model, monkeypatch):
+    fake, stored = model
+    monkeypatch.setattr(embeddings.settings, "EMBEDDING_QUERY_CACHE_SIZE", 2)
+
+    first = stored.embed_query("how do I stop  overthinking")
+    assert stored.embed_query("how do I stop overthinking") == first
+    stored.embed_query("second")
+    stored.embed_query("how do I stop overthinking")  # Now the most recent
+    stored.embed_query("third")  # Evicts "second"
+    stored.embed_query("second")
+
+    assert fake.queries == 4
+    assert stored.query_cache_snapshot() == {"entries": 2, "max_entries": 2, "hits": 2, "misses": 4, "evicted": 2}
+    assert len(open_store(stored.model_id, DIMENSIONS, "query")) == 0
+
+
+def test_evaluation_queries_are_persisted(request):
+    fake = CountingEmbeddings()
+    model_id = f"test-{request.node.name}"
+    StoredEmbeddings(lambda: fake, model_id, DIMENSIONS, persist_queries=True).embed_query("a rerun question")
+    # A later run (a new wrapper, empty LRU) reads it from disk
+    StoredEmbeddings(lambda: fake, model_id, DIMENSIONS, persist_queries=True).embed_query("a rerun question")
+
+    assert fake.queries == 1
+    assert len(open_store(model_id, DIMENSIONS, "query")) == 1
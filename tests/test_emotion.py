@@ -0,0 +1,147 @@
+"""
+Emotion micro-batching: concurrent messages share one model call, a batch
+flushes early when full, and a message left out of (or garbled in) the
+answer, or a failed call, falls back to keyword detection for its callers
+only.
+"""
+import asyncio
+
+import pytest
+
+from innertone.core.serialization import dumps
+from innertone.services import emotion
+from innertone.services.emotion import EmotionBatcher, _parse_classifications
+
+
+class FakeBackend:
+    """Records each batch; answers every item as anxious unless told to drop or garble it."""
+
+    def __init__(self, latency: float = 0.01):
+        self.latency = latency
+        self.batches: list[list[str]] = []
+        self.drop: set[str] = set()
+        self.garble: set[str] = set()
+        self.error: Exception | None = None
+
+    async def __call__(self, items: list[dict]) -> str:
+        self.batches.append([item["message"] for item in items])
+        await asyncio.sleep(self.latency)
+        if self.error is not None:
+            raise self.error
+        answer = []
+        for item in items:
+            if item["message"] in self.drop:
+                continue
+            emotions = "anxious" if item["message"] in self.garble else ["anxious"]
+            answer.append({"id": item["id"], "emotions": emotions, "intensity": "high"})
+        return "```json\n" + dumps(answer) + "\n```"
+
+
+async def _classify_all(batcher: EmotionBatcher, messages: list[str]) -> list:
+    return await asyncio.gather(*(batcher.classify(m) for m in messages), return_exceptions=True)
+
+
+def test_concurrent_messages_share_one_call():
+    backend = FakeBackend()
+    batcher = EmotionBatcher(window=0.05, max_batch=16, backend=backend)
+    messages = [f"message {i}" for i in range(5)]
+
+    results = asyncio.run(_classify_all(batcher, messages))
+    assert results == [{"emotions": ["anxious"], "intensity": "high"}] * 5
+    assert backend.batches == [messages]
+    assert batcher.snapshot()["mean_batch"] == 5
+
+
+def test_a_full_batch_is_sent_without_waiting_for_the_window():
+    backend = FakeBackend()
+    batcher = EmotionBatcher(window=10.0, max_batch=2, backend=backend)
+
+    async def scenario():
+        full = await asyncio.wait_for(_classify_all(batcher, ["a", "b", "c", "d"]), timeout=1.0)
+        # The odd one waits for the window (or the next message) to fill up
+        straggler = asyncio.create_task(batcher.classify("e"))
+        await asyncio.sleep(0.05)
+        pending = not straggler.done()
+        straggler.cancel()
+        return full, pending
+
+    full, pending = asyncio.run(scenario())
+    assert len(full) == 4 and backend.batches[:2] == [["a", "b"], ["c", "d"]]
+    assert pending
+
+
+def test_missing_or_garbled_entries_fail_only_their_callers():
+    backend = FakeBackend()
+    backend.drop.add("dropped")
+    backend.garble.add("garbled")
+    batcher = EmotionBatcher(window=0.02, max_batch=16, backend=backend)
+
+    ok, dropped, garbled = asyncio.run(_classify_all(batcher, ["fine", "dropped", "garbled"]))
+    assert ok == {"emotions": ["anxious"], "intensity": "high"}
+    assert isinstance(dropped, ValueError) and isinstance(garbled, ValueError)
+    assert batcher.stats["unclassified"] == 2 and batcher.stats["failed_calls"] == 0
+
+
+def test_a_failed_call_fails_the_whole_batch():
+    backend = FakeBackend()
+    backend.error = RuntimeError("every model failed")
+    batcher = EmotionBatcher(window=0.02, max_batch=16, backend=backend)
+
+    results = asyncio.run(_classify_all(batcher, ["one", "two"]))
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert batcher.stats["failed_calls"] == 1
+
+
+def test_a_caller_that_goes_away_does_not_cancel_the_batch():
+    backend = FakeBackend(latency=0.05)
+    batcher = EmotionBatcher(window=0.01, max_batch=16, backend=backend)
+
+    async def scenario():
+        leaving = asyncio.create_task(batcher.classify("leaving"))
+        staying = asyncio.create_task(batcher.classify("staying"))
+        await asyncio.sleep(0.03)  # The batch is in flight
+        leaving.cancel()
+        return await staying
+
+    assert asyncio.run(scenario()) == {"emotions": ["anxious"], "intensity": "high"}
+
+
+def test_parse_keeps_valid_entries_and_normalises_them():
+    results = _parse_classifications(dumps([
+        {"id": 1, "emotions": ["sad", "furious", "lonely", "anxious", "stressed"], "intensity": "extreme"},
+        {"id": "2", "emotions": ["confused"], "intensity": "low"},
+        {"id": None, "emotions": ["sad"]},
+        "not an object",
+    ]))
+    assert results == {"1": {"emotions": ["sad", "lonely", "anxious"], "intensity": "medium"}}
+    with pytest.raises(ValueError):
+        _parse_classifications('{"id": 1}')
+
+
+@pytest.fixture
+def gemini_path(monkeypatch):
+    backend = FakeBackend()
+    batcher = EmotionBatcher(window=0.02, max_batch=16, backend=backend)
+    monkeypatch.setattr(emotion.settings, "GEMINI_API_KEY", "test-key")
+    monkeypatch.setattr(emotion, "get_emotion_batcher", lambda: batcher)
+    return backend
+
+
+def test_detect_emotion_batches_and_falls_back_to_keywords(gemini_path):
+    gemini_path.drop.add("I am so lonely and sad tonight")
+    same = "Work has been a lot this week honestly"
+
+    async def scenario():
+        return await asyncio.gather(
+            emotion.detect_emotion(same),
+            emotion.detect_emotion(same),
+            emotion.detect_emotion("I am so lonely and sad tonight"),
+            emotion.detect_emotion("ok thanks"),  # Too short for the model
+        )
+
+    first, second, dropped, short = asyncio.run(scenario())
+    assert first == second == {"emotions": ["anxious"], "intensity": "high", "method": "gemini"}
+    assert dropped == {"emotions": ["lonely", "sad"], "intensity": "medium", "method": "keyword"}
+    assert short["method"] == "keyword"
+    # One call; the identical messages shared one entry
+    assert gemini_path.batches == [[same, "I am so lonely and sad tonight"]]
@@ -0,0 +1,137 @@
+"""
+FAISS index vs document_metadata through delete, replace and compaction,
+with a fake embedding model: retrieval never returns a tombstoned chunk,
+and after compaction the index holds exactly the live rows' ids.
+"""
+import asyncio
+import hashlib
+
+import numpy as np
+from sqlalchemy import select
+
+from innertone.core.database import AsyncSessionLocal, engine
+from innertone.models.document_metadata import DocumentMetadata
+from innertone.rag import retrieve, store
+from innertone.rag.embeddings import StoredEmbeddings
+
+DIMENSIONS = store.settings.EMBEDDING_DIMENSIONS
+
+
+class FakeEmbeddings:
+    """A fixed pseudo-random vector per text, so a chunk's own text finds it first."""
+
+    def _vector(self, text: str) -> list[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+        return np.random.default_rng(seed).random(DIMENSIONS, dtype="float32").tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._vector(text)
+
+
+def _chunks(book: str, edition: int, count: int = 5) -> list[str]:
+    return [f"{book}, edition {edition}, chunk {i}" for i in range(count)]
+
+
+async def _ingest(db, book: str, texts: list[str], replace: bool = False, commit: bool = True) -> list[int]:
+    """What ingest.py does for one book: vectors saved first, then the rows committed."""
+    with store.index_lock():
+        index = store.load_index(DIMENSIONS)
+        if replace:
+            await store.tombstone_book(db, book)
+        first = await store.next_faiss_id(db, index)
+        ids = list(range(first, first + len(texts)))
+        index.add_with_ids(np.array(FakeEmbeddings().embed_documents(texts), dtype="float32"), np.array(ids, dtype="int64"))
+        db.add_all(DocumentMetadata(faiss_id=i, book_name=book, content=t) for i, t in zip(ids, texts))
+        await db.flush()
+        store.save_index(index)
+        if commit:
+            await db.commit()
+        else:
+            await db.rollback()  # A run that failed after saving the index
+    return ids
+
+
+async def _live_ids(db) -> set[int]:
+    return set((await db.execute(
+        select(DocumentMetadata.faiss_id).where(DocumentMetadata.deleted_at.is_(None))
+    )).scalars())
+
+
+def _index_ids() -> set[int]:
+    return store.index_ids(store.load_index(DIMENSIONS))
+
+
+async def _top(db, text: str) -> str | None:
+    results = await retrieve.retrieve_relevant_chunks(text, db, top_k=1)
+    return results[0]["content"] if results else None
+
+
+def _run(scenario, monkeypatch):
+    fake = StoredEmbeddings(FakeEmbeddings, "fake-embeddings", DIMENSIONS)
+    monkeypatch.setattr(retrieve, "_get_embedding_model", lambda: fake)
+
+    async def main():
+        try:
+            async with AsyncSessionLocal() as db:
+                await scenario(db)
+        finally:
+            await engine.dispose()
+
+    asyncio.run(main())
+
+
+def test_delete_replace_and_compact_keep_index_and_rows_in_step(database, monkeypatch):
+    async def scenario(db):
+        first_edition = _chunks("Book A", 1)
+        kept = _chunks("Book B", 1)
+        old_ids = await _ingest(db, "Book A", first_edition)
+        await _ingest(db, "Book B", kept)
+        assert _index_ids() == await _live_ids(db)
+
+        # Replace: the new edition gets new ids; the old one is skipped at once
+        second_edition = _chunks("Book A", 2)
+        new_ids = await _ingest(db, "Book A", second_edition, replace=True)
+        assert min(new_ids) > max(old_ids)
+        for old, new in zip(first_edition, second_edition):
+            assert await _top(db, old) != old
+            assert await _top(db, new) == new
+
+        # Delete: tombstoned rows keep their vectors until compaction
+        assert await store.delete_book(db, "Book B") == len(kept)
+        for text in kept:
+            assert await _top(db, text) not in kept
+        assert _index_ids() - await _live_ids(db)
+        stats = await store.index_stats(db)
+        assert stats["tombstoned_chunks"] >= len(first_edition) + len(kept)
+
+        report = await store.compact(db, force=True)
+        assert report["removed_vectors"] >= len(first_edition) + len(kept)
+        assert report["missing_vectors"] == 0
+        assert _index_ids() == await _live_ids(db)
+        assert (await store.index_stats(db))["tombstoned_chunks"] == 0
+        for text in second_edition:
+            assert await _top(db, text) == text
+
+    _run(scenario, monkeypatch)
+
+
+def test_orphaned_vectors_are_ignored_then_compacted(database, monkeypatch):
+    async def scenario(db):
+        await _ingest(db, "Book C", _chunks("Book C", 1))
+        orphaned = _chunks("Book D", 1)
+        orphan_ids = await _ingest(db, "Book D", orphaned, commit=False)
+
+        assert set(orphan_ids) <= _index_ids()
+        for text in orphaned:
+            assert await _top(db, text) not in orphaned
+        # The next writer does not reuse the orphans' ids
+        assert await store.next_faiss_id(db, store.load_index(DIMENSIONS)) > max(orphan_ids)
+
+        report = await store.compact(db, force=True)
+        assert report["orphaned_vectors"] == len(orphaned)
+        assert _index_ids() == await _live_ids(db)
+
+    _run(scenario, monkeypatch)
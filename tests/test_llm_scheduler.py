@@ -0,0 +1,215 @@
+"""
+LLMScheduler under synthetic overload, with a fake backend standing in for
+Gemini: priority ordering, bounded queue eviction, deadline and budget
+shedding, the concurrency cap, and what the consultant does when shed.
+"""
+import asyncio
+import random
+import time
+
+import pytest
+
+from innertone.services import consultant
+from innertone.services.context_cache import ContextCacheManager
+from innertone.services.gemini_fakes import FAKE_REPLY, FakeGeminiClient
+from innertone.services.llm_scheduler import LLMScheduler, Priority, SchedulerOverloaded
+
+
+def _scheduler(**overrides) -> LLMScheduler:
+    options = dict(max_concurrency=1, max_queue=16, default_rpm=10_000, default_tpm=10 ** 9, congestion_depth=4)
+    options.update(overrides)
+    return LLMScheduler(**options)
+
+
+class FakeBackend:
+    """Records how many calls are in flight at once."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = 0
+
+    async def generate(self) -> None:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            self.calls += 1
+        finally:
+            self.in_flight -= 1
+
+
+def test_waiters_are_admitted_by_priority():
+    async def scenario():
+        scheduler = _scheduler()
+        await scheduler.acquire(Priority.CHAT, "m")  # Holds the only slot
+        order = []
+
+        async def request(priority: Priority):
+            async with scheduler.slot(priority, "m"):
+                order.append(priority)
+
+        tasks = []
+        for priority in (Priority.BACKGROUND, Priority.EMOTION, Priority.CHAT, Priority.VOICE):
+            tasks.append(asyncio.create_task(request(priority)))
+            await asyncio.sleep(0)
+        assert scheduler.queue_depth() == 4
+        scheduler.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == [Priority.VOICE, Priority.CHAT, Priority.EMOTION, Priority.BACKGROUND]
+
+
+def test_full_queue_evicts_lower_priority_and_sheds_equal_priority():
+    async def scenario():
+        scheduler = _scheduler(max_queue=2)
+        await scheduler.acquire(Priority.CHAT, "m")
+        background = [asyncio.create_task(scheduler.acquire(Priority.BACKGROUND, "m")) for _ in range(2)]
+        await asyncio.sleep(0)
+
+        # A chat request takes the place of the newest background waiter
+        chat = asyncio.create_task(scheduler.acquire(Priority.CHAT, "m"))
+        evicted, _ = await asyncio.wait(background, timeout=0.5, return_when=asyncio.FIRST_COMPLETED)
+        assert len(evicted) == 1
+        with pytest.raises(SchedulerOverloaded):
+            await evicted.pop()
+
+        # Nothing below background to evict: shed on arrival
+        with pytest.raises(SchedulerOverloaded):
+            await scheduler.acquire(Priority.BACKGROUND, "m")
+
+        snapshot = scheduler.snapshot()
+        for task in background + [chat]:
+            task.cancel()
+        await asyncio.gather(*background, chat, return_exceptions=True)
+        return snapshot
+
+    snapshot = asyncio.run(scenario())
+    assert snapshot["classes"]["background"]["shed"] == 2
+    assert snapshot["queue_by_priority"] == {"voice": 0, "chat": 1, "emotion": 0, "background": 1}
+
+
+def test_waiter_is_shed_at_its_deadline():
+    async def scenario():
+        scheduler = _scheduler()
+        await scheduler.acquire(Priority.CHAT, "m")
+        started = time.monotonic()
+        with pytest.raises(SchedulerOverloaded):
+            await scheduler.acquire(Priority.EMOTION, "m", deadline=started + 0.05)
+        return time.monotonic() - started, scheduler
+
+    waited, scheduler = asyncio.run(scenario())
+    assert waited < 0.5
+    assert scheduler.queue_depth() == 0
+    assert scheduler.snapshot()["classes"]["emotion"]["shed"] == 1
+
+
+def test_exhausted_model_budget_sheds_instead_of_waiting_past_the_deadline():
+    async def scenario():
+        scheduler = _scheduler(max_concurrency=8, model_limits={"small": {"rpm": 2, "tpm": 10 ** 9}})
+        for _ in range(2):
+            async with scheduler.slot(Priority.CHAT, "small"):
+                pass
+        started = time.monotonic()
+        with pytest.raises(SchedulerOverloaded, match="budget"):
+            await scheduler.acquire(Priority.CHAT, "small", deadline=started + 1.0)
+        # Other models have their own budget
+        async with scheduler.slot(Priority.CHAT, "other"):
+            pass
+        return time.monotonic() - started
+
+    # The next request slot is 30 s away, so it is shed right away
+    assert asyncio.run(scenario()) < 0.5
+
+
+def test_synthetic_overload_respects_concurrency_and_protects_voice():
+    async def scenario():
+        scheduler = _scheduler(max_concurrency=4, max_queue=20)
+        backend = FakeBackend(latency=0.01)
+        outcomes = {p: {"ok": 0, "shed": 0} for p in Priority}
+        congested = False
+        rng = random.Random(0)
+
+        async def request(priority: Priority):
+            nonlocal congested
+            try:
+                async with scheduler.slot(priority, "m", deadline=time.monotonic() + 0.5):
+                    congested = congested or scheduler.is_congested()
+                    await backend.generate()
+                outcomes[priority]["ok"] += 1
+            except SchedulerOverloaded:
+                outcomes[priority]["shed"] += 1
+
+        # 400 requests arriving at ~1000/s against a backend that serves ~400/s
+        tasks = []
+        for priority in rng.choices(list(Priority), weights=[1, 3, 4, 4], k=400):
+            tasks.append(asyncio.create_task(request(priority)))
+            await asyncio.sleep(rng.expovariate(1000))
+        await asyncio.gather(*tasks)
+        return scheduler, backend, outcomes, congested
+
+    scheduler, backend, outcomes, congested = asyncio.run(scenario())
+    assert backend.max_in_flight <= 4
+    assert scheduler.running == 0 and scheduler.queue_depth() == 0
+    assert sum(o["ok"] + o["shed"] for o in outcomes.values()) == 400
+    assert congested
+    # Shedding falls on the lower classes first
+    assert outcomes[Priority.VOICE]["shed"] == 0
+    assert outcomes[Priority.BACKGROUND]["shed"] > 0
+    shed_rate = {p: o["shed"] / max(1, o["ok"] + o["shed"]) for p, o in outcomes.items()}
+    assert shed_rate[Priority.VOICE] <= shed_rate[Priority.CHAT] <= shed_rate[Priority.BACKGROUND]
+
+
+@pytest.fixture
+def fake_consultant(monkeypatch):
+    """The consultant on a fake client, without RAG or context caching; returns the client."""
+    client = FakeGeminiClient(latency=0.001)
+    cache = ContextCacheManager(enabled=False, ttl=0, refresh_margin=0, min_tokens=0, hot_threshold=0, max_entries=0)
+    monkeypatch.setattr(consultant, "_client", client)
+    monkeypatch.setattr(consultant, "get_context_cache", lambda: cache)
+    monkeypatch.setattr(consultant.settings, "RAG_ENABLED", False)
+    return client
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_consultant_raises_a_full_queue_without_trying_other_models(monkeypatch, fake_consultant, streaming):
+    scheduler = _scheduler(max_queue=1)
+    monkeypatch.setattr(consultant, "get_scheduler", lambda: scheduler)
+
+    async def scenario():
+        await scheduler.acquire(Priority.CHAT, "m")  # Holds the only slot
+        voice = asyncio.create_task(scheduler.acquire(Priority.VOICE, "m"))
+        await asyncio.sleep(0)
+        try:
+            with pytest.raises(SchedulerOverloaded) as shed:
+                if streaming:
+                    async for _ in consultant.stream_consultant_response("hello", [], None, priority=Priority.CHAT):
+                        pass
+                else:
+                    await consultant.get_consultant_response("hello", [], None)
+            return shed.value
+        finally:
+            voice.cancel()
+            await asyncio.gather(voice, return_exceptions=True)
+
+    error = asyncio.run(scenario())
+    assert error.model is None
+    # Every model waits in the same queue, so none was tried
+    assert not fake_consultant.calls
+
+
+def test_consultant_moves_to_the_next_model_when_one_budget_is_spent(monkeypatch, fake_consultant):
+    primary, secondary = consultant.FALLBACK_MODELS[:2]
+    scheduler = _scheduler(model_limits={primary: {"rpm": 1, "tpm": 10 ** 9}})
+    monkeypatch.setattr(consultant, "get_scheduler", lambda: scheduler)
+
+    async def scenario():
+        return [(await consultant.get_consultant_response("hello", [], None))["response"] for _ in range(2)]
+
+    started = time.monotonic()
+    assert asyncio.run(scenario()) == [FAKE_REPLY] * 2
+    # The second turn did not wait a minute for the primary's next request slot
+    assert time.monotonic() - started < 5
+    assert fake_consultant.calls == {primary: 1, secondary: 1}
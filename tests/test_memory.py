@@ -0,0 +1,89 @@
+"""
+SessionMemory over long voice calls, with the local summary fallback (no
+Gemini key): the context stays the same size, and nothing that fell out of
+the window is lost when a call ends or is resumed.
+"""
+import asyncio
+
+from innertone.core.database import AsyncSessionLocal, engine
+from innertone.services.memory import MEMORY_WINDOW, SUMMARY_BATCH, SUMMARY_MAX_CHARS, SessionMemory
+from innertone.services.llm_scheduler import estimate_tokens
+
+
+def _context_tokens(memory: SessionMemory) -> int:
+    return sum(estimate_tokens(turn["parts"][0]["text"]) for turn in memory.context())
+
+
+def _turn(i: int) -> tuple[str, str]:
+    return f"user turn {i}: " + "I keep worrying about work. " * 8, f"model turn {i}: " + "Let's try a breathing exercise. " * 8
+
+
+def test_prompt_size_stays_flat_over_a_100_turn_call():
+    async def scenario() -> list[int]:
+        memory = SessionMemory("memory-flat")
+        sizes = []
+        for i in range(100):
+            user, model = _turn(i)
+            memory.add("user", user, persist=False)
+            memory.add("model", model, persist=False)
+            await asyncio.sleep(0)  # Let a background fold run
+            sizes.append(_context_tokens(memory))
+        return sizes
+
+    sizes = asyncio.run(scenario())
+    window_tokens = sum(estimate_tokens(text) for text in _turn(0)) * MEMORY_WINDOW // 2
+    ceiling = window_tokens + estimate_tokens("x" * SUMMARY_MAX_CHARS) + 50
+    assert max(sizes) <= ceiling
+    # Flat once the window is full: turn 100 costs what turn 20 did, give or take the summary
+    steady = sizes[MEMORY_WINDOW:]
+    assert max(steady) - min(steady) <= estimate_tokens("x" * SUMMARY_MAX_CHARS)
+    assert sizes[-1] <= sizes[MEMORY_WINDOW] + estimate_tokens("x" * SUMMARY_MAX_CHARS)
+
+
+def test_close_folds_evicted_turns_that_did_not_fill_a_batch(database):
+    # Four turns past the window: evicted, but fewer than SUMMARY_BATCH
+    extra = SUMMARY_BATCH - 2
+
+    async def scenario():
+        try:
+            async with AsyncSessionLocal() as db:
+                memory = SessionMemory("memory-close")
+                for i in range(MEMORY_WINDOW + extra):
+                    memory.add("user", f"close message {i}")
+                await memory.close(db)
+            async with AsyncSessionLocal() as db:
+                resumed = SessionMemory("memory-close")
+                await resumed.load(db)
+            return memory, resumed
+        finally:
+            await engine.dispose()
+
+    memory, resumed = asyncio.run(scenario())
+    for i in range(extra):
+        assert f"close message {i}" in memory.summary
+    assert resumed.summary == memory.summary
+    assert resumed._evicted == []
+    assert [t["parts"][0]["text"] for t in resumed.turns] == [
+        f"close message {i}" for i in range(extra, MEMORY_WINDOW + extra)
+    ]
+
+
+def test_resume_folds_turns_a_crashed_call_never_summarised(database):
+    async def scenario():
+        try:
+            async with AsyncSessionLocal() as db:
+                memory = SessionMemory("memory-crash")
+                for i in range(MEMORY_WINDOW + 3):
+                    memory.add("user", f"crash message {i}")
+                await memory.flush(db)  # No close(): the worker died mid-call
+            async with AsyncSessionLocal() as db:
+                resumed = SessionMemory("memory-crash")
+                await resumed.load(db)
+                await resumed.close(db)
+            return resumed
+        finally:
+            await engine.dispose()
+
+    resumed = asyncio.run(scenario())
+    for i in range(3):
+        assert f"crash message {i}" in resumed.summary
@@ -0,0 +1,134 @@
+"""
+Sharded search across real processes: shard files written by book, one
+`innertone.rag.shards serve` process per shard, and ShardClient merging
+their answers into the single index's result. Also covers a shard file
+replaced on disk, a dead shard and one slower than the timeout.
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+import pytest
+
+from innertone.rag.shards import ShardClient, shard_of, shard_path, write_shards
+from innertone.rag.store import save_index
+
+faiss = pytest.importorskip("faiss")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHARDS = 3
+DIMENSION = 16
+BOOKS = [f"Book {i}" for i in range(12)]
+TOP_K = 5
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _serve(path: str, delay_ms: float = 0.0) -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    command = [sys.executable, "-m", "innertone.rag.shards", "serve", "--index", path, "--port", str(port)]
+    if delay_ms:
+        command += ["--delay-ms", str(delay_ms)]
+    return subprocess.Popen(command, cwd=ROOT), f"http://127.0.0.1:{port}"
+
+
+def _wait_ready(servers: list[tuple[subprocess.Popen, str]], timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    for process, url in servers:
+        while True:
+            assert process.poll() is None, f"shard server {url} exited with {process.returncode}"
+            try:
+                if httpx.get(f"{url}/health").status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            assert time.monotonic() < deadline, f"shard server {url} did not start"
+            time.sleep(0.1)
+
+
+@pytest.fixture
+def cluster(tmp_path):
+    """The full index, its shard files (split by book), and a server per shard plus a slow one."""
+    rng = np.random.default_rng(0)
+    count = 600
+    vectors = rng.random((count, DIMENSION), dtype="float32")
+    ids = np.arange(1000, 1000 + count, dtype="int64")
+    index = faiss.IndexIDMap2(faiss.IndexFlatL2(DIMENSION))
+    index.add_with_ids(vectors, ids)
+    book_of = {int(i): BOOKS[n % len(BOOKS)] for n, i in enumerate(ids)}
+    base = str(tmp_path / "index.faiss")
+    sizes = write_shards(index, np.array([shard_of(book_of[int(i)], SHARDS) for i in ids]), SHARDS, base)
+
+    servers = [_serve(shard_path(shard, base)) for shard in range(SHARDS)]
+    slow = _serve(shard_path(0, base), delay_ms=3000)
+    try:
+        _wait_ready([*servers, slow])
+        yield {"index": index, "base": base, "sizes": sizes, "servers": servers, "slow": slow, "book_of": book_of}
+    finally:
+        for process, _ in [*servers, slow]:
+            process.terminate()
+        for process, _ in [*servers, slow]:
+            process.wait()
+
+
+def _search(urls: list[str], queries: np.ndarray, timeout: float = 10.0):
+    async def scenario():
+        client = ShardClient(urls, timeout)
+        try:
+            return [await client.search(q.tolist(), TOP_K) for q in queries], client
+        finally:
+            await client.close()
+
+    return asyncio.run(scenario())
+
+
+def test_scatter_gather_matches_the_single_index(cluster):
+    queries = np.random.default_rng(1).random((20, DIMENSION), dtype="float32")
+    results, client = _search([url for _, url in cluster["servers"]], queries)
+
+    exact = cluster["index"].search(queries, TOP_K)[1].tolist()
+    assert [ids for ids, _ in results] == exact
+    assert {total for _, total in results} == {cluster["index"].ntotal}
+    # Every book lives on exactly one shard
+    assert sum(cluster["sizes"]) == cluster["index"].ntotal and all(cluster["sizes"])
+    assert client.degraded_queries == 0
+    assert all(stats["ok"] == len(queries) for stats in client.stats.values())
+
+
+def test_a_replaced_shard_file_is_reloaded(cluster):
+    # Shard 0 loses its books, as after a delete and re-split
+    save_index(faiss.IndexIDMap2(faiss.IndexFlatL2(DIMENSION)), shard_path(0, cluster["base"]))
+    queries = np.random.default_rng(2).random((10, DIMENSION), dtype="float32")
+    results, client = _search([url for _, url in cluster["servers"]], queries)
+
+    assert {total for _, total in results} == {cluster["index"].ntotal - cluster["sizes"][0]}
+    returned = {i for ids, _ in results for i in ids}
+    assert returned and all(shard_of(cluster["book_of"][i], SHARDS) != 0 for i in returned)
+    assert client.degraded_queries == 0
+
+
+def test_dead_and_slow_shards_are_left_out(cluster):
+    (dead, dead_url), *live = cluster["servers"]
+    dead.terminate()
+    dead.wait()
+    queries = np.random.default_rng(3).random((3, DIMENSION), dtype="float32")
+
+    started = time.monotonic()
+    results, client = _search([dead_url, *(url for _, url in live), cluster["slow"][1]], queries, timeout=0.5)
+    # Each query waited for the slow shard's timeout at most, not its 3 s delay
+    assert time.monotonic() - started < 3 * 2.5
+    assert client.degraded_queries == len(queries)
+    assert client.stats[dead_url]["errors"] == len(queries)
+    assert client.stats[cluster["slow"][1]]["timeouts"] == len(queries)
+    # Answered by the two live shards alone
+    assert {total for _, total in results} == {sum(cluster["sizes"][1:])}
+    assert all(shard_of(cluster["book_of"][i], SHARDS) != 0 for ids, _ in results for i in ids)
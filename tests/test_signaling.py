@@ -0,0 +1,100 @@
+"""
+Signaling rooms across workers: ConnectionManagers on RedisBackplanes that
+share one in-memory broker, as workers share one Redis.
+"""
+import asyncio
+
+from innertone.core.serialization import dumps, loads
+from innertone.services.signaling import ConnectionManager, MemoryBroker, RedisBackplane
+
+
+class PeerSocket:
+    """Records what a signaling peer was sent."""
+
+    def __init__(self):
+        self.received: list[dict] = []
+
+    async def accept(self) -> None:
+        pass
+
+    async def send_text(self, message: str) -> None:
+        self.received.append(loads(message))
+
+    async def close(self) -> None:
+        pass
+
+
+async def _settle(sockets: list[PeerSocket], count: int, timeout: float = 2.0) -> None:
+    """Waits until every socket has received `count` messages, or the timeout."""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while any(len(s.received) < count for s in sockets) and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.01)
+
+
+def test_peers_on_different_workers_see_each_other():
+    async def scenario():
+        broker = MemoryBroker()
+        workers = [ConnectionManager(RedisBackplane(client=broker)) for _ in range(2)]
+        caller, callee, listener = PeerSocket(), PeerSocket(), PeerSocket()
+        offerer = await workers[0].connect("relay", caller)
+        await workers[1].connect("relay", callee)
+        await workers[1].connect("relay", listener)
+        try:
+            await workers[0].broadcast_to_room("relay", dumps({"type": "offer", "sdp": "v=0"}), exclude=offerer)
+            await _settle([callee, listener], 1)
+        finally:
+            for worker in workers:
+                await worker.close()
+        return caller, callee, listener
+
+    caller, callee, listener = asyncio.run(scenario())
+    assert callee.received == listener.received == [{"type": "offer", "sdp": "v=0"}]
+    # Neither echoed to the sender nor delivered twice by its own worker's relay
+    assert caller.received == []
+
+
+def test_relay_resumes_after_the_listener_loses_its_connection(monkeypatch):
+    monkeypatch.setattr(RedisBackplane, "RETRY_SECONDS", 0.01)
+
+    async def scenario():
+        broker = MemoryBroker()
+        workers = [ConnectionManager(RedisBackplane(client=broker)) for _ in range(2)]
+        caller, callee = PeerSocket(), PeerSocket()
+        offerer = await workers[0].connect("resubscribe", caller)
+        await workers[1].connect("resubscribe", callee)
+        try:
+            # The server forgets the callee worker's subscriptions and its next read fails
+            workers[1].backplane._pubsub.drop_connection()
+            await asyncio.sleep(0.1)
+            await workers[0].broadcast_to_room("resubscribe", dumps({"type": "candidate", "n": 1}), exclude=offerer)
+            await _settle([callee], 1)
+            listener_alive = not workers[1].backplane._listener.done()
+        finally:
+            for worker in workers:
+                await worker.close()
+        return callee, listener_alive
+
+    callee, listener_alive = asyncio.run(scenario())
+    assert callee.received == [{"type": "candidate", "n": 1}]
+    assert listener_alive
+
+
+def test_a_bad_relayed_payload_does_not_stop_other_rooms():
+    async def scenario():
+        broker = MemoryBroker()
+        workers = [ConnectionManager(RedisBackplane(client=broker)) for _ in range(2)]
+        first, second = PeerSocket(), PeerSocket()
+        await workers[1].connect("room-a", first)
+        await workers[1].connect("room-b", second)
+        try:
+            await broker.publish(RedisBackplane.CHANNEL_PREFIX + "room-a", b"not json")
+            await workers[0].broadcast_to_room("room-b", dumps({"type": "answer"}))
+            await _settle([second], 1)
+        finally:
+            for worker in workers:
+                await worker.close()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first.received == []
+    assert second.received == [{"type": "answer"}]
@@ -0,0 +1,141 @@
+"""
+Topic assignment: k-means finds the corpus' themes (each its own cluster,
+which random starting centroids often missed), every chunk of a theme gets
+the same label, labelling takes one call per LABEL_BATCH clusters, and a
+later run gives new chunks the topic of their nearest saved centroid
+without clustering or labelling again.
+"""
+import asyncio
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+from sqlalchemy import delete, select, update
+
+from innertone.core.database import AsyncSessionLocal, engine
+from innertone.models.document_metadata import DocumentMetadata
+from innertone.rag import topics
+
+faiss = pytest.importorskip("faiss")
+
+DIMENSIONS = 16
+THEMES = {
+    "sleep": "sleep insomnia bedtime routine",
+    "grief": "grief mourning bereavement loss",
+    "anger": "anger irritation temper outbursts",
+}
+FIRST_ID = 5_000_000
+
+
+def _themed_vectors(count: int, seed: int) -> tuple[np.ndarray, list[str]]:
+    """`count` vectors around each theme's centre (the same centres for every seed)."""
+    centres = np.random.default_rng(0).normal(size=(len(THEMES), DIMENSIONS)).astype("float32") * 5
+    rng = np.random.default_rng(seed)
+    vectors = np.concatenate([c + rng.normal(size=(count, DIMENSIONS)).astype("float32") for c in centres])
+    return vectors, [theme for theme in THEMES for _ in range(count)]
+
+
+def test_clusters_and_nearest_members():
+    vectors, themes = _themed_vectors(50, seed=1)
+    centroids, assignment, distances = topics.cluster(vectors, len(THEMES))
+
+    assert centroids.shape == (len(THEMES), DIMENSIONS)
+    # Each theme is exactly one cluster
+    by_theme = {theme: {int(c) for c, t in zip(assignment, themes) if t == theme} for theme in THEMES}
+    assert all(len(clusters) == 1 for clusters in by_theme.values())
+    assert len(set.union(*by_theme.values())) == len(THEMES)
+
+    nearest = topics.nearest_members(assignment, distances, len(THEMES), 4)
+    for c, members in nearest.items():
+        assert len(members) == 4 and all(assignment[m] == c for m in members)
+        others = distances[(assignment == c) & ~np.isin(np.arange(len(vectors)), members)]
+        assert distances[members].tolist() == sorted(distances[members]) and distances[members].max() <= others.min()
+
+
+def test_labels_batch_clusters_and_keep_keyword_fallbacks(monkeypatch):
+    samples = {c: [f"passage about {word} and more {word}"] for c, word in enumerate(
+        "sleep grief anger worry shame guilt panic habits trust rumination".split()
+    )}
+    batches = []
+
+    async def fake_gemini_labels(batch):
+        batches.append(sorted(batch))
+        if len(batches) == 2:
+            raise RuntimeError("every model failed")
+        return {c: f"topic {c}" for c in batch if c != 3}  # Cluster 3 left out of the answer
+
+    monkeypatch.setattr(topics.settings, "GEMINI_API_KEY", "test-key")
+    monkeypatch.setattr(topics, "_gemini_labels", fake_gemini_labels)
+    labels, calls = asyncio.run(topics.label_clusters(samples))
+
+    assert calls == 2 and batches == [list(range(topics.LABEL_BATCH)), [8, 9]]
+    assert labels[0] == "topic 0" and labels[3].startswith("worry")
+    assert labels[9].startswith("rumination")
+
+
+async def _add_rows(db, vectors: np.ndarray, themes: list[str], first_id: int, topic: str | None = None) -> list[int]:
+    ids = list(range(first_id, first_id + len(vectors)))
+    db.add_all(
+        DocumentMetadata(faiss_id=i, book_name=f"Topics {theme}", topic=topic, content=f"{THEMES[theme]} passage {i}")
+        for i, theme in zip(ids, themes)
+    )
+    await db.commit()
+    return ids
+
+
+async def _topics_by_theme(db) -> dict[str, set[str]]:
+    rows = (await db.execute(
+        select(DocumentMetadata.book_name, DocumentMetadata.topic).where(
+            DocumentMetadata.book_name.like("Topics %"), DocumentMetadata.deleted_at.is_(None)
+        )
+    )).all()
+    found: dict[str, set[str]] = {}
+    for book, topic in rows:
+        found.setdefault(book.removeprefix("Topics "), set()).add(topic)
+    return found
+
+
+def test_assign_then_place_new_chunks_by_nearest_centroid(database, monkeypatch, tmp_path):
+    monkeypatch.setattr(topics, "TOPIC_MODEL_PATH", str(tmp_path / "index.faiss.topics.npz"))
+    monkeypatch.setattr(topics.settings, "TOPIC_CLUSTERS", len(THEMES))
+    index = faiss.IndexIDMap2(faiss.IndexFlatL2(DIMENSIONS))
+
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            try:
+                vectors, themes = _themed_vectors(topics.MIN_CLUSTER_SIZE, seed=1)
+                ids = await _add_rows(db, vectors, themes, FIRST_ID)
+                index.add_with_ids(vectors, np.array(ids, dtype="int64"))
+
+                first = await topics.assign_topics(db, index=index)
+                assert first["chunks"] == len(ids) and first["clusters"] == len(THEMES)
+                assert first["label_calls"] == 0  # No API key: keyword labels
+                labelled = await _topics_by_theme(db)
+                assert all(len(found) == 1 for found in labelled.values())
+                label = {theme: found.pop() for theme, found in labelled.items()}
+                assert len(set(label.values())) == len(THEMES)
+                assert all(set(label[theme].split(", ")) <= set(THEMES[theme].split()) for theme in THEMES)
+
+                # New chunks (one batch still carrying the old placeholder) and a tombstoned one
+                vectors, themes = _themed_vectors(5, seed=2)
+                half = len(vectors) // 2
+                new_ids = await _add_rows(db, vectors[:half], themes[:half], FIRST_ID + 1000)
+                new_ids += await _add_rows(db, vectors[half:], themes[half:], FIRST_ID + 2000, topics.PLACEHOLDER_TOPIC)
+                index.add_with_ids(vectors, np.array(new_ids, dtype="int64"))
+                await db.execute(
+                    update(DocumentMetadata).where(DocumentMetadata.faiss_id == new_ids[0]).values(deleted_at=datetime.now(timezone.utc))
+                )
+                await db.commit()
+
+                second = await topics.assign_topics(db, index=index)
+                assert second["chunks"] == len(new_ids) - 1
+                assert second["label_calls"] == 0 and "cluster_s" not in second
+                assert await _topics_by_theme(db) == {theme: {label[theme]} for theme in THEMES}
+                tombstoned = await db.scalar(select(DocumentMetadata.topic).where(DocumentMetadata.faiss_id == new_ids[0]))
+                assert tombstoned is None
+            finally:
+                await db.execute(delete(DocumentMetadata).where(DocumentMetadata.book_name.like("Topics %")))
+                await db.commit()
+        await engine.dispose()
+
+    asyncio.run(scenario())
@@ -0,0 +1,60 @@
+"""
+VoiceSession protocol handling over a fake socket (no model calls).
+"""
+import asyncio
+
+import pytest
+from fastapi import WebSocketDisconnect
+
+from innertone.core.database import engine
+from innertone.core.serialization import loads
+from innertone.services.voice import SentenceChunker, VoiceSession
+
+
+class FakeVoiceSocket:
+    """Plays back client frames, then disconnects; records what the server sent."""
+
+    def __init__(self, frames: list[str]):
+        self.frames = list(frames)
+        self.sent: list[dict] = []
+
+    async def receive_text(self) -> str:
+        await asyncio.sleep(0.01)  # Let the greeting turn run
+        if not self.frames:
+            raise WebSocketDisconnect(code=1000)
+        return self.frames.pop(0)
+
+    async def send_text(self, data: str) -> None:
+        self.sent.append(loads(data))
+
+
+def test_malformed_frames_are_skipped_without_ending_the_call(database):
+    socket = FakeVoiceSocket([
+        "not json",
+        "[]",
+        "1",
+        '"text"',
+        '{"type": "text", "text": 5}',
+        '{"type": "text", "text": "   "}',
+        '{"type": "ack", "turn_id": 1}',
+    ])
+
+    async def scenario():
+        try:
+            with pytest.raises(WebSocketDisconnect):
+                await VoiceSession(socket, "voice-malformed").run()
+        finally:
+            await engine.dispose()
+
+    asyncio.run(scenario())
+    assert socket.frames == []  # Every frame was read; the call ended on the disconnect
+    kinds = [message["type"] for message in socket.sent]
+    assert kinds[-2:] == ["turn_end", "control"]  # Greeting spoken, then acked
+    assert socket.sent[-1]["state"] == "listening"
+
+
+def test_sentence_chunker_waits_for_whole_sentences():
+    chunker = SentenceChunker(min_chars=10)
+    assert chunker.feed("That sounds hard. It costs 3.5 hours") == ["That sounds hard."]
+    assert chunker.feed(" a night. What helps") == ["It costs 3.5 hours a night."]
+    assert chunker.flush() == ["What helps"]